@@ -0,0 +1,146 @@
+"""
+Benchmark adaptive alignment scans against the fixed-grid scans.
+
+A simulated edge (error function) or peak (Gaussian) with noise is
+scanned over the default range of ``x_lup`` (-3 to 3 mm) by
+
+* the fixed grid of the step scans (60 points, centre from
+  ``fly_alignment.find_centre``, as the plots are read), and
+* ``AdaptiveSampler`` with the requested tolerance.
+
+Each point costs the motor travel plus the settle and read time, so the
+scan time of both is compared too.  No EPICS connection is needed.
+
+Run it from the repository root, with ``src`` on the path::
+
+    export PYTHONPATH=src
+    python scripts/benchmark_adaptive_alignment.py -n 200 --tolerance 0.01
+"""
+
+import argparse
+import math
+import statistics
+
+import numpy as np
+
+from id8_i.utils.adaptive_scan import AdaptiveSampler
+from id8_i.utils.fly_alignment import find_centre
+
+
+def profile(kind: str, centre: float, width: float):
+    """Noise-free signal of the simulated sample."""
+    if kind == "edge":
+        erf = np.vectorize(math.erf)
+        return lambda x: (
+            0.5 * (1 + erf((np.asarray(x) - centre) / (width * math.sqrt(2))))
+        )
+    return lambda x: np.exp(-((np.asarray(x) - centre) ** 2) / (2 * width**2))
+
+
+def scan_time(positions, velocity: float, per_point: float) -> float:
+    """Seconds to visit the positions in order."""
+    travel = np.sum(np.abs(np.diff(positions)))
+    return float(travel / velocity + per_point * len(positions))
+
+
+def fixed_grid(signal, noise, rng, begin, end, num_pts, kind):
+    """Centre found from ``num_pts`` evenly spaced points, and the points."""
+    x = np.linspace(begin, end, num_pts)
+    y = signal(x) + noise * rng.standard_normal(num_pts)
+    return find_centre(x, y, kind).centre, list(x)
+
+
+def adaptive(signal, noise, rng, begin, end, tolerance, kind, max_points):
+    """Centre found by the AdaptiveSampler, and the points it visited."""
+    sampler = AdaptiveSampler(begin, end, tolerance, kind=kind, max_points=max_points)
+    visited = []
+    positions = list(sampler.initial_points())
+    while positions:
+        for x in positions:
+            sampler.tell(x, float(signal(x)) + noise * rng.standard_normal())
+            visited.append(x)
+        positions = sampler.ask()
+    return sampler.result().centre, visited
+
+
+def benchmark(args) -> dict:
+    """Error, points and scan time of both methods over ``args.n`` profiles."""
+    rng = np.random.default_rng(args.seed)
+    results = {"fixed": ([], [], []), "adaptive": ([], [], [])}
+    for _ in range(args.n):
+        centre = rng.uniform(-1.5, 1.5)
+        signal = profile(args.kind, centre, args.width)
+        runs = {
+            "fixed": fixed_grid(
+                signal, args.noise, rng, -3, 3, args.num_pts, args.kind
+            ),
+            "adaptive": adaptive(
+                signal, args.noise, rng, -3, 3, args.tolerance, args.kind, args.num_pts
+            ),
+        }
+        for name, (found, visited) in runs.items():
+            errors, points, times = results[name]
+            errors.append(abs(found - centre))
+            points.append(len(visited))
+            times.append(scan_time(visited, args.velocity, args.per_point))
+    summary = {}
+    for name, (errors, points, times) in results.items():
+        found = [e for e in errors if not math.isnan(e)]
+        # a miss is the worst error
+        ranked = sorted(found) + [math.inf] * (len(errors) - len(found))
+        summary[name] = {
+            "not_found": len(errors) - len(found),
+            "mean_error": statistics.mean(found) if found else math.nan,
+            "p95_error": ranked[int(0.95 * (len(ranked) - 1))],
+            "mean_points": statistics.mean(points),
+            "mean_time_s": statistics.mean(times),
+        }
+    return summary
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "-n", type=int, default=200, help="simulated scans (default: 200)"
+    )
+    parser.add_argument("--kind", choices=("edge", "peak"), default="edge")
+    parser.add_argument(
+        "--width", type=float, default=0.05, help="edge sigma or peak sigma, mm"
+    )
+    parser.add_argument(
+        "--noise", type=float, default=0.01, help="noise, fraction of the step"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.01, help="adaptive tolerance, mm"
+    )
+    parser.add_argument(
+        "--num-pts", type=int, default=60, help="fixed grid points (default: x_lup)"
+    )
+    parser.add_argument(
+        "--velocity", type=float, default=1.0, help="motor velocity, mm/s"
+    )
+    parser.add_argument(
+        "--per-point", type=float, default=0.5, help="settle + read per point, s"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(
+        f"{args.n} simulated {args.kind}s, width {args.width} mm,"
+        f" noise {args.noise:.1%}"
+    )
+    print(
+        f"{'':>10} {'missed':>7} {'mean err':>10} {'p95 err':>10}"
+        f" {'points':>8} {'time (s)':>9}"
+    )
+    for name, stats in benchmark(args).items():
+        print(
+            f"{name:>10} {stats['not_found']:7d} {stats['mean_error']:10.4f}"
+            f" {stats['p95_error']:10.4f}"
+            f" {stats['mean_points']:8.1f} {stats['mean_time_s']:9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
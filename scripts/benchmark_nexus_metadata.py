@@ -0,0 +1,74 @@
+"""
+Benchmark the per-file latency of writing the XPCS NeXus metadata file.
+
+Uses the precompiled write program (``id8_i.utils.nexus_write_program``)
+with the default metadata values, so no EPICS connection is needed.
+Point ``--directory`` at the data file system (such as ``/gdata``) to
+include the NFS cost in the measurement.
+
+Run it from the repository root, with ``src`` on the path::
+
+    PYTHONPATH=src python scripts/benchmark_nexus_metadata.py -n 50 -d /tmp
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from id8_i.utils.APS8IDI_default_metadata import default_metadata
+from id8_i.utils.APS8IDI_xpcs_schema import xpcs_schema
+from id8_i.utils.nexus_write_program import compile_schema
+from id8_i.utils.nexus_write_program import write_nexus_file
+
+
+def benchmark(directory: Path, n_files: int) -> dict:
+    """Write ``n_files`` metadata files, return latency statistics (ms)."""
+    t0 = time.perf_counter()
+    compile_schema(xpcs_schema)
+    compile_ms = (time.perf_counter() - t0) * 1e3
+
+    latencies = []
+    for rep in range(n_files):
+        filename = directory / f"bench_r{rep + 1:05d}_metadata.hdf"
+        t0 = time.perf_counter()
+        write_nexus_file(str(filename), default_metadata)
+        latencies.append((time.perf_counter() - t0) * 1e3)
+
+    latencies.sort()
+    return {
+        "compile_ms": compile_ms,
+        "n_files": n_files,
+        "mean_ms": statistics.mean(latencies),
+        "median_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(0.95 * (n_files - 1))],
+        "max_ms": latencies[-1],
+    }
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--n-files", type=int, default=30)
+    parser.add_argument("-d", "--directory", default=None)
+    args = parser.parse_args()
+
+    if args.directory is None:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = benchmark(Path(tmp), args.n_files)
+    else:
+        results = benchmark(Path(args.directory), args.n_files)
+
+    print(f"compile (once at import): {results['compile_ms']:.3f} ms")
+    print(
+        f"per-file write over {results['n_files']} files:"
+        f"  mean={results['mean_ms']:.2f} ms"
+        f"  median={results['median_ms']:.2f} ms"
+        f"  p95={results['p95_ms']:.2f} ms"
+        f"  max={results['max_ms']:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Replay a DM job trace against the analysis machine scheduling policies.
+
+Each machine runs as many jobs at once as its slots (``ANALYSIS_MACHINES``)
+and queues the others; a job's run time is its trace duration divided by
+the machine's speed, which the scheduler does not know.  Finished jobs are reported
+to the scheduler ``--report-delay`` seconds late, as the DM job listing
+would be.  The turnaround (submit to done) of every policy is printed.
+
+The trace is a CSV file with ``submit`` and ``duration`` columns (seconds),
+such as exported from the DM job journal.  Without a trace, a synthetic one
+is used: bursts of repetitions with a random run time.
+
+Run it from the repository root, with ``src`` on the path::
+
+    export PYTHONPATH=src
+    python scripts/simulate_analysis_scheduler.py -m adamite=1:1.0 califone=2:0.7
+
+Several ``--seed`` values give several synthetic traces.
+"""
+
+import argparse
+import csv
+import heapq
+import random
+import statistics
+
+from id8_i.utils.analysis_scheduler import POLICIES
+from id8_i.utils.analysis_scheduler import AnalysisScheduler
+
+
+def synthetic_trace(n_series: int, seed: int = 0) -> list:
+    """Bursts of 3-20 repetitions, 10-60 s apart, run times of 30-300 s."""
+    rng = random.Random(seed)
+    trace, t = [], 0.0
+    for _ in range(n_series):
+        duration = rng.uniform(30, 300)
+        for _ in range(rng.randint(3, 20)):
+            trace.append((t, duration * rng.uniform(0.8, 1.2)))
+            t += rng.uniform(10, 60)
+        t += rng.uniform(60, 900)
+    return trace
+
+
+def read_trace(path: str) -> list:
+    """(submit, duration) rows of a CSV trace, in submit order."""
+    with open(path, newline="") as f:
+        rows = [(float(r["submit"]), float(r["duration"])) for r in csv.DictReader(f)]
+    return sorted(rows)
+
+
+def simulate(trace: list, machines: dict, policy: str, report_delay: float) -> dict:
+    """Run one policy over the trace, return the turnaround statistics (s)."""
+    clock = [0.0]
+    scheduler = AnalysisScheduler(
+        {name: slots for name, (slots, _) in machines.items()},
+        policy=policy,
+        clock=lambda: clock[0],
+    )
+    free_at = {name: [0.0] * slots for name, (slots, _) in machines.items()}
+    reports = []  # heap of (report time, key, run time), as listed by DM
+    turnaround = []
+    for n, (submit, duration) in enumerate(trace):
+        while reports and reports[0][0] <= submit:
+            t_report, key, run_time = heapq.heappop(reports)
+            clock[0] = t_report
+            scheduler.complete(key, duration=run_time)
+        clock[0] = submit
+        key = f"job{n}"
+        name = scheduler.choose(key)
+        run_time = duration / machines[name][1]
+        free = free_at[name]
+        start = max(submit, heapq.heappop(free))
+        end = start + run_time
+        heapq.heappush(free, end)
+        heapq.heappush(reports, (end + report_delay, key, run_time))
+        turnaround.append(end - submit)
+
+    turnaround.sort()
+    return {
+        "policy": policy,
+        "jobs": len(turnaround),
+        "mean_s": statistics.mean(turnaround),
+        "p95_s": turnaround[int(0.95 * (len(turnaround) - 1))],
+        "max_s": turnaround[-1],
+        "assigned": {name: m.assigned for name, m in scheduler.machines.items()},
+    }
+
+
+def parse_machine(text: str) -> tuple:
+    """'name=slots:speed' -> (name, (slots, speed))."""
+    name, _, spec = text.partition("=")
+    slots, _, speed = spec.partition(":")
+    return name, (max(int(slots or 1), 1), float(speed or 1))
+
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "-t", "--trace", default=None, help="CSV with submit,duration columns"
+    )
+    parser.add_argument(
+        "-m",
+        "--machines",
+        nargs="+",
+        default=["adamite=1:1", "califone=2:1"],
+        help="name=slots:speed",
+    )
+    parser.add_argument(
+        "-n", "--n-series", type=int, default=40, help="series in the synthetic trace"
+    )
+    parser.add_argument("--report-delay", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = read_trace(args.trace)
+    else:
+        trace = synthetic_trace(args.n_series, args.seed)
+    machines = dict(parse_machine(m) for m in args.machines)
+    for policy in POLICIES:
+        r = simulate(trace, machines, policy, args.report_delay)
+        print(
+            f"{r['policy']:>13s}: {r['jobs']} jobs,"
+            f" turnaround mean {r['mean_s']:8.1f} s"
+            f"  p95 {r['p95_s']:8.1f} s  max {r['max_s']:8.1f} s  {r['assigned']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
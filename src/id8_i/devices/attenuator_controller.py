@@ -0,0 +1,243 @@
+"""
+Move the A-V-S filters once, and only when needed.
+
+:class:`AttenuatorController` wraps an ``AVSfilters`` device and keeps
+Channel Access monitors on ``filterBusy``, the attenuation, transmission
+and sorted-index readbacks, the ``inMask``/``outMask`` configuration, and
+the IOC's lookup of the attenuation and transmission of every sorted
+index.  With those:
+
+* a request for the attenuation the filters are already at finishes at
+  once, nothing is written;
+* otherwise the setpoint is written once and the move is finished when
+  ``filterBusy`` has dropped *and* the attenuation readback is at the
+  request.  If the busy flag drops and the readback stays elsewhere, the
+  write is repeated (``retries`` times) before the move fails;
+* the table attenuation -> (sorted index, transmission) is the IOC's
+  lookup, loaded again whenever the IOC updates it (masks or energy
+  changed).  An IOC without the lookup records leaves the table to the
+  settled readbacks, emptied when the in/out masks change.
+
+It is a movable: ``bps.mv(controller, level)``.
+
+.. autosummary::
+
+    ~AttenuatorController
+"""
+
+import logging
+import threading
+import time
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+from ophyd import Device
+from ophyd.status import DeviceStatus
+
+logger = logging.getLogger(__name__)
+
+READBACK_GRACE = 0.5  # s for the readback monitor to follow the drop of filterBusy
+
+
+class AttenuatorController(Device):
+    """Verified, no-op-skipping attenuation moves of an AVSfilters device."""
+
+    def __init__(
+        self,
+        filters: Any,
+        *,
+        tolerance: float = 0.5,
+        timeout: float = 10.0,
+        retries: int = 1,
+        name: Optional[str] = None,
+    ):
+        """Watch ``filters``.
+
+        Args:
+            filters: AVSfilters device
+            tolerance: Largest difference between readback and request
+            timeout: Seconds for one write to settle
+            retries: Writes repeated when the readback misses the request
+            name: Device name (default: ``<filters>_controller``)
+        """
+        super().__init__(name=name or f"{filters.name}_controller")
+        self.filters = filters
+        self.tolerance = float(tolerance)
+        self.timeout = float(timeout)
+        self.retries = int(retries)
+
+        self._changed = threading.Condition()
+        self._busy: Optional[bool] = None
+        self._busy_seen = False  # filterBusy went up since the last write
+        self._moving = False  # readbacks may be out of step until the move is verified
+        self._attenuation: Optional[float] = None
+        self._transmission: Optional[float] = None
+        self._index: Optional[int] = None
+        self._masks: Dict[str, Any] = {}
+        self._table: Dict[float, Tuple[Optional[int], Optional[float]]] = {}
+        self._lookup: Dict[str, Any] = {}  # waveforms of the IOC lookup
+        self._from_ioc = False  # the table is the IOC lookup
+        self.moves = 0
+        self.skipped = 0
+        self.rewrites = 0
+
+        self._watch(filters.attenuation.done, "_busy", bool)
+        self._watch(filters.attenuation.readback, "_attenuation", float)
+        self._watch(filters.transmission.readback, "_transmission", float)
+        self._watch(filters.index.readback, "_index", int)
+        for signal in (filters.inMask_config, filters.outMask_config):
+            signal.subscribe(self._on_mask, run=True)
+        for attr in ("sorted_attenuations", "sorted_transmissions"):
+            signal = getattr(filters, attr, None)
+            if signal is not None:
+                signal.subscribe(self._on_lookup, run=True)
+
+    def _watch(self, signal: Any, attr: str, cast: Any):
+        def on_value(value=None, **kwargs):
+            if value is None:
+                return
+            with self._changed:
+                setattr(self, attr, cast(value))
+                if attr == "_busy" and self._busy:
+                    self._busy_seen = True
+                self._remember()
+                self._changed.notify_all()
+
+        signal.subscribe(on_value, run=True)
+
+    def _on_mask(self, value=None, obj=None, **kwargs):
+        with self._changed:
+            key = obj.name if obj is not None else "mask"
+            if key in self._masks and self._masks[key] != value and not self._from_ioc:
+                logger.info(
+                    "%s: filter masks changed, transmission table cleared", self.name
+                )
+                self._table.clear()
+            self._masks[key] = value
+
+    def _on_lookup(self, value=None, obj=None, **kwargs):
+        if value is None or obj is None:
+            return
+        with self._changed:
+            self._lookup[obj.attr_name] = list(value)
+            attenuations = self._lookup.get("sorted_attenuations")
+            transmissions = self._lookup.get("sorted_transmissions")
+            if attenuations is None or transmissions is None:
+                return
+            if len(attenuations) != len(transmissions):
+                return  # one waveform updated, the other one follows
+            table = {}
+            for index, (attenuation, transmission) in enumerate(
+                zip(attenuations, transmissions, strict=True)
+            ):
+                table.setdefault(float(attenuation), (index, float(transmission)))
+            self._table = table
+            self._from_ioc = True
+
+    def _remember(self):
+        """Record the settled state in the table (call with the lock held)."""
+        if self._from_ioc:
+            return
+        if not self._moving and self._busy is False and self._attenuation is not None:
+            self._table[self._attenuation] = (self._index, self._transmission)
+
+    def _at(self, level: float) -> bool:
+        return (
+            self._busy is False
+            and self._attenuation is not None
+            and abs(self._attenuation - level) <= self.tolerance
+        )
+
+    @property
+    def position(self) -> Optional[float]:
+        """Attenuation readback (from the monitor)."""
+        return self._attenuation
+
+    @property
+    def table(self) -> Dict[float, Tuple[Optional[int], Optional[float]]]:
+        """Attenuation -> (sorted index, transmission), from the IOC lookup.
+
+        Without the lookup records: the settled attenuations seen so far.
+        """
+        with self._changed:
+            return dict(self._table)
+
+    def transmission(self, level: float) -> Optional[float]:
+        """Transmission at ``level``, None if the table does not have it."""
+        with self._changed:
+            for attenuation, (_, transmission) in self._table.items():
+                if abs(attenuation - level) <= self.tolerance:
+                    return transmission
+        return None
+
+    def set(self, level: float) -> DeviceStatus:
+        """Move to ``level``; the status finishes once the readback is verified."""
+        level = float(level)
+        status = DeviceStatus(self)
+        with self._changed:
+            if self._at(level):
+                self.skipped += 1
+                status.set_finished()
+                return status
+            self._moving = True
+        self.moves += 1
+        threading.Thread(target=self._move, args=(level, status), daemon=True).start()
+        return status
+
+    def _write_and_settle(self, level: float) -> bool:
+        """One write; True when filterBusy dropped with the readback at ``level``."""
+        with self._changed:
+            self._busy_seen = False
+        self.filters.attenuation.setpoint.put(level)
+        deadline = time.monotonic() + self.timeout
+        dropped = None
+        with self._changed:
+            while True:
+                if self._at(level):
+                    return True
+                now = time.monotonic()
+                if self._busy_seen and self._busy is False:
+                    dropped = dropped or now
+                    if now - dropped > READBACK_GRACE:
+                        return False
+                if now > deadline:
+                    return False
+                self._changed.wait(0.05)
+
+    def _move(self, level: float, status: DeviceStatus):
+        try:
+            for attempt in range(self.retries + 1):
+                if self._write_and_settle(level):
+                    with self._changed:
+                        self._moving = False
+                        self._remember()
+                    status.set_finished()
+                    return
+                if attempt < self.retries:
+                    self.rewrites += 1
+                    logger.warning(
+                        "%s: readback %s after writing %s, writing again",
+                        self.name,
+                        self._attenuation,
+                        level,
+                    )
+            raise RuntimeError(
+                f"{self.name}: attenuation readback {self._attenuation}"
+                f" (busy={self._busy})"
+                f" after {self.retries + 1} writes of {level}"
+            )
+        except Exception as exc:
+            with self._changed:
+                self._moving = False
+            status.set_exception(exc)
+
+    def summary(self) -> str:
+        """One line for the console."""
+        return (
+            f"{self.name}: {self.moves} moves, {self.skipped} skipped,"
+            f" {self.rewrites} rewrites,"
+            f" {len(self._table)} attenuations in the table"
+            + (" (IOC lookup)" if self._from_ioc else "")
+        )
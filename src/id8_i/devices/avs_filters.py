@@ -70,3 +70,10 @@ class AVSfilters(Device):
     rbv_crl1_config = Cpt(EpicsSignalRO, "filterConfig_RBV", kind="hinted")
     inMask_config = Cpt(EpicsSignalRO, "inMask_RBV", kind="config")
     outMask_config = Cpt(EpicsSignalRO, "outMask_RBV", kind="config")
+    # Lookup of the IOC, one element per sortedIndex (current masks and energy)
+    sorted_attenuations = Cpt(
+        EpicsSignalRO, "sortedAttenuations_RBV", kind="omitted", lazy=True
+    )
+    sorted_transmissions = Cpt(
+        EpicsSignalRO, "sortedTransmissions_RBV", kind="omitted", lazy=True
+    )
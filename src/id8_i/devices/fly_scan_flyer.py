@@ -0,0 +1,464 @@
+"""
+Fly scan with the sample position latched at every detector frame.
+
+The SoftGlue FPGA generates the frame triggers.  Each trigger also
+advances the channel of the MeasComp multichannel scaler (MCS), which
+keeps the time each channel closed (``AbsTimeWF``) and, if wired, counts
+the encoder pulses of the fly axis per channel.  After the scan, these
+give the time and the position of the stage at each trigger, so every
+frame is tied to where the sample was, however much the motor lagged.
+
+Wiring (``FLY_SCAN`` in iconfig.yml): the MCS input channel counting the
+encoder and its counts per mm.  Without an encoder channel, the positions
+follow from the latched trigger times and the commanded velocity.
+
+The pulses are started on a timer, ``trigger_delay`` seconds after the
+motion (acceleration and settling), not gated on the encoder or a
+position compare.  The motor readback when they start is recorded
+(``FrameTrace.start_readback``); only an encoder tells where each frame
+really was.
+
+The MCS has ``MaxChannels`` channels (2048): longer scans advance the
+channel every ``prescale`` triggers and the frames in between are
+interpolated.  Channel ``k`` closes at trigger ``(k + 1) * prescale - 1``
+(counting from 0): channel 0 holds the run-up and the first
+``prescale - 1`` frames.
+
+.. autosummary::
+
+    ~FlyScanGeometry
+    ~FrameTrace
+    ~frame_positions
+    ~FlyScanFlyer
+"""
+
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+from typing import Dict
+from typing import Optional
+
+import numpy as np
+from ophyd import Device
+from ophyd.flyers import FlyerInterface
+from ophyd.status import DeviceStatus
+from ophyd.status import Status
+
+logger = logging.getLogger(__name__)
+
+# SoftGlue pulses after the last frame, in case it started before the detector
+EXTRA_PULSES = 10
+RUNUP_SETTLE = 0.1  # seconds at constant velocity before the first trigger
+DEFAULT_MAX_CHANNELS = 2048
+PUT_TIMEOUT = 5  # seconds for the MCS to process a command
+
+
+def _put_and_wait(signal: Any, value: Any, timeout: float = PUT_TIMEOUT):
+    """Write with put-callback and wait until the record processed."""
+    done = threading.Event()
+    signal.put(value, use_complete=True, callback=lambda *args, **kwargs: done.set())
+    if not done.wait(timeout):
+        raise TimeoutError(f"{signal.name}: no put callback within {timeout} s")
+
+
+@dataclass(frozen=True)
+class FlyScanGeometry:
+    """Motion and triggers of one fly scan."""
+
+    motor_name: str
+    start: float  # position at the first trigger
+    stop: float  # position at the end of the last frame
+    num_frames: int
+    period: float  # seconds between triggers
+    acq_time: float  # exposure of each frame
+    velocity: float  # always positive
+    accel_time: float
+    prescale: int  # triggers per MCS channel
+
+    @property
+    def direction(self) -> int:
+        """+1 or -1."""
+        return 1 if self.stop >= self.start else -1
+
+    @property
+    def runup(self) -> float:
+        """Distance covered before the first trigger (acceleration and settling)."""
+        return self.velocity * (self.accel_time / 2 + RUNUP_SETTLE)
+
+    @property
+    def runup_start(self) -> float:
+        """Where the motor starts."""
+        return self.start - self.direction * self.runup
+
+    @property
+    def runout_stop(self) -> float:
+        """Where the motor stops, after the extra pulses and the deceleration."""
+        extra = self.velocity * EXTRA_PULSES * self.period
+        return self.stop + self.direction * (extra + self.runup)
+
+    @property
+    def trigger_delay(self) -> float:
+        """Seconds from the start of the motion to the first trigger."""
+        return self.accel_time + RUNUP_SETTLE
+
+    def summary(self) -> Dict[str, Any]:
+        """Run metadata."""
+        return dict(
+            motor=self.motor_name,
+            start=self.start,
+            stop=self.stop,
+            num_frames=self.num_frames,
+            period=self.period,
+            velocity=self.velocity,
+            prescale=self.prescale,
+        )
+
+
+@dataclass
+class FrameTrace:
+    """Time and position of every frame of a fly scan."""
+
+    times: np.ndarray  # s from the first trigger
+    positions: np.ndarray  # position at each trigger (frame start)
+    commanded: np.ndarray  # position the commanded profile gives at the same times
+    encoder: bool  # positions measured by the encoder (else: commanded)
+    start_readback: Optional[float] = None  # motor readback when the pulses started
+
+    @property
+    def lag(self) -> np.ndarray:
+        """Measured minus commanded position."""
+        return self.positions - self.commanded
+
+    @property
+    def max_lag(self) -> float:
+        """Largest lag of the motor behind (or ahead of) its profile."""
+        return float(np.max(np.abs(self.lag))) if len(self.lag) else 0.0
+
+
+def _running(values: Any, n_channels: int) -> np.ndarray:
+    """Running sum of the first channels of a waveform."""
+    return np.cumsum(np.asarray(values, dtype=float)[:n_channels])
+
+
+def _at_triggers(edges: np.ndarray, values: np.ndarray, num_frames: int) -> np.ndarray:
+    """Interpolate values latched at ``edges`` (trigger numbers) at every trigger.
+
+    The triggers before the first edge and after the last one are
+    extrapolated.
+    """
+    triggers = np.arange(num_frames, dtype=float)
+    result = np.interp(triggers, edges, values)
+    if len(edges) > 1:
+        slope = (values[1] - values[0]) / (edges[1] - edges[0])
+        head = triggers < edges[0]
+        result[head] = values[0] - slope * (edges[0] - triggers[head])
+        slope = (values[-1] - values[-2]) / (edges[-1] - edges[-2])
+        tail = triggers > edges[-1]
+        result[tail] = values[-1] + slope * (triggers[tail] - edges[-1])
+    return result
+
+
+def frame_positions(
+    geometry: FlyScanGeometry,
+    abs_times: Any,
+    encoder: Any = None,
+    counts_per_unit: Optional[float] = None,
+    origin: Optional[float] = None,
+    closed: Optional[int] = None,
+) -> FrameTrace:
+    """Time and position of every trigger from the MCS waveforms.
+
+    Args:
+        geometry: The scan
+        abs_times: Waveform of the time (s) each channel closed (``AbsTimeWF``)
+        encoder: Waveform of encoder counts per channel (None: no encoder)
+        counts_per_unit: Encoder counts per motor unit
+        origin: Motor position when the MCS started (the run-up start)
+        closed: Channels the MCS closed (``CurrentChannel``), None: all used
+
+    Raises:
+        ValueError: If the MCS closed fewer than two channels
+    """
+    n_channels = math.ceil(geometry.num_frames / geometry.prescale) + 1
+    if closed is not None:
+        n_channels = min(n_channels, int(closed))
+    seconds = np.asarray(abs_times, dtype=float)[:n_channels]
+    if len(seconds) < 2:
+        raise ValueError("The MCS closed fewer than two channels")
+    # channel k closes at trigger (k + 1) * prescale - 1
+    edges = (np.arange(len(seconds), dtype=float) + 1) * geometry.prescale - 1
+    times = _at_triggers(edges, seconds, geometry.num_frames)
+    times -= times[0]
+    commanded = geometry.start + geometry.direction * geometry.velocity * times
+    if encoder is None or counts_per_unit is None:
+        return FrameTrace(times, commanded.copy(), commanded, encoder=False)
+    origin = geometry.runup_start if origin is None else origin
+    travel = _running(encoder, len(seconds)) / counts_per_unit
+    positions = origin + geometry.direction * _at_triggers(
+        edges[: len(travel)], travel, geometry.num_frames
+    )
+    return FrameTrace(times, positions, commanded, encoder=True)
+
+
+class FlyScanFlyer(FlyerInterface, Device):
+    """Fly a motor at constant velocity, trigger frames, latch positions with the MCS.
+
+    Usage in a plan::
+
+        geometry = flyer.prepare(sample.y, start, stop, num_frames, period)
+        yield from bps.mv(sample.y, geometry.runup_start)
+        # arm the detector for external triggers, then
+        yield from bps.kickoff(flyer, wait=True)
+        yield from bps.complete(flyer, wait=True)
+        yield from bps.collect(flyer)
+    """
+
+    def __init__(
+        self,
+        mcs: Any,
+        softglue: Any,
+        *,
+        encoder_channel: Optional[int] = None,
+        counts_per_unit: Optional[float] = None,
+        name: str = "fly_scan",
+        **kwargs,
+    ):
+        """Create the flyer around an MCS and a SoftGlue.
+
+        Args:
+            mcs: ``MeasCompCtrMcs``
+            softglue: ``SoftGlue`` that generates the triggers
+            encoder_channel: MCS channel (1-8) counting the encoder, None if not wired
+            counts_per_unit: Encoder counts per motor unit (mm)
+            name: Name of the flyer and prefix of its data keys
+        """
+        super().__init__("", name=name, **kwargs)
+        self.mcs = mcs
+        self.softglue = softglue
+        self.encoder_channel = encoder_channel
+        self.counts_per_unit = counts_per_unit
+        self.geometry: Optional[FlyScanGeometry] = None
+        self.trace: Optional[FrameTrace] = None
+        self._motor = None
+        self._velocity = None  # of the motor before the scan, restored after it
+        self._origin = None
+        self._move_status = None
+        self._timer = None
+        self._t_kickoff = None
+        self._start_readback = None
+
+    def _max_channels(self) -> int:
+        try:
+            return int(self.mcs.max_channels.get()) or DEFAULT_MAX_CHANNELS
+        except Exception:
+            return DEFAULT_MAX_CHANNELS
+
+    def prepare(
+        self,
+        motor: Any,
+        start: float,
+        stop: float,
+        num_frames: int,
+        period: float,
+        acq_time: Optional[float] = None,
+    ) -> FlyScanGeometry:
+        """Plan the next scan: frames from ``start`` to ``stop`` every ``period`` s.
+
+        Move the motor to ``geometry.runup_start`` before the kickoff.
+        """
+        if num_frames < 1 or period <= 0:
+            raise ValueError("num_frames must be at least 1 and period positive")
+        # One channel for the run-up, the rest for the triggers.
+        prescale = max(math.ceil(num_frames / (self._max_channels() - 2)), 1)
+        self.geometry = FlyScanGeometry(
+            motor_name=motor.name,
+            start=float(start),
+            stop=float(stop),
+            num_frames=int(num_frames),
+            period=float(period),
+            acq_time=float(period if acq_time is None else acq_time),
+            velocity=abs(float(stop) - float(start)) / (num_frames * period),
+            accel_time=float(motor.acceleration.get()),
+            prescale=prescale,
+        )
+        self._motor = motor
+        self.trace = None
+        return self.geometry
+
+    def _channel(self, channel: int):
+        return getattr(self.mcs, f"mca{channel}")
+
+    def kickoff(self) -> Status:
+        """Start the MCS and the motion, the status finishes at the first trigger.
+
+        The pulses start ``trigger_delay`` s after the motion (time-based);
+        the motor readback at that moment is kept as ``start_readback``.
+        """
+        if self.geometry is None:
+            raise RuntimeError(f"{self.name}: call prepare() before kickoff()")
+        g = self.geometry
+        status = DeviceStatus(self)
+        self.softglue.acq_time.put(g.acq_time)
+        self.softglue.acq_period.put(g.period)
+        self.softglue.num_triggers.put(g.num_frames + EXTRA_PULSES)
+
+        self.mcs.stop_all.put(1)
+        self.mcs.channel_advance.put("External")
+        self.mcs.prescale.put(g.prescale)
+        self.mcs.n_use_all.put(math.ceil(g.num_frames / g.prescale) + 1)
+        self._origin = float(self._motor.position)
+        self._start_readback = None
+        self.mcs.erase_start.put(1)
+
+        self._velocity = self._motor.velocity.get()
+        if g.velocity > 0:
+            self._motor.velocity.put(g.velocity)
+        self._t_kickoff = time.monotonic()
+        self._move_status = self._motor.set(g.runout_stop)
+
+        def start_pulses():
+            try:
+                self.softglue.start_pulses.put("1!")
+                self._start_readback = float(self._motor.position)
+            except Exception as exc:
+                status.set_exception(exc)
+            else:
+                status.set_finished()
+
+        self._timer = threading.Timer(g.trigger_delay, start_pulses)
+        self._timer.start()
+        return status
+
+    def complete(self) -> Status:
+        """Status that finishes once the motion ended and the MCS was read."""
+        if self._move_status is None:
+            raise RuntimeError(f"{self.name}: complete() before kickoff()")
+        status = DeviceStatus(self)
+
+        def finished(move_status):
+            try:
+                self._finish()
+                if not move_status.success:
+                    raise RuntimeError(
+                        f"{self.name}: motion of {self._motor.name} failed"
+                    )
+            except Exception as exc:
+                status.set_exception(exc)
+            else:
+                status.set_finished()
+
+        self._move_status.add_callback(finished)
+        return status
+
+    def _finish(self):
+        """Stop the pulses and the MCS, restore the motor velocity, read the data."""
+        self.softglue.stop_pulses.put("1!")
+        self.mcs.stop_all.put(1)
+        if self._velocity is not None:
+            self._motor.velocity.put(self._velocity)
+            self._velocity = None
+        # The waveforms are only complete once the read-all has processed.
+        _put_and_wait(self.mcs.do_read_all, 1)
+        encoder = None
+        if self.encoder_channel is not None:
+            encoder = self._channel(self.encoder_channel).get()
+        self.trace = frame_positions(
+            self.geometry,
+            self.mcs.absolute_timebase_waveform.get(),
+            encoder,
+            counts_per_unit=self.counts_per_unit,
+            origin=self._origin,
+            closed=self.mcs.current_channel.get(),
+        )
+        self.trace.start_readback = self._start_readback
+        lag_limit = self.geometry.velocity * self.geometry.period / 2
+        if (
+            self._start_readback is not None
+            and abs(self._start_readback - self.geometry.start) > lag_limit
+        ):
+            logger.warning(
+                "%s: pulses started at %.4g, the first frame is at %.4g"
+                " (the start is timed, not gated on the position)",
+                self._motor.name,
+                self._start_readback,
+                self.geometry.start,
+            )
+        if self.trace.encoder and self.trace.max_lag > lag_limit:
+            logger.warning(
+                "%s lagged up to %.4g behind its profile (half a frame is %.4g)",
+                self._motor.name,
+                self.trace.max_lag,
+                lag_limit,
+            )
+
+    def stop(self, *, success: bool = False):
+        """Abort: stop the pulses, the MCS and the motor, restore the velocity."""
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._motor is None:
+            return
+        for action in (
+            lambda: self.softglue.stop_pulses.put("1!"),
+            lambda: self.mcs.stop_all.put(1),
+            lambda: self._motor.stop(success=success),
+        ):
+            try:
+                action()
+            except Exception as exc:
+                logger.warning("%s: stop failed: %s", self.name, exc)
+        if self._velocity is not None:
+            self._motor.velocity.put(self._velocity)
+            self._velocity = None
+
+    def describe_collect(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """One event holding the arrays of the scan."""
+        n = self.geometry.num_frames if self.geometry is not None else 0
+        source = f"{self.name}:mcs"
+
+        def key(units, shape=(n,)):
+            dtype = "array" if shape else "number"
+            return dict(source=source, dtype=dtype, shape=list(shape), units=units)
+
+        return {
+            self.name: {
+                f"{self.name}_time": key("s"),
+                f"{self.name}_position": key("mm"),
+                f"{self.name}_lag": key("mm"),
+                f"{self.name}_start_readback": key("mm", shape=()),
+            }
+        }
+
+    def collect(self):
+        """Yield the event of the last scan (compact: one array per key)."""
+        if self.trace is None:
+            return
+        now = time.time()
+        data = {
+            f"{self.name}_time": self.trace.times,
+            f"{self.name}_position": self.trace.positions,
+            f"{self.name}_lag": self.trace.lag,
+            f"{self.name}_start_readback": self.trace.start_readback,
+        }
+        yield dict(time=now, data=data, timestamps={k: now for k in data})
+
+    def nexus_metadata(self) -> Dict[str, Any]:
+        """Fly scan fields of the NeXus metadata file (lengths in m).
+
+        Only for a detector gated by the SoftGlue pulses: the positions are
+        those of its frames.
+        """
+        if self.trace is None:
+            return {}
+        fields = {
+            "/entry/sample/fly_scan/axis": self.geometry.motor_name,
+            "/entry/sample/fly_scan/position": self.trace.positions / 1000.0,
+            "/entry/sample/fly_scan/frame_time": self.trace.times,
+            "/entry/sample/fly_scan/position_lag": self.trace.lag / 1000.0,
+        }
+        if self.trace.start_readback is not None:
+            start = self.trace.start_readback / 1000.0
+            fields["/entry/sample/fly_scan/start_readback"] = start
+        return fields
@@ -0,0 +1,418 @@
+"""
+Stream the MeasComp MCS channels for acquisitions longer than its memory.
+
+The MCS holds ``MaxChannels`` (2048) channels per input.  :class:`McsStream`
+reads them while the MCS is counting: a background thread polls
+``CurrentChannel``, asks the driver for the waveforms (``DoReadAll``), and
+copies the channels that closed since the last poll into preallocated
+numpy ring buffers (slice copies, no per-channel Python work).  Before the
+memory is full, the MCS is stopped and restarted (``EraseStart``), a new
+*chunk*.  The channel that was still open at the stop is carried over into
+the first channel of the next chunk, so each sample stays one channel
+advance (e.g. one detector frame) long; the advances that arrive while the
+MCS restarts are not counted, and :attr:`McsStream.gaps` says where that
+happened and for how long.
+
+The poll thread must read the channels before the MCS fills: with
+``External`` channel advance, :meth:`McsStream.prepare` derives the
+prescale (frame triggers per channel) from the frame rate and the poll
+period so that at most ``MAX_FILL_PER_POLL`` of the channels close between
+two polls, and raises ValueError if a configured prescale (or, with
+``Internal`` advance, the dwell time) cannot keep up.
+
+The timebase channel counts an internal clock, so the time of every sample
+follows from the running sum of its ticks.  After ``complete()``, the
+samples are collected as one event page per chunk-sized slice in the
+``mcs_stream`` stream: ``{name}_time``, ``{name}_chunk``, and one column
+per configured channel.
+
+.. autosummary::
+
+    ~RingBuffer
+    ~McsStream
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+from ophyd import Device
+from ophyd.status import DeviceStatus
+from ophyd.status import Status
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = 1 << 20  # samples kept per channel
+DEFAULT_MAX_CHANNELS = 2048
+MIN_HEADROOM = 16  # channels left free when a chunk is restarted
+MAX_FILL_PER_POLL = 0.25  # of the channels, closed between two polls at most
+PUT_TIMEOUT = 5  # seconds for the MCS to process a command
+
+
+def prescale_for(rate: float, poll_period: float, max_channels: int) -> int:
+    """Fewest advances per channel that close at most ``MAX_FILL_PER_POLL`` per poll.
+
+    Args:
+        rate: Channel advances (frame triggers) per second
+        poll_period: Seconds between two reads
+        max_channels: Channels of the MCS
+    """
+    per_poll = rate * poll_period
+    return max(math.ceil(per_poll / (MAX_FILL_PER_POLL * max_channels)), 1)
+
+
+def _put_and_wait(signal: Any, value: Any, timeout: float = PUT_TIMEOUT):
+    """Write with put-callback and wait until the record processed."""
+    done = threading.Event()
+    signal.put(value, use_complete=True, callback=lambda *args, **kwargs: done.set())
+    if not done.wait(timeout):
+        raise TimeoutError(f"{signal.name}: no put callback within {timeout} s")
+
+
+class RingBuffer:
+    """Fixed-size FIFO of numbers, the oldest values are overwritten when full."""
+
+    def __init__(self, capacity: int, dtype: Any = np.float64):
+        """Room for ``capacity`` values of ``dtype``."""
+        self._data = np.zeros(int(capacity), dtype=dtype)
+        self.written = 0  # values ever appended
+
+    @property
+    def capacity(self) -> int:
+        """Values kept at most."""
+        return len(self._data)
+
+    @property
+    def dropped(self) -> int:
+        """Values overwritten because the buffer was full."""
+        return max(self.written - self.capacity, 0)
+
+    def __len__(self) -> int:
+        """Values kept."""
+        return min(self.written, self.capacity)
+
+    def extend(self, values: Any):
+        """Append values (at most two slice copies)."""
+        values = np.asarray(values, dtype=self._data.dtype)
+        skipped = max(len(values) - self.capacity, 0)
+        values = values[skipped:]
+        self.written += skipped
+        start = self.written % self.capacity
+        first = min(len(values), self.capacity - start)
+        self._data[start : start + first] = values[:first]
+        self._data[: len(values) - first] = values[first:]
+        self.written += len(values)
+
+    def segments(self) -> List[np.ndarray]:
+        """Views of the content, oldest first (one or two arrays, no copy)."""
+        if self.written <= self.capacity:
+            return [self._data[: self.written]]
+        start = self.written % self.capacity
+        return [view for view in (self._data[start:], self._data[:start]) if len(view)]
+
+    def array(self) -> np.ndarray:
+        """Copy of the content, oldest first."""
+        return np.concatenate(self.segments())
+
+
+class McsStream(Device):
+    """Read the MCS channels while it counts, beyond its 2048 channels.
+
+    Follows the bluesky flyer protocol: ``kickoff()``, ``complete()``,
+    ``describe_collect()`` and ``collect_pages()``.
+    """
+
+    def __init__(
+        self,
+        mcs: Any,
+        channels: Dict[int, str],
+        *,
+        timebase_channel: int = 1,
+        timebase_hz: float = 1e7,
+        channel_advance: str = "External",
+        prescale: Optional[int] = None,
+        poll_period: float = 0.05,
+        capacity: int = DEFAULT_CAPACITY,
+        name: str = "mcs_stream",
+        **kwargs,
+    ):
+        """Create the stream around an MCS.
+
+        Args:
+            mcs: ``MeasCompCtrMcs``
+            channels: MCS channel (1-8) -> name of its column
+            timebase_channel: MCS channel (1-8) counting the timebase
+            timebase_hz: Frequency of the timebase
+            channel_advance: "External" (one channel per trigger) or "Internal"
+                (one per dwell time)
+            prescale: External advances per channel, None: derived from the
+                rate given to :meth:`prepare`
+            poll_period: Seconds between two reads while counting
+            capacity: Samples kept per channel (the oldest are dropped)
+            name: Name of the stream and prefix of its data keys
+        """
+        super().__init__("", name=name, **kwargs)
+        self.mcs = mcs
+        self.channels = dict(channels)
+        self.timebase_channel = timebase_channel
+        self.timebase_hz = timebase_hz
+        self.channel_advance = channel_advance
+        self.prescale = prescale
+        self.poll_period = poll_period
+        self.capacity = capacity
+        self._prescale: Optional[int] = None  # of the next kickoff, see prepare()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._reset()
+
+    def _reset(self):
+        """Empty buffers, before a kickoff."""
+        # s from the kickoff to the end of each sample
+        self.times = RingBuffer(self.capacity)
+        self.chunks = RingBuffer(self.capacity, np.int32)
+        self.counts = {ch: RingBuffer(self.capacity, np.int64) for ch in self.channels}
+        # (sample, seconds not counted) at each restart
+        self.gaps: List[Tuple[int, float]] = []
+        self._error: Optional[Exception] = None
+        self._chunk = 0
+        self._cursor = 0  # next channel of the current chunk to copy
+        self._clock = 0.0  # seconds from the kickoff to the end of the last sample
+        self._carry: Optional[Dict[int, int]] = None  # open channel at the last restart
+        self._advance = 0  # channels closed during the last poll
+        self._t_wall = None
+
+    @property
+    def _read_channels(self) -> List[int]:
+        return sorted(set(self.channels) | {self.timebase_channel})
+
+    def _max_channels(self) -> int:
+        try:
+            return int(self.mcs.max_channels.get()) or DEFAULT_MAX_CHANNELS
+        except Exception:
+            return DEFAULT_MAX_CHANNELS
+
+    def _waveforms(self) -> Dict[int, np.ndarray]:
+        """Ask the driver for the channels, then read them (arrays, not copied)."""
+        _put_and_wait(self.mcs.do_read_all, 1)
+        return {
+            ch: np.asarray(getattr(self.mcs, f"mca{ch}").get())
+            for ch in self._read_channels
+        }
+
+    def _append(self, waveforms: Dict[int, np.ndarray], end: int):
+        """Copy the channels from the cursor to ``end`` of the current chunk."""
+        begin = self._cursor
+        if end <= begin:
+            return
+        block = {
+            ch: waveforms[ch][begin:end].astype(np.int64) for ch in self._read_channels
+        }
+        if self._carry is not None:
+            for ch, value in self._carry.items():
+                block[ch][0] += value
+            self._carry = None
+        times = self._clock + np.cumsum(block[self.timebase_channel]) / self.timebase_hz
+        self._clock = float(times[-1])
+        self.times.extend(times)
+        self.chunks.extend(np.full(end - begin, self._chunk, dtype=np.int32))
+        for ch, buffer in self.counts.items():
+            buffer.extend(block[ch])
+        self._cursor = end
+
+    def _poll_once(self):
+        """Copy the channels closed since the last poll."""
+        closed = int(self.mcs.current_channel.get())
+        if closed <= self._cursor:
+            return
+        if closed >= self._max_channels():
+            logger.warning(
+                "%s: the MCS memory filled up, later advances are lost", self.name
+            )
+        self._advance = closed - self._cursor
+        waveforms = self._waveforms()
+        self._append(waveforms, min(closed, *(len(w) for w in waveforms.values())))
+
+    def _restart(self):
+        """Stop the MCS, keep its open channel for the next chunk, and start again."""
+        _put_and_wait(self.mcs.stop_all, 1)
+        t_stop = time.monotonic()
+        closed = int(self.mcs.current_channel.get())
+        waveforms = self._waveforms()
+        self._append(waveforms, closed)
+        self._carry = {
+            ch: int(w[closed]) for ch, w in waveforms.items() if len(w) > closed
+        }
+        self.mcs.erase_start.put(1)
+        gap = time.monotonic() - t_stop
+        self._clock += gap
+        self.gaps.append((self.times.written, gap))
+        self._chunk += 1
+        self._cursor = 0
+
+    def _run(self):
+        """Poll thread: read, and restart the MCS before its memory is full."""
+        try:
+            while not self._stopping.wait(self.poll_period):
+                self._poll_once()
+                headroom = max(2 * self._advance, MIN_HEADROOM)
+                if self._cursor >= self._max_channels() - headroom:
+                    self._restart()
+        except Exception as exc:
+            self._error = exc
+            logger.error("%s: streaming stopped: %s", self.name, exc)
+
+    def prepare(self, rate: Optional[float] = None) -> int:
+        """Choose the prescale of the next kickoff, check the polls keep up.
+
+        Args:
+            rate: Frame triggers per second (``External`` advance); with
+                ``Internal`` advance the dwell time of the MCS gives it
+
+        Returns:
+            The prescale
+
+        Raises:
+            ValueError: If the MCS would fill faster than the polls read it
+        """
+        max_channels = self._max_channels()
+        if self.channel_advance == "Internal":
+            rate = 1.0 / float(self.mcs.dwell.get())
+            if prescale_for(rate, self.poll_period, max_channels) > 1:
+                raise ValueError(
+                    f"{self.name}: a dwell time of {1 / rate:g} s closes"
+                    f" {rate * self.poll_period:.0f} channels per"
+                    f" {self.poll_period:g} s poll, more than"
+                    f" {MAX_FILL_PER_POLL:.0%} of {max_channels}"
+                )
+            self._prescale = 1
+        elif rate is None:
+            self._prescale = self.prescale or 1
+        else:
+            needed = prescale_for(rate, self.poll_period, max_channels)
+            if self.prescale is not None and self.prescale < needed:
+                raise ValueError(
+                    f"{self.name}: prescale {self.prescale} at {rate:g} triggers/s"
+                    f" closes {rate * self.poll_period / self.prescale:.0f} channels"
+                    f" per {self.poll_period:g} s poll, more than"
+                    f" {MAX_FILL_PER_POLL:.0%} of {max_channels}: use a prescale"
+                    f" of at least {needed} or a shorter poll period"
+                )
+            self._prescale = needed if self.prescale is None else self.prescale
+        return self._prescale
+
+    def kickoff(self) -> Status:
+        """Start the MCS and the poll thread (with the prescale of prepare())."""
+        if self._prescale is None:
+            self.prepare()
+        self._reset()
+        _put_and_wait(self.mcs.stop_all, 1)
+        self.mcs.channel_advance.put(self.channel_advance)
+        self.mcs.prescale.put(self._prescale)
+        self.mcs.n_use_all.put(self._max_channels())
+        self.mcs.erase_start.put(1)
+        self._t_wall = time.time()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        status = Status(obj=self)
+        status.set_finished()
+        return status
+
+    def complete(self) -> Status:
+        """Status that finishes once the MCS stopped and every channel was copied."""
+        status = DeviceStatus(self)
+
+        def finish():
+            try:
+                self._stop_thread()
+                if self._error is not None:
+                    raise self._error
+                _put_and_wait(self.mcs.stop_all, 1)
+                closed = int(self.mcs.current_channel.get())
+                waveforms = self._waveforms()
+                end = min(closed, *(len(w) for w in waveforms.values()))
+                self._append(waveforms, end)
+                self._prescale = None  # the next kickoff is prepared again
+            except Exception as exc:
+                status.set_exception(exc)
+            else:
+                status.set_finished()
+
+        threading.Thread(target=finish, daemon=True).start()
+        return status
+
+    def _stop_thread(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stop(self, *, success: bool = False):
+        """Stop polling and counting."""
+        self._stop_thread()
+        self._prescale = None
+        try:
+            self.mcs.stop_all.put(1)
+        except Exception as exc:
+            logger.warning("%s: stop failed: %s", self.name, exc)
+
+    @property
+    def dropped(self) -> int:
+        """Samples no longer in the ring buffers."""
+        return self.times.dropped
+
+    def summary(self) -> str:
+        """Samples, chunks, and the time not counted."""
+        lost = sum(gap for _, gap in self.gaps)
+        text = (
+            f"{self.name}: {self.times.written} samples in {self._chunk + 1} chunks,"
+            f" {self._clock:.3f} s, {lost * 1e3:.1f} ms not counted at restarts"
+        )
+        if self.dropped:
+            text += (
+                f", {self.dropped} oldest samples dropped (capacity {self.capacity})"
+            )
+        return text
+
+    def describe_collect(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """One row per sample."""
+        source = f"{self.name}:mcs"
+        keys = {
+            f"{self.name}_time": dict(
+                source=source, dtype="number", shape=[], units="s"
+            ),
+            f"{self.name}_chunk": dict(source=source, dtype="integer", shape=[]),
+        }
+        for column in self.channels.values():
+            keys[f"{self.name}_{column}"] = dict(
+                source=source, dtype="integer", shape=[], units="counts"
+            )
+        return {self.name: keys}
+
+    def collect_pages(self) -> Iterator[Dict[str, Any]]:
+        """Event pages of at most ``MaxChannels`` rows, views of the ring buffers."""
+        if self._t_wall is None:
+            return
+        columns = {f"{self.name}_time": self.times, f"{self.name}_chunk": self.chunks}
+        for ch, column in self.channels.items():
+            columns[f"{self.name}_{column}"] = self.counts[ch]
+        step = self._max_channels()
+        segments = {key: buffer.segments() for key, buffer in columns.items()}
+        time_key = f"{self.name}_time"
+        for part in range(len(segments[time_key])):
+            n = len(segments[time_key][part])
+            for begin in range(0, n, step):
+                data = {
+                    key: parts[part][begin : begin + step]
+                    for key, parts in segments.items()
+                }
+                stamps = self._t_wall + data[time_key]
+                yield dict(data=data, timestamps={key: stamps for key in data})
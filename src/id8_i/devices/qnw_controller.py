@@ -0,0 +1,139 @@
+"""
+Confirmed writes of the QNW target temperature and ramp rate.
+
+The QNW plans used to write the ramp rate and the target three times,
+with a 2 s sleep after each write, in case one was lost.
+:class:`VerifiedWrite` writes a value once, with put completion: the
+write finishes when the IOC calls back and the record's own readback
+holds the value (``EpicsSignal.set`` of a ``put_complete`` signal).  The
+write is repeated only if that fails, at most ``retries`` times, and then
+the write fails.  The process temperature (``SH_RBV``) plays no part:
+``wait=True`` in the plans waits for it separately.
+
+The number of writes each value needed is counted and logged, so
+:meth:`QnwController.summary` shows whether retries happen at all.
+
+.. autosummary::
+
+    ~VerifiedWrite
+    ~QnwController
+"""
+
+import logging
+import threading
+from collections import Counter
+from typing import Any
+from typing import Optional
+
+from ophyd import Device
+from ophyd.status import DeviceStatus
+from ophyd.status import SubscriptionStatus
+
+logger = logging.getLogger(__name__)
+
+
+class VerifiedWrite(Device):
+    """Write a signal once with put completion, repeated only if the put fails."""
+
+    def __init__(
+        self,
+        command: Any,
+        *,
+        timeout: float = 5.0,
+        retries: int = 1,
+        name: Optional[str] = None,
+    ):
+        """Write ``command``.
+
+        Args:
+            command: Signal written (``put_complete=True``)
+            timeout: Seconds for the put to complete
+            retries: Writes repeated when it does not
+            name: Device name (default: the name of ``command``)
+        """
+        super().__init__(name=name or command.name)
+        self.command = command
+        self.timeout = float(timeout)
+        self.retries = int(retries)
+        self.writes_needed: Counter = Counter()  # writes a value needed -> how often
+        self.failed = 0
+
+    @property
+    def position(self) -> Optional[float]:
+        """Readback of the record written."""
+        return self.command.get()
+
+    def set(self, value: float) -> DeviceStatus:
+        """Write ``value``; finish when the put completed."""
+        status = DeviceStatus(self)
+        threading.Thread(
+            target=self._write, args=(float(value), status), daemon=True
+        ).start()
+        return status
+
+    def _write(self, value: float, status: DeviceStatus):
+        error = None
+        for writes in range(1, self.retries + 2):
+            try:
+                self.command.set(value, timeout=self.timeout).wait()
+            except Exception as exc:
+                error = exc
+                logger.warning(
+                    "%s: write %d of %s failed: %s", self.name, writes, value, exc
+                )
+                continue
+            self.writes_needed[writes] += 1
+            log = logger.warning if writes > 1 else logger.info
+            log("%s: %s written after %d write(s)", self.name, value, writes)
+            status.set_finished()
+            return
+        self.failed += 1
+        status.set_exception(
+            TimeoutError(
+                f"{self.name}: {self.retries + 1} writes of {value} failed: {error}"
+            )
+        )
+
+    def summary(self) -> str:
+        """One line for the console."""
+        counts = (
+            ", ".join(
+                f"{n} write(s): {k}x" for n, k in sorted(self.writes_needed.items())
+            )
+            or "none"
+        )
+        return f"{self.name}: {counts}; {self.failed} failed"
+
+
+class QnwController:
+    """Confirmed writes of the target and the ramp rate of a QnwDevice."""
+
+    def __init__(self, qnw: Any, *, timeout: float = 5.0, retries: int = 1):
+        """Watch ``qnw``.
+
+        Args:
+            qnw: QnwDevice
+            timeout: Seconds for the put of a value to complete
+            retries: Writes repeated when it does not
+        """
+        self.qnw = qnw
+        options = dict(timeout=timeout, retries=retries)
+        self.setpoint = VerifiedWrite(
+            qnw.setpoint, name=f"{qnw.name}_target", **options
+        )
+        self.ramprate = VerifiedWrite(qnw.ramprate, name=f"{qnw.name}_ramp", **options)
+
+    def temperature_reached(
+        self, target: float, timeout: Optional[float] = None
+    ) -> SubscriptionStatus:
+        """Status finishing when the temperature is within tolerance of ``target``."""
+        tolerance = float(self.qnw.tolerance.get())
+
+        def reached(*args, value=None, **kwargs):
+            return value is not None and abs(value - target) <= tolerance
+
+        return SubscriptionStatus(self.qnw.readback, reached, timeout=timeout)
+
+    def summary(self) -> str:
+        """Writes needed by each value."""
+        return f"{self.setpoint.summary()}\n{self.ramprate.summary()}"
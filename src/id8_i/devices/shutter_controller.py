@@ -0,0 +1,266 @@
+"""
+Shutter state, with timing and beam-on accounting.
+
+:class:`ShutterController` wraps the command signal of a shutter (the
+LabJack output of 8-ID-I, the ``FastShutter`` of 8-ID-E).  Their output
+records only echo the command, so by default it is write-only, as
+``EpicsSignalWO``: every command is written, a move finishes once
+written, and the state is the *commanded* one.  Given a readback that
+reports the shutter itself (a state input), it answers "is it open" from
+a CA monitor of that readback, writes only when the state must change,
+and finishes a move when the readback confirms it.  It records:
+
+* with a readback, the latency of each command until it was confirmed;
+* open-to-acquire and acquire-to-close: from the shutter open until the
+  detector starts, and from the detector done until the shutter closed
+  (the acquisition plans call :meth:`ShutterController.acquire_started`
+  and :meth:`ShutterController.acquire_ended`);
+* the beam-on intervals, from the IOC timestamps of the readback or, when
+  write-only, from the times of the commands; per run when subscribed to
+  the RunEngine (``RE.subscribe(controller)``).
+
+.. autosummary::
+
+    ~LatencyStats
+    ~ShutterController
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+from ophyd import Device
+from ophyd.status import DeviceStatus
+
+logger = logging.getLogger(__name__)
+
+HISTORY = 1000  # latencies and beam-on intervals kept
+STATES = ("open", "close")
+
+
+class LatencyStats:
+    """The last latencies (s) of one kind."""
+
+    def __init__(self, maxlen: int = HISTORY):
+        """Keep the last ``maxlen`` latencies."""
+        self._values: deque = deque(maxlen=maxlen)
+
+    def add(self, seconds: float):
+        """Record one latency."""
+        self._values.append(float(seconds))
+
+    def __len__(self) -> int:
+        """Latencies kept."""
+        return len(self._values)
+
+    def summary(self) -> str:
+        """Count, mean, 95th percentile and maximum, in ms."""
+        if not self._values:
+            return "no data"
+        values = np.asarray(self._values)
+        return (
+            f"n={len(values)} mean={values.mean() * 1e3:.1f} ms"
+            f" p95={np.percentile(values, 95) * 1e3:.1f} ms"
+            f" max={values.max() * 1e3:.1f} ms"
+        )
+
+
+class ShutterController(Device):
+    """Write-only, or monitored and confirmed, timed moves of a shutter."""
+
+    def __init__(
+        self,
+        command: Any,
+        readback: Optional[Any] = None,
+        *,
+        open_value: Any = 0,
+        close_value: Any = 1,
+        timeout: float = 2.0,
+        name: str = "shutter_controller",
+    ):
+        """Watch a shutter.
+
+        Args:
+            command: Signal written to open or close
+            readback: Monitored signal of the shutter state (default: none,
+                write-only); not the command's own output record
+            open_value: Value of both signals with the shutter open
+            close_value: Value of both signals with the shutter closed
+            timeout: Seconds for the readback to confirm a command
+            name: Device name
+        """
+        super().__init__(name=name)
+        self.command = command
+        self.readback = readback
+        self.values = {"open": open_value, "close": close_value}
+        self.timeout = float(timeout)
+
+        self._lock = threading.Lock()
+        self._state: Optional[str] = None  # "open", "close", None: unknown
+        # (state, t_command, status)
+        self._pending: Optional[Tuple[str, float, DeviceStatus]] = None
+        self._opened: Optional[float] = None  # time the beam went on, None: closed
+        self._acquire_end: Optional[float] = None
+        self.intervals: deque = deque(maxlen=HISTORY)  # (t_open, t_close)
+        self.latency: Dict[str, LatencyStats] = {
+            kind: LatencyStats()
+            for kind in ("open", "close", "open_to_acquire", "acquire_to_close")
+        }
+        self.skipped = 0
+        # run uid -> beam-on intervals
+        self.runs: Dict[str, List[Tuple[float, float]]] = {}
+        self._run_starts: Dict[str, float] = {}
+
+        if self.readback is not None:
+            self.readback.subscribe(self._on_readback, run=True)
+
+    @property
+    def confirmed(self) -> bool:
+        """True if the state is read back, False if it is the commanded one."""
+        return self.readback is not None
+
+    @property
+    def basis(self) -> str:
+        """``"confirmed"`` or ``"commanded"``, the source of the state and times."""
+        return "confirmed" if self.confirmed else "commanded"
+
+    def _update(self, state: str, timestamp: float):
+        """The shutter is (or was commanded) ``state`` at ``timestamp``."""
+        with self._lock:
+            previous, self._state = self._state, state
+            if state == "open" and previous != "open":
+                self._opened = timestamp
+            elif state == "close" and self._opened is not None:
+                self.intervals.append((self._opened, timestamp))
+                self._opened = None
+                if self._acquire_end is not None:
+                    self.latency["acquire_to_close"].add(timestamp - self._acquire_end)
+                    self._acquire_end = None
+
+    def _on_readback(self, value=None, timestamp=None, **kwargs):
+        now = time.time()
+        timestamp = now if timestamp is None else timestamp
+        if value == self.values["open"]:
+            state = "open"
+        elif value == self.values["close"]:
+            state = "close"
+        else:
+            return
+        self._update(state, timestamp)
+        with self._lock:
+            pending = self._pending
+            if pending is not None and pending[0] == state:
+                self._pending = None
+            else:
+                pending = None
+        if pending is not None:
+            self.latency[state].add(now - pending[1])
+            if not pending[2].done:  # not timed out
+                pending[2].set_finished()
+
+    def _on_done(self, status: DeviceStatus):
+        """A confirmed move finished: forget it if it timed out."""
+        with self._lock:
+            if self._pending is not None and self._pending[2] is status:
+                self._pending = None
+
+    @property
+    def state(self) -> Optional[str]:
+        """ "open", "close", or None before the first readback (or command)."""
+        return self._state
+
+    @property
+    def is_open(self) -> Optional[bool]:
+        """From the last readback (or command), no round trip; None if unknown."""
+        return None if self._state is None else self._state == "open"
+
+    @property
+    def position(self) -> Optional[str]:
+        """``"open"`` or ``"close"``, from the last readback (or command)."""
+        return self._state
+
+    def set(self, state: str) -> DeviceStatus:
+        """Open or close (``"open"`` or ``"close"``).
+
+        Write-only: always written, done once written.  With a readback:
+        written if the shutter is not there, done when the readback
+        confirms it (failed after ``timeout``).
+        """
+        if state not in STATES:
+            raise ValueError(f"state must be one of {STATES}, not {state!r}")
+        if not self.confirmed:
+            self.command.put(self.values[state])
+            self._update(state, time.time())
+            status = DeviceStatus(self)
+            status.set_finished()
+            return status
+
+        status = DeviceStatus(self, timeout=self.timeout)
+        with self._lock:
+            if self._state == state and self._pending is None:
+                self.skipped += 1
+                status.set_finished()
+                return status
+            self._pending = (state, time.time(), status)
+        status.add_callback(self._on_done)
+        self.command.put(self.values[state])
+        return status
+
+    def acquire_started(self):
+        """The detector started: time since the shutter opened."""
+        opened = self._opened
+        if opened is not None:
+            self.latency["open_to_acquire"].add(time.time() - opened)
+
+    def acquire_ended(self):
+        """The detector is done: the time until the shutter closes is recorded."""
+        self._acquire_end = time.time()
+
+    def beam_on(self, start: float, stop: float) -> List[Tuple[float, float]]:
+        """Beam-on intervals between ``start`` and ``stop`` (time.time()), clipped."""
+        intervals = list(self.intervals)
+        if self._opened is not None:
+            intervals.append((self._opened, time.time()))
+        return [
+            (max(t0, start), min(t1, stop))
+            for t0, t1 in intervals
+            if t1 > start and t0 < stop
+        ]
+
+    def __call__(self, name: str, doc: dict):
+        """RunEngine callback: keep the beam-on intervals of each run in ``runs``."""
+        if name == "start":
+            self._run_starts[doc["uid"]] = doc["time"]
+        elif name == "stop":
+            start = self._run_starts.pop(doc["run_start"], None)
+            if start is not None:
+                intervals = self.beam_on(start, doc["time"])
+                self.runs[doc["run_start"]] = intervals
+                logger.info(
+                    "%s: beam on (%s) %.3f s in %d intervals during run %s",
+                    self.name,
+                    self.basis,
+                    sum(t1 - t0 for t0, t1 in intervals),
+                    len(intervals),
+                    doc["run_start"],
+                )
+                while len(self.runs) > HISTORY:
+                    self.runs.pop(next(iter(self.runs)))
+
+    def summary(self) -> str:
+        """Latencies and counts, one line each."""
+        lines = [
+            f"{self.name}: {self.state} ({self.basis}),"
+            f" {len(self.intervals)} beam-on intervals, {self.skipped} skipped"
+        ]
+        lines += [
+            f"  {kind:>16}: {stats.summary()}" for kind, stats in self.latency.items()
+        ]
+        return "\n".join(lines)
@@ -3,13 +3,22 @@ Caen picoammeter - TetraAMM
 
 GitHub apstools issue #878 has some useful documentation in the comments.
 
+The ``TS:`` time-series plugin of the quadEM IOC buffers every averaged
+sample; ``MyTetrAMM.ts`` captures the beam intensity during a whole
+exposure (see ``plans.beam_series_plans``).
+
 .. see:: https://github.com/BCDA-APS/apstools/issues/878
+.. see:: https://github.com/epics-modules/quadEM (NDPluginTimeSeries)
 """
 
 import logging
 import time as ttime
 
 from ophyd import Component
+from ophyd import Device
+from ophyd import EpicsSignal
+from ophyd import EpicsSignalRO
+from ophyd import EpicsSignalWithRBV
 from ophyd import TetrAMM
 from ophyd.areadetector.plugins import ImagePlugin_V34
 from ophyd.areadetector.plugins import StatsPlugin_V34
@@ -20,6 +29,24 @@ logger = logging.getLogger(__name__)
 logger.info(__file__)
 
 
+class TetrAMMTimeSeries(Device):
+    """Time-series plugin (``TS:``) of the quadEM IOC."""
+
+    acquire = Component(EpicsSignal, "TSAcquire", kind="omitted")
+    acquire_mode = Component(EpicsSignal, "TSAcquireMode", kind="config", string=True)
+    read_series = Component(EpicsSignal, "TSRead", kind="omitted")
+    num_points = Component(EpicsSignal, "TSNumPoints", kind="config")
+    current_point = Component(EpicsSignalRO, "TSCurrentPoint", kind="omitted")
+    averaging_time = Component(EpicsSignalWithRBV, "TSAveragingTime", kind="config")
+    time_axis = Component(EpicsSignalRO, "TSTimeAxis", kind="omitted")
+
+    current1 = Component(EpicsSignalRO, "Current1:TimeSeries", kind="omitted")
+    current2 = Component(EpicsSignalRO, "Current2:TimeSeries", kind="omitted")
+    current3 = Component(EpicsSignalRO, "Current3:TimeSeries", kind="omitted")
+    current4 = Component(EpicsSignalRO, "Current4:TimeSeries", kind="omitted")
+    sum_all = Component(EpicsSignalRO, "SumAll:TimeSeries", kind="omitted")
+
+
 class MyTetrAMM(TetrAMM):
     """Caen picoammeter - TetraAMM."""
 
@@ -31,6 +58,8 @@ class MyTetrAMM(TetrAMM):
     current4 = Component(StatsPlugin_V34, "Current4:")
     image = Component(ImagePlugin_V34, "image1:")
     sum_all = Component(StatsPlugin_V34, "SumAll:")
+    # lazy: IOCs without TS: still connect
+    ts = Component(TetrAMMTimeSeries, "TS:", kind="omitted", lazy=True)
 
     def __init__(self, *args, port_name="TetrAMM", **kwargs):
         """custom port name"""
@@ -0,0 +1,272 @@
+"""
+Pipelined multi-repetition acquisition for the XPCS series plans.
+
+A repetition runs these stages::
+
+    wait -> move -> setup -> expose -> snapshot -> drain -> DM job queued
+                                           |
+                                           +-> metadata file (background)
+
+While the HDF5 plugin of repetition N drains, the engine already moves the
+sample to the spot of repetition N+1 and writes the settings of N+1 that
+are safe to change then: those not of the ``held`` devices (the Eiger
+file plugin; the whole Rigaku, which has no separate file plugin and may
+still be writing its file).  The metadata file of repetition N is
+written in the background, and its DM job is queued as soon as the data
+file closed (``dm_util.dm_job_queue`` submits it once the metadata file
+is durable).
+
+Dependencies that keep the data correct:
+
+* the metadata snapshot of N is taken before anything of N+1 is touched
+  (it records the sample position and file names of N);
+* the sample does not move before the exposure of N has ended (beam blocked);
+* settings of the ``held`` devices for N+1 are written only at the setup
+  of N+1, after the file of N closed;
+* the exposure of N+1 waits for the move and the setup of N+1;
+* the DM job of N is queued after its data file closed, and submitted
+  after its metadata file is durable.
+
+With ``BEAM_SERIES`` enabled in iconfig.yml, the incident beam intensity
+of the whole exposure is captured and written to the metadata file (see
+``beam_series_plans``).
+
+Each stage is recorded in an :class:`~id8_i.utils.acq_timeline.AcquisitionTimeline`
+whose report shows the dead time recovered by the overlap.
+
+.. autosummary::
+
+    ~ad_expose
+    ~ad_drain
+    ~pipelined_series
+"""
+
+import datetime
+import time
+
+from apsbits.core.instrument_init import oregistry
+from bluesky import plan_stubs as bps
+
+from ..utils.acq_timeline import AcquisitionTimeline
+from ..utils.ad_completion import ACQUIRE_TIMEOUT_MARGIN
+from ..utils.ad_completion import AcquisitionTiming
+from ..utils.ad_completion import acquisition_done_status
+from ..utils.ad_completion import expected_acquisition_time
+from ..utils.ad_completion import hdf_drained_status
+from ..utils.dm_util import dm_run_job
+from ..utils.nexus_utils import submit_nexus_format_metadata
+from .ad_setup_plans import detector_config
+from .beam_series_plans import beam_series_enabled
+from .beam_series_plans import start_beam_series
+from .beam_series_plans import stop_beam_series
+from .sample_info_unpack import mesh_grid_move
+from .shutter_logic import beam_shutter
+from .shutter_logic import blockbeam
+from .shutter_logic import showbeam
+from .wait_plans import wait_for_status
+
+pv_registers = oregistry["pv_registers"]
+
+MOVE_GROUP = "pipeline_move"
+BEAM_SERIES_MARGIN = 2.0  # s of beam intensity captured beyond the nominal exposure
+
+
+def ad_expose(det, start_triggers=None, timeout=None):
+    """Expose one series with an area detector, return before the HDF5 queue drains.
+
+    Args:
+        det: Area detector with ``cam`` and ``hdf1``
+        start_triggers: Plan (callable) run once the detector is acquiring,
+            such as starting the SoftGlue pulses
+        timeout: Seconds allowed for the acquisition (default: the
+            configured acquisition time plus a margin)
+
+    Returns:
+        Tuple of (AcquisitionTiming, status that finishes when hdf1 drained)
+    """
+    if timeout is None:
+        timeout = expected_acquisition_time(det.cam) + ACQUIRE_TIMEOUT_MARGIN
+    timing = AcquisitionTiming()
+
+    yield from showbeam(settle=True)
+    yield from bps.mv(det.hdf1.capture, 1)
+    done = acquisition_done_status(det.cam, timeout=timeout)
+    yield from bps.mv(det.cam.acquire, 1)
+    done.arm()
+    beam_shutter.acquire_started()
+    try:
+        if start_triggers is not None:
+            yield from start_triggers()
+        yield from wait_for_status(done)
+    except Exception:
+        # No drain follows: stop the detector and close the file here.
+        yield from blockbeam()
+        beam_shutter.acquire_ended()
+        yield from bps.mv(det.cam.acquire, 0)
+        det.hdf1.capture.put(0)
+        raise
+    beam_shutter.acquire_ended()
+    timing.acquire = time.monotonic() - done.t_start
+    drained = hdf_drained_status(det.hdf1)
+    yield from blockbeam()
+    return timing, drained
+
+
+def ad_drain(det, timing, drained):
+    """Wait for the HDF5 queue to drain, then close the file.
+
+    Args:
+        det: Area detector with ``hdf1``
+        timing: AcquisitionTiming from :func:`ad_expose`, updated
+        drained: Drained status from :func:`ad_expose`
+
+    Returns:
+        The updated AcquisitionTiming
+    """
+    try:
+        yield from wait_for_status(drained)
+    finally:
+        det.hdf1.capture.put(0)  # close the file even if frames were lost
+    timing.drain = time.monotonic() - drained.t_start
+    return timing
+
+
+def pipelined_series(
+    det,
+    det_name,
+    num_rep,
+    file_name_for,
+    settings_for,
+    expose,
+    drain=None,
+    held=None,
+    prepare=None,
+    wait_time=0,
+    sample_move=False,
+    process=True,
+    workflowProcApi=None,
+    dmuser=None,
+):
+    """
+    Run ``num_rep`` repetitions with the stages overlapped across repetitions.
+
+    Args:
+        det: Detector, for the metadata file
+        det_name: Detector name for the DM workflow, "eiger" or "rigaku"
+        num_rep: Number of repetitions
+        file_name_for: Callable (rep index) -> file name
+        settings_for: Callable (file name) -> {signal: value} for detector_config
+        expose: Plan (callable) -> (AcquisitionTiming, drained status or None)
+        drain: Plan (callable) (timing, drained) -> timing; None if nothing drains
+        held: Device, or list of devices, whose settings are never prestaged
+            (default: all of ``det``)
+        prepare: Callable (file name) run once before the setup of each
+            repetition, such as creating its data directory
+        wait_time: Time to wait at the start of each repetition
+        sample_move: Whether to move the sample to a new spot for each repetition
+        process: Whether to submit the DM analysis jobs
+        workflowProcApi: DM workflow API (from ``dm_setup``)
+        dmuser: DM user name (from ``dm_setup``)
+
+    Returns:
+        AcquisitionTimeline of the series
+    """
+    timeline = AcquisitionTimeline()
+    detector_config.forget()  # read the detector state once, at the first repetition
+
+    if held is None:
+        held = [det]
+    elif not isinstance(held, (list, tuple)):
+        held = [held]
+
+    def is_held(sig):
+        parent = getattr(sig, "parent", None)
+        while parent is not None:
+            if any(parent is device for device in held):
+                return True
+            parent = getattr(parent, "parent", None)
+        return False
+
+    def prestage(settings):
+        """Settings that are safe to write while the previous repetition finishes."""
+        return {sig: value for sig, value in settings.items() if not is_held(sig)}
+
+    moving = False  # sample move for this repetition already started
+    settings = None  # of the next repetition, built when prestaged
+    for ii in range(num_rep):
+        file_name = file_name_for(ii)
+        if settings is None:
+            settings = settings_for(file_name)
+
+        if wait_time > 0:
+            with timeline.stage(ii, "wait"):
+                yield from bps.sleep(wait_time)
+
+        if sample_move and not moving:
+            with timeline.stage(ii, "move"):
+                yield from mesh_grid_move()
+
+        with timeline.stage(ii, "setup"):
+            if prepare is not None:
+                prepare(file_name)
+            setup = yield from detector_config.apply(settings, label=file_name)
+        settings = None
+
+        print(f"\nStarting Measurement {file_name} ({setup})")
+        beam = None
+        with timeline.stage(ii, "expose"):
+            if beam_series_enabled():
+                yield from start_beam_series(
+                    expected_acquisition_time(det.cam) + BEAM_SERIES_MARGIN
+                )
+            started = datetime.datetime.now()
+            timing, drained = yield from expose()
+            ended = datetime.datetime.now()
+            if beam_series_enabled():
+                beam = yield from stop_beam_series()
+
+        with timeline.stage(ii, "snapshot"):
+            metadata_fname = pv_registers.metadata_full_path.get()
+            status = submit_nexus_format_metadata(
+                metadata_fname,
+                det=det,
+                additional_metadata=beam.nexus_metadata() if beam is not None else None,
+                start_time=started,
+                end_time=ended,
+            )
+        timeline.record_status(ii, "metadata", status)
+
+        # --- overlap window: the file of this repetition is still draining ---
+        moving = sample_move and ii + 1 < num_rep
+        if moving:
+            t_move = time.monotonic()
+            statuses = yield from mesh_grid_move(group=MOVE_GROUP)
+            timeline.record_status(ii + 1, "move", statuses, start=t_move)
+        if ii + 1 < num_rep:
+            next_name = file_name_for(ii + 1)
+            settings = settings_for(next_name)
+            with timeline.stage(ii + 1, "prestage"):
+                yield from detector_config.apply(
+                    prestage(settings), label=f"{next_name} (prestage)"
+                )
+
+        if drain is not None and drained is not None:
+            t_drain = drained.t_start
+            timing = yield from drain(timing, drained)
+            timeline.record(ii, "drain", t_drain)
+        with timeline.stage(ii, "dm"):
+            # Only queued here; submitted once the metadata file is durable.
+            dm_run_job(
+                det_name,
+                process,
+                workflowProcApi,
+                dmuser,
+                file_name,
+                metadata_fname=metadata_fname,
+            )
+        if moving:
+            yield from bps.wait(MOVE_GROUP)
+        print(f"Measurement {file_name} Complete" + (f" ({timing})" if timing else ""))
+
+    timeline.finish()
+    return timeline
@@ -2,7 +2,17 @@
 Bluesky plans to setup various Area Detectors for acquisition.
 """
 
+import logging
+import math
 import pathlib
+import time
+from collections import deque
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Mapping
 
 from apsbits.core.instrument_init import oregistry
 from apsbits.utils.config_loaders import get_config
@@ -13,8 +23,19 @@ from bluesky import plan_stubs as bps
 from bluesky.utils import plan
 from ophyd import Kind
 
+from ..utils.pv_snapshot import snapshot_signals
+
+logger = logging.getLogger(__name__)
 iconfig = get_config()
 
+# (first, then): when both sibling signals change, write ``first`` before ``then``.
+CONFIG_WRITE_ORDER = (
+    ("create_directory", "file_path"),  # file_path creates the directory
+    ("acquire_time", "acquire_period"),  # the driver may adjust the period
+    ("trigger_mode", "num_triggers"),
+    ("trigger_mode", "num_images"),
+)
+
 
 def write_if_new(signal, value):
     """Write an ophyd signal if it has a new value."""
@@ -22,6 +43,160 @@ def write_if_new(signal, value):
         yield from bps.mv(signal, value)
 
 
+def _same_value(signal, current, desired) -> bool:
+    """Compare a (possibly enum or float) current value with a desired one."""
+    if isinstance(desired, str) and not isinstance(current, str):
+        enum_strs = getattr(signal, "enum_strs", None) or ()
+        try:
+            current = enum_strs[int(current)]
+        except (IndexError, TypeError, ValueError):
+            return False
+    if isinstance(desired, float) or isinstance(current, float):
+        try:
+            return math.isclose(
+                float(current), float(desired), rel_tol=1e-9, abs_tol=1e-12
+            )
+        except (TypeError, ValueError):
+            return False
+    return current == desired
+
+
+@dataclass
+class ConfigReport:
+    """What one call of :meth:`DetectorConfigWriter.apply` wrote, and how long."""
+
+    label: str = ""
+    written: List[str] = field(default_factory=list)
+    skipped: int = 0
+    groups: int = 0
+    elapsed: float = 0.0  # seconds
+
+    def __str__(self) -> str:
+        """One line summary for the console."""
+        total = len(self.written) + self.skipped
+        return (
+            f"{self.label or 'setup'}: wrote {len(self.written)} of {total} settings"
+            f" in {self.groups} parallel group(s), {self.elapsed:.3f} s"
+        )
+
+
+class DetectorConfigWriter:
+    """
+    Write a desired detector configuration, only the settings that changed.
+
+    The last value written to each signal is tracked locally, so repetitions
+    that reuse most of the configuration (trigger mode, acquire time, ...)
+    cost no Channel Access traffic for those settings.  Signals not seen
+    before are compared with their current value, read in one concurrent
+    snapshot.  The changed signals are written with one ``bps.mv`` per
+    group (in parallel, each waiting for put completion); groups follow the
+    ``CONFIG_WRITE_ORDER`` constraints between sibling signals.
+
+    Call :meth:`forget` when the configuration may have been changed
+    elsewhere (the series plans do so before their first repetition).
+    """
+
+    def __init__(self, write_order=CONFIG_WRITE_ORDER):
+        """Start with no last-known state."""
+        self.write_order = tuple(write_order)
+        self._last: Dict[int, Any] = {}
+        self.history = deque(maxlen=1000)  # ConfigReport of each call
+
+    def forget(self, signals=None):
+        """Drop the last-known value of ``signals`` (default: all)."""
+        if signals is None:
+            self._last.clear()
+        else:
+            for signal in signals:
+                self._last.pop(id(signal), None)
+
+    def changes(self, desired: Mapping[Any, Any]) -> Dict[Any, Any]:
+        """Return the subset of ``desired`` that differs from the known state.
+
+        Not a plan: the unknown signals are read here.
+        """
+        desired = {sig: value for sig, value in desired.items() if value is not None}
+        unknown = [sig for sig in desired if id(sig) not in self._last]
+        current, _ = snapshot_signals({sig.name: sig for sig in unknown})
+        changed = {}
+        for sig, value in desired.items():
+            if id(sig) in self._last:
+                if not _same_value(sig, self._last[id(sig)], value):
+                    changed[sig] = value
+            elif sig.name not in current or not _same_value(
+                sig, current[sig.name], value
+            ):
+                changed[sig] = value
+            else:
+                self._last[id(sig)] = value  # already set, nothing to write
+        return changed
+
+    def write_groups(self, changed: Mapping[Any, Any]) -> List[Dict[Any, Any]]:
+        """Split the changed signals into groups that respect the write order."""
+
+        def key(sig):
+            return id(getattr(sig, "parent", None)), getattr(sig, "attr_name", sig.name)
+
+        by_key = {key(sig): sig for sig in changed}
+        level = {}
+
+        def level_of(sig, seen=()):
+            if sig not in level:
+                parent_id, attr = key(sig)
+                before = [
+                    by_key[(parent_id, first)]
+                    for first, then in self.write_order
+                    if then == attr and (parent_id, first) in by_key
+                ]
+                before = [b for b in before if b not in seen]
+                deepest = max((level_of(b, seen + (sig,)) for b in before), default=-1)
+                level[sig] = 1 + deepest
+            return level[sig]
+
+        groups: List[Dict[Any, Any]] = []
+        for sig, value in changed.items():
+            n = level_of(sig)
+            while len(groups) <= n:
+                groups.append({})
+            groups[n][sig] = value
+        return groups
+
+    def apply(self, desired: Mapping[Any, Any], label: str = ""):
+        """
+        (plan) Write the settings of ``desired`` that changed.
+
+        Args:
+            desired: Mapping of ophyd signal to value (None: leave unchanged)
+            label: Name for the report, such as the file name
+
+        Returns:
+            ConfigReport of this call (also kept in ``history``)
+        """
+        t0 = time.monotonic()
+        changed = self.changes(desired)
+        report = ConfigReport(label=label, skipped=len(desired) - len(changed))
+        groups = self.write_groups(changed)
+        try:
+            for group in groups:
+                args = [item for pair in group.items() for item in pair]
+                yield from bps.mv(*args)
+                for sig, value in group.items():
+                    self._last[id(sig)] = value
+                    report.written.append(sig.name)
+        except Exception:
+            self.forget(changed)  # state unknown after a failed write
+            raise
+        report.groups = len(groups)
+        report.elapsed = time.monotonic() - t0
+        self.history.append(report)
+        logger.info("%s", report)
+        return report
+
+
+detector_config = DetectorConfigWriter()
+"""Configuration writer shared by the XPCS series plans."""
+
+
 class DetectorStateError(RuntimeError):
     """For custom errors in this module."""
 
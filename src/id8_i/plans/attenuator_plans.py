@@ -0,0 +1,49 @@
+"""
+Set the attenuation of the A-V-S filters.
+
+One :class:`~id8_i.devices.attenuator_controller.AttenuatorController`
+per filter device is created on first use, with the ``ATTENUATOR``
+settings of iconfig.yml.  It skips requests for the attenuation already
+in place and waits for ``filterBusy`` and the readback instead of fixed
+sleeps.
+
+.. autosummary::
+
+    ~attenuator
+    ~set_attenuation
+"""
+
+from typing import Any
+from typing import Dict
+
+from apsbits.utils.config_loaders import get_config
+from bluesky import plan_stubs as bps
+
+from ..devices.attenuator_controller import AttenuatorController
+
+iconfig = get_config()
+
+_controllers: Dict[str, AttenuatorController] = {}
+
+
+def attenuator(filters: Any) -> AttenuatorController:
+    """The controller of an AVSfilters device, created and started on first use."""
+    if filters.name not in _controllers:
+        config = iconfig.get("ATTENUATOR", {})
+        _controllers[filters.name] = AttenuatorController(
+            filters,
+            tolerance=config.get("TOLERANCE", 0.5),
+            timeout=config.get("TIMEOUT", 10.0),
+            retries=config.get("RETRIES", 1),
+        )
+    return _controllers[filters.name]
+
+
+def set_attenuation(filters: Any, level: float):
+    """Move the filters to ``level`` and verify the readback.
+
+    Args:
+        filters: AVSfilters device
+        level: Attenuation to set
+    """
+    yield from bps.mv(attenuator(filters), level)
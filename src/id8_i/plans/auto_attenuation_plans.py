@@ -0,0 +1,227 @@
+"""
+Choose the attenuation of a sample from a short preview frame.
+
+:func:`auto_attenuation` takes one short frame through the detector's
+``roi1``/``stats1`` plugins, predicts the peak pixel rate at every level
+of the filters from their transmission table (see
+``plans.attenuator_plans``), and sets the least attenuation that keeps
+it under the detector's ``MAX_RATE`` (``AUTO_ATTENUATION`` in
+iconfig.yml).  The first preview is taken with the most attenuation.  A
+preview with fewer than ``MIN_COUNTS`` counts (none included) bounds the
+rate by ``MIN_COUNTS`` per exposure only, and no step raises the
+transmission by more than ``MAX_STEP`` over the preview's; after such a
+choice another preview is taken at the chosen level.  The choice is kept
+for each (sample, detector): later calls for that sample set it without
+a preview.
+
+In ``measurement_info.json``, ``"auto"`` in ``att_list`` runs it.
+
+.. autosummary::
+
+    ~transmission_table
+    ~preview_counts
+    ~auto_attenuation
+    ~attenuation_cache
+"""
+
+import logging
+from typing import Dict
+from typing import Union
+
+from apsbits.core.instrument_init import oregistry
+from apsbits.utils.config_loaders import get_config
+from bluesky import plan_stubs as bps
+from bluesky import preprocessors as bpp
+from ophyd.status import SubscriptionStatus
+
+from ..utils.ad_completion import ACQUIRE_TIMEOUT_MARGIN
+from ..utils.ad_completion import acquisition_done_status
+from ..utils.auto_attenuation import AttenuationCache
+from ..utils.auto_attenuation import choose_attenuation
+from .ad_setup_plans import detector_config
+from .attenuator_plans import attenuator
+from .attenuator_plans import set_attenuation
+from .sample_info_unpack import current_sample
+from .sample_info_unpack import sample_catalog
+from .sample_info_unpack import sample_key
+from .shutter_logic import blockbeam
+from .shutter_logic import showbeam
+from .wait_plans import wait_for_status
+
+logger = logging.getLogger(__name__)
+iconfig = get_config()
+AUTO_ATTENUATION = iconfig.get("AUTO_ATTENUATION", {})
+
+filter_8ide = oregistry["filter_8ide"]
+
+attenuation_cache = AttenuationCache()
+"""Attenuation chosen for each (sample, detector) in this session."""
+
+
+def _settings(det) -> dict:
+    """``AUTO_ATTENUATION`` settings of a detector."""
+    settings = AUTO_ATTENUATION.get("DETECTORS", {}).get(det.name)
+    if settings is None:
+        raise KeyError(
+            f"No AUTO_ATTENUATION settings for detector {det.name!r} in iconfig.yml"
+        )
+    return settings
+
+
+def transmission_table(filters=None) -> Dict[float, float]:
+    """(plan) Transmission of each configured level known to the attenuator.
+
+    The levels come from the attenuator's table (the IOC lookup) and are
+    not visited.  If none is known yet, the most attenuating configured
+    level is set, with the beam blocked, to read its transmission.
+
+    Args:
+        filters: AVSfilters device (default: filter_8ide)
+
+    Returns:
+        attenuation level -> transmission
+    """
+    filters = filters or filter_8ide
+    controller = attenuator(filters)
+    levels = [float(level) for level in AUTO_ATTENUATION.get("LEVELS", range(16))]
+
+    def known():
+        table = {level: controller.transmission(level) for level in levels}
+        return {
+            level: transmission
+            for level, transmission in table.items()
+            if transmission is not None
+        }
+
+    table = known()
+    if not table:
+        logger.info("Reading the transmission of attenuation level %g", max(levels))
+        yield from blockbeam()
+        yield from set_attenuation(filters, max(levels))
+        table = known()
+    missing = sorted(set(levels) - set(table))
+    if missing:
+        logger.warning(
+            "%s: no transmission for attenuation levels %s", filters.name, missing
+        )
+    return table
+
+
+def preview_counts(det, exposure: float) -> float:
+    """(plan) Counts in the brightest pixel of ``roi1`` in one ``exposure`` s frame.
+
+    The beam is shown during the frame only.  The HDF5 plugin is not
+    capturing, so no file is written.  The frame is taken in the
+    detector's ``TRIGGER_MODE``; its trigger mode is restored afterwards.
+    """
+    cam = det.cam
+    trigger_mode = _settings(det).get("TRIGGER_MODE")
+    if trigger_mode is None:
+        raise KeyError(
+            f"No AUTO_ATTENUATION TRIGGER_MODE for detector {det.name!r} in iconfig.yml"
+        )
+    previous_mode = cam.trigger_mode.get()
+    settings = {
+        cam.acquire_time: exposure,
+        cam.acquire_period: exposure,
+        cam.num_images: 1,
+        det.roi1.enable: 1,
+        det.stats1.enable: 1,
+        det.stats1.compute_statistics: 1,
+        det.stats1.nd_array_port: det.roi1.port_name.get(),
+        cam.trigger_mode: trigger_mode,
+    }
+    if hasattr(cam, "num_triggers"):
+        settings[cam.num_triggers] = 1
+    yield from detector_config.apply(settings, label=f"{det.name} preview")
+
+    timeout = exposure + ACQUIRE_TIMEOUT_MARGIN
+    counter = det.stats1.array_counter.get()
+    analysed = SubscriptionStatus(
+        det.stats1.array_counter,
+        lambda *args, value=None, **kwargs: value is not None and value > counter,
+        timeout=timeout,
+    )
+    acquired = acquisition_done_status(cam, timeout=timeout)
+
+    def expose():
+        yield from showbeam()
+        yield from bps.mv(cam.acquire, 1)
+        acquired.arm()
+        yield from wait_for_status(acquired)
+
+    def restore():
+        yield from blockbeam()
+        yield from detector_config.apply(
+            {cam.trigger_mode: previous_mode}, label=f"{det.name} after preview"
+        )
+
+    yield from bpp.finalize_wrapper(expose(), restore())
+    yield from wait_for_status(analysed)
+    return float(det.stats1.max_value.get())
+
+
+def auto_attenuation(
+    det,
+    sample: Union[int, str, None] = None,
+    filters=None,
+    refresh: bool = False,
+) -> float:
+    """(plan) Set the least attenuation keeping the peak pixel rate under the limit.
+
+    Args:
+        det: Area detector with ``roi1`` and ``stats1`` plugins (eiger4M, rigaku3M)
+        sample: Sample index or key (default: the current sample)
+        filters: AVSfilters device (default: filter_8ide)
+        refresh: Take a preview even if the sample has a cached choice
+
+    Returns:
+        The attenuation level set
+    """
+    filters = filters or filter_8ide
+    settings = _settings(det)
+    if sample is None:
+        sample = sample_key(current_sample())
+    elif isinstance(sample, int):
+        sample = sample_key(sample_catalog[sample])
+
+    choice = None if refresh else attenuation_cache.get(sample, det.name)
+    if choice is not None:
+        print(f"{det.name}, sample {sample}: {choice} (cached)")
+        yield from set_attenuation(filters, choice.level)
+        return choice.level
+
+    transmissions = yield from transmission_table(filters)
+    if not transmissions:
+        raise RuntimeError(
+            f"{filters.name}: no transmission readback for any attenuation level"
+        )
+    exposure = float(settings.get("PREVIEW_TIME", 0.01))
+    max_rate = float(settings["MAX_RATE"])
+    min_counts = float(AUTO_ATTENUATION.get("MIN_COUNTS", 20))
+    max_step = float(AUTO_ATTENUATION.get("MAX_STEP", 100))
+
+    # the most attenuation
+    level = min(transmissions, key=lambda lv: (transmissions[lv], -lv))
+    for _ in range(int(AUTO_ATTENUATION.get("MAX_PREVIEWS", 3))):
+        yield from set_attenuation(filters, level)
+        counts = yield from preview_counts(det, exposure)
+        upper_bound = counts < min_counts  # then rate <= min_counts / exposure
+        choice = choose_attenuation(
+            max(counts, min_counts) / exposure,
+            level,
+            transmissions,
+            max_rate,
+            upper_bound=upper_bound,
+            max_step=max_step,
+        )
+        if choice.level == level or not (choice.upper_bound or choice.limited):
+            break
+        level = choice.level  # bound or step limited: look again there
+
+    if not choice.within_limit:
+        logger.warning("%s, sample %s: %s", det.name, sample, choice)
+    print(f"{det.name}, sample {sample}: {choice}")
+    attenuation_cache.put(sample, det.name, choice)
+    yield from set_attenuation(filters, choice.level)
+    return choice.level
@@ -0,0 +1,104 @@
+"""
+Capture the incident beam intensity during a whole exposure.
+
+With ``BEAM_SERIES: ENABLED`` in iconfig.yml, ``acq_pipeline.pipelined_series``
+brackets every exposure with :func:`start_beam_series` and
+:func:`stop_beam_series`.  The series (from the time-series plugin of the
+picoammeter) and its statistics go to the metadata file of the
+repetition, under ``/entry/instrument/incident_beam/incident_beam_series``;
+their mean replaces the single I0 reading.
+
+.. autosummary::
+
+    ~beam_series_enabled
+    ~start_beam_series
+    ~read_beam_series
+    ~stop_beam_series
+"""
+
+import math
+
+import numpy as np
+from apsbits.core.instrument_init import oregistry
+from apsbits.utils.config_loaders import get_config
+from bluesky import plan_stubs as bps
+
+from ..utils.beam_series import DROPOUT_FRACTION
+from ..utils.beam_series import LOSS_FRACTION
+from ..utils.beam_series import MIN_LOSS
+from ..utils.beam_series import beam_series_stats
+
+iconfig = get_config()
+BEAM_SERIES = iconfig.get("BEAM_SERIES", {})
+
+beam_monitor = oregistry[BEAM_SERIES.get("DEVICE", "tetramm1")]
+
+
+def beam_series_enabled() -> bool:
+    """Capture the beam intensity during the exposures of the series plans."""
+    return bool(BEAM_SERIES.get("ENABLED", False))
+
+
+def start_beam_series(duration: float, picoammeter=None, averaging_time=None):
+    """Start buffering the intensity for ``duration`` seconds.
+
+    The averaging time is lengthened if ``duration`` needs more than
+    ``MAX_POINTS`` samples.
+
+    Args:
+        duration: Seconds to capture
+        picoammeter: TetrAMM (default: the configured ``DEVICE``)
+        averaging_time: Seconds per sample (default: the configured ``AVERAGING_TIME``)
+    """
+    ts = (picoammeter or beam_monitor).ts
+    max_points = int(BEAM_SERIES.get("MAX_POINTS", 100_000))
+    if averaging_time is None:
+        averaging_time = float(BEAM_SERIES.get("AVERAGING_TIME", 1e-3))
+    averaging_time = max(averaging_time, duration / max_points)
+    # The driver rounds the averaging time to whole samples: do not wait for
+    # its readback.
+    yield from bps.abs_set(ts.averaging_time, averaging_time)
+    yield from bps.mv(ts.acquire_mode, "Fixed length")
+    yield from bps.mv(
+        ts.num_points, min(math.ceil(duration / averaging_time), max_points)
+    )
+    yield from bps.abs_set(ts.acquire, 1)  # runs until num_points or read_beam_series
+
+
+def read_beam_series(picoammeter=None, channel=None):
+    """Stop buffering and read the series.
+
+    Args:
+        picoammeter: TetrAMM (default: the configured ``DEVICE``)
+        channel: TimeSeries waveform (default: the configured ``CHANNEL``)
+
+    Returns:
+        (times from the start of the capture, values), numpy arrays
+    """
+    ts = (picoammeter or beam_monitor).ts
+    yield from bps.mv(ts.acquire, 0)
+    yield from bps.mv(ts.read_series, 1)
+    n = int(ts.current_point.get())
+    values = np.asarray(
+        getattr(ts, channel or BEAM_SERIES.get("CHANNEL", "current1")).get()
+    )[:n]
+    times = np.asarray(ts.time_axis.get())[:n]
+    return times, values
+
+
+def stop_beam_series():
+    """Stop buffering, read the series of the configured channel and reduce it.
+
+    Returns:
+        BeamSeries
+    """
+    times, values = yield from read_beam_series()
+    series = beam_series_stats(
+        times,
+        values,
+        dropout_fraction=BEAM_SERIES.get("DROPOUT_FRACTION", DROPOUT_FRACTION),
+        loss_fraction=BEAM_SERIES.get("LOSS_FRACTION", LOSS_FRACTION),
+        min_loss=BEAM_SERIES.get("MIN_LOSS", MIN_LOSS),
+    )
+    print(series.summary())
+    return series
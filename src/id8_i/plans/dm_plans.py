@@ -10,10 +10,22 @@ Plans in support of APS Data Management
 """
 
 from apstools.devices import DM_WorkflowConnector
-from apstools.utils import dm_api_proc
 from apstools.utils import share_bluesky_metadata_with_dm
 from bluesky import plan_stubs as bps
 
+from ..utils.dm_client import dm_client
+
+
+def _tracker():
+    """The session's DM job tracker.
+
+    ``dm_util`` reads the beamline registers, so it is imported only once
+    the devices exist (this module is imported before them, at startup).
+    """
+    from ..utils.dm_util import dm_job_tracker
+
+    return dm_job_tracker
+
 
 def dm_kickoff_workflow(run, argsDict, timeout=None, wait=False):
     """
@@ -35,7 +47,7 @@ def dm_kickoff_workflow(run, argsDict, timeout=None, wait=False):
     wait (*bool*): Should this plan stub wait for the job to end?
         Default is 'False'.
     """
-    dm_workflow = DM_WorkflowConnector(name="dm_workflow")
+    dm_workflow = dm_client.attach(DM_WorkflowConnector(name="dm_workflow"))
 
     if timeout is None:
         # Disable periodic reports, use a long time (s).
@@ -56,11 +68,11 @@ def dm_kickoff_workflow(run, argsDict, timeout=None, wait=False):
     share_bluesky_metadata_with_dm(argsDict["experimentName"], workflow_name, run)
 
     # Users requested the DM workflow job ID be printed to the console.
-    dm_workflow._update_processing_data()
+    # Its status is followed by the DM job tracker, not queried here.
+    tracker = _tracker()
     job_id = dm_workflow.job_id.get()
-    job_stage = dm_workflow.stage_id.get()
-    job_status = dm_workflow.status.get()
-    print(f"DM workflow id: {job_id!r}  status: {job_status}  stage: {job_stage}")
+    tracker.track(job_id)
+    print(f"DM workflow id: {job_id!r}  status: {tracker.get(job_id).status}")
 
 
 def dm_list_processing_jobs(exclude=None):
@@ -68,18 +80,25 @@ def dm_list_processing_jobs(exclude=None):
     Show all the DM jobs with status not excluded.
 
     Excluded status (default): 'done', 'failed'
+
+    The jobs are read from the local index of ``dm_util.dm_job_tracker``, which
+    polls DM in the background.  Only the first call of a session (before
+    the tracker has polled) waits for DM.
     """
     yield from bps.null()  # make this a plan stub
-    api = dm_api_proc()
     if exclude is None:
         exclude = ("done", "failed")
+    tracker = _tracker()
+    if tracker.last_poll is None:
+        tracker.poll()
+    tracker.start()
 
-    for j in api.listProcessingJobs():
-        if j["status"] not in exclude:
+    for record in sorted(tracker.jobs.copy().values(), key=lambda r: r.start or 0.0):
+        if record.status not in exclude:
             print(
-                f"id={j['id']!r}"
-                f"  submitted={j.get('submissionTimestamp')}"
-                f"  status={j['status']!r}"
+                f"id={record.id!r}"
+                f"  submitted={record.data.get('submissionTimestamp')}"
+                f"  status={record.status!r}"
             )
 
 
@@ -100,7 +119,7 @@ def dm_submit_workflow_job(workflowName, argsDict):
         content of 'argsDict'.
     """
     yield from bps.null()  # make this a plan stub
-    api = dm_api_proc()
+    api = dm_client
 
     job = api.startProcessingJob(api.username, workflowName, argsDict)
     print(f"workflow={workflowName!r}  id={job['id']!r}")
@@ -0,0 +1,107 @@
+"""
+Fly scans with the sample position latched at every detector frame.
+
+The flyer (see ``devices.fly_scan_flyer``) is created on first use from
+the ``mcs`` and ``softglue_8idi`` devices and the ``FLY_SCAN`` wiring in
+iconfig.yml.  :func:`fly_scan` runs one scan as one run; its ``fly_scan``
+stream holds the time, position and lag of every frame as arrays.
+
+.. autosummary::
+
+    ~fly_scan_flyer
+    ~fly_scan
+"""
+
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Optional
+
+from apsbits.core.instrument_init import oregistry
+from apsbits.utils.config_loaders import get_config
+from bluesky import plan_stubs as bps
+from bluesky import preprocessors as bpp
+
+from ..devices.fly_scan_flyer import FlyScanFlyer
+
+iconfig = get_config()
+
+_flyer: Optional[FlyScanFlyer] = None
+
+
+def fly_scan_flyer() -> FlyScanFlyer:
+    """The session's flyer (the MCS is looked up on first use, it may be absent)."""
+    global _flyer
+    if _flyer is None:
+        wiring = iconfig.get("FLY_SCAN", {})
+        _flyer = FlyScanFlyer(
+            oregistry["mcs"],
+            oregistry["softglue_8idi"],
+            encoder_channel=wiring.get("ENCODER_CHANNEL"),
+            counts_per_unit=wiring.get("ENCODER_COUNTS_PER_MM"),
+        )
+    return _flyer
+
+
+def fly_scan(
+    expose: Callable,
+    motor: Any,
+    start: float,
+    stop: float,
+    num_frames: int,
+    period: float,
+    acq_time: Optional[float] = None,
+    md: Optional[Dict[str, Any]] = None,
+):
+    """Fly ``motor`` from ``start`` to ``stop`` while the detector takes ``num_frames``.
+
+    The motor first goes to its run-up position.  Then, in one run,
+    ``expose(kickoff)`` arms the detector and calls ``kickoff`` (a plan that
+    starts the motion and, once the run-up time has passed, the triggers:
+    timed, not gated on the position), such as
+    ``lambda kickoff: ad_expose(det, start_triggers=kickoff)``.  The frame
+    positions are collected once the motion ended.  If anything fails, the
+    triggers and the motor are stopped and the motor velocity restored.
+
+    Args:
+        expose: Plan (callable) (kickoff) -> result
+        motor: Motor to fly
+        start: Position at the first frame
+        stop: Position at the end of the last frame
+        num_frames: Frames (triggers)
+        period: Seconds between triggers
+        acq_time: Exposure of each frame (default: period)
+        md: Run metadata
+
+    Returns:
+        (result of expose, FrameTrace)
+    """
+    flyer = fly_scan_flyer()
+    geometry = flyer.prepare(motor, start, stop, num_frames, period, acq_time)
+    yield from bps.mv(motor, geometry.runup_start)
+
+    def kickoff():
+        yield from bps.kickoff(flyer, wait=True)
+
+    result = None
+
+    @bpp.run_decorator(md=dict(md or {}, fly_scan=geometry.summary()))
+    def run():
+        nonlocal result
+        result = yield from expose(kickoff)
+        yield from bps.complete(flyer, wait=True)
+        yield from bps.collect(flyer)
+
+    def abort(exc):
+        flyer.stop()
+        yield from bps.null()
+
+    yield from bpp.contingency_wrapper(run(), except_plan=abort)
+    trace = flyer.trace
+    started = "?" if trace.start_readback is None else f"{trace.start_readback:.4f}"
+    print(
+        f"Fly scan of {motor.name}: {num_frames} frames, {start:.4f} to {stop:.4f},"
+        f" triggers started at {started} (timed),"
+        f" largest lag {trace.max_lag:.4g}" + ("" if trace.encoder else " (no encoder)")
+    )
+    return result, trace
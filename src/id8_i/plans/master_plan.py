@@ -1,111 +1,249 @@
-from apsbits.core.instrument_init import oregistry
-from bluesky import plan_stubs as bps
-from bluesky import plans as bp
-from pathlib import Path
+"""
+Run the measurement blocks of a ``measurement_info.json`` file.
+
+The blocks are run in the order that moves the hardware least (see
+``utils.measurement_schedule``), unless ``optimize=False``.  With
+``dry_run=True`` the file order and the optimised order are printed side
+by side and nothing moves.  ``estimate_measurement_info`` predicts the
+wall time of a file (see ``utils.plan_estimator``).  ``"auto"`` in the
+``att_list`` of a block chooses the attenuation from a preview frame
+(see ``plans.auto_attenuation_plans``).
+
+.. autosummary::
+
+    ~load_measurement_info
+    ~schedule_measurement_info
+    ~estimate_measurement_info
+    ~run_measurement_info
+"""
+
 import json
-import re
+from typing import Optional
+from typing import Tuple
 
-from id8_i.plans.nexus_acq_eiger_int import eiger_acq_int_series 
+from apsbits.core.instrument_init import oregistry
+
+from id8_i.plans.auto_attenuation_plans import auto_attenuation
+from id8_i.plans.nexus_acq_eiger_int import eiger_acq_int_series
 from id8_i.plans.nexus_acq_eiger_ext import eiger_acq_ext_trig
 
 from id8_i.plans.nexus_acq_rigaku_zdt import rigaku_acq_ZDT_series
 
+from id8_i.plans.sample_info_unpack import sample_catalog
+from id8_i.plans.sample_info_unpack import sample_stage
 from id8_i.plans.sample_info_unpack import select_sample
 from id8_i.plans.scan_8idi import att
 from id8_i.plans.select_detector import select_detector
+from id8_i.utils.measurement_schedule import Acquisition
+from id8_i.utils.measurement_schedule import CostModel
+from id8_i.utils.measurement_schedule import Schedule
+from id8_i.utils.measurement_schedule import ScheduleState
+from id8_i.utils.measurement_schedule import compile_blocks
+from id8_i.utils.measurement_schedule import file_order
+from id8_i.utils.measurement_schedule import format_diff
+from id8_i.utils.measurement_schedule import optimize as optimize_schedule
+from id8_i.utils.plan_estimator import Estimate
+from id8_i.utils.plan_estimator import SeriesCosts
+from id8_i.utils.plan_estimator import estimate_series
+
+pv_registers = oregistry["pv_registers"]
+filter = oregistry["filter_8ide"]
+
+MEASUREMENT_INFO_DIR = "/home/beams10/8IDIUSER/bluesky/src/user_plans/"
+AUTO_ATT = "auto"  # att_list entry: attenuation chosen from a preview
+
+
+def load_measurement_info(file_name: str = "measurement_info.json"):
+    """Read and compile the blocks of a file of ``MEASUREMENT_INFO_DIR``."""
+    with open(MEASUREMENT_INFO_DIR + file_name, "r") as f:
+        return compile_blocks(json.load(f))
+
+
+def _sample_position(index: int) -> Tuple[str, float, float]:
+    """(stage, x, y) of the centre of sample ``index``."""
+    info = sample_catalog[index]
+    stage = sample_stage(index)
+    return (stage.name if stage is not None else "none"), info.x_cen, info.y_cen
+
+
+def _cost_model() -> CostModel:
+    """Cost model with the speeds of the sample stages."""
+    speeds = {}
+    for index in (0, 1):
+        stage = sample_stage(index)
+        try:
+            speeds[stage.name] = min(
+                float(stage.x.velocity.get()), float(stage.y.velocity.get())
+            )
+        except Exception:
+            pass  # not connected, the default speed is used
+    return CostModel(_sample_position, stage_speed=speeds)
+
+
+def _current_state() -> ScheduleState:
+    """Stage positions, detector, and attenuation before the first block."""
+    state = ScheduleState(
+        detector=pv_registers.det_name.get(), att=filter.attenuation.setpoint.get()
+    )
+    for index in (0, 1):
+        stage = sample_stage(index)
+        try:
+            x, y = float(stage.x.position), float(stage.y.position)
+            state = state.moved(stage.name, x, y)
+        except Exception:
+            pass  # position unknown
+    return state
+
+
+def schedule_measurement_info(
+    file_name: str = "measurement_info.json", optimize: bool = True
+) -> Tuple[Schedule, Schedule]:
+    """The file order and the order to run of the blocks of a file.
+
+    Returns:
+        (file order, schedule to run), the same schedule if not optimize
+    """
+    blocks = load_measurement_info(file_name)
+    costs, start = _cost_model(), _current_state()
+    as_written = file_order(blocks, costs, start)
+    if not optimize:
+        return as_written, as_written
+    return as_written, optimize_schedule(blocks, costs, start)
+
+
+def _series(det_name: str, acq: Acquisition) -> Optional[Tuple[str, dict]]:
+    """Series plan (one of ``SERIES_PLANS``) and its arguments, None to skip.
+
+    For one acquisition of a block.
+    """
+    common = dict(
+        num_rep=acq.num_reps, wait_time=0, process=True, sample_move=acq.sample_move
+    )
+    frames = dict(acq_time=acq.acq_time, num_frames=acq.num_frames)
+    if det_name == "eiger4M":
+        if acq.acq_time == acq.acq_period:
+            return "eiger_int", dict(**frames, **common)
+        if acq.acq_period >= 0.1:
+            return "eiger_ext", dict(acq_period=acq.acq_period, **frames, **common)
+        return None
+    if det_name == "rigaku3M":
+        return "rigaku_zdt", dict(acq_time=2e-5, num_frame=100000, **common)
+    print("Detector name must be eiger4M or rigaku3M")
+    return None
+
+
+SERIES_PLANS = {
+    "eiger_int": eiger_acq_int_series,
+    "eiger_ext": eiger_acq_ext_trig,
+    "rigaku_zdt": rigaku_acq_ZDT_series,
+}
+
+
+def _acquire(det_name: str, acq: Acquisition):
+    """Run one acquisition series of a block."""
+    print(f"    Acquisition Time: {acq.acq_time}")
+    print(f"    Acquisition Period: {acq.acq_period}")
+    print(f"    Number of Frames: {acq.num_frames}")
+    print(f"    Number of Repeats: {acq.num_reps}")
+
+    series = _series(det_name, acq)
+    if series is not None:
+        kind, kwargs = series
+        yield from SERIES_PLANS[kind](**kwargs)
+
+
+def estimate_measurement_info(
+    file_name: str = "measurement_info.json",
+    optimize: bool = True,
+    costs: Optional[SeriesCosts] = None,
+) -> Estimate:
+    """Predict the wall time of a measurement_info file, print the breakdown.
+
+    Stages: the motion between blocks (``travel``, ``detector``,
+    ``filter``) from the schedule, then the stages of every series.
+
+    Args:
+        file_name: File in ``MEASUREMENT_INFO_DIR``
+        optimize: Estimate the optimised order (as run_measurement_info does)
+        costs: Series stage costs (default: SeriesCosts())
+    """
+    _, schedule = schedule_measurement_info(file_name, optimize)
+    estimate = Estimate()
+    for overhead in schedule.overheads:
+        estimate.add("travel", overhead.travel)
+        estimate.add("detector", overhead.detector)
+        estimate.add("filter", overhead.filter)
+    for block, steps in schedule:
+        for step in steps:
+            for acq in step.acquisitions:
+                series = _series(block.detector, acq)
+                if series is None:
+                    continue
+                kind, kwargs = series
+                if "num_frame" in kwargs:  # spelling of the Rigaku plan
+                    kwargs["num_frames"] = kwargs.pop("num_frame")
+                estimate += estimate_series(kind, costs=costs, **kwargs)
+    print(estimate.report())
+    return estimate
+
+
+def run_measurement_info(
+    file_name: str = "measurement_info.json",
+    optimize: bool = True,
+    dry_run: bool = False,
+    schedule: Optional[Schedule] = None,
+):
+    """Run every block of a measurement_info file.
+
+    The schedule is computed when this is called, before the RunEngine
+    starts the plan: ``RE(run_measurement_info())`` spends no RunEngine
+    time ordering the blocks.
+
+    Args:
+        file_name: File in ``MEASUREMENT_INFO_DIR``
+        optimize: Reorder the blocks and attenuations to move the hardware least
+        dry_run: Only print the file order and the optimised order
+        schedule: Schedule to run, from schedule_measurement_info (default:
+            computed from ``file_name``)
+
+    Returns:
+        Generator: Bluesky plan messages
+    """
+    if schedule is None:
+        as_written, schedule = schedule_measurement_info(file_name, optimize)
+        if optimize or dry_run:
+            print(format_diff(as_written, schedule))
+    return _run_schedule(None if dry_run else schedule)
+
+
+def _run_schedule(schedule: Optional[Schedule]):
+    """Run the blocks of ``schedule`` in order, nothing if None."""
+    if schedule is None:
+        return
+    try:
+        current_att: Optional[float] = None
+        for block, steps in schedule:
+            print(f"\n --- Measurement Block {block.key} ---")
 
-def run_measurement_info(file_name='measurement_info.json'):
-    file_path = '/home/beams10/8IDIUSER/bluesky/src/user_plans/'
+            print(f"Sample index: {block.sample}")
+            yield from select_sample(block.sample)
 
-    try:
-        with open(file_path+file_name, 'r') as f:
-            measurement_info = json.load(f)
-
-        for block_key, block_value in measurement_info.items():
-
-            match = re.search(r'_(\d+)', block_key)
-            sam_index = int(match.group(1))
-            det_name = block_value.get("detector")
-            att_list = block_value.get("att_list")
-            acq_time_list = block_value.get("acq_time_list")
-            acq_period_list = block_value.get("acq_period_list")
-            num_frames_list = block_value.get("num_frames_list")
-            num_reps_list = block_value.get("num_reps_list")
-            num_reps_list = block_value.get("num_reps_list")
-            # fly_scan_yes_list = block_value.get("fly_scan_yes_list")
-            sample_move_yes_list = block_value.get("sample_move_yes_list")
-
-            print(f'\n --- Measurement Block {block_key} ---')
-
-            print(f'Sample index: {sam_index}')
-            yield from select_sample(sam_index)
-
-            print(f'Detector name: {det_name}')
-            yield from select_detector(det_name)
-
-            for ii in range(len(att_list)):
-
-                print(f'\n At Attenuation Ratio {att_list[ii]}:\n')
-                yield from att(att_list[ii])
-
-                for jj in range(len(acq_time_list[ii])):
-
-                    acq_time = acq_time_list[ii][jj]
-                    acq_period = acq_period_list[ii][jj]
-                    num_frames = num_frames_list[ii][jj]
-                    num_reps = num_reps_list[ii][jj]
-                    # fly_scan_yes = fly_scan_yes_list[ii][jj]
-                    sample_move_yes = sample_move_yes_list[ii][jj]
-
-
-                    print(f'    Acquisition Time: {acq_time}')
-                    print(f'    Acquisition Period: {acq_period}')
-                    print(f'    Number of Frames: {num_frames}')
-                    print(f'    Number of Repeats: {num_reps}')
-                    # print(f"    Fly Scan? {'Yes' if fly_scan_yes == 1 else 'No'}\n")  
-
-                    if det_name == 'eiger4M':
-                        if acq_time == acq_period:
-                            yield from  eiger_acq_int_series(
-                                                                acq_time=acq_time,
-                                                                num_frames=num_frames,
-                                                                num_rep=num_reps,
-                                                                wait_time=0,
-                                                                process=True,
-                                                                sample_move=sample_move_yes,
-                                                            )
-                        else:
-                            if acq_period >= 0.1:
-                                yield from  eiger_acq_ext_trig(     
-                                                                    acq_time=acq_time,
-                                                                    acq_period=acq_period,
-                                                                    num_frames=num_frames,
-                                                                    num_rep=num_reps,
-                                                                    wait_time=0,
-                                                                    process=True,
-                                                                    sample_move=sample_move_yes,
-                                                                )
-                    elif det_name == 'rigaku3M':
-                        yield from  rigaku_acq_ZDT_series(
-                                                            acq_time=2e-5,
-                                                            num_frame=100000,
-                                                            num_rep=num_reps,
-                                                            wait_time=0,
-                                                            process=True,
-                                                            sample_move=sample_move_yes,
-                                                        )
-                    else:
-                        print('Detector name must be eiger4M or rigaku3M')
+            print(f"Detector name: {block.detector}")
+            yield from select_detector(block.detector)
+
+            for step in steps:
+                print(f"\n At Attenuation Ratio {step.att}:\n")
+                if step.att == AUTO_ATT:
+                    det = oregistry[block.detector]
+                    current_att = yield from auto_attenuation(det, sample=block.sample)
+                elif step.att != current_att:
+                    yield from att(step.att)
+                    current_att = step.att
+
+                for acq in step.acquisitions:
+                    yield from _acquire(block.detector, acq)
 
     except KeyboardInterrupt:
         raise RuntimeError("\n Bluesky plan stopped by user (Ctrl+C).")
     except Exception as e:
         print(f"Error occurred during measurement: {e}")
-    finally:
-        pass
-
-
-
-
-
-
@@ -0,0 +1,88 @@
+"""
+Record the MCS inputs during an acquisition, beyond the 2048 MCS channels.
+
+The stream (see ``devices.mcs_stream``) is created on first use from the
+``mcs`` device and the ``MCS_STREAM`` channels of iconfig.yml, for example
+the beam intensity (i0) and the timebase of every detector frame of a
+100k-frame Rigaku ZDT series.
+
+.. autosummary::
+
+    ~mcs_stream
+    ~stream_mcs
+"""
+
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Optional
+
+from apsbits.core.instrument_init import oregistry
+from apsbits.utils.config_loaders import get_config
+from bluesky import plan_stubs as bps
+from bluesky import preprocessors as bpp
+
+from ..devices.mcs_stream import McsStream
+
+iconfig = get_config()
+
+_stream: Optional[McsStream] = None
+
+
+def mcs_stream() -> McsStream:
+    """The session's stream (the MCS is looked up on first use, it may be absent)."""
+    global _stream
+    if _stream is None:
+        config = iconfig.get("MCS_STREAM", {})
+        _stream = McsStream(
+            oregistry["mcs"],
+            {
+                int(ch): name
+                for ch, name in config.get("CHANNELS", {1: "timebase"}).items()
+            },
+            timebase_channel=config.get("TIMEBASE_CHANNEL", 1),
+            timebase_hz=config.get("TIMEBASE_HZ", 1e7),
+            channel_advance=config.get("CHANNEL_ADVANCE", "External"),
+            prescale=config.get("PRESCALE"),
+            poll_period=config.get("POLL_PERIOD", 0.05),
+        )
+    return _stream
+
+
+def stream_mcs(
+    expose: Callable, md: Optional[Dict[str, Any]] = None, rate: Optional[float] = None
+):
+    """Run ``expose`` in a run whose ``mcs_stream`` stream has the MCS samples.
+
+    If ``expose`` fails, the MCS is stopped and the error raised.
+
+    Args:
+        expose: Plan (callable) () -> result
+        md: Run metadata
+        rate: Frame triggers per second, to derive and check the prescale
+
+    Raises:
+        ValueError: If the MCS would fill faster than the stream reads it
+
+    Returns:
+        The result of expose
+    """
+    stream = mcs_stream()
+    stream.prepare(rate)
+    result = None
+
+    @bpp.run_decorator(md=md or {})
+    def run():
+        nonlocal result
+        yield from bps.kickoff(stream, wait=True)
+        result = yield from expose()
+        yield from bps.complete(stream, wait=True)
+        yield from bps.collect(stream)
+
+    def abort(exc):
+        stream.stop()
+        yield from bps.null()
+
+    yield from bpp.contingency_wrapper(run(), except_plan=abort)
+    print(stream.summary())
+    return result
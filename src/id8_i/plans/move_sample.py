@@ -5,10 +5,12 @@ This module provides plans for moving samples in a grid pattern, supporting both
 rheometer and regular sample stages.
 """
 
-import numpy as np
 from apsbits.core.instrument_init import oregistry
 from bluesky import plan_stubs as bps
 
+from ..utils.sample_grid import grid_for
+from .sample_info_unpack import SAMPLE_GRID_ORDER
+
 rheometer = oregistry["rheometer"]
 sample = oregistry["sample"]
 pv_registers = oregistry["pv_registers"]
@@ -35,14 +37,9 @@ def mesh_grid_move(
         y_pts: Number of points in y direction
     """
     sample_pos_register = pv_registers.sample_position_register(sam_index)
-    sam_pos = int(sample_pos_register.get())
-
-    samx_list = np.linspace(x_cen - x_radius, x_cen + x_radius, num=x_pts)
-    samy_list = np.linspace(y_cen - y_radius, y_cen + y_radius, num=y_pts)
-
-    pos_index = np.mod(sam_pos + 1, x_pts * y_pts)
-    x_pos = samx_list[np.mod(pos_index, x_pts)]
-    y_pos = samy_list[int(np.floor(pos_index / x_pts))]
+    grid = grid_for(x_cen, y_cen, x_radius, y_radius, x_pts, y_pts, SAMPLE_GRID_ORDER)
+    pos_index = grid.wrap(int(sample_pos_register.get()) + 1)
+    x_pos, y_pos = grid.position(pos_index)
 
     if sam_index == 0:
         yield from bps.mv(rheometer.x, x_pos, rheometer.y, y_pos)
@@ -10,14 +10,13 @@ from apsbits.core.instrument_init import oregistry
 from bluesky import plan_stubs as bps
 from bluesky import plans as bp
 
-from ..utils.dm_util import dm_run_job
 from ..utils.dm_util import dm_setup
-from ..utils.nexus_utils import create_nexus_format_metadata
+from .acq_pipeline import ad_drain
+from .acq_pipeline import ad_expose
+from .acq_pipeline import pipelined_series
+from .ad_setup_plans import detector_config
 from .sample_info_unpack import gen_folder_prefix
-from .sample_info_unpack import mesh_grid_move
-from .shutter_logic import blockbeam
 from .shutter_logic import post_align
-from .shutter_logic import showbeam
 from .shutter_logic import shutteron
 
 eiger4M = oregistry["eiger4M"]
@@ -25,45 +24,67 @@ softglue_8idi = oregistry["softglue_8idi"]
 pv_registers = oregistry["pv_registers"]
 
 
-def setup_eiger_ext_trig(
+def eiger_ext_trig_settings(
     acq_time: float,
     acq_period: float,
     num_frames: int,
     file_name: str,
 ):
-    """Setup the Eiger4M for external trigger mode.
+    """Desired Eiger4M and SoftGlue settings for one external trigger acquisition.
 
     Args:
         acq_time: Acquisition time per frame in seconds
         acq_period: Time between frames in seconds
         num_frames: Number of frames to acquire
         file_name: Base name for the output files
+
+    Returns:
+        Dictionary of signal to value, for ``detector_config``
     """
     cycle_name = pv_registers.cycle_name.get()
     exp_name = pv_registers.experiment_name.get()
 
     file_path = f"/gdata/dm/8ID/8IDI/{cycle_name}/{exp_name}/data/{file_name}/"
 
-    yield from bps.mv(eiger4M.cam.trigger_mode, "External Enable")
-    yield from bps.mv(eiger4M.cam.acquire_time, acq_time)
-    yield from bps.mv(eiger4M.cam.acquire_period, acq_period)
+    return {
+        eiger4M.cam.trigger_mode: "External Enable",
+        eiger4M.cam.acquire_time: acq_time,
+        eiger4M.cam.acquire_period: acq_period,
+        eiger4M.cam.num_triggers: num_frames,
+        eiger4M.hdf1.file_name: file_name,
+        eiger4M.hdf1.file_path: file_path,
+        eiger4M.hdf1.num_capture: num_frames,
+        pv_registers.file_name: file_name,
+        pv_registers.file_path: file_path,
+        pv_registers.metadata_full_path: f"{file_path}/{file_name}_metadata.hdf",
+        softglue_8idi.acq_time: acq_time,
+        softglue_8idi.acq_period: acq_period,
+        softglue_8idi.num_triggers: num_frames,
+    }
 
-    yield from bps.mv(eiger4M.cam.num_triggers, num_frames)
 
-    yield from bps.mv(eiger4M.hdf1.file_name, file_name)
-    yield from bps.mv(eiger4M.hdf1.file_path, file_path)
-    yield from bps.mv(eiger4M.hdf1.num_capture, num_frames)
+def setup_eiger_ext_trig(
+    acq_time: float,
+    acq_period: float,
+    num_frames: int,
+    file_name: str,
+):
+    """Setup the Eiger4M for external trigger mode.
 
-    yield from bps.mv(pv_registers.file_name, file_name)
-    yield from bps.mv(pv_registers.file_path, file_path)
-    yield from bps.mv(
-        pv_registers.metadata_full_path,
-        f"{file_path}/{file_name}_metadata.hdf",
-    )
+    Only the settings that changed since the previous repetition are written.
 
-    yield from bps.mv(softglue_8idi.acq_time, acq_time)
-    yield from bps.mv(softglue_8idi.acq_period, acq_period)
-    yield from bps.mv(softglue_8idi.num_triggers, num_frames)
+    Args:
+        acq_time: Acquisition time per frame in seconds
+        acq_period: Time between frames in seconds
+        num_frames: Number of frames to acquire
+        file_name: Base name for the output files
+
+    Returns:
+        ConfigReport of the settings written
+    """
+    settings = eiger_ext_trig_settings(acq_time, acq_period, num_frames, file_name)
+    report = yield from detector_config.apply(settings, label=file_name)
+    return report
 
 
 # def setup_softglue_ext_trig(
@@ -82,9 +103,9 @@ def setup_eiger_ext_trig(
 #     yield from bps.mv(softglue_8idi.acq_period, acq_period)
 #     yield from bps.mv(softglue_8idi.num_triggers, num_frames)
 
-# def softglue_start_pulses():
-#     """Start generating trigger pulses."""
-#     yield from bps.mv(softglue_8idi.start_pulses, "1!")
+def softglue_start_pulses():
+    """Start generating trigger pulses."""
+    yield from bps.mv(softglue_8idi.start_pulses, "1!")
 
 
 # def softglue_stop_pulses():
@@ -93,33 +114,24 @@ def setup_eiger_ext_trig(
 
 
 ############# Homebrew acquisition plan #############
-def eiger_acquire():
+def eiger_acquire(timeout=None):
+    """Acquire one series with the Eiger4M and wait until the HDF5 file is written.
 
-    yield from showbeam()
-    yield from bps.sleep(0.1)
-    yield from bps.mv(eiger4M.hdf1.capture, 1)
-    yield from bps.mv(eiger4M.cam.acquire, 1)
+    Completion is event driven (CA monitors on ``cam.acquire_busy`` and
+    ``hdf1.queue_free``), see ``utils.ad_completion``.
 
-    yield from bps.mv(softglue_8idi.start_pulses, "1!")
-        
-    while True:
-        det_status = eiger4M.cam.acquire_busy.get()
-        if det_status == 1:
-            yield from bps.sleep(0.1)
-        if det_status == 0:
-            break
-    yield from blockbeam()
-
-    frame_num_set = eiger4M.hdf1.queue_size.get()
-    count = 0
-    while count < 100:
-        frame_num_processed = eiger4M.hdf1.queue_free.get()
-        if frame_num_processed == frame_num_set:
-            break
-        else:
-            yield from bps.sleep(0.1)
-            count=+1
-        eiger4M.hdf1.capture.put(0)
+    Args:
+        timeout: Seconds allowed for the acquisition (default: the
+            configured acquisition time plus a margin)
+
+    Returns:
+        AcquisitionTiming with the acquisition and drain times
+    """
+    timing, drained = yield from ad_expose(
+        eiger4M, start_triggers=softglue_start_pulses, timeout=timeout
+    )
+    timing = yield from ad_drain(eiger4M, timing, drained)
+    return timing
 ############# Homebrew acquisition plan ends #############
 
 
@@ -134,6 +146,8 @@ def eiger_acq_ext_trig(
 ):
     """Run an external trigger acquisition sequence.
 
+    The repetitions are pipelined, see ``acq_pipeline.pipelined_series``.
+
     Args:
         acq_time: Acquisition time per frame in seconds
         acq_period: Time between frames in seconds
@@ -151,30 +165,31 @@ def eiger_acq_ext_trig(
         workflowProcApi, dmuser = dm_setup(process)
         folder_prefix = gen_folder_prefix()
 
-        for ii in range(num_rep):
-            yield from bps.sleep(wait_time)
-
-            if sample_move:
-                yield from mesh_grid_move()
-
-            file_name = f"{folder_prefix}_f{num_frames:06d}_r{ii+1:05d}"
-            yield from setup_eiger_ext_trig(acq_time, acq_period, num_frames, file_name)
-
-            # yield from showbeam()
-            # yield from bps.sleep(0.1)
-            # yield from softglue_start_pulses()
-            # yield from bp.count([eiger4M])
-            # yield from softglue_stop_pulses()
-            # yield from blockbeam()
-
-            print(f"\nStarting Measurement {file_name}")
-            yield from eiger_acquire()
-            print(f"Measurement {file_name} Complete")
-
-            metadata_fname = pv_registers.metadata_full_path.get()
-            create_nexus_format_metadata(metadata_fname, det=eiger4M)
-
-            dm_run_job("eiger", process, workflowProcApi, dmuser, file_name)
+        # yield from showbeam()
+        # yield from bps.sleep(0.1)
+        # yield from softglue_start_pulses()
+        # yield from bp.count([eiger4M])
+        # yield from softglue_stop_pulses()
+        # yield from blockbeam()
+
+        timeline = yield from pipelined_series(
+            eiger4M,
+            "eiger",
+            num_rep,
+            file_name_for=lambda ii: f"{folder_prefix}_f{num_frames:06d}_r{ii+1:05d}",
+            settings_for=lambda file_name: eiger_ext_trig_settings(
+                acq_time, acq_period, num_frames, file_name
+            ),
+            expose=lambda: ad_expose(eiger4M, start_triggers=softglue_start_pulses),
+            drain=lambda timing, drained: ad_drain(eiger4M, timing, drained),
+            held=eiger4M.hdf1,
+            wait_time=wait_time,
+            sample_move=sample_move,
+            process=process,
+            workflowProcApi=workflowProcApi,
+            dmuser=dmuser,
+        )
+        print(timeline.report())
     except KeyboardInterrupt:
         raise RuntimeError("\n Bluesky plan stopped by user (Ctrl+C).")
     except Exception as e:
@@ -3,33 +3,30 @@ Simple, modular Bluesky plans for users.
 """
 
 from apsbits.core.instrument_init import oregistry
-from bluesky import plan_stubs as bps
-from bluesky import plans as bp
 
-from ..utils.dm_util import dm_run_job
 from ..utils.dm_util import dm_setup
-from ..utils.nexus_utils import create_nexus_format_metadata
+from .acq_pipeline import ad_drain
+from .acq_pipeline import ad_expose
+from .acq_pipeline import pipelined_series
+from .ad_setup_plans import detector_config
 from .sample_info_unpack import gen_folder_prefix
-from .sample_info_unpack import mesh_grid_move
-from .shutter_logic import blockbeam
 from .shutter_logic import post_align
-from .shutter_logic import showbeam
 from .shutter_logic import shutteroff
 
 eiger4M = oregistry["eiger4M"]
 pv_registers = oregistry["pv_registers"]
 
 
-def setup_eiger_int_series(acq_time, num_frames, file_name):
-    """Setup the Eiger4M for internal series acquisition.
-
-    Configure the detector's cam module for internal acquisition mode and
-    set up the HDF plugin for data storage.
+def eiger_int_series_settings(acq_time, num_frames, file_name):
+    """Desired Eiger4M settings for one internal series acquisition.
 
     Args:
         acq_time: Acquisition time per frame in seconds
         num_frames: Number of frames to acquire
         file_name: Base name for the output files
+
+    Returns:
+        Dictionary of signal to value, for ``detector_config``
     """
     cycle_name = pv_registers.cycle_name.get()
     exp_name = pv_registers.experiment_name.get()
@@ -37,49 +34,57 @@ def setup_eiger_int_series(acq_time, num_frames, file_name):
     file_path = f"/gdata/dm/8ID/8IDI/{cycle_name}/{exp_name}/data/{file_name}"
 
     acq_period = acq_time
-    yield from bps.mv(eiger4M.cam.trigger_mode, "Internal Series")  # 0
-    yield from bps.mv(eiger4M.cam.acquire_time, acq_time)
-    yield from bps.mv(eiger4M.cam.acquire_period, acq_period)
-    yield from bps.mv(eiger4M.hdf1.file_name, file_name)
-    yield from bps.mv(eiger4M.hdf1.file_path, file_path)
-    yield from bps.mv(eiger4M.cam.num_images, num_frames)
-    yield from bps.mv(
-        eiger4M.cam.num_triggers, 1
-    )  # Need to put num_trigger to 1 for internal mode
-    yield from bps.mv(eiger4M.hdf1.num_capture, num_frames)
-
-    yield from bps.mv(pv_registers.file_name, file_name)
-    yield from bps.mv(pv_registers.file_path, file_path)
-    yield from bps.mv(
-        pv_registers.metadata_full_path, f"{file_path}/{file_name}_metadata.hdf"
-    )
+    return {
+        eiger4M.cam.trigger_mode: "Internal Series",  # 0
+        eiger4M.cam.acquire_time: acq_time,
+        eiger4M.cam.acquire_period: acq_period,
+        eiger4M.hdf1.file_name: file_name,
+        eiger4M.hdf1.file_path: file_path,
+        eiger4M.cam.num_images: num_frames,
+        eiger4M.cam.num_triggers: 1,  # Need to put num_trigger to 1 for internal mode
+        eiger4M.hdf1.num_capture: num_frames,
+        pv_registers.file_name: file_name,
+        pv_registers.file_path: file_path,
+        pv_registers.metadata_full_path: f"{file_path}/{file_name}_metadata.hdf",
+    }
+
+
+def setup_eiger_int_series(acq_time, num_frames, file_name):
+    """Setup the Eiger4M for internal series acquisition.
+
+    Configure the detector's cam module for internal acquisition mode and
+    set up the HDF plugin for data storage.  Only the settings that changed
+    since the previous repetition are written.
+
+    Args:
+        acq_time: Acquisition time per frame in seconds
+        num_frames: Number of frames to acquire
+        file_name: Base name for the output files
+
+    Returns:
+        ConfigReport of the settings written
+    """
+    settings = eiger_int_series_settings(acq_time, num_frames, file_name)
+    report = yield from detector_config.apply(settings, label=file_name)
+    return report
 
 ############# Homebrew acquisition plan #############
-def eiger_acquire():
-
-    yield from showbeam()
-    yield from bps.sleep(0.1)
-    yield from bps.mv(eiger4M.hdf1.capture, 1)
-    yield from bps.mv(eiger4M.cam.acquire, 1)
-        
-    while True:
-        det_status = eiger4M.cam.acquire_busy.get()
-        if det_status == 1:
-            yield from bps.sleep(0.1)
-        if det_status == 0:
-            break
-    yield from blockbeam()
-
-    frame_num_set = eiger4M.hdf1.queue_size.get()
-    count = 0
-    while count < 100:
-        frame_num_processed = eiger4M.hdf1.queue_free.get()
-        if frame_num_processed == frame_num_set:
-            break
-        else:
-            yield from bps.sleep(0.1)
-            count=+1
-        eiger4M.hdf1.capture.put(0)
+def eiger_acquire(timeout=None):
+    """Acquire one series with the Eiger4M and wait until the HDF5 file is written.
+
+    Completion is event driven (CA monitors on ``cam.acquire_busy`` and
+    ``hdf1.queue_free``), see ``utils.ad_completion``.
+
+    Args:
+        timeout: Seconds allowed for the acquisition (default: the
+            configured acquisition time plus a margin)
+
+    Returns:
+        AcquisitionTiming with the acquisition and drain times
+    """
+    timing, drained = yield from ad_expose(eiger4M, timeout=timeout)
+    timing = yield from ad_drain(eiger4M, timing, drained)
+    return timing
 ############# Homebrew acquisition plan ends #############
 
 
@@ -93,6 +98,8 @@ def eiger_acq_int_series(
 ):
     """Run internal series acquisition with the Eiger detector.
 
+    The repetitions are pipelined, see ``acq_pipeline.pipelined_series``.
+
     Args:
         acq_time: Acquisition time per frame in seconds
         num_frames: Number of frames to acquire
@@ -107,23 +114,24 @@ def eiger_acq_int_series(
     workflowProcApi, dmuser = dm_setup(process)
     folder_prefix = gen_folder_prefix()
 
-    for ii in range(num_rep):
-        yield from bps.sleep(wait_time)
-
-        if sample_move:
-            yield from mesh_grid_move()
-
-        file_name = f"{folder_prefix}_f{num_frames:06d}_r{ii+1:05d}"
-        yield from setup_eiger_int_series(acq_time, num_frames, file_name)
-
-        print(f"\nStarting Measurement {file_name}")
-        yield from eiger_acquire()
-        print(f"Measurement {file_name} Complete")
-
-        metadata_fname = pv_registers.metadata_full_path.get()
-        create_nexus_format_metadata(metadata_fname, det=eiger4M)
-
-        dm_run_job("eiger", process, workflowProcApi, dmuser, file_name)
+    timeline = yield from pipelined_series(
+        eiger4M,
+        "eiger",
+        num_rep,
+        file_name_for=lambda ii: f"{folder_prefix}_f{num_frames:06d}_r{ii+1:05d}",
+        settings_for=lambda file_name: eiger_int_series_settings(
+            acq_time, num_frames, file_name
+        ),
+        expose=lambda: ad_expose(eiger4M),
+        drain=lambda timing, drained: ad_drain(eiger4M, timing, drained),
+        held=eiger4M.hdf1,
+        wait_time=wait_time,
+        sample_move=sample_move,
+        process=process,
+        workflowProcApi=workflowProcApi,
+        dmuser=dmuser,
+    )
+    print(timeline.report())
     # except KeyboardInterrupt:
     #     raise RuntimeError("\n Bluesky plan stopped by user (Ctrl+C).")
     # except Exception as e:
@@ -8,11 +8,12 @@ from apsbits.core.instrument_init import oregistry
 from bluesky import plan_stubs as bps
 from bluesky import plans as bp
 
-from ..utils.dm_util import dm_run_job
 from ..utils.dm_util import dm_setup
-from ..utils.nexus_utils import create_nexus_format_metadata
+from .acq_pipeline import pipelined_series
+from .ad_setup_plans import detector_config
+from .mcs_stream_plans import stream_mcs
 from .sample_info_unpack import gen_folder_prefix
-from .sample_info_unpack import mesh_grid_move
+from .shutter_logic import beam_shutter
 from .shutter_logic import blockbeam
 from .shutter_logic import post_align
 from .shutter_logic import showbeam
@@ -22,16 +23,27 @@ rigaku3M = oregistry["rigaku3M"]
 pv_registers = oregistry["pv_registers"]
 
 
-def setup_rigaku_ZDT_series(acq_time, num_frames, file_name):
-    """Setup the Rigaku3M for ZDT series acquisition.
+def rigaku_data_dir(file_name):
+    """Create the data directory of ``file_name`` (the metadata file goes there)."""
+    cycle_name = pv_registers.cycle_name.get()
+    exp_name = pv_registers.experiment_name.get()
+    os.makedirs(
+        f"/gdata/dm/8ID/8IDI/{cycle_name}/{exp_name}/data/{file_name}",
+        mode=0o770,
+        exist_ok=True,
+    )
 
-    Configure the detector's cam module for internal acquisition mode and
-    set up the file paths for data storage.
+
+def rigaku_ZDT_series_settings(acq_time, num_frames, file_name):
+    """Desired Rigaku3M settings for one ZDT series acquisition.
 
     Args:
         acq_time: Acquisition time per frame in seconds
         num_frames: Number of frames to acquire
         file_name: Base name for the output files
+
+    Returns:
+        Dictionary of signal to value, for ``detector_config``
     """
     cycle_name = pv_registers.cycle_name.get()
     exp_name = pv_registers.experiment_name.get()
@@ -39,30 +51,53 @@ def setup_rigaku_ZDT_series(acq_time, num_frames, file_name):
     file_path = f"{exp_name}/data/{file_name}"
     acq_period = acq_time
 
-    yield from bps.mv(rigaku3M.cam.acquire_time, acq_time)
-    yield from bps.mv(rigaku3M.cam.acquire_period, acq_period)
-    yield from bps.mv(rigaku3M.cam.fast_file_name, f"{file_name}.bin")
-    yield from bps.mv(rigaku3M.cam.fast_file_path, file_path)
-    yield from bps.mv(rigaku3M.cam.num_images, num_frames)
+    return {
+        rigaku3M.cam.acquire_time: acq_time,
+        rigaku3M.cam.acquire_period: acq_period,
+        rigaku3M.cam.fast_file_name: f"{file_name}.bin",
+        rigaku3M.cam.fast_file_path: file_path,
+        rigaku3M.cam.num_images: num_frames,
+        pv_registers.file_name: file_name,
+        pv_registers.file_path: f"/gdata/dm/8ID/8IDI/{cycle_name}/{file_path}",
+        pv_registers.metadata_full_path: (
+            f"/gdata/dm/8ID/8IDI/{cycle_name}/{file_path}/{file_name}_metadata.hdf"
+        ),
+    }
 
-    yield from bps.mv(pv_registers.file_name, file_name)
-    yield from bps.mv(
-        pv_registers.file_path, f"/gdata/dm/8ID/8IDI/{cycle_name}/{file_path}"
-    )
-    yield from bps.mv(
-        pv_registers.metadata_full_path,
-        f"/gdata/dm/8ID/8IDI/{cycle_name}/{file_path}/{file_name}_metadata.hdf",
-    )
 
-    os.makedirs(f"/gdata/dm/8ID/8IDI/{cycle_name}/{file_path}", mode=0o770, exist_ok=True)
+def setup_rigaku_ZDT_series(acq_time, num_frames, file_name):
+    """Setup the Rigaku3M for ZDT series acquisition.
+
+    Configure the detector's cam module for internal acquisition mode and
+    set up the file paths for data storage.  Only the settings that changed
+    since the previous repetition are written.
+
+    Args:
+        acq_time: Acquisition time per frame in seconds
+        num_frames: Number of frames to acquire
+        file_name: Base name for the output files
+
+    Returns:
+        ConfigReport of the settings written
+    """
+    rigaku_data_dir(file_name)
+    settings = rigaku_ZDT_series_settings(acq_time, num_frames, file_name)
+    report = yield from detector_config.apply(settings, label=file_name)
+    return report
 
 
 ############# Homebrew acquisition plan #############
-def rigaku_zdt_acquire():
+def rigaku_zdt_acquire(start_triggers=None):
+    """Open the shutter, acquire one ZDT series, close the shutter.
 
-    yield from showbeam()
-    yield from bps.sleep(0.1)
+    Args:
+        start_triggers: Plan (callable) run once the detector is acquiring,
+            e.g. the kickoff of a fly scan
+    """
+    yield from showbeam(settle=True)
     yield from bps.mv(rigaku3M.cam.acquire, 1)
+    if start_triggers is not None:
+        yield from start_triggers()
     # yield from bps.sleep(2.0)
         
     while True:
@@ -70,6 +105,7 @@ def rigaku_zdt_acquire():
         if det_status != 1:
             yield from bps.sleep(0.1)
         if det_status == 1:
+            beam_shutter.acquire_started()
             break
 
     while True:
@@ -77,9 +113,16 @@ def rigaku_zdt_acquire():
         if det_status != 0:
             yield from bps.sleep(0.1)
         if det_status == 0:
+            beam_shutter.acquire_ended()
             break
    
     yield from blockbeam()
+
+
+def rigaku_zdt_expose():
+    """Acquire one ZDT series, in the form used by ``pipelined_series``."""
+    yield from rigaku_zdt_acquire()
+    return None, None  # no timing, the Rigaku writes its own file
 ############# Homebrew acquisition plan ends #############
 
 def rigaku_acq_ZDT_series(
@@ -89,9 +132,16 @@ def rigaku_acq_ZDT_series(
     wait_time=0,
     process=True,
     sample_move=False,
+    record_mcs=False,
 ):
     """Run ZDT series acquisition with the Rigaku detector.
 
+    The repetitions are pipelined, see ``acq_pipeline.pipelined_series``;
+    no Rigaku setting is written before the previous repetition ended.  With
+    ``record_mcs``, each exposure is a run whose ``mcs_stream`` stream has
+    the MCS inputs of every frame, or of every few frames at high frame
+    rates (see ``mcs_stream_plans``).
+
     Args:
         acq_time: Acquisition time per frame in seconds
         num_frame: Number of frames to acquire
@@ -99,6 +149,7 @@ def rigaku_acq_ZDT_series(
         wait_time: Time to wait between repetitions
         process: Whether to process data after acquisition
         sample_move: Whether to move sample between repetitions
+        record_mcs: Whether to record the MCS inputs during the exposures
     """
     # try:
     yield from post_align()
@@ -106,24 +157,27 @@ def rigaku_acq_ZDT_series(
     workflowProcApi, dmuser = dm_setup(process)
     folder_prefix = gen_folder_prefix()
 
-    for ii in range(num_rep):
-        if sample_move:
-            yield from mesh_grid_move()
-
-        file_name = f"{folder_prefix}_f{num_frame:06d}_r{ii+1:05d}"
-        print(file_name)
-        yield from setup_rigaku_ZDT_series(acq_time, num_frame, file_name)
-
-        print(f"\nStarting Measurement {file_name}")
-        yield from rigaku_zdt_acquire()
-        print(f"Measurement {file_name} Complete")
-
-        metadata_fname = pv_registers.metadata_full_path.get()
-        create_nexus_format_metadata(metadata_fname, det=rigaku3M)
-
-        dm_run_job("rigaku", process, workflowProcApi, dmuser, file_name)
-
-        yield from bps.sleep(wait_time)
+    timeline = yield from pipelined_series(
+        rigaku3M,
+        "rigaku",
+        num_rep,
+        file_name_for=lambda ii: f"{folder_prefix}_f{num_frame:06d}_r{ii+1:05d}",
+        settings_for=lambda file_name: rigaku_ZDT_series_settings(
+            acq_time, num_frame, file_name
+        ),
+        prepare=rigaku_data_dir,
+        expose=(
+            (lambda: stream_mcs(rigaku_zdt_expose, rate=1 / acq_time))
+            if record_mcs
+            else rigaku_zdt_expose
+        ),
+        wait_time=wait_time,
+        sample_move=sample_move,
+        process=process,
+        workflowProcApi=workflowProcApi,
+        dmuser=dmuser,
+    )
+    print(timeline.report())
 
     # except Exception as e:
     #     print(f"Error occurred during measurement: {e}")
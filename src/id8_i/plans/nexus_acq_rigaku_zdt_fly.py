@@ -6,16 +6,15 @@ import os
 
 from apsbits.core.instrument_init import oregistry
 from bluesky import plan_stubs as bps
-from bluesky import plans as bp
 
 from ..utils.dm_util import dm_run_job
 from ..utils.dm_util import dm_setup
 from ..utils.nexus_utils import create_nexus_format_metadata
+from .fly_scan_plans import fly_scan
+from .nexus_acq_rigaku_zdt import rigaku_zdt_acquire
 from .sample_info_unpack import gen_folder_prefix
 from .sample_info_unpack import mesh_grid_move
-from .shutter_logic import blockbeam
 from .shutter_logic import post_align
-from .shutter_logic import showbeam
 from .shutter_logic import shutteroff
 
 rigaku3M = oregistry["rigaku3M"]
@@ -71,6 +70,11 @@ def rigaku_acq_ZDT_fly(
 
     This plan performs a continuous motion scan while collecting data,
     moving the sample stage at a constant velocity during acquisition.
+    The Rigaku runs on its own clock and is not gated: the SoftGlue pulses,
+    one per frame period once the run-up time has passed, only clock the
+    MCS (see ``fly_scan``).  The latched stage motion stays in the
+    ``fly_scan`` stream of the run; it is not tied to the Rigaku frames, so
+    the metadata file has no ``/entry/sample/fly_scan``.
 
     Args:
         acq_time: Acquisition time per frame in seconds
@@ -94,19 +98,21 @@ def rigaku_acq_ZDT_fly(
                 yield from mesh_grid_move()
 
             file_name = (
-                f"{folder_prefix}_f{num_frame:06d}_s{flyspeed*1000:04d}_r{ii+1:05d}"
+                f"{folder_prefix}_f{num_frame:06d}"
+                f"_s{int(flyspeed * 1000):04d}_r{ii+1:05d}"
             )
             yield from setup_rigaku_ZDT_fly(acq_time, num_frame, file_name)
 
-            extra_acq_time = 1.0
-            total_travel = flyspeed * (acq_time * num_frame + extra_acq_time)
-            yield from bps.mv(sample.y.velocity, flyspeed)
-            yield from bps.mvr(sample.y.user_setpoint, total_travel)
-            yield from showbeam()
-            yield from bp.count([rigaku3M])
-            yield from blockbeam()
-            yield from bps.mv(sample.y.velocity, 5)
-            yield from bps.mvr(sample.y, -total_travel)
+            y0 = sample.y.position
+            yield from fly_scan(
+                lambda kickoff: rigaku_zdt_acquire(start_triggers=kickoff),
+                sample.y,
+                y0,
+                y0 + flyspeed * acq_time * num_frame,
+                num_frame,
+                acq_time,
+            )
+            yield from bps.mv(sample.y, y0)
 
             metadata_fname = pv_registers.metadata_full_path.get()
             create_nexus_format_metadata(metadata_fname, det=rigaku3M)
@@ -4,6 +4,11 @@ QNW temperature control plans for the 8ID-I beamline.
 This module provides plans for controlling QNW temperature controllers, including
 setting temperatures, ramping rates, and waiting for temperature stabilization.
 
+The target and the ramp rate are written once, with put completion, and
+written again only if the put fails (see ``devices.qnw_controller`` and
+``QNW`` in iconfig.yml); ``wait=True`` then waits for the temperature.
+``qnw_controller(qnw).summary()`` shows how many writes the values needed.
+
 Example:
     RE(set_qnw(1, 20))
 
@@ -18,10 +23,18 @@ To watch the EPICS PVs in a simple GUI:
         &
 """
 
+from typing import Any
+from typing import Dict
+
 from apsbits.core.instrument_init import oregistry
+from apsbits.utils.config_loaders import get_config
 from bluesky import plan_stubs as bps
 
-from .sample_info_unpack import sort_qnw
+from ..devices.qnw_controller import QnwController
+from .sample_info_unpack import current_sample
+from .wait_plans import wait_for_status
+
+iconfig = get_config()
 
 qnw_env1 = oregistry["qnw_env1"]
 qnw_env2 = oregistry["qnw_env2"]
@@ -60,6 +73,33 @@ qnw_controllers = [qnw_env1, qnw_env2, qnw_env3]
 # For vac qnw
 # qnw_controllers = [qnw_vac1, qnw_vac2, qnw_vac3]
 
+_verified: Dict[str, QnwController] = {}
+
+
+def qnw_controller(qnw: Any) -> QnwController:
+    """The write layer of a QnwDevice, created and started on first use."""
+    if qnw.name not in _verified:
+        config = iconfig.get("QNW", {})
+        _verified[qnw.name] = QnwController(
+            qnw,
+            timeout=config.get("WRITE_TIMEOUT", 5.0),
+            retries=config.get("RETRIES", 1),
+        )
+    return _verified[qnw.name]
+
+
+def _set_temperature(qnw, setpoint: float, wait: bool):
+    """Write the target once, then wait for the temperature if asked."""
+    control = qnw_controller(qnw)
+    yield from bps.mv(control.setpoint, setpoint)
+    if wait:
+        yield from wait_for_status(control.temperature_reached(setpoint))
+
+
+def _set_ramp_rate(qnw, ramprate: float):
+    """Write the ramp rate once."""
+    yield from bps.mv(qnw_controller(qnw).ramprate, ramprate)
+
 
 def find_qnw_index() -> int:
     """Find the index of the currently selected QNW environment.
@@ -70,12 +110,12 @@ def find_qnw_index() -> int:
     Raises:
         ValueError: If no QNW environment is selected
     """
-    sam_dict = sort_qnw()
-    if sam_dict["temp_zone"] == "qnw_env1":
+    temp_zone = current_sample().temp_zone
+    if temp_zone == "qnw_env1":
         qnw_number = 1
-    elif sam_dict["temp_zone"] == "qnw_env2":
+    elif temp_zone == "qnw_env2":
         qnw_number = 2
-    elif sam_dict["temp_zone"] == "qnw_env3":
+    elif temp_zone == "qnw_env3":
         qnw_number = 3
     else:
         raise ValueError("No QNW environment selected")
@@ -91,11 +131,7 @@ def set_temperature(setpoint: float, wait: bool = False):
     """
     qnw_number = find_qnw_index()
     qnw = qnw_controllers[qnw_number - 1]
-    if wait:
-        yield from bps.mv(qnw, setpoint)
-    else:
-        yield from bps.mv(qnw.setpoint, setpoint)
-    yield from bps.sleep(2)
+    yield from _set_temperature(qnw, setpoint, wait)
 
 
 def set_ramp_rate(ramprate: float = 0.3):
@@ -106,10 +142,7 @@ def set_ramp_rate(ramprate: float = 0.3):
     """
     qnw_number = find_qnw_index()
     qnw = qnw_controllers[qnw_number - 1]
-    yield from bps.mv(qnw.ramprate, ramprate)
-    yield from bps.sleep(2)
-    yield from bps.mv(qnw.ramprate, ramprate)
-    yield from bps.sleep(2)
+    yield from _set_ramp_rate(qnw, ramprate)
 
 
 def set_temperature_with_ramp(
@@ -126,30 +159,9 @@ def set_temperature_with_ramp(
     """
     qnw_number = find_qnw_index()
     qnw = qnw_controllers[qnw_number - 1]
-    # Run this thrice just to make sure all settings go through
-    yield from bps.mv(qnw.ramprate, ramprate)
-    yield from bps.sleep(2)
-    if wait:
-        yield from bps.mv(qnw, setpoint)
-    else:
-        yield from bps.mv(qnw.setpoint, setpoint)
-    yield from bps.sleep(2)
-
-    yield from bps.mv(qnw.ramprate, ramprate)
-    yield from bps.sleep(2)
-    if wait:
-        yield from bps.mv(qnw, setpoint)
-    else:
-        yield from bps.mv(qnw.setpoint, setpoint)
-    yield from bps.sleep(2)
-
-    yield from bps.mv(qnw.ramprate, ramprate)
-    yield from bps.sleep(2)
-    if wait:
-        yield from bps.mv(qnw, setpoint)
-    else:
-        yield from bps.mv(qnw.setpoint, setpoint)
-    yield from bps.sleep(2)
+    # before the target, so the new ramp applies
+    yield from _set_ramp_rate(qnw, ramprate)
+    yield from _set_temperature(qnw, setpoint, wait)
 
 
 def set_temperature_env(
@@ -165,10 +177,7 @@ def set_temperature_env(
         wait: Whether to wait for temperature to stabilize
     """
     qnw = qnw_controllers[qnw_number - 1]
-    if wait:
-        yield from bps.mv(qnw, setpoint)
-    else:
-        yield from bps.mv(qnw.setpoint, setpoint)
+    yield from _set_temperature(qnw, setpoint, wait)
 
 
 def set_ramp_rate_env(
@@ -182,4 +191,4 @@ def set_ramp_rate_env(
         ramprate: Temperature ramp rate in degrees Celsius per minute
     """
     qnw = qnw_controllers[qnw_number - 1]
-    yield from bps.mv(qnw.ramprate, ramprate)
+    yield from _set_ramp_rate(qnw, ramprate)
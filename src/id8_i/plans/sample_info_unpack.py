@@ -1,24 +1,172 @@
 """
 Module for selecting samples and reading sample information from a JSON
 configuration file. Supports both rheometer and regular sample stages.
+
+The file is read through ``sample_catalog`` (see ``utils.sample_catalog``),
+which parses it again only when it changed.  The dose received by each
+spot is kept in ``utils.dose_ledger``; with ``MAX_SPOT_DOSE`` set in
+iconfig.yml, ``mesh_grid_move`` skips spots that already received it.
+Doses are booked at the grid position nearest the stage readback, the
+position they are looked up at.
 """
 
-import json
+import logging
 from pathlib import Path
 from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
 from typing import Union
 
 import numpy as np
 from apsbits.core.instrument_init import oregistry
+from apsbits.utils.config_loaders import get_config
 from bluesky import plan_stubs as bps
 
+from ..utils.dose_ledger import dose_ledger
+from ..utils.sample_catalog import SampleCatalog
+from ..utils.sample_catalog import SampleInfo
+from ..utils.sample_grid import SampleGrid
+
 sample = oregistry["sample"]
 rheometer = oregistry["rheometer"]
 filter = oregistry["filter_8ide"]
 pv_registers = oregistry["pv_registers"]
+iconfig = get_config()
+logger = logging.getLogger(__name__)
 
 SAMPLE_INFO_PATH = Path("/home/beams/8IDIUSER/bluesky/src/user_plans/sample_info.json")
 
+SAMPLE_GRID_ORDER = iconfig.get("SAMPLE_GRID_ORDER", "raster")
+MAX_SPOT_DOSE = iconfig.get("MAX_SPOT_DOSE")  # A s, None: spots reused in grid order
+
+sample_catalog = SampleCatalog(SAMPLE_INFO_PATH)
+
+
+def current_sample() -> SampleInfo:
+    """Return the sample selected by the ``qnw_index`` register."""
+    return sample_catalog[int(pv_registers.qnw_index.get())]
+
+
+def sample_grid(info: Optional[SampleInfo] = None) -> SampleGrid:
+    """Return the (cached) grid of spots of a sample, default: the current one."""
+    info = current_sample() if info is None else info
+    return SampleGrid.from_sample(info, SAMPLE_GRID_ORDER)
+
+
+def sample_stage(index: int):
+    """Stage that moves sample ``index``: rheometer (0), sample (1-27), or None."""
+    if index == 0:
+        return rheometer
+    if 1 <= index <= 27:
+        return sample
+    return None
+
+
+def next_grid_positions(
+    k: int, info: Optional[SampleInfo] = None
+) -> List[Tuple[int, float, float]]:
+    """The next ``k`` spots of a sample after its cursor, without moving.
+
+    Args:
+        k: Number of spots
+        info: Sample (default: the current one)
+
+    Returns:
+        List of (step, x, y), the step is the value the cursor register takes there
+    """
+    info = current_sample() if info is None else info
+    cursor = int(pv_registers.sample_position_register(info.index).get())
+    steps, positions = sample_grid(info).next_positions(cursor, k)
+    return [
+        (int(step), float(x), float(y))
+        for step, (x, y) in zip(steps, positions, strict=True)
+    ]
+
+
+def sample_key(info: SampleInfo) -> str:
+    """Key of a sample in the dose ledger: slot and name."""
+    return f"{info.index}:{info.sample_name}"
+
+
+def current_spot() -> Optional[Tuple[str, float, float]]:
+    """(sample key, x, y) of the spot in the beam, None if no stage holds the sample.
+
+    The readback is snapped to the nearest spot of the sample grid (the
+    setpoint), so the dose is found again by ``spot_doses``; a position off
+    the grid is kept as read.
+    """
+    info = current_sample()
+    stage = sample_stage(info.index)
+    if stage is None:
+        return None
+    x, y = stage.x.position, stage.y.position
+    grid = sample_grid(info)
+    step = grid.nearest_step(x, y)
+    if step is not None:
+        x, y = grid.position(step)
+    return sample_key(info), x, y
+
+
+def spot_doses(info: Optional[SampleInfo] = None) -> np.ndarray:
+    """Dose (A s) received by each spot of a sample, in grid order."""
+    info = current_sample() if info is None else info
+    return dose_ledger.doses(sample_key(info), sample_grid(info).positions)
+
+
+def rank_spots(
+    k: int, info: Optional[SampleInfo] = None
+) -> List[Tuple[int, float, float, float]]:
+    """The ``k`` least exposed spots of a sample, grid order after the cursor on ties.
+
+    Returns:
+        List of (step, x, y, dose)
+    """
+    info = current_sample() if info is None else info
+    grid = sample_grid(info)
+    cursor = int(pv_registers.sample_position_register(info.index).get())
+    steps, positions = grid.next_positions(cursor, len(grid))
+    doses = spot_doses(info)[steps]
+    best = np.lexsort((np.arange(len(steps)), doses))[:k]  # stable: by dose, then order
+    return [
+        (int(steps[i]), float(positions[i, 0]), float(positions[i, 1]), float(doses[i]))
+        for i in best
+    ]
+
+
+def next_spot_step(
+    cursor: int, info: SampleInfo, max_dose: Optional[float] = None
+) -> int:
+    """Grid step of the next spot to measure after ``cursor``.
+
+    Args:
+        cursor: Current step of the sample's cursor
+        info: Sample
+        max_dose: Skip spots that received more (A s); None: the next step
+
+    Returns:
+        The first step after ``cursor`` whose dose is at most ``max_dose``,
+        or the least exposed spot if all received more
+    """
+    grid = sample_grid(info)
+    if max_dose is None:
+        return grid.wrap(cursor + 1)
+    steps, _ = grid.next_positions(cursor, len(grid))
+    doses = spot_doses(info)[steps]
+    fresh = np.flatnonzero(doses <= max_dose)
+    if len(fresh) == 0:
+        logger.warning(
+            "All spots of %s received more than %g A s, using the least exposed",
+            sample_key(info),
+            max_dose,
+        )
+        return int(steps[np.argmin(doses)])
+    if fresh[0] > 0:
+        logger.info(
+            "Skipped %d spots of %s above %g A s", fresh[0], sample_key(info), max_dose
+        )
+    return int(steps[fresh[0]])
+
 
 def select_sample(env: int):
     """Select and move to a sample position.
@@ -33,21 +181,15 @@ def select_sample(env: int):
     Yields:
         Generator: Bluesky plan messages
     """
-    with open(SAMPLE_INFO_PATH, "r") as f:
-        loaded_dict = json.load(f)
+    info = sample_catalog[env]
+    x_cen = info.x_cen
+    y_cen = info.y_cen
 
-    sample_key = f"sample_{env}"
-    x_cen = loaded_dict[sample_key]["x_cen"]
-    y_cen = loaded_dict[sample_key]["y_cen"]
+    print(f"Moving sample_{env} x to {x_cen} and y to {y_cen}")
 
-    print(f"Moving {sample_key} x to {x_cen} and y to {y_cen}")
-
-    if env == 0:
-        yield from bps.mv(rheometer.x, x_cen, rheometer.y, y_cen)
-    elif 1 <= env <= 27:
-        yield from bps.mv(sample.x, x_cen, sample.y, y_cen)
-    else:
-        pass
+    stage = sample_stage(env)
+    if stage is not None:
+        yield from bps.mv(stage.x, x_cen, stage.y, y_cen)
 
     yield from bps.mv(pv_registers.qnw_index, env)
 
@@ -70,23 +212,20 @@ def sort_qnw() -> Dict[str, Union[int, float, str]]:
         - x_pts, y_pts: Number of points in each direction
         - temp_zone: Temperature zone information
     """
-    qnw_index = int(pv_registers.qnw_index.get())
-    sample_key = f"sample_{qnw_index}"
-    with open(SAMPLE_INFO_PATH, "r") as f:
-        loaded_dict = json.load(f)
+    info = current_sample()
 
     sam_dict = {
-        "qnw_index": int(pv_registers.qnw_index.get()),
+        "qnw_index": info.index,
         "meas_num": int(pv_registers.measurement_num.get()),
-        "sample_name": loaded_dict[sample_key]["sample_name"],
-        "header": loaded_dict[sample_key]["header"],
-        "x_cen": float(loaded_dict[sample_key]["x_cen"]),
-        "y_cen": float(loaded_dict[sample_key]["y_cen"]),
-        "x_radius": float(loaded_dict[sample_key]["x_radius"]),
-        "y_radius": float(loaded_dict[sample_key]["y_radius"]),
-        "x_pts": int(loaded_dict[sample_key]["x_pts"]),
-        "y_pts": int(loaded_dict[sample_key]["y_pts"]),
-        "temp_zone": loaded_dict[sample_key]["temp_zone"],
+        "sample_name": info.sample_name,
+        "header": info.header,
+        "x_cen": info.x_cen,
+        "y_cen": info.y_cen,
+        "x_radius": info.x_radius,
+        "y_radius": info.y_radius,
+        "x_pts": info.x_pts,
+        "y_pts": info.y_pts,
+        "temp_zone": info.temp_zone,
     }
 
     return sam_dict
@@ -116,41 +255,44 @@ def gen_folder_prefix() -> str:
     return folder_name
 
 
-def mesh_grid_move():
+def mesh_grid_move(group=None, max_dose=MAX_SPOT_DOSE):
     """Move to the next position in a mesh grid scan.
 
-    This plan calculates and moves to the next position in a mesh grid pattern,
-    using either the rheometer or sample stage depending on the current
-    environment.
+    This plan moves to the next spot of the current sample's grid (in the
+    ``SAMPLE_GRID_ORDER`` of iconfig.yml), using either the rheometer or
+    sample stage depending on the current environment, and advances the
+    cursor in the sample's position register.
+
+    Args:
+        group: If given, only start the moves in this group and return;
+            the caller waits with ``bps.wait(group)``
+        max_dose: Skip spots that received more dose (A s), see
+            ``next_spot_step``; None: the next spot in grid order
 
     Yields:
         Generator: Bluesky plan messages
-    """
-    sam_dict = sort_qnw()
 
-    sample_pos_register = pv_registers.sample_position_register(sam_dict["qnw_index"])
-    sam_pos = int(sample_pos_register.get())
-
-    samx_list = np.linspace(
-        sam_dict["x_cen"] - sam_dict["x_radius"],
-        sam_dict["x_cen"] + sam_dict["x_radius"],
-        num=sam_dict["x_pts"],
-    )
-    samy_list = np.linspace(
-        sam_dict["y_cen"] - sam_dict["y_radius"],
-        sam_dict["y_cen"] + sam_dict["y_radius"],
-        num=sam_dict["y_pts"],
-    )
-
-    pos_index = np.mod(sam_pos + 1, sam_dict["x_pts"] * sam_dict["y_pts"])
-    x_pos = samx_list[np.mod(pos_index, sam_dict["x_pts"])]
-    y_pos = samy_list[int(np.floor(pos_index / sam_dict["x_pts"]))]
-
-    if sam_dict["qnw_index"] == 0:
-        yield from bps.mv(rheometer.x, x_pos, rheometer.y, y_pos)
-    elif sam_dict["qnw_index"] >= 1 and sam_dict["qnw_index"] <= 27:
-        yield from bps.mv(sample.x, x_pos, sample.y, y_pos)
-    else:
-        pass
-
-    yield from bps.mv(sample_pos_register, pos_index)
+    Returns:
+        List of the move statuses (empty unless ``group`` is given)
+    """
+    info = current_sample()
+
+    sample_pos_register = pv_registers.sample_position_register(info.index)
+    grid = sample_grid(info)
+    pos_index = next_spot_step(int(sample_pos_register.get()), info, max_dose)
+    x_pos, y_pos = grid.position(pos_index)
+    stage = sample_stage(info.index)
+
+    if group is None:
+        if stage is not None:
+            yield from bps.mv(stage.x, x_pos, stage.y, y_pos)
+        yield from bps.mv(sample_pos_register, pos_index)
+        return []
+
+    statuses = []
+    if stage is not None:
+        statuses.append((yield from bps.abs_set(stage.x, x_pos, group=group)))
+        statuses.append((yield from bps.abs_set(stage.y, y_pos, group=group)))
+    status = yield from bps.abs_set(sample_pos_register, pos_index, group=group)
+    statuses.append(status)
+    return statuses
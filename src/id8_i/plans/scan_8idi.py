@@ -3,15 +3,36 @@ Scanning plans for the 8ID-I beamline.
 
 This module provides plans for scanning various motors and detectors at the
 8ID-I beamline, including sample and rheometer stages, with attenuation control.
+
+The ``*_fly_lup`` plans are continuous variants of the ``*_lup`` step scans:
+the stage moves once across the range while the picoammeter buffers its
+samples (time-series plugin), and the centre of the peak or edge is
+returned as the plan value (see ``utils.fly_alignment``).
+
+:func:`adaptive_lup` steps like the ``*_lup`` scans, but starts with a
+coarse grid and adds points only where the signal changes, until the
+centre is known to a tolerance (see ``utils.adaptive_scan``).
 """
 
+import time
+from typing import List
 from typing import Optional
 
 from apsbits.core.instrument_init import oregistry
 from bluesky import plan_stubs as bps
 from bluesky import plans as bp
+from bluesky import preprocessors as bpp
 from ophyd import Device
 
+from ..utils.adaptive_scan import AdaptiveResult
+from ..utils.adaptive_scan import AdaptiveSampler
+from ..utils.fly_alignment import Alignment
+from ..utils.fly_alignment import bin_by_position
+from ..utils.fly_alignment import find_centre
+from ..utils.fly_alignment import positions_at
+from .attenuator_plans import set_attenuation
+from .beam_series_plans import read_beam_series
+from .beam_series_plans import start_beam_series
 from .shutter_logic import blockbeam
 from .shutter_logic import pre_align
 from .shutter_logic import showbeam
@@ -21,15 +42,18 @@ sample = oregistry["sample"]
 filter = oregistry["filter_8ide"]
 tetramm1 = oregistry["tetramm1"]
 
+FLY_ALIGN_TIME = 5.0  # s to cross the range of a fly alignment scan
+FLY_ALIGN_SAMPLE_TIME = 1e-3  # s per picoammeter sample
+FLY_ALIGN_MARGIN = 2.0  # s of samples captured beyond the crossing
+
 
 def att(att_ratio: Optional[float] = None):
-    """Set the attenuation ratio with multiple attempts.
+    """Set the attenuation ratio, waiting for the filters to settle (no-op if set).
 
     Args:
         att_ratio: Attenuation ratio to set (0-15)
     """
-    yield from bps.mv(filter.attenuation, att_ratio)
-    yield from bps.sleep(0.5)
+    yield from set_attenuation(filter, att_ratio)
 
 
 def x_lup(
@@ -49,7 +73,7 @@ def x_lup(
         det: Detector to use for the scan
     """
     yield from pre_align()
-    yield from bps.mv(filter.attenuation, att_ratio)
+    yield from att(att_ratio)
 
     yield from showbeam()
     yield from bp.rel_scan([det], sample.x, rel_begin, rel_end, num_pts)
@@ -73,7 +97,7 @@ def y_lup(
         det: Detector to use for the scan
     """
     yield from pre_align()
-    yield from bps.mv(filter.attenuation, att_ratio)
+    yield from att(att_ratio)
 
     yield from showbeam()
     yield from bp.rel_scan([det], sample.y, rel_begin, rel_end, num_pts)
@@ -97,7 +121,7 @@ def rheo_x_lup(
         det: Detector to use for the scan
     """
     yield from pre_align()
-    yield from bps.mv(filter.attenuation, att_ratio)
+    yield from att(att_ratio)
 
     yield from showbeam()
     yield from bp.rel_scan([det], rheometer.x, rel_begin, rel_end, num_pts)
@@ -121,7 +145,7 @@ def rheo_y_lup(
         det: Detector to use for the scan
     """
     yield from pre_align()
-    yield from bps.mv(filter.attenuation, att_ratio)
+    yield from att(att_ratio)
 
     yield from showbeam()
     yield from bp.rel_scan([det], rheometer.y, rel_begin, rel_end, num_pts)
@@ -142,7 +166,7 @@ def rheo_set_x_lup(
         det: Detector to use for the scan
     """
     yield from pre_align()
-    yield from bps.mv(filter.attenuation, att_ratio)
+    yield from att(att_ratio)
 
     yield from bps.mv(rheometer.x, -14.0)
     yield from showbeam()
@@ -158,3 +182,266 @@ def rheo_set_x_lup(
     #yield from showbeam()
     #yield from bp.rel_scan([det], rheometer.x, -8, 8, 160)
     #yield from blockbeam()
+
+
+def _fly_align(
+    motor,
+    rel_begin: float,
+    rel_end: float,
+    num_bins: int,
+    det: Device,
+    duration: float,
+    channel: str,
+    kind: str,
+) -> Alignment:
+    """Fly ``motor`` across a relative range, return it, and find the centre."""
+    origin = motor.position
+    begin, end = origin + rel_begin, origin + rel_end
+    velocity = motor.velocity.get()
+
+    def record(value=None, **kwargs):
+        readbacks.append((time.time(), value))
+
+    yield from bps.mv(motor, begin)
+    yield from showbeam()
+    yield from start_beam_series(
+        duration + FLY_ALIGN_MARGIN,
+        picoammeter=det,
+        averaging_time=FLY_ALIGN_SAMPLE_TIME,
+    )
+    t_start = time.time()  # of the first picoammeter sample, within the CA latency
+    readbacks = [(t_start, begin)]
+    cid = motor.user_readback.subscribe(record, run=False)
+
+    def fly():
+        yield from bps.mv(motor.velocity, abs(rel_end - rel_begin) / duration)
+        yield from bps.mv(motor, end)
+
+    def cleanup():
+        motor.user_readback.unsubscribe(cid)
+        yield from blockbeam()
+        yield from bps.mv(motor.velocity, velocity)
+
+    yield from bpp.finalize_wrapper(fly(), cleanup())
+    times, values = yield from read_beam_series(det, channel)
+    yield from bps.mv(motor, origin)  # as the step scans do
+
+    readback_times, positions = (list(c) for c in zip(*readbacks, strict=True))
+    at_samples = positions_at(t_start + times, readback_times, positions)
+    x, y = bin_by_position(at_samples, values, begin, end, num_bins)
+    result = find_centre(x, y, kind)
+    print(f"{motor.name}: {result}")
+    return result
+
+
+def fly_lup(
+    motor,
+    rel_begin: float = -3,
+    rel_end: float = 3,
+    num_bins: int = 60,
+    att_ratio: int = 7,
+    det: Device = tetramm1,
+    duration: float = FLY_ALIGN_TIME,
+    channel: str = "sum_all",
+    kind: str = "auto",
+):
+    """Fly a motor across a relative range and find the centre of the peak or edge.
+
+    Args:
+        motor: Motor to scan
+        rel_begin: Start position relative to current position (mm)
+        rel_end: End position relative to current position (mm)
+        num_bins: Number of position bins (the points of the step scan)
+        att_ratio: Attenuation level to use (0-15)
+        det: Picoammeter to use for the scan
+        duration: Seconds to cross the range
+        channel: Time series of ``det.ts`` to use
+        kind: "peak", "edge", or "auto"
+
+    Returns:
+        Alignment (the motor is back at its start position)
+    """
+    yield from pre_align()
+    yield from att(att_ratio)
+    return (
+        yield from _fly_align(
+            motor, rel_begin, rel_end, num_bins, det, duration, channel, kind
+        )
+    )
+
+
+def x_fly_lup(
+    rel_begin: float = -3,
+    rel_end: float = 3,
+    num_bins: int = 60,
+    att_ratio: int = 7,
+    det: Device = tetramm1,
+    duration: float = FLY_ALIGN_TIME,
+    kind: str = "auto",
+):
+    """Fly variant of :func:`x_lup`, returns the Alignment."""
+    motor = sample.x
+    return (
+        yield from fly_lup(
+            motor, rel_begin, rel_end, num_bins, att_ratio, det, duration, kind=kind
+        )
+    )
+
+
+def y_fly_lup(
+    rel_begin: float = -3,
+    rel_end: float = 3,
+    num_bins: int = 60,
+    att_ratio: int = 7,
+    det: Device = tetramm1,
+    duration: float = FLY_ALIGN_TIME,
+    kind: str = "auto",
+):
+    """Fly variant of :func:`y_lup`, returns the Alignment."""
+    motor = sample.y
+    return (
+        yield from fly_lup(
+            motor, rel_begin, rel_end, num_bins, att_ratio, det, duration, kind=kind
+        )
+    )
+
+
+def rheo_x_fly_lup(
+    rel_begin: float = -3,
+    rel_end: float = 3,
+    num_bins: int = 30,
+    att_ratio: int = 10,
+    det: Device = tetramm1,
+    duration: float = FLY_ALIGN_TIME,
+    kind: str = "auto",
+):
+    """Fly variant of :func:`rheo_x_lup`, returns the Alignment."""
+    motor = rheometer.x
+    return (
+        yield from fly_lup(
+            motor, rel_begin, rel_end, num_bins, att_ratio, det, duration, kind=kind
+        )
+    )
+
+
+def rheo_y_fly_lup(
+    rel_begin: float = -3,
+    rel_end: float = 3,
+    num_bins: int = 30,
+    att_ratio: int = 10,
+    det: Device = tetramm1,
+    duration: float = FLY_ALIGN_TIME,
+    kind: str = "auto",
+):
+    """Fly variant of :func:`rheo_y_lup`, returns the Alignment."""
+    motor = rheometer.y
+    return (
+        yield from fly_lup(
+            motor, rel_begin, rel_end, num_bins, att_ratio, det, duration, kind=kind
+        )
+    )
+
+
+def rheo_set_x_fly_lup(
+    att_ratio: int = 10,
+    det: Device = tetramm1,
+    duration: float = FLY_ALIGN_TIME,
+    kind: str = "auto",
+) -> List[Alignment]:
+    """Fly variant of :func:`rheo_set_x_lup`, returns the Alignment at each position."""
+    yield from pre_align()
+    yield from att(att_ratio)
+
+    results = []
+    for position in (-14.0, -2.6):
+        yield from bps.mv(rheometer.x, position)
+        result = yield from _fly_align(
+            rheometer.x, -0.5, 0.5, 100, det, duration, "sum_all", kind
+        )
+        results.append(result)
+    return results
+
+
+def adaptive_lup(
+    motor,
+    rel_begin: float = -3,
+    rel_end: float = 3,
+    tolerance: float = 0.01,
+    att_ratio: int = 7,
+    det: Device = tetramm1,
+    kind: str = "auto",
+    coarse_points: int = 11,
+    max_points: int = 60,
+    signal=None,
+    md: Optional[dict] = None,
+) -> AdaptiveResult:
+    """Step a motor over a relative range, adding points until the centre is known.
+
+    Works for ``sample.x``, ``sample.y``, ``rheometer.x`` and ``rheometer.y``
+    as the ``*_lup`` scans do; every point is an event of one run.
+
+    Args:
+        motor: Motor to scan
+        rel_begin: Start position relative to current position (mm)
+        rel_end: End position relative to current position (mm)
+        tolerance: Wanted uncertainty of the centre (mm)
+        att_ratio: Attenuation level to use (0-15)
+        det: Detector to use for the scan
+        kind: "peak", "edge", or "auto"
+        coarse_points: Points of the initial uniform grid
+        max_points: Points after which the scan stops anyway
+        signal: Signal of ``det`` to follow (default: ``det.sum_all.mean_value``)
+        md: Metadata of the run
+
+    Returns:
+        AdaptiveResult (the motor is back at its start position)
+    """
+    signal = signal if signal is not None else det.sum_all.mean_value
+    origin = motor.position
+    sampler = AdaptiveSampler(
+        origin + rel_begin,
+        origin + rel_end,
+        tolerance,
+        kind=kind,
+        coarse_points=coarse_points,
+        max_points=max_points,
+    )
+    _md = {
+        "plan_name": "adaptive_lup",
+        "motors": [motor.name],
+        "detectors": [det.name],
+        "plan_args": {
+            "rel_begin": rel_begin,
+            "rel_end": rel_end,
+            "tolerance": tolerance,
+            "kind": kind,
+        },
+        "hints": {"dimensions": [(motor.hints["fields"], "primary")]},
+    }
+    _md.update(md or {})
+
+    @bpp.stage_decorator([det])
+    @bpp.run_decorator(md=_md)
+    def scan():
+        positions = list(sampler.initial_points())
+        while positions:
+            for position in positions:
+                yield from bps.mv(motor, position)
+                readings = yield from bps.trigger_and_read([det, motor])
+                sampler.tell(
+                    readings[motor.name]["value"], readings[signal.name]["value"]
+                )
+            positions = sampler.ask()
+
+    def cleanup():
+        yield from blockbeam()
+        yield from bps.mv(motor, origin)  # as the step scans do
+
+    yield from pre_align()
+    yield from att(att_ratio)
+    yield from showbeam()
+    yield from bpp.finalize_wrapper(scan(), cleanup())
+
+    result = sampler.result()
+    print(f"{motor.name}: {result}")
+    return result
@@ -3,25 +3,76 @@ Shutter control logic for the 8ID-I beamline.
 
 This module provides plans for controlling the beam shutter and safety interlocks
 using the LabJack device.
+
+The LabJack output (Bo0) is write-only: its record echoes the command,
+not the shutter.  ``beam_shutter`` (see ``devices.shutter_controller``)
+writes every command, without a round trip, and keeps the *commanded*
+state and beam-on times.  ``beam_shutter.summary()`` shows the measured
+open-to-acquire and acquire-to-close times.
+
+The time the beam is shown, and the dose the sample spot in the beam
+receives, is booked in the dose ledger (see ``utils.dose_ledger``).
 """
 
+import logging
+
 import epics as pe
 from apsbits.core.instrument_init import oregistry
+from apsbits.utils.config_loaders import get_config
 from bluesky import plan_stubs as bps
 
+from ..devices.shutter_controller import ShutterController
+from ..utils.dose_ledger import dose_meter
+from ..utils.metadata_cache import metadata_cache
+from .sample_info_unpack import current_spot
+
+logger = logging.getLogger(__name__)
+iconfig = get_config()
+SHUTTER = iconfig.get("SHUTTER", {})
+OPEN_SETTLE = SHUTTER.get("OPEN_SETTLE", 0.1)  # s after the open, before exposing
+
 labjack = oregistry["labjack"]
+tetramm1 = oregistry["tetramm1"]
+filter_8ide = oregistry["filter_8ide"]
+
+beam_shutter = ShutterController(
+    labjack.operation,
+    open_value=0,
+    close_value=1,
+    name="beam_shutter",
+)
 
+dose_meter.attach(tetramm1.current1.mean_value)  # incident beam intensity
+metadata_cache.watch(filter_8ide.transmission.readback)
 
-def showbeam():
-    """Open the beam shutter to show the beam."""
-    if labjack.operation.get(use_cache=False) != 0:
-        yield from bps.mv(labjack.operation, 0)
+
+def _spot_in_beam():
+    """(sample, x, y) for the dose ledger, None if it cannot be told."""
+    try:
+        return current_spot()
+    except Exception as exc:  # no sample file, no sample selected, ...
+        logger.debug("Dose not booked: %s", exc)
+        return None
+
+
+def showbeam(settle: bool = False):
+    """Open the beam shutter to show the beam.
+
+    Args:
+        settle: Wait ``OPEN_SETTLE`` after the open is written (before an exposure)
+    """
+    yield from bps.mv(beam_shutter, "open")
+    transmission = metadata_cache.get(filter_8ide.transmission.readback)
+    transmission = 1.0 if transmission is None else float(transmission)
+    dose_meter.beam_on(_spot_in_beam(), transmission)
+    if settle and OPEN_SETTLE > 0:
+        yield from bps.sleep(OPEN_SETTLE)
 
 
 def blockbeam():
     """Block the beam by closing the shutter."""
-    if labjack.operation.get(use_cache=False) != 1:
-        yield from bps.mv(labjack.operation, 1)
+    yield from bps.mv(beam_shutter, "close")
+    dose_meter.beam_off()
 
 
 def shutteron():
@@ -2,23 +2,45 @@
 Shutter control logic for the 8ID-E beamline.
 
 This module provides plans for controlling the beam shutter and safety interlocks
-at the 8ID-E station.
+at the 8ID-E station.  As in 8ID-I, the shutter is write-only: the
+``State`` record echoes the command (``beam_shutter``, see
+``devices.shutter_controller``).
 """
 
 from apsbits.core.instrument_init import oregistry
+from apsbits.utils.config_loaders import get_config
 from bluesky import plan_stubs as bps
 
+from ..devices.shutter_controller import ShutterController
+
+iconfig = get_config()
+SHUTTER = iconfig.get("SHUTTER", {})
+OPEN_SETTLE = SHUTTER.get("OPEN_SETTLE", 0.1)  # s after the open, before exposing
+
 shutter_8ide = oregistry["shutter_8ide"]
 
+beam_shutter = ShutterController(
+    shutter_8ide.operation,
+    open_value=0,
+    close_value=1,
+    name="beam_shutter_8ide",
+)
+
+
+def showbeam(settle: bool = False):
+    """Open the beam shutter to show the beam.
 
-def showbeam():
-    """Open the beam shutter to show the beam."""
-    yield from bps.mv(shutter_8ide.operation, 0)
+    Args:
+        settle: Wait ``OPEN_SETTLE`` after the open is written (before an exposure)
+    """
+    yield from bps.mv(beam_shutter, "open")
+    if settle and OPEN_SETTLE > 0:
+        yield from bps.sleep(OPEN_SETTLE)
 
 
 def blockbeam():
     """Block the beam by closing the shutter."""
-    yield from bps.mv(shutter_8ide.operation, 1)
+    yield from bps.mv(beam_shutter, "close")
 
 
 def shutteron():
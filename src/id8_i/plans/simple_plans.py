@@ -4,7 +4,6 @@ Simple, modular Bluesky plans for users.
 
 import warnings
 
-import numpy as np
 from apsbits.core.instrument_init import oregistry
 from apstools.devices import DM_WorkflowConnector
 from apstools.utils import share_bluesky_metadata_with_dm
@@ -14,8 +13,17 @@ from bluesky import preprocessors as bpp
 
 from ..startup import cat
 from ..startup import nxwriter
+from ..utils.dm_client import dm_client
+from ..utils.dm_util import dm_job_tracker
+from ..utils.metadata_cache import metadata_cache
 from ..utils.nexus_utils import create_nexus_format_metadata
-from .sample_info_unpack import sort_qnw
+from .acq_pipeline import ad_drain
+from .acq_pipeline import ad_expose
+from .ad_setup_plans import detector_config
+from .attenuator_plans import set_attenuation
+from .fly_scan_plans import fly_scan
+from .sample_info_unpack import current_sample
+from .sample_info_unpack import sample_grid
 from .shutter_logic import blockbeam
 from .shutter_logic import showbeam
 from .shutter_logic import shutteroff
@@ -35,6 +43,13 @@ pv_registers = oregistry["pv_registers"]
 sl4 = oregistry["sl4"]
 softglue_8idi = oregistry["softglue_8idi"]
 
+# Slowly-changing run metadata, served from CA monitors (max age in s).
+metadata_cache.watch(qnw_env1.readback, max_age=10)
+metadata_cache.watch(qnw_env2.readback, max_age=10)
+metadata_cache.watch(qnw_env3.readback, max_age=10)
+metadata_cache.watch(filter_8ide.attenuation.readback)
+metadata_cache.watch(filter_8idi.attenuation.readback)
+
 
 def create_run_metadata_dict(
     det=None,
@@ -89,12 +104,12 @@ def create_run_metadata_dict(
     md["sl4_v_size"] = sl4.v.size.position
     md["sl4_v_center"] = sl4.v.center.position
 
-    md["qnw1_temp"] = qnw_env1.readback.get()
-    md["qnw2_temp"] = qnw_env2.readback.get()
-    md["qnw3_temp"] = qnw_env3.readback.get()
+    md["qnw1_temp"] = metadata_cache.get(qnw_env1.readback)
+    md["qnw2_temp"] = metadata_cache.get(qnw_env2.readback)
+    md["qnw3_temp"] = metadata_cache.get(qnw_env3.readback)
 
-    md["att_8ide"] = filter_8ide.attenuation_readback.get()
-    md["att_8idi"] = filter_8idi.attenuation_readback.get()
+    md["att_8ide"] = metadata_cache.get(filter_8ide.attenuation.readback)
+    md["att_8idi"] = metadata_cache.get(filter_8idi.attenuation.readback)
     return md
 
 
@@ -161,6 +176,34 @@ def simple_acquire_int_series(det, md):
     yield from nxwriter.wait_writer_plan_stub()
 
 
+def fly_acquire_ext_trig(det, md, motor, start, stop, num_frames, period, acq_time):
+    """Fly ``motor``, the detector taking one frame per SoftGlue gate; save the file.
+
+    The run has a ``fly_scan`` stream with the position of every frame,
+    written to the NeXus file with the rest of the run.
+    """
+    nxwriter.warn_on_missing_content = False
+    nxwriter.file_path = det.hdf1.file_path.get()
+    base_file_name = det.hdf1.file_name.get()
+    nxwriter.file_name = f"{nxwriter.file_path}/{base_file_name}.hdf"
+
+    def expose(kickoff):
+        timing, drained = yield from ad_expose(det, start_triggers=kickoff)
+        return (yield from ad_drain(det, timing, drained))
+
+    @bpp.subs_decorator(nxwriter.receiver)
+    def acquire():
+        return (
+            yield from fly_scan(
+                expose, motor, start, stop, num_frames, period, acq_time, md=md
+            )
+        )
+
+    result = yield from acquire()
+    yield from nxwriter.wait_writer_plan_stub()
+    return result
+
+
 def simple_acquire_int_series_nexus(det):
     """Just run the acquisition and save the file, nothing else."""
     metadata_fname = pv_registers.metadata_full_path.get()
@@ -173,7 +216,8 @@ def setup_det_int_series(det, acq_time, acq_period, num_frames, file_name):
     """Setup the detector for internal series acquisition.
 
     Configure the detector's cam module for internal acquisition mode and
-    set up the HDF plugin for data storage.
+    set up the HDF plugin for data storage.  Only the settings that changed
+    since the previous repetition are written.
 
     Args:
         det: The detector device to configure
@@ -181,28 +225,30 @@ def setup_det_int_series(det, acq_time, acq_period, num_frames, file_name):
         acq_period: Time between frame starts in seconds
         num_frames: Number of frames to acquire
         file_name: Base name for the output files
+
+    Returns:
+        ConfigReport of the settings written
     """
     cycle_name = pv_registers.cycle_name.get()
     exp_name = pv_registers.experiment_name.get()
 
     file_path = f"/gdata/dm/8IDI/{cycle_name}/{exp_name}/data/{file_name}"
 
-    yield from bps.mv(det.cam.trigger_mode, "Internal Series")  # 0
-    yield from bps.mv(det.cam.acquire_time, acq_time)
-    yield from bps.mv(det.cam.acquire_period, acq_period)
-    yield from bps.mv(det.hdf1.file_name, file_name)
-    yield from bps.mv(det.hdf1.file_path, file_path)
-    yield from bps.mv(det.cam.num_images, num_frames)
-    yield from bps.mv(
-        det.cam.num_triggers, 1
-    )  # Need to put num_trigger to 1 for internal mode
-    yield from bps.mv(det.hdf1.num_capture, num_frames)
-
-    yield from bps.mv(pv_registers.file_name, file_name)
-    yield from bps.mv(pv_registers.file_path, file_path)
-    yield from bps.mv(
-        pv_registers.metadata_full_path, f"{file_path}/{file_name}_metadata.hdf"
-    )
+    settings = {
+        det.cam.trigger_mode: "Internal Series",  # 0
+        det.cam.acquire_time: acq_time,
+        det.cam.acquire_period: acq_period,
+        det.hdf1.file_name: file_name,
+        det.hdf1.file_path: file_path,
+        det.cam.num_images: num_frames,
+        det.cam.num_triggers: 1,  # Need to put num_trigger to 1 for internal mode
+        det.hdf1.num_capture: num_frames,
+        pv_registers.file_name: file_name,
+        pv_registers.file_path: file_path,
+        pv_registers.metadata_full_path: f"{file_path}/{file_name}_metadata.hdf",
+    }
+    report = yield from detector_config.apply(settings, label=file_name)
+    return report
 
 
 def setup_det_ext_trig(det, acq_time, acq_period, num_frames, file_name):
@@ -258,7 +304,7 @@ def kickoff_dm_workflow(
 ):
     """Start a DM workflow for this bluesky run."""
     # oregistry.auto_register = False  # Ignore re-creations of this device.
-    dm_workflow = DM_WorkflowConnector(name="dm_workflow")
+    dm_workflow = dm_client.attach(DM_WorkflowConnector(name="dm_workflow"))
     # oregistry.auto_register = True
 
     forever = 999_999_999_999  # long time, s, disables periodic reports
@@ -298,11 +344,10 @@ def kickoff_dm_workflow(
     share_bluesky_metadata_with_dm(experiment_name, workflow_name_run, run)
 
     # Users requested the DM workflow job ID be printed to the console.
-    dm_workflow._update_processing_data()
+    # Its status is followed by the DM job tracker, not queried here.
     job_id = dm_workflow.job_id.get()
-    job_stage = dm_workflow.stage_id.get()
-    job_status = dm_workflow.status.get()
-    print(f"DM workflow id: {job_id!r}  status: {job_status}  stage: {job_stage}")
+    dm_job_tracker.track(job_id)
+    print(f"DM workflow id: {job_id!r}  status: {dm_job_tracker.get(job_id).status}")
 
 
 def eiger_acq_int_series(
@@ -326,46 +371,31 @@ def eiger_acq_int_series(
         att_level: Attenuation level to set (default: 0)
         sample_move: Whether to move sample between repetitions (default: False)
     """
-    yield from bps.mv(filter_8idi.attenuation_set, att_level)
-    yield from bps.sleep(5)
-    yield from bps.mv(filter_8idi.attenuation_set, att_level)
-    yield from bps.sleep(5)
+    yield from set_attenuation(filter_8idi, att_level)
 
     # yield from post_align()
     yield from shutteroff()
 
-    (
-        header_name,
-        meas_num,
-        qnw_index,
-        _,
-        sample_name,
-        x_cen,
-        y_cen,
-        x_radius,
-        y_radius,
-        x_pts,
-        y_pts,
-    ) = sort_qnw()
+    info = current_sample()
+    header_name = info.header
+    meas_num = int(pv_registers.measurement_num.get())
     yield from bps.mv(pv_registers.measurement_num, meas_num + 1)
     # yield from bps.mv(pv_registers.sample_name, sample_name)
     sample_name = pv_registers.sample_name.get()
 
     # temp_name = int(temp * 10)
 
-    sample_pos_register = pv_registers.sample_position_register(qnw_index)
+    sample_pos_register = pv_registers.sample_position_register(info.index)
     sam_pos = int(sample_pos_register.get())
+    grid = sample_grid(info)
 
-    samx_list = np.linspace(x_cen - x_radius, x_cen + x_radius, num=x_pts)
-    samy_list = np.linspace(y_cen - y_radius, y_cen + y_radius, num=y_pts)
-
+    detector_config.forget()  # read the detector state once, at the first repetition
     for ii in range(num_rep):
-        pos_index = np.mod(sam_pos + ii, x_pts * y_pts)
+        pos_index = grid.wrap(sam_pos + ii)
 
         try:
             if sample_move:
-                x_pos = samx_list[np.mod(pos_index, x_pts)]
-                y_pos = samy_list[int(np.floor(pos_index / y_pts))]
+                x_pos, y_pos = grid.position(pos_index)
                 yield from bps.mv(sample.x, x_pos, sample.y, y_pos)
                 yield from bps.mv(sample_pos_register, pos_index)
             else:
@@ -386,8 +416,7 @@ def eiger_acq_int_series(
             det, acq_period, acq_period, num_frame, filename
         )
 
-        yield from showbeam()
-        yield from bps.sleep(0.1)
+        yield from showbeam(settle=True)
         yield from simple_acquire_int_series_nexus(det)
         yield from blockbeam()
 
@@ -429,51 +458,31 @@ def eiger_acq_ext_trig(
         att_level: Attenuation level
         sample_move: Whether to move sample between repetitions
     """
-    yield from bps.mv(filter_8idi.attenuation_set, att_level)
-    yield from bps.sleep(5)
-    yield from bps.mv(filter_8idi.attenuation_set, att_level)
-    yield from bps.sleep(5)
+    yield from set_attenuation(filter_8idi, att_level)
 
     yield from shutteron()
-    yield from showbeam()
 
     yield from setup_softglue_ext_trig(acq_time, acq_period, num_frame)
 
-    (
-        header_name,
-        meas_num,
-        qnw_index,
-        _,
-        sample_name,
-        x_cen,
-        y_cen,
-        x_radius,
-        y_radius,
-        x_pts,
-        y_pts,
-    ) = sort_qnw()
+    info = current_sample()
+    header_name = info.header
+    meas_num = int(pv_registers.measurement_num.get())
     yield from bps.mv(pv_registers.measurement_num, meas_num + 1)
     sample_name = pv_registers.sample_name.get()
 
     # temp_name = int(temp * 10)
 
-    sample_pos_register = pv_registers.sample_position_register(qnw_index)
-    sam_pos = sample_pos_register.get()
-
-    samx_list = np.linspace(x_cen - x_radius, x_cen + x_radius, num=x_pts)
-    samy_list = np.linspace(y_cen - y_radius, y_cen + y_radius, num=y_pts)
+    sample_pos_register = pv_registers.sample_position_register(info.index)
+    sam_pos = int(sample_pos_register.get())
+    grid = sample_grid(info)
 
     for ii in range(num_rep):
-        pos_index = np.mod(sam_pos + ii, x_pts * y_pts)
+        pos_index = grid.wrap(sam_pos + ii)
 
         try:
             if sample_move:
-                yield from bps.mv(
-                    sample.x,
-                    samx_list[np.mod(pos_index, x_pts)],
-                    sample.y,
-                    samy_list[int(np.floor(pos_index / y_pts))],
-                )
+                x_pos, y_pos = grid.position(pos_index)
+                yield from bps.mv(sample.x, x_pos, sample.y, y_pos)
                 yield from bps.mv(sample_pos_register, pos_index)
             else:
                 pass
@@ -492,8 +501,10 @@ def eiger_acq_ext_trig(
         yield from setup_det_ext_trig(det, acq_time, acq_period, num_frame, filename)
 
         md = create_run_metadata_dict(det)
+        # The beam (and the dose booked to the spot) only while exposing.
+        yield from showbeam()
         # (uid,) = yield from simple_acquire_ext_trig(det, md)
-        yield from simple_acquire_ext_trig(det, md)
+        yield from bpp.finalize_wrapper(simple_acquire_ext_trig(det, md), blockbeam())
 
         try:
             qmap_file_run = pv_registers.qmap_file.get()
@@ -521,9 +532,14 @@ def eiger_acq_flyscan(
     att_level=0,
     sample_move=False,
     flyspeed=0.1,
+    acq_time=None,
 ):
     """Run flyscan acquisition with the Eiger detector.
 
+    Every frame is gated by a SoftGlue pulse ("External Enable"); the
+    pulses start when the stage passes its start position, at full speed,
+    and the MCS latches the stage position at each of them.
+
     Args:
         det: Detector to use (default: eiger4M)
         acq_period: Time between frame starts in seconds
@@ -532,49 +548,36 @@ def eiger_acq_flyscan(
         att_level: Attenuation level
         sample_move: Whether to move sample between repetitions
         flyspeed: Speed for continuous motion in mm/s
+        acq_time: Exposure of each frame in seconds (default: acq_period)
     """
-    acq_time = acq_period
+    if acq_time is None:
+        acq_time = acq_period
 
-    yield from bps.mv(filter_8idi.attenuation_set, att_level)
-    yield from bps.sleep(5)
-    yield from bps.mv(filter_8idi.attenuation_set, att_level)
-    yield from bps.sleep(5)
+    yield from set_attenuation(filter_8idi, att_level)
 
     # yield from post_align()
     yield from shutteroff()
 
-    (
-        header_name,
-        meas_num,
-        qnw_index,
-        _,
-        sample_name,
-        x_cen,
-        y_cen,
-        x_radius,
-        y_radius,
-        x_pts,
-        y_pts,
-    ) = sort_qnw()
+    info = current_sample()
+    header_name = info.header
+    meas_num = int(pv_registers.measurement_num.get())
     yield from bps.mv(pv_registers.measurement_num, meas_num + 1)
     # yield from bps.mv(pv_registers.sample_name, sample_name)
     sample_name = pv_registers.sample_name.get()
 
     # temp_name = int(temp * 10)
 
-    sample_pos_register = pv_registers.sample_position_register(qnw_index)
+    sample_pos_register = pv_registers.sample_position_register(info.index)
     sam_pos = int(sample_pos_register.get())
+    grid = sample_grid(info)
 
-    samx_list = np.linspace(x_cen - x_radius, x_cen + x_radius, num=x_pts)
-    samy_list = np.linspace(y_cen - y_radius, y_cen + y_radius, num=y_pts)
-
+    detector_config.forget()  # read the detector state once, at the first repetition
     for ii in range(num_rep):
-        pos_index = np.mod(sam_pos, x_pts * y_pts)
+        pos_index = grid.wrap(sam_pos)
 
         try:
             if sample_move:
-                x_pos = samx_list[np.mod(pos_index, x_pts)]
-                y_pos = samy_list[int(np.floor(pos_index / y_pts))]
+                x_pos, y_pos = grid.position(pos_index)
                 yield from bps.mv(sample.x, x_pos, sample.y, y_pos)
                 yield from bps.mv(sample_pos_register, pos_index)
             else:
@@ -591,21 +594,15 @@ def eiger_acq_flyscan(
             f"f{num_frame:06d}_r{ii+1:05d}"
         )
 
-        yield from setup_det_int_series(det, acq_time, acq_period, num_frame, filename)
+        yield from setup_det_ext_trig(det, acq_time, acq_period, num_frame, filename)
 
         md = create_run_metadata_dict(det)
-        # (uid,) = yield from simple_acquire_ext_trig(det, md)
-        extra_acq_time = 1.0
-        total_travel = flyspeed * (acq_period * num_frame + extra_acq_time)
-        yield from showbeam()
-        yield from bps.sleep(0.1)
-        yield from bps.mv(sample.y.velocity, flyspeed)
-        yield from bps.mvr(sample.y.user_setpoint, total_travel)
-        yield from simple_acquire_int_series(det, md)
-        yield from blockbeam()
-        yield from bps.sleep(1)
-        yield from bps.mv(sample.y.velocity, 5)
-        yield from bps.mvr(sample.y, -total_travel)
+        y0 = sample.y.position
+        travel = flyspeed * acq_period * num_frame
+        yield from fly_acquire_ext_trig(
+            det, md, sample.y, y0, y0 + travel, num_frame, acq_period, acq_time
+        )
+        yield from bps.mv(sample.y, y0)
 
         try:
             qmap_file_run = pv_registers.qmap_file.get()
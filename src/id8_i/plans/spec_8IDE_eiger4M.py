@@ -8,9 +8,8 @@ triggered by SPEC through EPICS PVs.
 
 from apsbits.core.instrument_init import oregistry
 from bluesky import plan_stubs as bps
-from dm.common.utility.configurationManager import ConfigurationManager
-from dm.proc_web_service.api.workflowProcApi import WorkflowProcApi
 
+from ..utils.dm_client import dm_client
 from ..utils.nexus_utils import create_nexus_format_metadata
 
 rigaku3M = oregistry["rigaku3M"]
@@ -39,13 +38,8 @@ def submit_Nexus_DM():
     while True:
         bluesky_start = pv_registers.start_bluesky.get()
         if bluesky_start == "Yes":
-            # DM workflow setup.
-            # configManager is an object that tracks beamline-specific config.
-            # In WorkflowProcApi, user/password/url info is passed to DM API
-            configManager = ConfigurationManager.getInstance()
-            dmuser, password = configManager.parseLoginFile()
-            serviceUrl = configManager.getProcWebServiceUrl()
-            workflowProcApi = WorkflowProcApi(dmuser, password, serviceUrl)
+            # DM workflow setup: the session-wide client logs in only once.
+            workflowProcApi, dmuser = dm_client, dm_client.username
 
             # Spec will need to write these fields in StrReg.
             # exp_name, workflow_name, analysis_machine need to be written once
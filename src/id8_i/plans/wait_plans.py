@@ -0,0 +1,84 @@
+"""
+Plan stubs that wait for work done outside of the RunEngine.
+
+.. autosummary::
+
+    ~wait_for_status
+    ~wait_for_metadata_file
+"""
+
+import asyncio
+import logging
+import time
+
+from bluesky import plan_stubs as bps
+from ophyd.utils import WaitTimeoutError
+
+from ..utils.metadata_writer import metadata_writer
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILE_TIMEOUT = 60  # seconds, generous: NFS can stall for a while
+
+
+def wait_for_status(status, timeout=None):
+    """Wait for an ophyd Status, without blocking the RunEngine event loop.
+
+    Args:
+        status: ophyd Status (or any object with ``add_callback``)
+        timeout: Seconds to wait, None to wait forever
+
+    Returns:
+        Seconds spent waiting
+
+    Raises:
+        WaitTimeoutError: If the status did not finish within ``timeout``
+        Exception: The exception the status finished with, if it failed
+    """
+    t0 = time.monotonic()
+    if not status.done:
+
+        async def status_done():
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+
+            def finished(st):
+                loop.call_soon_threadsafe(
+                    lambda: future.done() or future.set_result(None)
+                )
+
+            status.add_callback(finished)
+            await future
+
+        try:
+            yield from bps.wait_for([status_done], timeout=timeout)
+        except TimeoutError as exc:  # bluesky's WaitForTimeoutError
+            raise WaitTimeoutError(
+                f"{status} did not finish within {timeout} s"
+            ) from exc
+
+    if not status.success:
+        raise status.exception() or RuntimeError(f"{status} failed")
+    return time.monotonic() - t0
+
+
+def wait_for_metadata_file(filename, timeout=METADATA_FILE_TIMEOUT):
+    """Wait until a metadata file submitted to the background writer is durable.
+
+    Returns at once if the file was never submitted (for example when it was
+    written synchronously).
+
+    Args:
+        filename: Name of the metadata file
+        timeout: Seconds to wait before giving up
+
+    Returns:
+        Seconds spent waiting
+    """
+    status = metadata_writer.status(filename)
+    if status is None:
+        return 0.0
+    waited = yield from wait_for_status(status, timeout=timeout)
+    if waited > 0.01:
+        logger.info("Waited %.3f s for metadata file %s", waited, filename)
+    return waited
@@ -103,6 +103,7 @@ def _startup_create_devices_plan():
     device_files = [
         "flight_tube_devices.yml",
         "aerotech_stages_devices.yml",
+        "meascomp_devices.yml",
     ]
     for device_file in device_files:
         try:
@@ -132,15 +133,22 @@ else:
             )
 
 from .plans.master_plan import run_measurement_info
+from .plans.auto_attenuation_plans import auto_attenuation, attenuation_cache
 from .plans.nexus_acq_eiger_int import setup_eiger_int_series, eiger_acq_int_series
 from .plans.nexus_acq_eiger_ext import setup_eiger_ext_trig, eiger_acq_ext_trig
 from .plans.nexus_acq_rigaku_zdt import setup_rigaku_ZDT_series, rigaku_acq_ZDT_series, rigaku_zdt_acquire
 from .plans.sample_info_unpack import select_sample, gen_folder_prefix
 from .plans.scan_8idi import att, x_lup, y_lup, rheo_x_lup, rheo_y_lup, rheo_set_x_lup
+from .plans.scan_8idi import fly_lup, x_fly_lup, y_fly_lup
+from .plans.scan_8idi import rheo_x_fly_lup, rheo_y_fly_lup, rheo_set_x_fly_lup
+from .plans.scan_8idi import adaptive_lup
 from .plans.select_detector import select_detector
 from .plans.select_sample_env import select_sample_env
 from .plans.shutter_logic import showbeam, blockbeam, shutteron, shutteroff, pre_align, post_align 
+from .plans.shutter_logic import beam_shutter
 from .plans.pv_break_test import break_pv
 from .plans.rheometer_wait import wait_for_mcr
 
 from id8_user_plans.write_measurement_info import write_measurement_info
+
+RE.subscribe(beam_shutter)  # beam-on intervals of each run, in beam_shutter.runs
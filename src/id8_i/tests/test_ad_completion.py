@@ -0,0 +1,58 @@
+"""Test the event-driven completion of an area detector acquisition."""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+from ophyd.sim import Signal
+from ophyd.status import StatusTimeoutError
+
+from id8_i.utils.ad_completion import acquisition_done_status
+from id8_i.utils.ad_completion import hdf_drained_status
+
+
+def cam():
+    """Cam plugin with an idle ``acquire_busy``."""
+    return SimpleNamespace(acquire_busy=Signal(name="acquire_busy", value=0))
+
+
+def test_idle_before_the_start_is_not_done():
+    """The idle state preceding the acquisition does not finish the status."""
+    status = acquisition_done_status(cam(), timeout=0.2)
+    with pytest.raises(StatusTimeoutError):
+        status.wait(1)
+
+
+def test_busy_then_idle():
+    """Busy then idle finishes the status."""
+    c = cam()
+    status = acquisition_done_status(c, timeout=1)
+    c.acquire_busy.put(1)
+    status.arm()
+    time.sleep(0.05)
+    assert not status.done
+    c.acquire_busy.put(0)
+    status.wait(1)
+    assert status.success
+
+
+def test_armed_and_already_idle():
+    """Busy and idle merged into one update: armed and idle is done."""
+    status = acquisition_done_status(cam(), timeout=1)
+    status.arm()
+    status.wait(1)
+    assert status.success
+
+
+def test_drained():
+    """The HDF5 queue drained when all of it is free."""
+    plugin = SimpleNamespace(
+        queue_size=Signal(name="queue_size", value=20),
+        queue_free=Signal(name="queue_free", value=15),
+    )
+    status = hdf_drained_status(plugin, timeout=1)
+    time.sleep(0.05)
+    assert not status.done
+    plugin.queue_free.put(20)
+    status.wait(1)
+    assert status.success
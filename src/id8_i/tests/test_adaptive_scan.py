@@ -0,0 +1,83 @@
+"""Test the adaptive point selection of alignment scans."""
+
+import math
+
+import numpy as np
+import pytest
+
+from id8_i.utils.adaptive_scan import AdaptiveSampler
+
+
+def edge(centre=0.37, width=0.05):
+    """Error-function edge rising from 0 to 1 at ``centre``."""
+    return lambda x: 0.5 * (1 + math.erf((x - centre) / (width * math.sqrt(2))))
+
+
+def peak(centre=-0.81, width=0.1):
+    """Gaussian peak at ``centre``."""
+    return lambda x: math.exp(-((x - centre) ** 2) / (2 * width**2))
+
+
+def run(sampler, signal, noise=0.0, seed=0):
+    """Measure the coarse grid, then the points asked for, until done."""
+    rng = np.random.default_rng(seed)
+    positions = list(sampler.initial_points())
+    while positions:
+        for x in positions:
+            sampler.tell(x, signal(x) + noise * rng.standard_normal())
+        positions = sampler.ask()
+    return sampler.result()
+
+
+@pytest.mark.parametrize(
+    "kind, signal, centre",
+    [("edge", edge(), 0.37), ("peak", peak(), -0.81), ("auto", edge(), 0.37)],
+)
+def test_centre_to_the_tolerance(kind, signal, centre):
+    """The centre is found to the tolerance, with fewer points than the limit."""
+    sampler = AdaptiveSampler(-3, 3, tolerance=0.01, kind=kind, max_points=60)
+    result = run(sampler, signal)
+    assert result.kind == ("edge" if kind == "auto" else kind)
+    assert result.uncertainty <= 0.01
+    assert abs(result.centre - centre) <= 0.02
+    assert result.num_points < 60
+
+
+def test_noisy_edge():
+    """With noise, the steepest crossing is the edge."""
+    sampler = AdaptiveSampler(-3, 3, tolerance=0.02, kind="edge", max_points=60)
+    result = run(sampler, edge(), noise=0.01)
+    assert abs(result.centre - 0.37) <= 0.05
+
+
+def test_narrow_peak_between_coarse_points():
+    """A peak the coarse grid misses is found by splitting the largest intervals."""
+    sampler = AdaptiveSampler(-3, 3, tolerance=0.01, kind="peak", max_points=80)
+    result = run(sampler, peak(centre=0.27, width=0.05))
+    assert abs(result.centre - 0.27) <= 0.02
+
+
+def test_flat_signal_stops_at_max_points():
+    """Only noise: the scan stops at ``max_points`` without a centre."""
+    sampler = AdaptiveSampler(-1, 1, tolerance=0.01, max_points=20)
+    result = run(sampler, lambda x: 1.0, noise=0.01)
+    assert result.num_points == 20
+    assert math.isnan(result.centre)
+    assert result.uncertainty == math.inf
+
+
+def test_ask_before_the_coarse_grid():
+    """Nothing is proposed until the coarse grid is measured."""
+    sampler = AdaptiveSampler(0, 1, tolerance=0.01, coarse_points=5)
+    sampler.tell(0.0, 1.0)
+    assert sampler.ask() == []
+
+
+def test_bad_arguments():
+    """Unknown kinds and too few points are refused."""
+    with pytest.raises(ValueError):
+        AdaptiveSampler(0, 1, 0.01, kind="valley")
+    with pytest.raises(ValueError):
+        AdaptiveSampler(0, 1, 0.01, coarse_points=2)
+    with pytest.raises(ValueError):
+        AdaptiveSampler(0, 1, 0.01, coarse_points=20, max_points=10)
@@ -0,0 +1,95 @@
+"""Test the choice of the analysis machine from the load of each machine."""
+
+import pytest
+
+from id8_i.utils.analysis_scheduler import AnalysisScheduler
+from id8_i.utils.analysis_scheduler import MachineState
+
+
+class Clock:
+    """Time source advanced by the test."""
+
+    def __init__(self, now: float = 1000.0):
+        """Start at ``now``."""
+        self.now = now
+
+    def __call__(self) -> float:
+        """Current time."""
+        return self.now
+
+
+def test_slot_free_times():
+    """Outstanding jobs are laid out on the slots in turn."""
+    machine = MachineState("m", slots=2)
+    machine.outstanding = {"a": (0.0, 10.0), "b": (0.0, 10.0), "c": (0.0, 10.0)}
+    assert sorted(machine.slot_free_times(0.0)) == [10.0, 20.0]
+    assert machine.expected_completion(0.0, 5.0) == 15.0
+
+
+def test_least_loaded_fills_the_free_slots():
+    """Jobs go to the machine that would finish them first."""
+    clock = Clock()
+    scheduler = AnalysisScheduler({"a": 1, "b": 2}, default_duration=100, clock=clock)
+    chosen = [scheduler.choose(f"job{i}") for i in range(3)]
+    assert sorted(chosen) == ["a", "b", "b"]
+    loads = scheduler.loads()
+    assert loads["a"]["outstanding"] == 1
+    assert loads["b"]["outstanding"] == 2
+
+
+def test_slowness_is_learned():
+    """A machine whose jobs run slow gets fewer of them."""
+    clock = Clock()
+    scheduler = AnalysisScheduler(
+        {"fast": 1, "slow": 1}, default_duration=10, clock=clock
+    )
+    for i in range(4):
+        scheduler.machines["slow"].outstanding[f"s{i}"] = (clock.now, 10.0)
+        scheduler.complete(f"s{i}", duration=40.0)
+        scheduler.machines["fast"].outstanding[f"f{i}"] = (clock.now, 10.0)
+        scheduler.complete(f"f{i}", duration=10.0)
+    assert scheduler.machines["slow"].slowness > scheduler.machines["fast"].slowness
+    chosen = [scheduler.choose(f"job{i}") for i in range(3)]
+    assert chosen.count("fast") > chosen.count("slow")
+
+
+def test_sync_completes_done_jobs():
+    """Done jobs of a DM listing leave the ledger, running ones stay."""
+    clock = Clock()
+    scheduler = AnalysisScheduler({"a": 1}, clock=clock)
+    scheduler.choose("/data/x.h5")
+    scheduler.choose("/data/y.h5")
+    scheduler.sync(
+        [
+            {"status": "done", "filePath": "/data/x.h5", "runTime": 30.0},
+            {"status": "running", "argsDict": {"filePath": "/data/y.h5"}},
+        ]
+    )
+    assert list(scheduler.machines["a"].outstanding) == ["/data/y.h5"]
+    # 30 s against the expected 120 s: a machine 4 times faster
+    assert scheduler.machines["a"].slowness == pytest.approx(0.25)
+
+
+def test_stale_jobs_expire():
+    """A job never reported done is dropped after ``stale_after``."""
+    clock = Clock()
+    scheduler = AnalysisScheduler({"a": 1}, stale_after=60.0, clock=clock)
+    scheduler.choose("old")
+    clock.now += 61.0
+    scheduler.choose("new")
+    assert list(scheduler.machines["a"].outstanding) == ["new"]
+
+
+@pytest.mark.parametrize("policy", ["round-robin", "weighted"])
+def test_static_policies(policy):
+    """Round-robin alternates; weighted follows the slots."""
+    scheduler = AnalysisScheduler({"a": 1, "b": 1}, policy=policy, clock=Clock())
+    assert [scheduler.choose() for _ in range(4)] == ["a", "b", "a", "b"]
+
+
+def test_bad_arguments():
+    """No machine, or an unknown policy, is refused."""
+    with pytest.raises(ValueError):
+        AnalysisScheduler({})
+    with pytest.raises(ValueError):
+        AnalysisScheduler({"a": 1}, policy="random")
@@ -0,0 +1,122 @@
+"""Test the attenuation chosen from the count rate of a preview frame."""
+
+import pytest
+
+from id8_i.utils.auto_attenuation import AttenuationCache
+from id8_i.utils.auto_attenuation import choose_attenuation
+
+# level n transmits 10**(-n/3): a decade every three levels
+TRANSMISSIONS = {float(n): 10.0 ** (-n / 3) for n in range(16)}
+EXPOSURE = 0.01  # s
+MIN_COUNTS = 20
+MAX_RATE = 1.0e4
+
+
+def test_least_attenuation_under_the_limit():
+    """The rate scales with the transmission; the least attenuation under it wins."""
+    choice = choose_attenuation(1000.0, 15.0, TRANSMISSIONS, MAX_RATE)
+    assert choice.level == 12.0  # 10x the transmission of the preview
+    assert choice.predicted_rate == pytest.approx(1.0e4)
+    assert choice.within_limit
+    assert not choice.upper_bound and not choice.limited
+
+
+def test_nothing_under_the_limit():
+    """Even the most attenuation too bright: it is chosen, flagged."""
+    choice = choose_attenuation(1.0e6, 15.0, TRANSMISSIONS, MAX_RATE)
+    assert choice.level == 15.0
+    assert not choice.within_limit
+    assert "ABOVE THE LIMIT" in str(choice)
+
+
+@pytest.mark.parametrize("counts", [0, 1, 19])
+def test_low_counts_are_an_upper_bound(counts):
+    """Below MIN_COUNTS, zero included, the rate is at most MIN_COUNTS/exposure."""
+    rate = max(counts, MIN_COUNTS) / EXPOSURE  # as auto_attenuation does
+    choice = choose_attenuation(
+        rate, 15.0, TRANSMISSIONS, MAX_RATE, upper_bound=True, max_step=100
+    )
+    assert choice.upper_bound
+    assert "upper bounds" in str(choice)
+    # 2000 counts/s at most: a factor 5 is safe, 10 (level 12) may not be
+    assert choice.level == 13.0
+    assert choice.predicted_rate <= MAX_RATE
+
+
+def test_zero_counts_never_open_everything():
+    """A dark preview is not taken at face value (0 counts/s fits everywhere)."""
+    naive = choose_attenuation(0.0, 15.0, TRANSMISSIONS, MAX_RATE)
+    assert naive.level == 0.0
+    bounded = choose_attenuation(
+        MIN_COUNTS / EXPOSURE, 15.0, TRANSMISSIONS, MAX_RATE, upper_bound=True
+    )
+    assert bounded.level > 0.0
+
+
+def test_step_limited():
+    """No step raises the transmission by more than ``max_step``."""
+    choice = choose_attenuation(10.0, 15.0, TRANSMISSIONS, MAX_RATE, max_step=100)
+    assert choice.level == 9.0  # 100x; level 6 (1000x) would be allowed
+    assert choice.limited
+    assert "step limited" in str(choice)
+    unlimited = choose_attenuation(10.0, 15.0, TRANSMISSIONS, MAX_RATE)
+    assert unlimited.level == 6.0
+
+
+def walk(true_rate_at_0: float, max_previews: int = 3):
+    """Choice of the preview loop of ``auto_attenuation`` for a sample."""
+    level = 15.0
+    for _ in range(max_previews):
+        counts = true_rate_at_0 * TRANSMISSIONS[level] * EXPOSURE
+        upper_bound = counts < MIN_COUNTS
+        choice = choose_attenuation(
+            max(counts, MIN_COUNTS) / EXPOSURE,
+            level,
+            TRANSMISSIONS,
+            MAX_RATE,
+            upper_bound=upper_bound,
+            max_step=100,
+        )
+        if choice.level == level or not (choice.upper_bound or choice.limited):
+            break
+        level = choice.level
+    return choice
+
+
+def test_previews_converge():
+    """A bounded preview is followed by one that counts enough."""
+    choice = walk(5.0e7)  # 5 counts at level 15, 23 at level 13
+    # 5e7 * 10**(-n/3) <= 1e4 first at n = 12
+    assert choice.level == 12.0
+    assert not choice.upper_bound
+
+
+def test_dim_sample_stays_safe():
+    """Previews that never count enough err on the side of attenuation."""
+    choice = walk(5.0e5)
+    assert choice.upper_bound
+    assert 5.0e5 * choice.transmission <= MAX_RATE
+    assert choice.level >= 6.0  # the level a long preview would choose
+
+
+def test_bad_arguments():
+    """An unknown preview level, or a step below 1, is refused."""
+    with pytest.raises(ValueError):
+        choose_attenuation(1.0, 16.0, TRANSMISSIONS, MAX_RATE)
+    with pytest.raises(ValueError):
+        choose_attenuation(1.0, 15.0, TRANSMISSIONS, MAX_RATE, max_step=0.5)
+
+
+def test_cache():
+    """Choices are kept per (sample, detector) and forgotten per sample."""
+    cache = AttenuationCache()
+    choice = choose_attenuation(1000.0, 15.0, TRANSMISSIONS, MAX_RATE)
+    cache.put("s1", "eiger4M", choice)
+    cache.put("s1", "rigaku3M", choice)
+    cache.put("s2", "eiger4M", choice)
+    assert cache.get("s1", "eiger4M") is choice
+    assert cache.get("s3", "eiger4M") is None
+    cache.forget("s1")
+    assert len(cache) == 1
+    cache.forget()
+    assert len(cache) == 0
@@ -0,0 +1,187 @@
+"""Test the journaled DM job queue against a fake WorkflowProcApi."""
+
+import time
+
+import pytest
+from ophyd.status import Status
+
+from id8_i.utils import dm_queue
+from id8_i.utils.dm_queue import FAILED
+from id8_i.utils.dm_queue import QUEUED
+from id8_i.utils.dm_queue import SUBMITTED
+from id8_i.utils.dm_queue import DMJobQueue
+
+
+class FakeApi:
+    """``startProcessingJob`` failing the first ``failures`` calls."""
+
+    def __init__(self, failures=0):
+        """Count the calls."""
+        self.failures = failures
+        self.calls = []
+
+    def startProcessingJob(self, user, workflow, argsDict=None):
+        """Accept the job, or raise while failures remain."""
+        self.calls.append((user, workflow, argsDict))
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("DM web service unreachable")
+        return {"id": f"job-{len(self.calls)}"}
+
+
+class Factory:
+    """``api_factory`` counting the DM sessions it starts."""
+
+    def __init__(self, api):
+        """Hand out ``api``."""
+        self.api = api
+        self.sessions = 0
+
+    def __call__(self):
+        """(workflowProcApi, dmuser)."""
+        self.sessions += 1
+        return self.api, "dmuser"
+
+
+def wait_for(condition, timeout=5.0):
+    """Poll ``condition`` until true; fail after ``timeout`` s."""
+    t0 = time.monotonic()
+    while not condition():
+        if time.monotonic() - t0 > timeout:
+            pytest.fail("condition not met")
+        time.sleep(0.005)
+
+
+def state(queue, file_name):
+    """State of the job of ``file_name``."""
+    return {job["file_name"]: job for job in queue.jobs()}[file_name]["state"]
+
+
+@pytest.fixture
+def journal(tmp_path):
+    """Path of an sqlite journal."""
+    return str(tmp_path / "jobs.sqlite")
+
+
+def test_submitted(journal):
+    """A queued job is submitted by the worker with its arguments."""
+    api = FakeApi()
+    queue = DMJobQueue(journal, api_factory=Factory(api))
+    assert queue.enqueue("a.h5", "xpcs", {"filePath": "a.h5"})
+    wait_for(lambda: queue.depth() == 0)
+    assert state(queue, "a.h5") == SUBMITTED
+    assert api.calls == [("dmuser", "xpcs", {"filePath": "a.h5"})]
+    assert queue.jobs(SUBMITTED)[0]["job_id"] == "job-1"
+
+
+def test_dedupe(journal):
+    """A file queued again is dropped while queued or recently submitted."""
+    api = FakeApi()
+    queue = DMJobQueue(journal, api_factory=Factory(api), dedupe_window=600)
+    assert queue.enqueue("a.h5", "xpcs", {})
+    assert not queue.enqueue("a.h5", "xpcs", {})
+    wait_for(lambda: queue.depth() == 0)
+    assert not queue.enqueue("a.h5", "xpcs", {})
+    assert len(api.calls) == 1
+
+    queue = DMJobQueue(journal, api_factory=Factory(api), dedupe_window=0)
+    assert queue.enqueue("a.h5", "xpcs", {})  # outside the window: a new job
+    wait_for(lambda: len(api.calls) == 2)
+
+
+def test_backoff_and_retry(journal):
+    """Failed submissions are retried with backoff, on a new DM session."""
+    api = FakeApi(failures=2)
+    factory = Factory(api)
+    queue = DMJobQueue(journal, api_factory=factory, backoff=0.01)
+    queue.enqueue("a.h5", "xpcs", {})
+    wait_for(lambda: state(queue, "a.h5") == SUBMITTED)
+    assert len(api.calls) == 3
+    assert factory.sessions == 3  # the client is rebuilt after each failure
+    assert queue.jobs()[0]["attempts"] == 3
+
+
+def test_failed_after_max_attempts(journal):
+    """A job failing ``max_attempts`` times is failed, until retried."""
+    api = FakeApi(failures=3)
+    queue = DMJobQueue(journal, api_factory=Factory(api), max_attempts=3, backoff=0)
+    queue.enqueue("a.h5", "xpcs", {})
+    wait_for(lambda: state(queue, "a.h5") == FAILED)
+    assert "unreachable" in queue.jobs(FAILED)[0]["last_error"]
+    queue.retry_failed()
+    wait_for(lambda: state(queue, "a.h5") == SUBMITTED)
+
+
+def test_prerequisite_gating(journal):
+    """A job waits for its metadata file; the jobs behind it go first."""
+    metadata = Status()
+    api = FakeApi()
+    queue = DMJobQueue(
+        journal,
+        api_factory=Factory(api),
+        prerequisite_status=lambda name: metadata if name == "a_meta.hdf" else None,
+    )
+    queue.enqueue("a.h5", "xpcs", {}, prerequisite="a_meta.hdf")
+    queue.enqueue("b.h5", "xpcs", {})
+    wait_for(lambda: state(queue, "b.h5") == SUBMITTED)
+    assert state(queue, "a.h5") == QUEUED
+    metadata.set_finished()
+    wait_for(lambda: state(queue, "a.h5") == SUBMITTED)
+
+
+def test_failed_prerequisite_keeps_the_session(journal, monkeypatch):
+    """A failed metadata file is retried without starting a new DM session."""
+    monkeypatch.setattr(dm_queue, "PREREQUISITE_RECHECK", 0.01)
+    metadata = Status()
+    metadata.set_exception(OSError("metadata file not written"))
+    api = FakeApi()
+    factory = Factory(api)
+    queue = DMJobQueue(
+        journal,
+        api_factory=factory,
+        max_attempts=2,
+        backoff=0,
+        prerequisite_status=lambda name: metadata if name == "b_meta.hdf" else None,
+    )
+    queue.enqueue("a.h5", "xpcs", {})
+    wait_for(lambda: state(queue, "a.h5") == SUBMITTED)
+    queue.enqueue("b.h5", "xpcs", {}, prerequisite="b_meta.hdf")
+    wait_for(lambda: state(queue, "b.h5") == FAILED)
+    assert "metadata" in queue.jobs(FAILED)[0]["last_error"]
+    queue.enqueue("c.h5", "xpcs", {})
+    wait_for(lambda: state(queue, "c.h5") == SUBMITTED)
+    assert factory.sessions == 1
+    assert len(api.calls) == 2
+
+
+def test_journal_replay(journal):
+    """Jobs still queued when a session ends are submitted by the next one."""
+    queue = DMJobQueue(journal, api_factory=Factory(FakeApi()))
+    queue.start = lambda: None  # this session ends before its worker runs
+    queue.enqueue("a.h5", "xpcs", {"n": 1})
+    queue.enqueue("b.h5", "xpcs", {"n": 2})
+    assert queue.depth() == 2
+
+    api = FakeApi()
+    restarted = DMJobQueue(journal, api_factory=Factory(api))
+    restarted.start()
+    wait_for(lambda: restarted.depth() == 0)
+    assert sorted(args["n"] for _, _, args in api.calls) == [1, 2]
+
+
+def test_stats(journal):
+    """Queue depth by state, latency of the submitted jobs."""
+    queue = DMJobQueue(journal, api_factory=Factory(FakeApi(failures=1)), backoff=0.05)
+    stats = queue.stats()
+    assert (stats.queued, stats.submitted, stats.failed) == (0, 0, 0)
+    assert stats.latency_mean is None
+    assert "n/a" in str(stats)
+
+    queue.enqueue("a.h5", "xpcs", {})
+    wait_for(lambda: queue.depth() == 0)
+    stats = queue.stats()
+    assert (stats.queued, stats.submitted, stats.failed) == (0, 1, 0)
+    assert stats.latency_max >= 0.05  # the backoff after the failed attempt
+    assert stats.latency_mean == stats.latency_max
+    assert stats.last_call is not None
+    assert queue.stats(since=time.time()).latency_mean is None
@@ -0,0 +1,62 @@
+"""Test the dose booked for each spot of each sample."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("apsbits")
+
+from id8_i.utils.dose_ledger import DoseLedger  # noqa: E402
+from id8_i.utils.dose_ledger import DoseMeter  # noqa: E402
+from id8_i.utils.sample_grid import SampleGrid  # noqa: E402
+
+
+def test_spots_accumulate():
+    """Exposures of a spot add up; other samples and spots are apart."""
+    ledger = DoseLedger(":memory:")
+    ledger.add("a", 1.0, 2.0, beam_time=1.0, dose=0.5)
+    spot = ledger.add("a", 1.0, 2.0, beam_time=2.0, dose=0.25)
+    assert spot.exposures == 2
+    assert spot.beam_time == pytest.approx(3.0)
+    assert spot.dose == pytest.approx(0.75)
+    assert ledger.spot("b", 1.0, 2.0).dose == 0.0
+    assert ledger.spot("a", 1.1, 2.0).dose == 0.0
+
+
+def test_grid_lookup_finds_snapped_readbacks():
+    """A readback snapped to its grid spot is found by the grid lookup."""
+    ledger = DoseLedger(":memory:")
+    grid = SampleGrid(1.0, 2.0, 0.2, 0.1, 5, 3)
+    x, y = grid.positions[4]
+    readback = (x + 0.0008, y - 0.0009)  # more than the ledger resolution off
+    ledger.add("a", *readback, beam_time=1.0, dose=1.0)
+    assert ledger.doses("a", grid.positions)[4] == 0.0  # the raw readback misses
+    step = grid.nearest_step(*readback)
+    ledger.add("a", *grid.position(step), beam_time=1.0, dose=1.0)
+    doses = ledger.doses("a", grid.positions)
+    assert doses[4] == 1.0
+    assert np.count_nonzero(doses) == 1
+
+
+def test_ledger_survives_a_restart(tmp_path):
+    """Doses are read back from the sqlite file."""
+    path = tmp_path / "dose.sqlite"
+    DoseLedger(str(path)).add("a", 0.5, 0.5, beam_time=1.0, dose=2.0)
+    ledger = DoseLedger(str(path))
+    assert ledger.spot("a", 0.5, 0.5).dose == 2.0
+    ledger.clear("a")
+    assert DoseLedger(str(path)).spots("a") == {}
+
+
+def test_meter_books_current_times_transmission():
+    """The meter integrates the current while the beam is on."""
+    ledger = DoseLedger(":memory:")
+    meter = DoseMeter(ledger)
+    meter._on_current(value=2.0)
+    meter.beam_on(("a", 0.0, 0.0), transmission=0.5)
+    assert meter.beam_is_on
+    sample, x, y, beam_time, dose = meter.beam_off()
+    assert (sample, x, y) == ("a", 0.0, 0.0)
+    assert dose == pytest.approx(2.0 * 0.5 * beam_time)
+    assert ledger.spot("a", 0.0, 0.0).exposures == 1
+    meter.beam_on(None)
+    assert meter.beam_off() is None
@@ -0,0 +1,115 @@
+"""Test the travel-minimising order of the measurement_info blocks."""
+
+import itertools
+
+import pytest
+
+from id8_i.utils.measurement_schedule import CostModel
+from id8_i.utils.measurement_schedule import Schedule
+from id8_i.utils.measurement_schedule import ScheduleState
+from id8_i.utils.measurement_schedule import compile_blocks
+from id8_i.utils.measurement_schedule import file_order
+from id8_i.utils.measurement_schedule import format_diff
+from id8_i.utils.measurement_schedule import optimize
+
+SAMPLE_X = {0: 0.0, 1: 50.0, 2: 1.0, 3: 51.0, 4: 2.0}
+
+
+def block(atts=(0,), detector="eiger4M", **extra):
+    """One block of measurement_info.json, one acquisition per attenuation."""
+    n = len(atts)
+    raw = {
+        "detector": detector,
+        "att_list": list(atts),
+        "acq_time_list": [[0.1]] * n,
+        "acq_period_list": [[0.1]] * n,
+        "num_frames_list": [[10]] * n,
+        "num_reps_list": [[1]] * n,
+        "sample_move_yes_list": [[True]] * n,
+    }
+    raw.update(extra)
+    return raw
+
+
+def costs() -> CostModel:
+    """Samples on one stage, 1 mm/s."""
+    return CostModel(sample_position=lambda i: ("stage", SAMPLE_X[i], 0.0))
+
+
+def test_compile_blocks():
+    """Blocks keep their file position, sample index and constraints."""
+    blocks = compile_blocks(
+        {"a_0": block((3, 0, 3)), "b_2": block(after="a_0", keep_att_order=True)}
+    )
+    assert [b.sample for b in blocks] == [0, 2]
+    assert [s.att for s in blocks[0].steps] == [3, 0, 3]
+    assert blocks[1].after == ("a_0",)
+    assert blocks[1].keep_att_order
+
+
+@pytest.mark.parametrize(
+    "info",
+    [
+        {"a": block()},
+        {"a_0": dict(block(), att_list=[0, 1])},
+        {"a_0": block(after=["z_9"])},
+        {"a_0": block(after=["b_1"]), "b_1": block(after=["a_0"])},
+    ],
+)
+def test_compile_blocks_refuses(info):
+    """Bad keys, ragged lists, unknown or cyclic constraints are refused."""
+    with pytest.raises(ValueError):
+        compile_blocks(info)
+
+
+def test_optimize_groups_nearby_samples():
+    """Back and forth between far samples is replaced by a sweep."""
+    blocks = compile_blocks({f"b_{i}": block() for i in range(5)})
+    reference = file_order(blocks, costs(), ScheduleState())
+    best = optimize(blocks, costs())
+    assert best.overhead.total < reference.overhead.total
+    assert best.overhead.travel == pytest.approx(
+        min(
+            Schedule.evaluate(order, costs(), ScheduleState()).overhead.travel
+            for order in itertools.permutations(blocks)
+        )
+    )
+    assert "saves" in format_diff(reference, best)
+
+
+def test_optimize_honours_after():
+    """A block never runs before the blocks it names in 'after'."""
+    info = {f"b_{i}": block() for i in range(5)}
+    info["b_0"]["after"] = ["b_1"]
+    blocks = compile_blocks(info)
+    keys = optimize(blocks, costs()).keys
+    assert keys.index("b_1") < keys.index("b_0")
+
+
+def test_attenuations_grouped_unless_kept():
+    """Equal attenuations run together, starting at the filters' level."""
+    blocks = compile_blocks({"a_0": block((3, 0, 3))})
+    best = optimize(blocks, costs(), ScheduleState(att=0))
+    assert [s.att for s in best.steps[0]] == [0, 3, 3]
+    kept = compile_blocks({"a_0": block((3, 0, 3), keep_att_order=True)})
+    best = optimize(kept, costs(), ScheduleState(att=0))
+    assert [s.att for s in best.steps[0]] == [3, 0, 3]
+
+
+def test_never_worse_than_the_file():
+    """A file already in the best order is returned as written."""
+    blocks = compile_blocks({"a_0": block(), "b_2": block(), "c_4": block()})
+    start = ScheduleState(detector="eiger4M", att=0)
+    best = optimize(blocks, costs(), start)
+    assert best.keys == ["a_0", "b_2", "c_4"]
+    assert best.overhead.total == file_order(blocks, costs(), start).overhead.total
+
+
+def test_detector_swaps_counted():
+    """Alternating detectors costs a swap per change."""
+    info = {"a_0": block(), "b_2": block(detector="rigaku3M"), "c_4": block()}
+    blocks = compile_blocks(info)
+    start = ScheduleState(detector="eiger4M")
+    reference = file_order(blocks, costs(), start)
+    assert reference.overhead.detector == 2 * costs().detector_swap
+    assert optimize(blocks, costs(), start).overhead.detector == costs().detector_swap
@@ -0,0 +1,114 @@
+"""Test the wall time predicted for plans and series."""
+
+import pytest
+from bluesky import plan_stubs as bps
+from ophyd.sim import SynAxis
+
+from id8_i.utils import plan_estimator
+from id8_i.utils.plan_estimator import MessageCosts
+from id8_i.utils.plan_estimator import SeriesCosts
+from id8_i.utils.plan_estimator import estimate_series
+from id8_i.utils.plan_estimator import move_time
+from id8_i.utils.plan_estimator import simulate_plan
+
+
+class Timeline:
+    """Recorded spans of a series, as ``AcquisitionTimeline.rows()``."""
+
+    def __init__(self, spans):
+        """``spans``: (rep, stage, seconds)."""
+        self.spans = spans
+
+    def rows(self):
+        """(rep, stage, start, end)."""
+        return [(rep, stage, 100.0, 100.0 + s) for rep, stage, s in self.spans]
+
+
+def test_move_time():
+    """Trapezoidal moves, triangular when too short to reach the velocity."""
+    assert move_time(0.0, 1.0, 0.5) == 0.0
+    assert move_time(-10.0, 5.0, 0.5) == pytest.approx(2.5)
+    assert move_time(1.0, 10.0, 1.0) == pytest.approx(2 * (0.1) ** 0.5)
+    with pytest.raises(ValueError):
+        move_time(1.0, 0.0, 0.5)
+
+
+def test_simulate_plan():
+    """Grouped moves overlap; nothing is moved."""
+    x, y = SynAxis(name="x"), SynAxis(name="y")
+    costs = MessageCosts(velocity={"x": 5.0, "y": 1.0}, accel_time={"x": 0, "y": 0})
+
+    def plan():
+        yield from bps.mv(x, 10, y, 3)  # in parallel: 3 s
+        yield from bps.sleep(2)
+        yield from bps.mv(x, 0)  # 2 s
+
+    estimate = simulate_plan(plan(), costs)
+    assert estimate.stages["motion"] == pytest.approx(5.0)
+    assert estimate.stages["sleep"] == 2.0
+    assert x.position == 0 and y.position == 0
+
+
+def test_simulate_plan_that_never_ends(monkeypatch):
+    """A plan polling hardware is stopped."""
+    monkeypatch.setattr(plan_estimator, "MAX_MESSAGES", 100)
+
+    def plan():
+        while True:
+            yield from bps.sleep(0.1)
+
+    with pytest.raises(RuntimeError):
+        simulate_plan(plan())
+
+
+def test_estimate_series():
+    """Expose, setup and drain of each repetition; DM in the background."""
+    costs = SeriesCosts(hdf5_rate=100.0)
+    estimate = estimate_series(
+        "eiger_int", acq_time=0.001, num_frames=1000, num_rep=3, costs=costs
+    )
+    assert estimate.stages["expose"] == pytest.approx(3.0)
+    assert estimate.stages["setup"] == pytest.approx(
+        costs.setup_first + 2 * costs.setup
+    )
+    drain = 1000 / 100.0 - 1.0 + costs.file_close
+    assert estimate.stages["drain"] == pytest.approx(3 * drain)
+    assert estimate.background["prestage"] == pytest.approx(2 * costs.prestage)
+    assert "prestage" not in estimate.stages  # hidden behind the drain
+    assert estimate.background["dm_submit"] == pytest.approx(3 * costs.dm_submit)
+    assert estimate.total == pytest.approx(sum(estimate.stages.values()))
+
+
+def test_rigaku_has_no_drain():
+    """The Rigaku writes its own file: the prestage and move show."""
+    costs = SeriesCosts()
+    estimate = estimate_series(
+        "rigaku_zdt", 0.01, 100, 2, sample_move=True, process=False, costs=costs
+    )
+    assert estimate.stages["drain"] == 0.0
+    assert estimate.stages["prestage"] == pytest.approx(costs.prestage)
+    assert estimate.stages["move"] == pytest.approx(2 * costs.move)
+    assert "dm" not in estimate.stages
+    with pytest.raises(ValueError):
+        estimate_series("pilatus", 0.01, 100, 2)
+
+
+def test_from_timeline():
+    """Median spans calibrate the costs, overrides win."""
+    timeline = Timeline(
+        [
+            (0, "setup", 2.0),
+            (1, "setup", 0.2),
+            (2, "setup", 0.4),
+            (0, "expose", 1.6),
+            (1, "expose", 1.8),
+            (0, "prestage", 0.05),
+        ]
+    )
+    costs = SeriesCosts.from_timeline(timeline, exposure=1.0, shutter=0.2)
+    assert costs.setup_first == pytest.approx(2.0)
+    assert costs.setup == pytest.approx(0.3)
+    assert costs.prestage == pytest.approx(0.05)
+    assert costs.shutter == 0.2
+    assert costs.arm == pytest.approx(1.7 - 1.0 - 0.2)
+    assert SeriesCosts.from_timeline(timeline, setup=9.0).setup == 9.0
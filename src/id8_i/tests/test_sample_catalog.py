@@ -0,0 +1,101 @@
+"""Test the cached, validated view of sample_info.json."""
+
+import json
+import os
+
+import pytest
+
+from id8_i.utils.sample_catalog import SampleCatalog
+
+
+def entry(name="s", **changes):
+    """One valid sample entry, with ``changes``."""
+    values = dict(
+        sample_name=name,
+        header="H",
+        x_cen=1.0,
+        y_cen=2.0,
+        x_radius=0.5,
+        y_radius=0.25,
+        x_pts=3,
+        y_pts=2,
+        temp_zone="qnw_env1",
+    )
+    values.update(changes)
+    return values
+
+
+def write(path, samples):
+    """Write ``samples`` as sample_info.json, with a new modification time."""
+    path.write_text(json.dumps(samples))
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+
+@pytest.fixture
+def path(tmp_path):
+    """Path of a sample_info.json with two samples and one other key."""
+    path = tmp_path / "sample_info.json"
+    write(path, {"sample_0": entry("a"), "sample_1": entry("b"), "comment": "x"})
+    return path
+
+
+def test_samples(path):
+    """Only sample_N keys are samples, converted to SampleInfo."""
+    catalog = SampleCatalog(path)
+    assert len(catalog) == 2
+    assert 1 in catalog and 2 not in catalog
+    sample = catalog[1]
+    assert sample.sample_name == "b"
+    assert sample.num_points == 6
+    with pytest.raises(KeyError):
+        catalog[2]
+
+
+def test_reloaded_only_when_changed(path):
+    """The file is parsed again only when its modification time or size change."""
+    catalog = SampleCatalog(path, check_interval=0)
+    catalog[0]
+    catalog[1]
+    assert catalog.loads == 1
+    write(path, {"sample_0": entry("renamed")})
+    assert catalog[0].sample_name == "renamed"
+    assert catalog.loads == 2
+    assert 1 not in catalog
+
+
+def test_check_interval(path):
+    """Within ``check_interval``, the file is not even checked."""
+    catalog = SampleCatalog(path, check_interval=3600)
+    catalog[0]
+    write(path, {"sample_0": entry("renamed")})
+    assert catalog[0].sample_name == "a"
+    assert catalog.refresh(force=True)
+    assert catalog[0].sample_name == "renamed"
+
+
+def test_malformed_entry_left_out(path):
+    """A malformed entry raises on its own lookup only."""
+    write(
+        path,
+        {
+            "sample_0": entry("a"),
+            "sample_1": entry("b", x_pts="many"),
+            "sample_2": {"sample_name": "c"},
+            "sample_3": entry("d", y_pts=0),
+        },
+    )
+    catalog = SampleCatalog(path)
+    assert catalog[0].sample_name == "a"
+    assert sorted(catalog.invalid()) == [1, 2, 3]
+    for index in (1, 2, 3):
+        with pytest.raises(ValueError):
+            catalog[index]
+
+
+def test_unreadable_file_keeps_samples(path):
+    """A file caught while being written leaves the samples loaded."""
+    catalog = SampleCatalog(path, check_interval=0)
+    catalog[0]
+    path.write_text('{"sample_0": ')
+    assert catalog[0].sample_name == "a"
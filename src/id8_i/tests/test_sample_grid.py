@@ -0,0 +1,81 @@
+"""Test the precomputed sample grids and their visiting orders."""
+
+import numpy as np
+import pytest
+
+from id8_i.utils.sample_grid import ORDERS
+from id8_i.utils.sample_grid import SampleGrid
+from id8_i.utils.sample_grid import grid_for
+
+
+@pytest.mark.parametrize("order", ORDERS)
+@pytest.mark.parametrize("shape", [(1, 1), (4, 3), (5, 5), (2, 7), (8, 8)])
+def test_every_spot_once(order, shape):
+    """Each order visits every spot of the grid exactly once."""
+    grid = SampleGrid(0.0, 0.0, 1.0, 1.0, *shape, order=order)
+    assert len(grid) == shape[0] * shape[1]
+    assert len({tuple(cell) for cell in grid.cells}) == len(grid)
+    assert grid.cells[:, 0].max() == shape[0] - 1
+    assert grid.cells[:, 1].max() == shape[1] - 1
+
+
+def test_raster_is_the_old_order():
+    """Raster, the default, steps as the old plans: rows of increasing x."""
+    grid = SampleGrid(0.0, 0.0, 1.0, 1.0, 3, 2)
+    assert grid.order == "raster"
+    xs = np.linspace(-1.0, 1.0, 3)
+    ys = np.linspace(-1.0, 1.0, 2)
+    expected = [(x, y) for y in ys for x in xs]
+    assert np.allclose(grid.positions, expected)
+
+
+@pytest.mark.parametrize("order", ["serpentine", "hilbert"])
+def test_moves_of_one_spacing(order):
+    """Serpentine and Hilbert orders move by one grid spacing (Hilbert: 8x8)."""
+    grid = SampleGrid(0.0, 0.0, 3.5, 3.5, 8, 8, order=order)
+    moves = np.abs(np.diff(grid.cells, axis=0)).sum(axis=1)
+    assert (moves == 1).all()
+    raster = SampleGrid(0.0, 0.0, 3.5, 3.5, 8, 8, order="raster")
+    assert grid.path_length() < raster.path_length()
+
+
+def test_steps_wrap():
+    """The cursor walks the grid again and again."""
+    grid = SampleGrid(0.0, 0.0, 1.0, 1.0, 2, 2)
+    assert grid.position(5) == grid.position(1)
+    steps, positions = grid.next_positions(2, 3)
+    assert list(steps) == [3, 0, 1]
+    assert np.allclose(positions, grid.positions[[3, 0, 1]])
+
+
+def test_grids_are_shared_and_read_only():
+    """grid_for returns one grid per geometry and order."""
+    grid = grid_for(0.0, 0.0, 1.0, 1.0, 3, 3, "hilbert")
+    assert grid_for(0.0, 0.0, 1.0, 1.0, 3, 3, "hilbert") is grid
+    with pytest.raises(ValueError):
+        grid.positions[0, 0] = 1.0
+
+
+def test_unknown_order():
+    """An unknown order is refused."""
+    with pytest.raises(ValueError):
+        SampleGrid(0.0, 0.0, 1.0, 1.0, 2, 2, order="spiral")
+
+
+@pytest.mark.parametrize("order", ORDERS)
+def test_nearest_step_snaps_readbacks(order):
+    """A readback near a spot finds that spot, whatever the order."""
+    grid = SampleGrid(1.0, 2.0, 0.2, 0.1, 5, 3, order=order)
+    for step, (x, y) in enumerate(grid.positions):
+        assert grid.nearest_step(x + 0.0004, y - 0.0007) == step
+        assert grid.position(grid.nearest_step(x + 0.04, y)) == grid.position(step)
+
+
+def test_nearest_step_off_the_grid():
+    """A position more than half a spacing from every spot has no step."""
+    grid = SampleGrid(0.0, 0.0, 1.0, 1.0, 3, 3)  # spacing 1
+    assert grid.nearest_step(1.4, 0.0) is not None
+    assert grid.nearest_step(1.6, 0.0) is None
+    single = SampleGrid(0.0, 0.0, 0.0, 0.0, 1, 1)
+    assert single.nearest_step(0.01, -0.01) == 0
+    assert single.nearest_step(0.2, 0.0) is None
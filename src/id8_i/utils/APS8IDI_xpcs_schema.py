@@ -277,6 +277,56 @@ xpcs_schema = {
                     "description": "Storage ring current in mA",
                     "data": 0.0,
                 },
+                "incident_beam_series": {
+                    "type": "NXcollection",
+                    "required": False,
+                    "description": "Incident beam intensity during the exposure",
+                    "time": {
+                        "type": "NX_NUMBER",
+                        "units": "NX_TIME",
+                        "required": False,
+                        "description": "Time of each sample from the capture start",
+                        "data": None,
+                    },
+                    "intensity": {
+                        "type": "NX_NUMBER",
+                        "required": False,
+                        "description": "Picoammeter current of each sample",
+                        "data": None,
+                    },
+                    "mean": {
+                        "type": "NX_FLOAT",
+                        "required": False,
+                        "description": "Mean intensity",
+                        "data": 0.0,
+                    },
+                    "std": {
+                        "type": "NX_FLOAT",
+                        "required": False,
+                        "description": "Standard deviation of the intensity",
+                        "data": 0.0,
+                    },
+                    "dropouts": {
+                        "type": "NX_INT",
+                        "required": False,
+                        "description": "Samples below a fraction of the median",
+                        "data": 0,
+                    },
+                    "beam_loss_start": {
+                        "type": "NX_NUMBER",
+                        "units": "NX_TIME",
+                        "required": False,
+                        "description": "Start of each window without beam",
+                        "data": None,
+                    },
+                    "beam_loss_end": {
+                        "type": "NX_NUMBER",
+                        "units": "NX_TIME",
+                        "required": False,
+                        "description": "End of each window without beam",
+                        "data": None,
+                    },
+                },
             },
             "undulator_1": {
                 "type": "NXinsertion_device",
@@ -620,6 +670,45 @@ xpcs_schema = {
                 "description": "The temperature of the rheometer",
                 "data": 1.0,
             },
+            "fly_scan": {
+                "type": "NXcollection",
+                "required": False,
+                "description": "Sample position at each frame of a gated fly scan",
+                "axis": {
+                    "type": "NX_CHAR",
+                    "required": False,
+                    "description": "Motor flown during the acquisition",
+                    "data": "",
+                },
+                "position": {
+                    "type": "NX_NUMBER",
+                    "units": "NX_LENGTH",
+                    "required": False,
+                    "description": "Axis position at each frame start (MCS latch)",
+                    "data": None,
+                },
+                "frame_time": {
+                    "type": "NX_NUMBER",
+                    "units": "NX_TIME",
+                    "required": False,
+                    "description": "Start of each frame, from the first trigger",
+                    "data": None,
+                },
+                "position_lag": {
+                    "type": "NX_NUMBER",
+                    "units": "NX_LENGTH",
+                    "required": False,
+                    "description": "Measured minus commanded position at each frame",
+                    "data": None,
+                },
+                "start_readback": {
+                    "type": "NX_FLOAT",
+                    "units": "NX_LENGTH",
+                    "required": False,
+                    "description": "Axis readback when the (timed) triggers started",
+                    "data": 0.0,
+                },
+            },
         },
         "user": {
             "type": "NXuser",
@@ -0,0 +1,133 @@
+"""
+Timeline of the stages of a multi-repetition acquisition.
+
+Each stage of each repetition (move, setup, expose, drain, metadata, DM
+submission, ...) is recorded as a span of wall-clock time.  Stages that run
+in the background (the metadata writer) or overlap with others (a sample
+move during the HDF5 drain) are recorded the same way, so the report can
+compare the actual wall time with the time the same stages would take one
+after another.
+
+.. autosummary::
+
+    ~StageSpan
+    ~AcquisitionTimeline
+"""
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict
+from typing import List
+from typing import Optional
+
+
+@dataclass
+class StageSpan:
+    """One stage of one repetition, times from time.monotonic()."""
+
+    rep: int
+    stage: str
+    start: float
+    end: float
+
+    @property
+    def duration(self) -> float:
+        """Seconds spent in this stage."""
+        return self.end - self.start
+
+
+class AcquisitionTimeline:
+    """Record stage spans and report the dead time recovered by overlapping them."""
+
+    def __init__(self):
+        """Start an empty timeline, the clock starts now."""
+        self._lock = threading.Lock()
+        self.spans: List[StageSpan] = []
+        self.t0 = time.monotonic()
+        self.t_end: Optional[float] = None
+
+    def record(self, rep: int, stage: str, start: float, end: Optional[float] = None):
+        """Add one span (thread-safe, used by status callbacks)."""
+        span = StageSpan(rep, stage, start, time.monotonic() if end is None else end)
+        with self._lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def stage(self, rep: int, stage: str):
+        """Record the code (or plan) run inside the ``with`` block."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(rep, stage, start)
+
+    def record_status(
+        self, rep: int, stage: str, status, start: Optional[float] = None
+    ):
+        """Record the span from now (or ``start``) until ``status`` finishes.
+
+        ``status`` may also be a list of statuses, the span then ends when
+        the last one finishes.
+        """
+        start = time.monotonic() if start is None else start
+        statuses = list(status) if isinstance(status, (list, tuple)) else [status]
+        if not statuses:
+            self.record(rep, stage, start)
+            return
+        remaining = [len(statuses)]
+
+        def finished(st):
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self.record(rep, stage, start)
+
+        for st in statuses:
+            st.add_callback(finished)
+
+    def finish(self):
+        """Stop the wall clock."""
+        self.t_end = time.monotonic()
+
+    @property
+    def wall_time(self) -> float:
+        """Seconds from the start of the timeline to finish() (or now)."""
+        return (self.t_end or time.monotonic()) - self.t0
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Total seconds per stage, over all repetitions."""
+        totals = defaultdict(float)
+        with self._lock:
+            for span in self.spans:
+                totals[span.stage] += span.duration
+        return dict(totals)
+
+    @property
+    def serial_time(self) -> float:
+        """Seconds the recorded stages would take, run one after another."""
+        return sum(self.stage_totals().values())
+
+    @property
+    def recovered_time(self) -> float:
+        """Seconds saved by overlapping stages (serial time minus wall time)."""
+        return max(self.serial_time - self.wall_time, 0.0)
+
+    def report(self) -> str:
+        """Multi-line summary for the console."""
+        lines = [
+            f"wall time {self.wall_time:.3f} s, stages one after another"
+            f" {self.serial_time:.3f} s, recovered {self.recovered_time:.3f} s"
+        ]
+        for stage, total in sorted(self.stage_totals().items(), key=lambda kv: -kv[1]):
+            lines.append(f"  {stage:>10s}: {total:8.3f} s")
+        return "\n".join(lines)
+
+    def rows(self) -> List[tuple]:
+        """(rep, stage, start, end) rows from the timeline start, in start order."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return [(s.rep, s.stage, s.start - self.t0, s.end - self.t0) for s in spans]
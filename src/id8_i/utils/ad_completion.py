@@ -0,0 +1,121 @@
+"""
+Event-driven completion of an area detector acquisition.
+
+Instead of polling ``cam.acquire_busy`` and ``hdf1.queue_free`` every
+100 ms, these ophyd statuses subscribe to the (monitored) signals and
+finish on the update that ends the phase.  Each has a real timeout: a
+status that does not finish in time fails with ``StatusTimeoutError``.
+
+Wait for them in a plan with ``plans.wait_plans.wait_for_status``.
+
+.. autosummary::
+
+    ~AcquisitionTiming
+    ~acquisition_done_status
+    ~hdf_drained_status
+    ~expected_acquisition_time
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Any
+from typing import Optional
+
+from ophyd.status import SubscriptionStatus
+from ophyd.utils import InvalidState
+
+ACQUIRE_TIMEOUT_MARGIN = 30  # seconds, added to the expected acquisition time
+DRAIN_TIMEOUT = 60  # seconds, for the HDF5 plugin to write the queued frames
+
+
+@dataclass
+class AcquisitionTiming:
+    """Durations of the phases of one acquisition, in seconds."""
+
+    acquire: Optional[float] = None  # acquire pressed until detector idle
+    drain: Optional[float] = None  # detector idle until HDF5 queue empty
+
+    def __str__(self) -> str:
+        """Short summary for the console."""
+
+        def fmt(t):
+            return "n/a" if t is None else f"{t:.3f} s"
+
+        return f"acquire={fmt(self.acquire)}, drain={fmt(self.drain)}"
+
+
+def expected_acquisition_time(cam: Any) -> float:
+    """Nominal duration of the acquisition configured in ``cam``, seconds."""
+    num_triggers = (
+        max(int(cam.num_triggers.get()), 1) if hasattr(cam, "num_triggers") else 1
+    )
+    return cam.acquire_period.get() * cam.num_images.get() * num_triggers
+
+
+def acquisition_done_status(
+    cam: Any, timeout: Optional[float] = None
+) -> SubscriptionStatus:
+    """Status that finishes when ``cam.acquire_busy`` goes from busy to idle.
+
+    Create it *before* starting the acquisition: it only finishes after it
+    has seen the detector busy, so it cannot be fooled by the idle state
+    that precedes the start.  A short acquisition can go busy and idle
+    within one monitor update, which then only shows idle: call
+    ``status.arm()`` once the write of ``cam.acquire`` completed (its
+    readback shows the acquisition started), and an idle detector counts
+    as done from then on.
+
+    Args:
+        cam: Area detector cam plugin
+        timeout: Seconds before the status fails, None to wait forever
+
+    Returns:
+        SubscriptionStatus with a ``t_start`` attribute (time.monotonic())
+        and an ``arm()`` method
+    """
+    seen_busy = False
+
+    def idle_after_busy(*args, value=None, **kwargs):
+        nonlocal seen_busy
+        if value:
+            seen_busy = True
+        return seen_busy and not value
+
+    status = SubscriptionStatus(cam.acquire_busy, idle_after_busy, timeout=timeout)
+    status.t_start = time.monotonic()
+
+    def arm():
+        nonlocal seen_busy
+        seen_busy = True
+        if not status.done and not cam.acquire_busy.get():
+            try:
+                status.set_finished()
+            except InvalidState:
+                pass  # the monitor update finished it meanwhile
+
+    status.arm = arm
+    return status
+
+
+def hdf_drained_status(
+    plugin: Any, timeout: Optional[float] = DRAIN_TIMEOUT
+) -> SubscriptionStatus:
+    """Status that finishes when the plugin's queue is empty.
+
+    Finishes at once if the queue is already empty.
+
+    Args:
+        plugin: Area detector file plugin (such as ``hdf1``)
+        timeout: Seconds before the status fails, None to wait forever
+
+    Returns:
+        SubscriptionStatus with a ``t_start`` attribute (time.monotonic())
+    """
+    queue_size = plugin.queue_size.get()
+
+    def drained(*args, value=None, **kwargs):
+        return value == queue_size
+
+    status = SubscriptionStatus(plugin.queue_free, drained, timeout=timeout)
+    status.t_start = time.monotonic()
+    return status
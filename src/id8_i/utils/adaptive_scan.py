@@ -0,0 +1,205 @@
+"""
+Adaptive point selection for alignment scans.
+
+A uniform grid spends most of its points on the flat parts of an
+alignment scan.  :class:`AdaptiveSampler` starts with a coarse grid and,
+batch after batch, splits the intervals that matter:
+
+* the interval(s) bracketing the edge (mid-level crossing) or the two
+  half-maximum crossings of the peak, until they are narrower than twice
+  the tolerance: this bounds the uncertainty of the centre;
+* the intervals with the largest normalised arc length
+  ``sqrt(dx**2 + dy**2)``, where the signal changes most, so a feature
+  the coarse grid barely touched is not missed.
+
+While the signal does not rise above the noise (a peak narrower than
+the coarse grid), the largest intervals are split first.  It stops once
+the centre is known to the tolerance, or at ``max_points``.
+The sampler only proposes positions and receives readings; the plan
+(``scan_8idi.adaptive_lup``) moves and reads.
+
+.. autosummary::
+
+    ~AdaptiveResult
+    ~AdaptiveSampler
+"""
+
+import math
+from dataclasses import dataclass
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+from .fly_alignment import EDGE_STEP
+from .fly_alignment import KINDS
+
+MIN_CONTRAST = 8  # a peak or edge must exceed this many times the noise
+
+
+@dataclass(frozen=True)
+class AdaptiveResult:
+    """Centre of a peak or an edge found by an adaptive scan."""
+
+    kind: str  # "peak" or "edge"
+    centre: float
+    uncertainty: float  # half the width of the interval(s) bracketing the centre
+    x: np.ndarray  # measured positions, sorted
+    y: np.ndarray
+
+    @property
+    def num_points(self) -> int:
+        """Points measured."""
+        return len(self.x)
+
+    def __str__(self) -> str:
+        """One line for the console."""
+        return (
+            f"{self.kind} at {self.centre:.4f} +/- {self.uncertainty:.4f}"
+            f" ({self.num_points} points)"
+        )
+
+
+def _noise(y: np.ndarray) -> float:
+    """Robust noise level: the median second difference, unmoved by a few features."""
+    if len(y) < 3:
+        return 0.0
+    return float(1.4826 * np.median(np.abs(np.diff(y, 2))) / math.sqrt(6))
+
+
+def _crossing(x: np.ndarray, y: np.ndarray, i: int, level: float) -> float:
+    """Where y crosses ``level`` between the points i and i+1."""
+    if y[i + 1] == y[i]:
+        return float((x[i] + x[i + 1]) / 2)
+    return float(x[i] + (level - y[i]) * (x[i + 1] - x[i]) / (y[i + 1] - y[i]))
+
+
+class AdaptiveSampler:
+    """Propose the positions of an alignment scan from the readings so far."""
+
+    def __init__(
+        self,
+        begin: float,
+        end: float,
+        tolerance: float,
+        kind: str = "auto",
+        coarse_points: int = 11,
+        max_points: int = 60,
+        batch: int = 2,
+    ):
+        """Plan a scan from ``begin`` to ``end``.
+
+        Args:
+            begin: First position of the coarse grid
+            end: Last position of the coarse grid
+            tolerance: Wanted uncertainty of the centre
+            kind: "peak", "edge", or "auto" (decided from the coarse grid)
+            coarse_points: Points of the initial uniform grid
+            max_points: Points after which the scan stops anyway
+            batch: Points proposed by each ask()
+        """
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}, not {kind!r}")
+        if coarse_points < 3 or max_points < coarse_points:
+            raise ValueError("need coarse_points >= 3 and max_points >= coarse_points")
+        self.begin, self.end = float(begin), float(end)
+        self.tolerance = float(tolerance)
+        self.kind = kind
+        self.coarse_points = coarse_points
+        self.max_points = max_points
+        self.batch = batch
+        self._x: List[float] = []
+        self._y: List[float] = []
+
+    def initial_points(self) -> np.ndarray:
+        """The coarse grid."""
+        return np.linspace(self.begin, self.end, self.coarse_points)
+
+    def tell(self, x: float, y: float):
+        """Record one reading."""
+        self._x.append(float(x))
+        self._y.append(float(y))
+
+    def _sorted(self) -> Tuple[np.ndarray, np.ndarray]:
+        order = np.argsort(self._x)
+        return np.asarray(self._x)[order], np.asarray(self._y)[order]
+
+    def _kind(self, y: np.ndarray) -> str:
+        if self.kind != "auto":
+            return self.kind
+        span = np.max(y) - np.min(y)
+        step = np.mean(y[-2:]) - np.mean(y[:2])
+        return "edge" if span > 0 and abs(step) > EDGE_STEP * span else "peak"
+
+    def _brackets(
+        self, x: np.ndarray, y: np.ndarray
+    ) -> Tuple[str, Optional[float], List[int]]:
+        """(kind, centre, indices i of the intervals [x[i], x[i+1]] bracketing it)."""
+        kind = self._kind(y)
+        if np.ptp(y) < MIN_CONTRAST * _noise(y):
+            return kind, None, []  # only noise so far
+        if kind == "edge":
+            level = (np.mean(y[:2]) + np.mean(y[-2:])) / 2
+            above = y >= level
+            crossings = np.flatnonzero(above[1:] != above[:-1])
+            if not len(crossings):
+                return kind, None, []
+            # With noise, several crossings: the steepest is the edge.
+            i = int(crossings[np.argmax(np.abs(y[crossings + 1] - y[crossings]))])
+            return kind, _crossing(x, y, i, level), [i]
+
+        top = int(np.argmax(y))
+        level = (y[top] + np.min(y)) / 2
+        below_left = np.flatnonzero(y[:top] < level)
+        below_right = np.flatnonzero(y[top:] < level)
+        if not len(below_left) or not len(below_right):
+            return kind, float(x[top]), []  # peak not inside the range
+        left = int(below_left[-1])
+        right = top + int(below_right[0]) - 1
+        centre = (_crossing(x, y, left, level) + _crossing(x, y, right, level)) / 2
+        return kind, centre, [left, right]
+
+    def result(self) -> AdaptiveResult:
+        """The centre and its uncertainty from the readings so far."""
+        x, y = self._sorted()
+        kind, centre, brackets = self._brackets(x, y)
+        if centre is None or not brackets:
+            return AdaptiveResult(
+                kind, math.nan if centre is None else centre, math.inf, x, y
+            )
+        uncertainty = max(x[i + 1] - x[i] for i in brackets) / 2
+        return AdaptiveResult(kind, centre, float(uncertainty), x, y)
+
+    @property
+    def done(self) -> bool:
+        """The centre is known to the tolerance, or no more points are allowed."""
+        return (
+            len(self._x) >= self.max_points
+            or self.result().uncertainty <= self.tolerance
+        )
+
+    def ask(self) -> List[float]:
+        """Next positions to measure, sorted; empty when done."""
+        if len(self._x) < self.coarse_points or self.done:
+            return []
+        x, y = self._sorted()
+        widths = np.diff(x)
+        wanted = min(self.batch, self.max_points - len(x))
+
+        _, centre, brackets = self._brackets(x, y)
+        chosen = [i for i in brackets if widths[i] > 2 * self.tolerance][:wanted]
+
+        if centre is None:  # nothing above the noise yet: densify evenly
+            loss = widths.copy()
+        else:
+            span = np.ptp(y) or 1.0
+            loss = np.hypot(
+                widths / (abs(self.end - self.begin) or 1.0), np.diff(y) / span
+            )
+        loss[widths <= self.tolerance] = -1  # finer than needed
+        loss[chosen] = -1
+        for i in np.argsort(loss)[::-1][: wanted - len(chosen)]:
+            if loss[i] >= 0:
+                chosen.append(int(i))
+        return sorted(float((x[i] + x[i + 1]) / 2) for i in set(chosen))
@@ -0,0 +1,334 @@
+"""
+Choose the analysis machine of a DM job from the load of each machine.
+
+The scheduler keeps a ledger of the jobs it sent to each machine (keyed by
+the ``filePath`` of the job).  Each machine runs ``slots`` jobs at once
+(``ANALYSIS_MACHINES`` in iconfig.yml); how fast it runs them is learned.
+The run time of a job is estimated as the size of the recent jobs (run
+times of the last jobs, on any machine, scaled to a machine of slowness 1)
+times the slowness of the machine (median ratio of the run times of its
+finished jobs to the job size when they finished).  Its outstanding jobs
+are laid out on its slots to estimate when a new job would complete; the
+default ``least-loaded`` policy sends the job to the machine that would
+finish it first.
+
+In the simulator (synthetic trace, 463 jobs, mean turnaround), it is
+within a few percent of the best static split when that split happens to
+match the machine speeds, and far ahead of it when it does not::
+
+    slots:speed adamite, califone   least-loaded   round-robin   weighted
+    1:1, 2:1                               321          638         317
+    1:2, 2:1                               180          174         247
+    1:1, 2:0.5                            1186         1115        3995
+    1:1, 2:2                               118          571         159
+
+Completed jobs are taken from DM job listings, passed to :meth:`sync`
+(by the ``DMJobTracker``, or by polling the optional ``job_source``
+callable at most every ``refresh_interval`` seconds, from a background
+thread so a plan never waits for DM).
+A job never reported done is dropped from the ledger after
+``stale_after`` seconds.  (An expiry relative to the expected run time
+was tried and rejected: under a backlog the estimate lags the actual job
+sizes, and dropping queued jobs made a busy machine look idle.)
+
+Policies are small classes with a ``choose(machines, now, size)`` method, so
+they can be replayed offline against a job trace, see
+``scripts/simulate_analysis_scheduler.py``.
+
+.. autosummary::
+
+    ~MachineState
+    ~LeastLoadedPolicy
+    ~RoundRobinPolicy
+    ~WeightedPolicy
+    ~AnalysisScheduler
+    ~POLICIES
+"""
+
+import heapq
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Callable
+from typing import Deque
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DURATION = 120.0  # seconds, expected run time before any job finished
+SIZE_HISTORY = 10  # recent jobs that set the size of the next job (a series)
+SLOWNESS_HISTORY = 50  # finished jobs that set the slowness of a machine
+STALE_AFTER = 6 * 3600.0  # seconds after which a job never reported done is dropped
+REFRESH_INTERVAL = 30.0  # seconds between two polls of the job source
+
+DONE_STATES = ("done", "failed", "aborted", "cancelled")
+
+
+@dataclass
+class MachineState:
+    """Ledger of one analysis machine."""
+
+    name: str
+    slots: int = 1  # jobs run at once
+    # key: (t assigned, size)
+    outstanding: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+    ratios: Deque[float] = field(default_factory=lambda: deque(maxlen=SLOWNESS_HISTORY))
+    assigned: int = 0  # jobs sent to this machine
+
+    @property
+    def slowness(self) -> float:
+        """Median ratio of run time to job size, 1 until a job finished."""
+        return statistics.median(self.ratios) if self.ratios else 1.0
+
+    def slot_free_times(self, now: float) -> List[float]:
+        """When each slot is expected to be free, the outstanding jobs run in turn."""
+        slowness = self.slowness
+        free = [now] * self.slots
+        for t, size in sorted(self.outstanding.values()):
+            expected = size * slowness
+            start = max(t, heapq.heappop(free))
+            # A job running longer than expected still holds the slot a while.
+            heapq.heappush(free, max(start + expected, now + 0.1 * expected))
+        return free
+
+    def expected_completion(self, now: float, size: float) -> float:
+        """Seconds until a job of ``size`` sent now would be done."""
+        return min(self.slot_free_times(now)) - now + size * self.slowness
+
+
+class LeastLoadedPolicy:
+    """Send the job to the machine with the earliest expected completion."""
+
+    name = "least-loaded"
+
+    def choose(
+        self, machines: List[MachineState], now: float, size: float
+    ) -> MachineState:
+        """Return the chosen machine."""
+        return min(
+            machines,
+            key=lambda m: (m.expected_completion(now, size), len(m.outstanding)),
+        )
+
+
+class RoundRobinPolicy:
+    """Send the jobs to the machines in turn."""
+
+    name = "round-robin"
+
+    def __init__(self):
+        """Start with the first machine."""
+        self._next = 0
+
+    def choose(
+        self, machines: List[MachineState], now: float, size: float
+    ) -> MachineState:
+        """Return the chosen machine."""
+        machine = machines[self._next % len(machines)]
+        self._next += 1
+        return machine
+
+
+class WeightedPolicy:
+    """Spread the jobs in proportion to the slots (smooth weighted round-robin)."""
+
+    name = "weighted"
+
+    def __init__(self):
+        """Start with no credit on any machine."""
+        self._credit: Dict[str, float] = {}
+
+    def choose(
+        self, machines: List[MachineState], now: float, size: float
+    ) -> MachineState:
+        """Return the chosen machine."""
+        total = sum(m.slots for m in machines)
+        for m in machines:
+            self._credit[m.name] = self._credit.get(m.name, 0.0) + m.slots
+        machine = max(machines, key=lambda m: self._credit[m.name])
+        self._credit[machine.name] -= total
+        return machine
+
+
+POLICIES: Dict[str, Callable[[], Any]] = {
+    LeastLoadedPolicy.name: LeastLoadedPolicy,
+    RoundRobinPolicy.name: RoundRobinPolicy,
+    WeightedPolicy.name: WeightedPolicy,
+}
+"""Policy classes by name, as used in ``iconfig.yml`` (``ANALYSIS_POLICY``)."""
+
+
+def _job_key(job: Dict[str, Any]) -> Optional[str]:
+    """Ledger key (``filePath``) of a DM job listing."""
+    args = job.get("argsDict") or {}
+    return job.get("filePath") or args.get("filePath")
+
+
+class AnalysisScheduler:
+    """Pick the analysis machine of each DM job from the per-machine ledgers."""
+
+    def __init__(
+        self,
+        machines: Dict[str, int],
+        policy: str = LeastLoadedPolicy.name,
+        default_duration: float = DEFAULT_DURATION,
+        job_source: Optional[Callable[[], Iterable[Dict[str, Any]]]] = None,
+        refresh_interval: float = REFRESH_INTERVAL,
+        stale_after: float = STALE_AFTER,
+        clock: Callable[[], float] = time.time,
+    ):
+        """Start with empty ledgers.
+
+        Args:
+            machines: Machine name: jobs it runs at once
+            policy: Name of the policy, a key of ``POLICIES``
+            default_duration: Expected run time (s) before any job finished
+            job_source: Callable returning DM job listings, for :meth:`sync`
+            refresh_interval: Minimum seconds between two calls of job_source
+            stale_after: Seconds after which a job never reported done is dropped
+            clock: Time source (replaced by the simulator)
+        """
+        if not machines:
+            raise ValueError("At least one analysis machine is needed.")
+        if policy not in POLICIES:
+            raise ValueError(
+                f"Unknown policy {policy!r}, expected one of {sorted(POLICIES)}."
+            )
+        self.machines = {
+            name: MachineState(name, max(int(slots), 1))
+            for name, slots in machines.items()
+        }
+        self.default_duration = default_duration
+        self._sizes = deque(maxlen=SIZE_HISTORY)
+        self.policy = POLICIES[policy]()
+        self.job_source = job_source
+        self.refresh_interval = refresh_interval
+        self.stale_after = stale_after
+        self.clock = clock
+        self._last_refresh = None
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    @property
+    def job_size(self) -> float:
+        """Expected run time (s) of the next job on a machine of slowness 1."""
+        return statistics.median(self._sizes) if self._sizes else self.default_duration
+
+    def choose(self, job_key: Optional[str] = None) -> str:
+        """Return the machine for a new job, and add the job to its ledger.
+
+        Args:
+            job_key: ``filePath`` of the job (not recorded if None)
+        """
+        self._refresh_in_background()
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            size = self.job_size
+            machine = self.policy.choose(list(self.machines.values()), now, size)
+            machine.assigned += 1
+            if job_key is not None:
+                machine.outstanding[job_key] = (now, size)
+            expected = machine.expected_completion(now, size)
+        logger.info(
+            "Analysis machine %s (%s) for %s, expected done in %.0f s",
+            machine.name,
+            self.policy.name,
+            job_key,
+            expected,
+        )
+        return machine.name
+
+    def complete(self, job_key: str, duration: Optional[float] = None):
+        """Remove a finished job from its ledger and learn from its run time.
+
+        Args:
+            job_key: Key given to :meth:`choose`
+            duration: Run time (s), default: time since the job was assigned
+                (which includes the time it waited on a busy machine)
+        """
+        now = self.clock()
+        with self._lock:
+            for machine in self.machines.values():
+                entry = machine.outstanding.pop(job_key, None)
+                if entry is not None:
+                    t_assigned, _ = entry
+                    run_time = now - t_assigned if duration is None else duration
+                    # Against the size now rather than at assignment: within a
+                    # series the sizes change, and the older estimate lags more.
+                    machine.ratios.append(run_time / self.job_size)
+                    self._sizes.append(run_time / machine.slowness)
+                    return
+
+    def sync(self, jobs: Iterable[Dict[str, Any]]):
+        """Update the ledgers from DM job listings (``listProcessingJobs()``)."""
+        for job in jobs:
+            if job.get("status") not in DONE_STATES:
+                continue
+            key = _job_key(job)
+            run_time = job.get("runTime")
+            if run_time is None and job.get("startTime") and job.get("endTime"):
+                run_time = job["endTime"] - job["startTime"]
+            if key is not None:
+                self.complete(key, duration=run_time)
+
+    def refresh(self, force: bool = False):
+        """Poll the job source, at most once per refresh interval."""
+        if self.job_source is None:
+            return
+        now = time.monotonic()
+        if (
+            not force
+            and self._last_refresh is not None
+            and now - self._last_refresh < self.refresh_interval
+        ):
+            return
+        self._last_refresh = now
+        try:
+            self.sync(self.job_source())
+        except Exception as exc:
+            logger.warning(
+                "Could not list the DM jobs, using the local ledger: %s", exc
+            )
+
+    def _refresh_in_background(self):
+        """Start :meth:`refresh` in a thread, unless one is still running."""
+        if self.job_source is None or (
+            self._refresher is not None and self._refresher.is_alive()
+        ):
+            return
+        self._refresher = threading.Thread(
+            target=self.refresh, name="analysis-scheduler", daemon=True
+        )
+        self._refresher.start()
+
+    def _expire(self, now: float):
+        """Drop outstanding jobs that were never reported done."""
+        for machine in self.machines.values():
+            for key, (t_assigned, _) in list(machine.outstanding.items()):
+                if now - t_assigned > self.stale_after:
+                    del machine.outstanding[key]
+
+    def loads(self) -> Dict[str, Dict[str, float]]:
+        """Per-machine outstanding jobs, slowness and expected completion (s)."""
+        now = self.clock()
+        with self._lock:
+            size = self.job_size
+            return {
+                m.name: {
+                    "outstanding": len(m.outstanding),
+                    "assigned": m.assigned,
+                    "slowness": m.slowness,
+                    "expected_completion": m.expected_completion(now, size),
+                }
+                for m in self.machines.values()
+            }
@@ -0,0 +1,149 @@
+"""
+Choose the attenuation from the count rate of a preview frame.
+
+The peak pixel rate measured at one transmission scales with the
+transmission, so the rate at every filter level is predicted from one
+short preview.  :func:`choose_attenuation` picks the least attenuation
+(highest transmission) whose predicted peak rate stays under the
+detector's limit, at most ``max_step`` times the transmission of the
+preview.  A preview with too few counts gives only an upper bound of the
+rate; the prediction from it is an upper bound too.
+:class:`AttenuationCache` keeps the choice of each
+(sample, detector) so later measurements of that sample skip the preview.
+
+.. autosummary::
+
+    ~AttenuationChoice
+    ~choose_attenuation
+    ~AttenuationCache
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Dict
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+
+
+@dataclass(frozen=True)
+class AttenuationChoice:
+    """Attenuation level chosen from a preview."""
+
+    level: float
+    transmission: float
+    predicted_rate: float  # counts/s in the brightest pixel at ``level``
+    preview_level: float
+    preview_rate: float
+    max_rate: float
+    upper_bound: bool = False  # preview_rate is an upper bound, not a measurement
+    limited: bool = False  # less attenuation is allowed but beyond ``max_step``
+
+    @property
+    def within_limit(self) -> bool:
+        """False if even the most attenuation is predicted above the limit."""
+        return self.predicted_rate <= self.max_rate
+
+    def __str__(self) -> str:
+        """One line for the console."""
+        text = (
+            f"attenuation {self.level:g} (transmission {self.transmission:.3g}):"
+            f" peak {self.predicted_rate:.3g} counts/s predicted,"
+            f" limit {self.max_rate:.3g}"
+            f" (preview at {self.preview_level:g}: {self.preview_rate:.3g} counts/s)"
+        )
+        if self.upper_bound:
+            text += ", upper bounds"
+        if self.limited:
+            text += ", step limited"
+        return text if self.within_limit else text + ", ABOVE THE LIMIT"
+
+
+def choose_attenuation(
+    preview_rate: float,
+    preview_level: float,
+    transmissions: Mapping[float, float],
+    max_rate: float,
+    upper_bound: bool = False,
+    max_step: Optional[float] = None,
+) -> AttenuationChoice:
+    """Least attenuation whose predicted peak pixel rate is at most ``max_rate``.
+
+    Args:
+        preview_rate: Peak pixel rate of the preview (counts/s)
+        preview_level: Attenuation level of the preview (a key of ``transmissions``)
+        transmissions: Attenuation level -> transmission
+        max_rate: Largest peak pixel rate allowed (counts/s)
+        upper_bound: ``preview_rate`` is an upper bound (too few counts)
+        max_step: Largest transmission allowed, relative to the preview level
+            (None: no limit)
+
+    Returns:
+        AttenuationChoice, the most attenuating level if none is under the limit
+    """
+    if preview_level not in transmissions:
+        raise ValueError(f"no transmission for the preview level {preview_level}")
+    reference = transmissions[preview_level]
+    if reference <= 0:
+        raise ValueError(
+            f"transmission {reference} at the preview level {preview_level}"
+        )
+    if max_step is not None and max_step < 1:
+        raise ValueError(f"max_step {max_step} is less than 1")
+
+    def predicted(level: float) -> float:
+        return preview_rate * transmissions[level] / reference
+
+    # Highest transmission first; equal transmissions: the lower level.
+    ranked = sorted(transmissions, key=lambda level: (-transmissions[level], level))
+    allowed = [level for level in ranked if predicted(level) <= max_rate]
+    limited = False
+    if max_step is not None:
+        reachable = [
+            level for level in allowed if transmissions[level] <= reference * max_step
+        ]
+        limited = reachable[:1] != allowed[:1]
+        allowed = reachable
+    level = allowed[0] if allowed else ranked[-1]
+    return AttenuationChoice(
+        level=level,
+        transmission=transmissions[level],
+        predicted_rate=predicted(level),
+        preview_level=preview_level,
+        preview_rate=preview_rate,
+        max_rate=max_rate,
+        upper_bound=upper_bound,
+        limited=limited,
+    )
+
+
+class AttenuationCache:
+    """Attenuation chosen for each (sample, detector)."""
+
+    def __init__(self):
+        """Empty cache."""
+        self._lock = threading.Lock()
+        self._choices: Dict[Tuple[str, str], AttenuationChoice] = {}
+
+    def get(self, sample: str, detector: str) -> Optional[AttenuationChoice]:
+        """Choice kept for (sample, detector), None if none."""
+        with self._lock:
+            return self._choices.get((sample, detector))
+
+    def put(self, sample: str, detector: str, choice: AttenuationChoice):
+        """Keep ``choice`` for (sample, detector)."""
+        with self._lock:
+            self._choices[(sample, detector)] = choice
+
+    def forget(self, sample: Optional[str] = None):
+        """Drop the choices of one sample, or of all samples."""
+        with self._lock:
+            if sample is None:
+                self._choices.clear()
+            else:
+                for key in [key for key in self._choices if key[0] == sample]:
+                    del self._choices[key]
+
+    def __len__(self) -> int:
+        """Choices kept."""
+        return len(self._choices)
@@ -0,0 +1,122 @@
+"""
+Statistics of the incident beam intensity recorded during one exposure.
+
+The picoammeter time series (see ``MyTetrAMM.ts``) is reduced with numpy
+only: the mean and spread, the single-sample dropouts, and the windows in
+which the beam was lost.  The reference level is the median, so a beam
+loss does not hide itself by lowering the reference.
+
+.. autosummary::
+
+    ~BeamSeries
+    ~beam_series_stats
+"""
+
+from dataclasses import dataclass
+from typing import Any
+from typing import Dict
+from typing import Tuple
+
+import numpy as np
+
+DROPOUT_FRACTION = 0.5  # a sample below this fraction of the median is a dropout
+LOSS_FRACTION = 0.1  # below this fraction of the median, the beam is lost
+MIN_LOSS = 0.01  # seconds, shorter losses are only dropouts
+
+
+@dataclass(frozen=True)
+class BeamSeries:
+    """Intensity of the incident beam during one exposure."""
+
+    times: np.ndarray  # s from the start of the capture
+    values: np.ndarray
+    mean: float
+    std: float
+    median: float
+    dropouts: int
+    losses: np.ndarray  # (k, 2) start and end (s) of each window without beam
+
+    @property
+    def beam_lost(self) -> bool:
+        """The beam was lost at least once."""
+        return len(self.losses) > 0
+
+    @property
+    def lost_time(self) -> float:
+        """Seconds without beam."""
+        return (
+            float(np.sum(self.losses[:, 1] - self.losses[:, 0]))
+            if len(self.losses)
+            else 0.0
+        )
+
+    def summary(self) -> str:
+        """One line for the console."""
+        text = (
+            f"I0: {len(self.values)} samples, mean {self.mean:.4g},"
+            f" std {self.std / self.mean if self.mean else 0:.2%},"
+            f" {self.dropouts} dropouts"
+        )
+        if self.beam_lost:
+            text += f", BEAM LOST {len(self.losses)}x ({self.lost_time:.3f} s)"
+        return text
+
+    def nexus_metadata(self) -> Dict[str, Any]:
+        """Fields of the NeXus metadata file (the mean replaces the I0 reading)."""
+        group = "/entry/instrument/incident_beam/incident_beam_series"
+        return {
+            "/entry/instrument/incident_beam/incident_beam_intensity": self.mean,
+            f"{group}/time": self.times,
+            f"{group}/intensity": self.values,
+            f"{group}/mean": self.mean,
+            f"{group}/std": self.std,
+            f"{group}/dropouts": self.dropouts,
+            f"{group}/beam_loss_start": self.losses[:, 0],
+            f"{group}/beam_loss_end": self.losses[:, 1],
+        }
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """First and one-past-last index of each run of True."""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def beam_series_stats(
+    times: Any,
+    values: Any,
+    dropout_fraction: float = DROPOUT_FRACTION,
+    loss_fraction: float = LOSS_FRACTION,
+    min_loss: float = MIN_LOSS,
+) -> BeamSeries:
+    """Reduce one intensity time series.
+
+    Args:
+        times: Time of each sample (s)
+        values: Intensity of each sample
+        dropout_fraction: Dropout level, fraction of the median
+        loss_fraction: Beam-loss level, fraction of the median
+        min_loss: Shortest beam loss (s)
+    """
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return BeamSeries(times, values, 0.0, 0.0, 0.0, 0, np.zeros((0, 2)))
+    median = float(np.median(values))
+    dropouts = int(np.count_nonzero(values < dropout_fraction * median))
+
+    starts, ends = _runs(values < loss_fraction * median)
+    period = float(np.median(np.diff(times))) if len(times) > 1 else 0.0
+    t_start = times[starts]
+    t_end = times[ends - 1] + period  # the last sample without beam lasts one period
+    keep = t_end - t_start >= min_loss
+    losses = np.column_stack((t_start[keep], t_end[keep]))
+    return BeamSeries(
+        times=times,
+        values=values,
+        mean=float(values.mean()),
+        std=float(values.std()),
+        median=median,
+        dropouts=dropouts,
+        losses=losses,
+    )
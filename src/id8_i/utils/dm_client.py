@@ -0,0 +1,151 @@
+"""
+One long-lived DM processing API client, shared by the whole session.
+
+Creating a ``WorkflowProcApi`` parses the DM login file and, on the first
+call, logs in to the DM web service.  :class:`DMClient` does that once,
+lazily, and keeps the client (and its session cookie) for every later
+call.  The credentials are only refreshed (login file parsed again, new
+client) when a call is refused with an authorization error, or when the
+optional ``max_age`` has passed.
+
+``dm_client`` can be used wherever a ``WorkflowProcApi`` is expected::
+
+    job = dm_client.startProcessingJob(dm_client.username, workflow, argsDict=args)
+
+.. autosummary::
+
+    ~DMClient
+    ~dm_client
+"""
+
+import logging
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Optional
+from typing import Tuple
+
+from dm.common.utility.configurationManager import ConfigurationManager
+from dm.proc_web_service.api.workflowProcApi import WorkflowProcApi
+
+logger = logging.getLogger(__name__)
+
+
+def dm_login() -> Tuple[str, str, str]:
+    """Read (user, password, service URL) from the DM configuration."""
+    configManager = ConfigurationManager.getInstance()
+    dmuser, password = configManager.parseLoginFile()
+    serviceUrl = configManager.getProcWebServiceUrl()
+    return dmuser, password, serviceUrl
+
+
+def _is_authorization_error(exc: Exception) -> bool:
+    """True if ``exc`` looks like an expired or refused DM session."""
+    name = type(exc).__name__.lower()
+    return "authoriz" in name or "authentic" in name
+
+
+class DMClient:
+    """Lazily created, shared ``WorkflowProcApi`` that re-logs in only when needed."""
+
+    def __init__(
+        self,
+        login: Callable[[], Tuple[str, str, str]] = dm_login,
+        api_class: Callable[..., Any] = WorkflowProcApi,
+        max_age: Optional[float] = None,
+    ):
+        """No connection is made until the client is first used.
+
+        Args:
+            login: Callable returning (user, password, service URL)
+            api_class: Class (or factory) called as api_class(user, password, url)
+            max_age: Seconds after which the credentials are read again, None: never
+        """
+        self._login = login
+        self._api_class = api_class
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._api = None
+        self._username = None
+        self._created = None
+        self.sessions = 0  # number of clients created
+        self.refreshes = 0  # number of refreshes after an authorization error
+
+    def session(self) -> Tuple[Any, str]:
+        """Return (WorkflowProcApi, DM user), creating them on the first call."""
+        with self._lock:
+            expired = (
+                self.max_age is not None
+                and self._created is not None
+                and time.monotonic() - self._created > self.max_age
+            )
+            if self._api is None or expired:
+                user, password, url = self._login()
+                self._api = self._api_class(user, password, url)
+                self._username = user
+                self._created = time.monotonic()
+                self.sessions += 1
+                logger.info(
+                    "DM client %d created for %s at %s", self.sessions, user, url
+                )
+            return self._api, self._username
+
+    @property
+    def api(self) -> Any:
+        """The shared WorkflowProcApi."""
+        return self.session()[0]
+
+    @property
+    def username(self) -> str:
+        """The DM user of the shared client."""
+        return self.session()[1]
+
+    def invalidate(self):
+        """Forget the client, the next call logs in again."""
+        with self._lock:
+            self._api = None
+
+    def renew(self) -> Tuple[Any, str]:
+        """Drop the cached client and return a new (WorkflowProcApi, DM user)."""
+        with self._lock:
+            self.invalidate()
+            return self.session()
+
+    def call(self, method: str, *args, **kwargs) -> Any:
+        """Call a WorkflowProcApi method, logging in again once if needed."""
+        try:
+            return getattr(self.api, method)(*args, **kwargs)
+        except Exception as exc:
+            if not _is_authorization_error(exc):
+                raise
+            logger.info("DM session refused (%s), logging in again", exc)
+            self.invalidate()
+            self.refreshes += 1
+            return getattr(self.api, method)(*args, **kwargs)
+
+    def attach(self, connector: Any) -> Any:
+        """Make an apstools ``DM_WorkflowConnector`` use the shared client."""
+        connector._api = self.api  # the connector creates its own client only if unset
+        return connector
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        """Any other attribute is a WorkflowProcApi method, called via ``call``."""
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def method(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+
+        method.__name__ = name
+        return method
+
+    def __repr__(self) -> str:
+        """Short summary of the client."""
+        state = "connected" if self._api is not None else "not connected"
+        counts = f"sessions={self.sessions}, refreshes={self.refreshes}"
+        return f"{self.__class__.__name__}({state}, {counts})"
+
+
+dm_client = DMClient()
+"""Process-wide DM client shared by the plans, the DM job queue, and the SPEC bridge."""
@@ -0,0 +1,426 @@
+"""
+Incremental, locally indexed status of the DM processing jobs.
+
+A background thread polls the DM processing service every
+``poll_interval`` seconds, but only for
+
+* the owner's jobs started after the newest start time already in the
+  index, and
+* the jobs of the index that are still active (one lookup per id; a job
+  that cannot be looked up is skipped, and marked ``lost`` after
+  ``MAX_LOOKUP_FAILURES`` polls in a row).
+
+A service that cannot filter the listing by start time is asked for the
+full listing at most every ``full_listing_interval`` seconds.
+
+Every job is kept in an in-memory index keyed by job id and mirrored to an
+sqlite file, so a new session starts from the last known state instead of
+the full job listing.  The index is opened on first use.  The queries
+(:meth:`~DMJobTracker.active`, :meth:`~DMJobTracker.failures`,
+:meth:`~DMJobTracker.turnaround`) only read the index, they never call DM.
+
+Callables added with :meth:`~DMJobTracker.subscribe` receive the jobs that
+finished during a poll (the analysis machine scheduler learns run times
+this way).
+
+.. autosummary::
+
+    ~JobRecord
+    ~DMJobTracker
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+from .analysis_scheduler import DONE_STATES
+
+logger = logging.getLogger(__name__)
+
+FAILED_STATES = ("failed", "aborted")
+LOST = "lost"  # no longer found by DM (such as deleted)
+MAX_LOOKUP_FAILURES = 5  # polls in a row before an active job is marked lost
+DEFAULT_POLL_INTERVAL = 30.0  # seconds
+DEFAULT_FULL_LISTING_INTERVAL = 300.0  # seconds, services without queries
+PERCENTILES = (50, 90, 95)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processing_jobs (
+    id TEXT PRIMARY KEY,
+    workflow TEXT,
+    status TEXT,
+    stage TEXT,
+    start_time REAL,
+    end_time REAL,
+    file_path TEXT,
+    analysis_machine TEXT,
+    updated REAL NOT NULL,
+    data TEXT NOT NULL
+)
+"""
+
+
+@dataclass(slots=True)
+class JobRecord:
+    """Indexed summary of one DM processing job (times from time.time())."""
+
+    id: str
+    workflow: Optional[str]
+    status: Optional[str]
+    stage: Optional[str]
+    start: Optional[float]
+    end: Optional[float]
+    file_path: Optional[str]
+    analysis_machine: Optional[str]
+    updated: float
+    data: Dict[str, Any]  # the job as listed by DM
+
+    @property
+    def active(self) -> bool:
+        """True until the job is done, failed, aborted, or lost."""
+        return self.status not in DONE_STATES and self.status != LOST
+
+    @property
+    def turnaround(self) -> Optional[float]:
+        """Seconds from start to end, None while active."""
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+    @classmethod
+    def from_job(cls, job: Dict[str, Any], updated: float) -> "JobRecord":
+        """Summarise a job dictionary of ``WorkflowProcApi``."""
+        args = job.get("argsDict") or {}
+        workflow = job.get("workflow")
+        if isinstance(workflow, dict):
+            workflow = workflow.get("name")
+        return cls(
+            id=str(job["id"]),
+            workflow=workflow or job.get("workflowName"),
+            status=job.get("status"),
+            stage=job.get("stage"),
+            start=_as_float(job.get("startTime")),
+            end=_as_float(job.get("endTime")),
+            file_path=job.get("filePath") or args.get("filePath"),
+            analysis_machine=(
+                job.get("analysisMachine") or args.get("analysisMachine")
+            ),
+            updated=updated,
+            data=job,
+        )
+
+
+def _as_float(value: Any) -> Optional[float]:
+    """Epoch time of a job field, None if missing or not a number."""
+    try:
+        return None if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a sorted list."""
+    rank = int(round(pct / 100 * (len(ordered) - 1)))
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class DMJobTracker:
+    """Poll DM for new and active jobs only, answer status queries locally."""
+
+    def __init__(
+        self,
+        index: str,
+        api_factory: Callable[[], Any],
+        owner: Optional[str] = None,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        full_listing_interval: float = DEFAULT_FULL_LISTING_INTERVAL,
+    ):
+        """Nothing is opened yet, the polling thread starts with start().
+
+        Args:
+            index: Path of the sqlite index (":memory:" for tests)
+            api_factory: Callable returning a ``WorkflowProcApi`` (or ``dm_client``)
+            owner: DM user whose jobs are tracked (default: the ``username``
+                of the API, the DM user of the session)
+            poll_interval: Seconds between two polls
+            full_listing_interval: Seconds between two full listings, when
+                the service cannot filter by start time
+        """
+        if index != ":memory:":
+            index = str(Path(index).expanduser())
+        self.index = index
+        self.api_factory = api_factory
+        self.owner = owner
+        self.poll_interval = poll_interval
+        self.full_listing_interval = full_listing_interval
+        self._db = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self._jobs: Dict[str, JobRecord] = {}
+        self._lookup_failures: Dict[str, int] = {}  # job id: failed lookups in a row
+        self._server_queries = True  # False once the service refused queryDict
+        self._full_listing: Optional[List[Dict[str, Any]]] = None
+        self._full_listing_time: Optional[float] = None  # time.monotonic()
+        # time.time() of the last successful poll
+        self.last_poll: Optional[float] = None
+        self.last_poll_duration: Optional[float] = None
+
+    def _database(self) -> sqlite3.Connection:
+        """The index, opened (and loaded) on first use; call with the lock held."""
+        if self._db is None:
+            if self.index != ":memory:":
+                Path(self.index).parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(
+                self.index, check_same_thread=False, isolation_level=None
+            )
+            memory = self.index == ":memory:"
+            db.execute(f"PRAGMA journal_mode={'MEMORY' if memory else 'WAL'}")
+            db.execute(_SCHEMA)
+            rows = db.execute(
+                "SELECT id, workflow, status, stage, start_time, end_time, file_path,"
+                " analysis_machine, updated, data FROM processing_jobs"
+            ).fetchall()
+            for row in rows:
+                self._jobs[row[0]] = JobRecord(*row[:9], data=json.loads(row[9]))
+            logger.info("DM job index %s: %d jobs", self.index, len(self._jobs))
+            self._db = db
+        return self._db
+
+    @property
+    def jobs(self) -> Dict[str, JobRecord]:
+        """Index of the jobs by id (loaded on first use)."""
+        with self._lock:
+            self._database()
+            return self._jobs
+
+    # --- polling ----------------------------------------------------------
+
+    @property
+    def cursor(self) -> float:
+        """Newest start time in the index, jobs after it are new."""
+        jobs = self.jobs
+        with self._lock:
+            starts = [r.start for r in jobs.values() if r.start is not None]
+        return max(starts, default=0.0)
+
+    def start(self):
+        """Start the polling thread (idempotent)."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="dm-job-tracker", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as exc:
+                logger.warning("DM job poll failed: %s", exc)
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _owner(self, api) -> Optional[str]:
+        """DM user whose jobs are tracked."""
+        owner = self.owner or getattr(api, "username", None)
+        if owner is None:
+            logger.warning("No DM user known, tracking the jobs of every user")
+        return owner
+
+    def _list_new(self, api, owner, since: float) -> Iterable[Dict[str, Any]]:
+        """Jobs started at or after ``since``, filtered by the service when it can."""
+        jobs = None
+        if self._server_queries:
+            try:
+                query = {"startTime": {"$gte": since}}
+                jobs = api.listProcessingJobs(owner, queryDict=query)
+            except TypeError:  # service without server-side queries
+                self._server_queries = False
+                logger.info(
+                    "DM service cannot filter jobs, full listing every %g s",
+                    self.full_listing_interval,
+                )
+        if jobs is None:
+            now = time.monotonic()
+            if (
+                self._full_listing_time is not None
+                and now - self._full_listing_time < self.full_listing_interval
+            ):
+                return []  # new jobs of this session come from track()
+            jobs = api.listProcessingJobs(owner)
+            self._full_listing_time = now
+        # Jobs started at the cursor itself are fetched again, so none is missed.
+        return [j for j in jobs if (_as_float(j.get("startTime")) or 0.0) >= since]
+
+    def _lookup(self, api, owner, record: JobRecord) -> Optional[Dict[str, Any]]:
+        """Current state of an active job, None if it could not be looked up."""
+        try:
+            job = api.getProcessingJobById(owner or record.data.get("owner"), record.id)
+        except Exception as exc:
+            failures = self._lookup_failures.get(record.id, 0) + 1
+            self._lookup_failures[record.id] = failures
+            if failures < MAX_LOOKUP_FAILURES:
+                logger.warning(
+                    "DM job %s lookup failed (%d): %s", record.id, failures, exc
+                )
+                return None
+            logger.warning(
+                "DM job %s not found in %d polls, marked %s: %s",
+                record.id,
+                failures,
+                LOST,
+                exc,
+            )
+            job = dict(record.data, id=record.id, status=LOST)
+        self._lookup_failures.pop(record.id, None)
+        return job
+
+    def poll(self) -> int:
+        """Fetch new jobs and refresh the active ones, return the number of updates."""
+        t0 = time.monotonic()
+        api = self.api_factory()
+        owner = self._owner(api)
+        updates = list(self._list_new(api, owner, self.cursor))
+        seen = {str(j["id"]) for j in updates}
+        jobs = self.jobs
+        with self._lock:
+            active = [r for r in jobs.values() if r.active and r.id not in seen]
+        for record in active:
+            job = self._lookup(api, owner, record)
+            if job is not None:
+                updates.append(job)
+        finished = self._update(updates)
+        self.last_poll = time.time()
+        self.last_poll_duration = time.monotonic() - t0
+        if finished:
+            for listener in list(self._listeners):
+                try:
+                    listener(finished)
+                except Exception as exc:
+                    logger.warning("DM job listener %r failed: %s", listener, exc)
+        return len(updates)
+
+    def _update(self, jobs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Store jobs in both indexes, return those that just finished."""
+        now = time.time()
+        finished = []
+        with self._lock:
+            db = self._database()
+            for job in jobs:
+                record = JobRecord.from_job(job, now)
+                previous = self._jobs.get(record.id)
+                done = record.status in DONE_STATES
+                if done and (previous is None or previous.active):
+                    finished.append(job)
+                self._jobs[record.id] = record
+                db.execute(
+                    "INSERT OR REPLACE INTO processing_jobs"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        record.id,
+                        record.workflow,
+                        record.status,
+                        record.stage,
+                        record.start,
+                        record.end,
+                        record.file_path,
+                        record.analysis_machine,
+                        record.updated,
+                        json.dumps(record.data, default=str),
+                    ),
+                )
+        return finished
+
+    def track(self, job_id: str, job: Optional[Dict[str, Any]] = None):
+        """Add a job just submitted from this session, it is refreshed while active.
+
+        Args:
+            job_id: DM job id
+            job: Job dictionary returned by ``startProcessingJob``, if known
+        """
+        job = dict(job or {}, id=job_id)
+        job.setdefault("status", "pending")
+        jobs = self.jobs
+        with self._lock:
+            known = str(job_id) in jobs
+        if not known:
+            self._update([job])
+        self.start()
+
+    def wake(self):
+        """Poll now instead of at the end of the interval."""
+        self.start()
+        self._wakeup.set()
+
+    def subscribe(self, listener: Callable[[List[Dict[str, Any]]], None]):
+        """Call ``listener(jobs)`` with the jobs that finished during each poll."""
+        self._listeners.append(listener)
+
+    # --- queries (index only) ---------------------------------------------
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        """Indexed record of one job."""
+        jobs = self.jobs
+        with self._lock:
+            return jobs.get(str(job_id))
+
+    def active(self) -> List[JobRecord]:
+        """Jobs not yet done, oldest first."""
+        jobs = self.jobs
+        with self._lock:
+            records = [r for r in jobs.values() if r.active]
+        return sorted(records, key=lambda r: r.start or 0.0)
+
+    def failures(self, since: float = 3600.0) -> List[JobRecord]:
+        """Jobs that failed in the last ``since`` seconds, newest first."""
+        t_min = time.time() - since
+        jobs = self.jobs
+        with self._lock:
+            records = [
+                r
+                for r in jobs.values()
+                if r.status in FAILED_STATES and (r.end or r.updated) >= t_min
+            ]
+        return sorted(records, key=lambda r: -(r.end or r.updated))
+
+    def turnaround(
+        self,
+        since: Optional[float] = None,
+        percentiles: Iterable[float] = PERCENTILES,
+    ) -> Dict[str, Dict[str, float]]:
+        """Per-workflow turnaround percentiles (s) of the finished jobs.
+
+        Args:
+            since: Only jobs that ended in the last ``since`` seconds (default: all)
+            percentiles: Percentiles to report
+
+        Returns:
+            {workflow: {"n": count, "p50": s, ...}}
+        """
+        t_min = 0.0 if since is None else time.time() - since
+        durations: Dict[str, List[float]] = {}
+        jobs = self.jobs
+        with self._lock:
+            for r in jobs.values():
+                if r.status == "done" and r.turnaround is not None and r.end >= t_min:
+                    durations.setdefault(r.workflow or "?", []).append(r.turnaround)
+        report = {}
+        for workflow, values in durations.items():
+            values.sort()
+            stats = {"n": len(values)}
+            stats.update({f"p{p:g}": _percentile(values, p) for p in percentiles})
+            report[workflow] = stats
+        return report
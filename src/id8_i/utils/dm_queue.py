@@ -0,0 +1,397 @@
+"""
+Journaled, asynchronous submission of DM analysis jobs.
+
+Plans only *enqueue* a job (a row in an sqlite journal).  A background
+worker submits it with ``WorkflowProcApi.startProcessingJob``, retrying
+with exponential backoff while the DM web service is slow or unreachable.
+A job whose prerequisite (its metadata file) is not written yet goes back
+in the queue, so it does not hold up the jobs behind it.  A file queued
+again while its job is still queued, or within ``dedupe_window`` of its
+submission, is dropped; later it is a new job.  Jobs still queued when
+the session ends are submitted when the next session starts the worker.
+The journal is opened on first use.
+
+The DM API is created lazily by an ``api_factory`` callable returning
+``(workflowProcApi, dmuser)``, so the queue can be tested against a local
+fake of ``WorkflowProcApi``::
+
+    class FakeApi:
+        def startProcessingJob(self, user, workflow, argsDict=None):
+            return {"id": "fake-1"}
+
+    queue = DMJobQueue("/tmp/jobs.sqlite", api_factory=lambda: (FakeApi(), "user"))
+
+.. autosummary::
+
+    ~DMJobQueue
+    ~QueueStats
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+SUBMITTED = "submitted"
+FAILED = "failed"
+
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BACKOFF = 2.0  # seconds, doubled after each failed attempt
+MAX_BACKOFF = 300.0  # seconds
+PREREQUISITE_TIMEOUT = 120.0  # seconds to wait for the metadata file of a job
+PREREQUISITE_RECHECK = 0.5  # seconds until a job waiting for its metadata is retried
+DEFAULT_DEDUPE_WINDOW = 600.0  # seconds a submitted file is not submitted again
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    file_name TEXT PRIMARY KEY,
+    det_name TEXT,
+    workflow TEXT NOT NULL,
+    args TEXT NOT NULL,
+    dmuser TEXT,
+    prerequisite TEXT,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued REAL NOT NULL,
+    next_attempt REAL NOT NULL,
+    submitted REAL,
+    job_id TEXT,
+    last_error TEXT
+)
+"""
+
+
+@dataclass
+class QueueStats:
+    """Depth of the queue and latency (enqueue to accepted by DM) of submitted jobs."""
+
+    queued: int
+    submitted: int
+    failed: int
+    latency_mean: Optional[float]  # seconds
+    latency_max: Optional[float]  # seconds
+    last_call: Optional[float]  # seconds spent in the last startProcessingJob()
+
+    def __str__(self) -> str:
+        """One line summary for the console."""
+
+        def fmt(t):
+            return "n/a" if t is None else f"{t:.3f} s"
+
+        return (
+            f"DM queue: {self.queued} queued, {self.submitted} submitted,"
+            f" {self.failed} failed; latency mean={fmt(self.latency_mean)}"
+            f" max={fmt(self.latency_max)}; last call {fmt(self.last_call)}"
+        )
+
+
+class DMJobQueue:
+    """Submit DM jobs from a background worker, journaled in sqlite."""
+
+    def __init__(
+        self,
+        journal: str,
+        api_factory: Callable[[], Tuple[Any, str]],
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        backoff: float = DEFAULT_BACKOFF,
+        dedupe_window: float = DEFAULT_DEDUPE_WINDOW,
+        prerequisite_status: Optional[Callable[[str], Any]] = None,
+        on_submitted: Optional[Callable[[str, Any], None]] = None,
+    ):
+        """Open the journal on first use, start the worker on the first enqueue().
+
+        Args:
+            journal: Path of the sqlite journal (":memory:" for tests)
+            api_factory: Callable returning (workflowProcApi, dmuser)
+            max_attempts: Attempts before a job is marked failed
+            backoff: Delay (s) after the first failed attempt, doubled each time
+            dedupe_window: Seconds after its submission during which a file
+                queued again is dropped
+            prerequisite_status: Callable (name) -> ophyd Status or None, the
+                job waits for that status (such as its metadata file)
+            on_submitted: Callable (job id, job) called after each submission,
+                such as ``DMJobTracker.track``
+        """
+        if journal != ":memory:":
+            journal = str(Path(journal).expanduser())
+        self.journal = journal
+        self.api_factory = api_factory
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.dedupe_window = dedupe_window
+        self.prerequisite_status = prerequisite_status
+        self.on_submitted = on_submitted
+        self._db = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._api = None
+        self._dmuser = None
+        self.last_call = None
+
+    def _database(self) -> sqlite3.Connection:
+        """The journal, opened (and created) on first use; call with the lock held."""
+        if self._db is None:
+            if self.journal != ":memory:":
+                Path(self.journal).parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(
+                self.journal, check_same_thread=False, isolation_level=None
+            )
+            memory = self.journal == ":memory:"
+            db.execute(f"PRAGMA journal_mode={'MEMORY' if memory else 'WAL'}")
+            db.execute(_SCHEMA)
+            self._db = db
+        return self._db
+
+    # --- plan side --------------------------------------------------------
+
+    def enqueue(
+        self,
+        file_name: str,
+        workflow: str,
+        args: Dict[str, Any],
+        dmuser: Optional[str] = None,
+        det_name: Optional[str] = None,
+        prerequisite: Optional[str] = None,
+    ) -> bool:
+        """Add a job to the journal and wake the worker.  Returns at once.
+
+        Args:
+            file_name: Data file of the job, the deduplication key
+            workflow: DM workflow name
+            args: ``argsDict`` of the workflow
+            dmuser: DM user (default: from the api_factory)
+            det_name: Detector name, for the record
+            prerequisite: Name passed to ``prerequisite_status`` (metadata file)
+
+        Returns:
+            True if queued, False if this file's job is still queued, or was
+            submitted less than ``dedupe_window`` ago
+        """
+        now = time.time()
+        with self._lock:
+            db = self._database()
+            row = db.execute(
+                "SELECT state, submitted FROM jobs WHERE file_name=?", (file_name,)
+            ).fetchone()
+            if row is not None and (
+                row[0] == QUEUED
+                or (row[0] == SUBMITTED and now - row[1] < self.dedupe_window)
+            ):
+                logger.info(
+                    "DM job for %s already %s, not queued again", file_name, row[0]
+                )
+                return False
+            db.execute(
+                "INSERT OR REPLACE INTO jobs"
+                " (file_name, det_name, workflow, args, dmuser, prerequisite, state,"
+                "  attempts, enqueued, next_attempt)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?)",
+                (
+                    file_name,
+                    det_name,
+                    workflow,
+                    json.dumps(args),
+                    dmuser,
+                    prerequisite,
+                    QUEUED,
+                    now,
+                    now,
+                ),
+            )
+        self.start()
+        self._wakeup.set()
+        return True
+
+    # --- worker side ------------------------------------------------------
+
+    def start(self):
+        """Start the worker thread (idempotent), it resumes jobs left in the journal."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="dm-job-queue", daemon=True
+                )
+                self._thread.start()
+
+    def _next_job(self):
+        with self._lock:
+            return (
+                self._database()
+                .execute(
+                    "SELECT file_name, workflow, args, dmuser, prerequisite, attempts,"
+                    " next_attempt, enqueued"
+                    " FROM jobs WHERE state=? ORDER BY next_attempt, enqueued LIMIT 1",
+                    (QUEUED,),
+                )
+                .fetchone()
+            )
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            delay = job[6] - time.time()
+            if delay > 0:
+                self._wakeup.wait(delay)  # woken early by a new job
+                self._wakeup.clear()
+                continue
+            self._submit(*job[:6], enqueued=job[7])
+
+    def _prerequisite_ready(self, prerequisite: Optional[str], enqueued: float) -> bool:
+        """True once the prerequisite (metadata file) is done; raise if it failed.
+
+        Raises TimeoutError once it has not been done for ``PREREQUISITE_TIMEOUT``
+        since the job was queued.
+        """
+        if prerequisite is None or self.prerequisite_status is None:
+            return True
+        status = self.prerequisite_status(prerequisite)
+        if status is None:
+            return True
+        if status.done:
+            exc = status.exception()
+            if exc is not None:
+                raise exc
+            return True
+        if time.time() - enqueued > PREREQUISITE_TIMEOUT:
+            raise TimeoutError(
+                f"{prerequisite} not written after {PREREQUISITE_TIMEOUT} s"
+            )
+        return False
+
+    def _submit(
+        self, file_name, workflow, args, dmuser, prerequisite, attempts, enqueued
+    ):
+        try:
+            ready = self._prerequisite_ready(prerequisite, enqueued)
+        except Exception as exc:
+            # The metadata file failed: retried, the DM session is fine.
+            self._failed(file_name, attempts, exc)
+            return
+        if not ready:
+            # Not ready: back in the queue, the jobs behind it go first.
+            with self._lock:
+                self._database().execute(
+                    "UPDATE jobs SET next_attempt=? WHERE file_name=?",
+                    (time.time() + PREREQUISITE_RECHECK, file_name),
+                )
+            return
+        t0 = time.monotonic()
+        try:
+            if self._api is None:
+                self._api, self._dmuser = self.api_factory()
+            t0 = time.monotonic()
+            job = self._api.startProcessingJob(
+                dmuser or self._dmuser, workflow, argsDict=json.loads(args)
+            )
+        except Exception as exc:
+            self.last_call = time.monotonic() - t0
+            self._api = None  # rebuild the client on the next attempt
+            self._failed(file_name, attempts, exc)
+            return
+        self.last_call = time.monotonic() - t0
+        job_id = job.get("id") if isinstance(job, dict) else getattr(job, "id", None)
+        with self._lock:
+            self._database().execute(
+                "UPDATE jobs SET state=?, attempts=?, submitted=?, job_id=?,"
+                " last_error=NULL WHERE file_name=?",
+                (SUBMITTED, attempts + 1, time.time(), job_id, file_name),
+            )
+        logger.info("DM job %s processing %s", job_id, file_name)
+        if self.on_submitted is not None and job_id is not None:
+            try:
+                self.on_submitted(job_id, job if isinstance(job, dict) else None)
+            except Exception as exc:
+                logger.warning("on_submitted(%s) failed: %s", job_id, exc)
+
+    def _failed(self, file_name: str, attempts: int, exc: Exception):
+        """Count a failed attempt: back off and retry, or mark the job failed."""
+        attempts += 1
+        if attempts >= self.max_attempts:
+            state, next_attempt = FAILED, time.time()
+            logger.error(
+                "DM job for %s failed after %d attempts: %s", file_name, attempts, exc
+            )
+        else:
+            state = QUEUED
+            delay = min(self.backoff * 2 ** (attempts - 1), MAX_BACKOFF)
+            next_attempt = time.time() + delay
+            logger.warning(
+                "DM job for %s, attempt %d failed: %s", file_name, attempts, exc
+            )
+        with self._lock:
+            self._database().execute(
+                "UPDATE jobs SET state=?, attempts=?, next_attempt=?, last_error=?"
+                " WHERE file_name=?",
+                (state, attempts, next_attempt, str(exc), file_name),
+            )
+
+    # --- reports ----------------------------------------------------------
+
+    def depth(self) -> int:
+        """Number of jobs waiting to be submitted."""
+        with self._lock:
+            return (
+                self._database()
+                .execute("SELECT COUNT(*) FROM jobs WHERE state=?", (QUEUED,))
+                .fetchone()[0]
+            )
+
+    def jobs(self, state: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Rows of the journal (optionally only one state), oldest first."""
+        query = "SELECT * FROM jobs"
+        params = ()
+        if state is not None:
+            query += " WHERE state=?"
+            params = (state,)
+        with self._lock:
+            cursor = self._database().execute(query + " ORDER BY enqueued", params)
+            names = [d[0] for d in cursor.description]
+            return [dict(zip(names, row, strict=True)) for row in cursor.fetchall()]
+
+    def stats(self, since: Optional[float] = None) -> QueueStats:
+        """Queue depth and latency of the jobs submitted since ``since``."""
+        with self._lock:
+            db = self._database()
+            counts = dict(
+                db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+            )
+            latency = db.execute(
+                "SELECT AVG(submitted - enqueued), MAX(submitted - enqueued) FROM jobs"
+                " WHERE state=? AND enqueued >= ?",
+                (SUBMITTED, since or 0),
+            ).fetchone()
+        return QueueStats(
+            queued=counts.get(QUEUED, 0),
+            submitted=counts.get(SUBMITTED, 0),
+            failed=counts.get(FAILED, 0),
+            latency_mean=latency[0],
+            latency_max=latency[1],
+            last_call=self.last_call,
+        )
+
+    def retry_failed(self):
+        """Queue the failed jobs again, with a fresh attempt count."""
+        with self._lock:
+            self._database().execute(
+                "UPDATE jobs SET state=?, attempts=0, next_attempt=? WHERE state=?",
+                (QUEUED, time.time(), FAILED),
+            )
+        self.start()
+        self._wakeup.set()
@@ -1,16 +1,30 @@
 """
 DM code from Hannah Parraga.
 Set up DM and submit jobs
+
+Jobs are not submitted from the plan: :func:`dm_run_job` only adds them to
+``dm_job_queue``, a journaled queue that submits them from a background
+thread (see ``dm_queue.DMJobQueue``).  Submitted jobs are followed by
+``dm_job_tracker`` (see ``dm_job_tracker.DMJobTracker``).
 """
 
 from apsbits.core.instrument_init import oregistry
-from dm.common.utility.configurationManager import ConfigurationManager
+from apsbits.utils.config_loaders import get_config
 from dm.proc_web_service.api.workflowProcApi import WorkflowProcApi
 
+from .dm_client import dm_client
+from .dm_job_tracker import DMJobTracker
+from .dm_queue import DMJobQueue
+from .metadata_writer import metadata_writer
+from .util_8idi import analysis_scheduler
 from .util_8idi import get_machine_name
 
+iconfig = get_config()
 pv_registers = oregistry["pv_registers"]
 
+DM_JOB_JOURNAL = iconfig.get("DM_JOB_JOURNAL", "~/.bluesky/dm_job_queue.sqlite")
+DM_JOB_INDEX = iconfig.get("DM_JOB_INDEX", "~/.bluesky/dm_job_index.sqlite")
+
 
 def dm_setup(process: bool) -> tuple:
     """Set up the Data Management workflow API.
@@ -18,73 +32,117 @@ def dm_setup(process: bool) -> tuple:
     Args:
         process: Whether to initialize the workflow API
 
+    The API is the session-wide ``dm_client`` (created, and logged in, only
+    once), which can be used like a ``WorkflowProcApi``.
+
     Returns:
         Tuple containing (workflowProcApi, dmuser) if process is True,
         otherwise (None, None)
     """
+    workflowProcApi, dmuser = None, None
     if process:
-        # Object that tracks beamline-specific configuration
-        configManager = ConfigurationManager.getInstance()
-        dmuser, password = configManager.parseLoginFile()
-        serviceUrl = configManager.getProcWebServiceUrl()
-        # user/password/url info passed to DM API
-        workflowProcApi = WorkflowProcApi(dmuser, password, serviceUrl)
+        workflowProcApi, dmuser = dm_client, dm_client.username
     return workflowProcApi, dmuser
 
 
+def dm_job_args(det_name: str, filename: str) -> tuple:
+    """Build the workflow name and arguments of a processing job.
+
+    The beamline registers are read now, so the job describes the current
+    measurement even if it is submitted later.
+
+    Args:
+        det_name: Name of the detector ("rigaku" or "eiger")
+        filename: Base name of the data file
+
+    Returns:
+        Tuple of (workflow name, argsDict)
+    """
+    exp_name = pv_registers.experiment_name.get()
+    qmap_file = pv_registers.qmap_file.get()
+    workflow_name = pv_registers.workflow_name.get()
+    analysis_machine = pv_registers.analysis_machine.get()
+    analysis_type = pv_registers.analysis_type.get()
+    cycle_name = pv_registers.cycle_name.get()
+
+    if det_name == "rigaku":
+        filepath = f"{filename}.bin.000"
+    elif det_name == "eiger":
+        filepath = f"{filename}.h5"
+    else:
+        raise ValueError(
+            f"Unknown detector {det_name!r}, expected 'rigaku' or 'eiger'."
+        )
+
+    if analysis_machine == "polaris":
+        gpuID = 0
+        machine_name = analysis_machine
+    elif analysis_machine == "local":
+        gpuID = -2
+        machine_name = get_machine_name(filepath)
+    else:
+        gpuID = -2
+        machine_name = analysis_machine
+
+    argsDict = {
+        "experimentName": exp_name,
+        "filePath": filepath,
+        "qmap": f"{qmap_file}",
+        "analysisMachine": machine_name,
+        "gpuID": gpuID,
+        "demand": "True",
+        "type": analysis_type,
+        "downloadDirectory": f"/home/8-id-i/{cycle_name}/{exp_name}/{analysis_type}/",
+    }
+    return f"{workflow_name}", argsDict
+
+
+dm_job_tracker = DMJobTracker(DM_JOB_INDEX, api_factory=lambda: dm_client)
+"""Process-wide index of the DM job status, polled in the background."""
+
+dm_job_queue = DMJobQueue(
+    DM_JOB_JOURNAL,
+    api_factory=dm_client.renew,  # after a failed call, a new client
+    prerequisite_status=metadata_writer.status,
+    on_submitted=dm_job_tracker.track,
+)
+"""Process-wide DM job queue, jobs left in the journal resume at the first enqueue."""
+
+# Finished jobs (and their run times) come from the DM job tracker.
+dm_job_tracker.subscribe(analysis_scheduler.sync)
+
+
 def dm_run_job(
     det_name: str,
     process: bool,
     workflowProcApi: WorkflowProcApi,
     dmuser: str,
     filename: str,
+    metadata_fname: str = None,
 ):
-    """Submit a data processing job to the Data Management system.
+    """Queue a data processing job for the Data Management system.
+
+    Returns at once; the job is submitted by ``dm_job_queue`` in the
+    background, with retries, after ``metadata_fname`` (if given) has been
+    written by the metadata writer.  A file queued again soon after is dropped.
 
     Args:
         det_name: Name of the detector ("rigaku" or "eiger")
         process: Whether to submit the job
-        workflowProcApi: Workflow API instance
+        workflowProcApi: Workflow API instance (unused, the queue has its own)
         dmuser: DM username
         filename: Base name of the data file
+        metadata_fname: Metadata file the job needs (optional)
     """
     if process:
-        exp_name = pv_registers.experiment_name.get()
-        qmap_file = pv_registers.qmap_file.get()
-        workflow_name = pv_registers.workflow_name.get()
-        analysis_machine = pv_registers.analysis_machine.get()
-        analysis_type = pv_registers.analysis_type.get()
-        cycle_name = pv_registers.cycle_name.get()
-
-        if det_name == "rigaku":
-            filepath = f"{filename}.bin.000"
-        elif det_name == "eiger":
-            filepath = f"{filename}.h5"
-        else:
-            pass
-
-        if analysis_machine == "polaris":
-            gpuID = 0
-            machine_name = analysis_machine
-        elif analysis_machine == "local":
-            gpuID = -2
-            machine_name = get_machine_name()
-        else:
-            gpuID = -2
-            machine_name = analysis_machine
-        
-        argsDict = {
-            "experimentName": exp_name,
-            "filePath": filepath,
-            "qmap": f"{qmap_file}",
-            "analysisMachine": machine_name,
-            "gpuID": gpuID,
-            "demand": "True",
-            "type": analysis_type,
-            "downloadDirectory": f"/home/8-id-i/{cycle_name}/{exp_name}/{analysis_type}/" 
-        }
-
-        job = workflowProcApi.startProcessingJob(
-            dmuser, f"{workflow_name}", argsDict=argsDict
+        workflow_name, argsDict = dm_job_args(det_name, filename)
+        queued = dm_job_queue.enqueue(
+            filename,
+            workflow_name,
+            argsDict,
+            dmuser=dmuser,
+            det_name=det_name,
+            prerequisite=metadata_fname,
         )
-        print(f"Job {job['id']} processing {filename}")
+        if queued:
+            print(f"Queued DM job for {filename} ({dm_job_queue.depth()} waiting)")
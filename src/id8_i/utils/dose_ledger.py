@@ -0,0 +1,245 @@
+"""
+Radiation dose received by each spot of each sample.
+
+The dose of an exposure is the incident beam current (``tetramm1``,
+integrated over the time the shutter is open) times the attenuator
+transmission, in ampere-seconds.  It is proportional to the number of
+photons the spot received, which is what matters for beam damage.
+
+* :class:`DoseMeter` integrates one exposure: ``beam_on`` when the
+  shutter opens, current updates from a CA monitor while it is open,
+  ``beam_off`` when it closes.
+* :class:`DoseLedger` accumulates the exposures per (sample, spot) in
+  memory and in an sqlite file, so doses survive a restart, and answers
+  vectorised lookups for a whole sample grid.
+
+Spots are keyed by their stage position rounded to ``POSITION_RESOLUTION``
+(not by grid step), so the ledger does not depend on the visiting order.
+Callers book a grid spot at its grid position, not at the stage readback
+(``sample_info_unpack.current_spot`` snaps the readback to the grid).
+
+.. autosummary::
+
+    ~SpotDose
+    ~DoseLedger
+    ~DoseMeter
+    ~dose_ledger
+    ~dose_meter
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+from apsbits.utils.config_loaders import get_config
+
+logger = logging.getLogger(__name__)
+
+POSITION_RESOLUTION = 1e-3  # mm, positions closer than this are the same spot
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spot_dose (
+    sample TEXT NOT NULL,
+    x REAL NOT NULL,
+    y REAL NOT NULL,
+    beam_time REAL NOT NULL,
+    dose REAL NOT NULL,
+    exposures INTEGER NOT NULL,
+    last_exposure REAL NOT NULL,
+    PRIMARY KEY (sample, x, y)
+)
+"""
+
+
+def _spot_key(x: float, y: float) -> Tuple[float, float]:
+    """Position rounded to the ledger resolution."""
+    return (
+        round(round(float(x) / POSITION_RESOLUTION) * POSITION_RESOLUTION, 6),
+        round(round(float(y) / POSITION_RESOLUTION) * POSITION_RESOLUTION, 6),
+    )
+
+
+@dataclass
+class SpotDose:
+    """Accumulated exposure of one spot."""
+
+    beam_time: float = 0.0  # seconds with the shutter open
+    dose: float = 0.0  # ampere-seconds (current x transmission x time)
+    exposures: int = 0
+    last_exposure: float = 0.0  # time.time() of the last exposure
+
+
+class DoseLedger:
+    """Per-spot dose of every sample, in memory and in an sqlite file."""
+
+    def __init__(self, path: str):
+        """Open (or create) the ledger file and load it.
+
+        Args:
+            path: Path of the sqlite file (":memory:" for tests)
+        """
+        if path != ":memory:":
+            Path(path).expanduser().parent.mkdir(parents=True, exist_ok=True)
+            path = str(Path(path).expanduser())
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute(_SCHEMA)
+        self._spots: Dict[str, Dict[Tuple[float, float], SpotDose]] = {}
+        for sample, x, y, *values in self._db.execute("SELECT * FROM spot_dose"):
+            self._spots.setdefault(sample, {})[(x, y)] = SpotDose(*values)
+
+    def add(
+        self, sample: str, x: float, y: float, beam_time: float, dose: float
+    ) -> SpotDose:
+        """Add one exposure to a spot, return the spot's new total."""
+        key = _spot_key(x, y)
+        with self._lock:
+            spot = self._spots.setdefault(sample, {}).setdefault(key, SpotDose())
+            spot.beam_time += beam_time
+            spot.dose += dose
+            spot.exposures += 1
+            spot.last_exposure = time.time()
+            self._db.execute(
+                "INSERT OR REPLACE INTO spot_dose VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    sample,
+                    *key,
+                    spot.beam_time,
+                    spot.dose,
+                    spot.exposures,
+                    spot.last_exposure,
+                ),
+            )
+        return spot
+
+    def spot(self, sample: str, x: float, y: float) -> SpotDose:
+        """Accumulated exposure of one spot (zero if never exposed)."""
+        with self._lock:
+            return self._spots.get(sample, {}).get(_spot_key(x, y), SpotDose())
+
+    def doses(self, sample: str, positions: np.ndarray) -> np.ndarray:
+        """Dose of each (x, y) row of ``positions``, such as a whole sample grid."""
+        with self._lock:
+            spots = self._spots.get(sample, {})
+            if not spots:
+                return np.zeros(len(positions))
+            return np.array(
+                [getattr(spots.get(_spot_key(x, y)), "dose", 0.0) for x, y in positions]
+            )
+
+    def spots(self, sample: str) -> Dict[Tuple[float, float], SpotDose]:
+        """All exposed spots of a sample."""
+        with self._lock:
+            return dict(self._spots.get(sample, {}))
+
+    def clear(self, sample: str):
+        """Forget a sample, such as when a new sample is loaded in its slot."""
+        with self._lock:
+            self._spots.pop(sample, None)
+            self._db.execute("DELETE FROM spot_dose WHERE sample=?", (sample,))
+
+
+class DoseMeter:
+    """Integrate the incident current while the shutter is open, book it in a ledger."""
+
+    def __init__(self, ledger: DoseLedger):
+        """Idle until beam_on().
+
+        Args:
+            ledger: Where the exposures are booked
+        """
+        self.ledger = ledger
+        self._lock = threading.Lock()
+        # latest incident current (A), None: no update yet
+        self._current: Optional[float] = None
+        self._exposure: Optional[Dict[str, Any]] = None
+        self._subscribed = []
+        # last booked exposure
+        self.last: Optional[Tuple[str, float, float, float, float]] = None
+
+    def attach(self, current_signal: Any):
+        """Follow the incident current with a CA monitor (once per signal)."""
+        if current_signal in self._subscribed:
+            return
+        current_signal.subscribe(self._on_current, run=True)
+        self._subscribed.append(current_signal)
+
+    def _on_current(self, value=None, **kwargs):
+        """Monitor callback: integrate up to now, then take the new current."""
+        now = time.monotonic()
+        with self._lock:
+            if self._exposure is not None:
+                self._exposure["charge"] += (self._current or 0.0) * (
+                    now - self._exposure["t_last"]
+                )
+                self._exposure["t_last"] = now
+            try:
+                self._current = float(value)
+            except (TypeError, ValueError):
+                pass
+
+    @property
+    def beam_is_on(self) -> bool:
+        """True between beam_on() and beam_off()."""
+        return self._exposure is not None
+
+    def beam_on(
+        self, spot: Optional[Tuple[str, float, float]], transmission: float = 1.0
+    ):
+        """Start an exposure of ``spot`` = (sample, x, y); None: not booked."""
+        if self._exposure is not None:
+            self.beam_off()
+        if self._current is None and self._subscribed:
+            try:  # the monitor has not reported yet
+                self._on_current(value=self._subscribed[0].get())
+            except Exception as exc:
+                logger.debug("Incident current not available: %s", exc)
+        now = time.monotonic()
+        with self._lock:
+            self._exposure = dict(
+                spot=spot, transmission=transmission, t_on=now, t_last=now, charge=0.0
+            )
+
+    def beam_off(self) -> Optional[Tuple[str, float, float, float, float]]:
+        """End the exposure and book it.
+
+        Returns:
+            (sample, x, y, beam time, dose) booked, or None
+        """
+        now = time.monotonic()
+        with self._lock:
+            exposure, self._exposure = self._exposure, None
+            if exposure is None:
+                return None
+            charge = exposure["charge"] + (self._current or 0.0) * (
+                now - exposure["t_last"]
+            )
+        if exposure["spot"] is None:
+            return None
+        sample, x, y = exposure["spot"]
+        beam_time = now - exposure["t_on"]
+        dose = charge * exposure["transmission"]
+        self.ledger.add(sample, x, y, beam_time, dose)
+        self.last = (sample, x, y, beam_time, dose)
+        logger.info(
+            "Spot %s (%.3f, %.3f): %.3f s, dose %.3g A s", sample, x, y, beam_time, dose
+        )
+        return self.last
+
+
+iconfig = get_config()
+
+dose_ledger = DoseLedger(iconfig.get("DOSE_LEDGER", "~/.bluesky/dose_ledger.sqlite"))
+"""Session-wide dose ledger."""
+
+dose_meter = DoseMeter(dose_ledger)
+"""Session-wide dose meter, driven by ``shutter_logic.showbeam``/``blockbeam``."""
@@ -0,0 +1,131 @@
+"""
+Reduce a fly alignment scan: intensity samples and motor readbacks to a centre.
+
+During a fly scan the picoammeter samples the intensity at a fixed rate
+while the motor readback arrives by CA monitor, both with their (host)
+time.  The position of every intensity sample is interpolated from the
+readbacks, the samples are averaged in position bins, and the centre of
+the peak or edge is found.  Everything is vectorised with numpy.
+
+.. autosummary::
+
+    ~Alignment
+    ~positions_at
+    ~bin_by_position
+    ~find_centre
+"""
+
+from dataclasses import dataclass
+from typing import Any
+from typing import Tuple
+
+import numpy as np
+
+KINDS = ("auto", "peak", "edge")
+EDGE_STEP = 0.5  # auto: ends differing by this fraction of the range make an edge
+
+
+@dataclass(frozen=True)
+class Alignment:
+    """Centre of a peak or an edge."""
+
+    kind: str  # "peak" or "edge"
+    centre: float
+    width: float  # FWHM of the peak, or of the derivative of the edge
+    amplitude: float  # height of the peak, or step of the edge (signed)
+    x: np.ndarray  # bin centres
+    y: np.ndarray  # mean signal in each bin (NaN if empty)
+
+    def __str__(self) -> str:
+        """One line for the console."""
+        shape = f"width {self.width:.4f}, amplitude {self.amplitude:.4g}"
+        return f"{self.kind} at {self.centre:.4f} ({shape})"
+
+
+def positions_at(times: Any, readback_times: Any, readbacks: Any) -> np.ndarray:
+    """Position at each time, interpolated between the readbacks."""
+    order = np.argsort(readback_times)
+    return np.interp(
+        times, np.asarray(readback_times)[order], np.asarray(readbacks)[order]
+    )
+
+
+def bin_by_position(
+    positions: Any, values: Any, begin: float, end: float, num_bins: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Mean of the values in ``num_bins`` equal bins from ``begin`` to ``end``.
+
+    Returns:
+        (bin centres, means), NaN for empty bins
+    """
+    lo, hi = min(begin, end), max(begin, end)
+    edges = np.linspace(lo, hi, num_bins + 1)
+    positions = np.asarray(positions, dtype=float)
+    values = np.asarray(values, dtype=float)
+    index = np.clip(
+        np.searchsorted(edges, positions, side="right") - 1, 0, num_bins - 1
+    )
+    inside = (positions >= lo) & (positions <= hi)
+    counts = np.bincount(index[inside], minlength=num_bins)
+    sums = np.bincount(index[inside], weights=values[inside], minlength=num_bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(counts > 0, sums / counts, np.nan)
+    return (edges[:-1] + edges[1:]) / 2, means
+
+
+def _half_max(x: np.ndarray, y: np.ndarray) -> Tuple[float, float, float]:
+    """Centroid, FWHM and height of the peak of ``y`` (above its minimum)."""
+    y = y - np.min(y)
+    top = int(np.argmax(y))
+    height = float(y[top])
+    if height <= 0:
+        return float(x[top]), 0.0, 0.0
+    above = y >= height / 2
+    # The contiguous run above half maximum that holds the top.
+    below_left = np.flatnonzero(~above[:top])
+    below_right = np.flatnonzero(~above[top:])
+    left = int(below_left[-1]) + 1 if len(below_left) else 0
+    right = top + int(below_right[0]) if len(below_right) else len(y)
+    run = slice(left, right)
+    centre = float(np.sum(x[run] * y[run]) / np.sum(y[run]))
+
+    def crossing(i: int, j: int) -> float:
+        """Where y crosses half maximum between the bins i and j."""
+        if y[j] == y[i]:
+            return float(x[i])
+        return float(x[i] + (height / 2 - y[i]) * (x[j] - x[i]) / (y[j] - y[i]))
+
+    x_left = crossing(left - 1, left) if left > 0 else float(x[0])
+    x_right = crossing(right - 1, right) if right < len(y) else float(x[-1])
+    return centre, abs(x_right - x_left), height
+
+
+def find_centre(x: Any, y: Any, kind: str = "auto") -> Alignment:
+    """Centre of the peak or edge of a binned scan.
+
+    Args:
+        x: Bin centres
+        y: Signal (NaN bins are ignored)
+        kind: "peak", "edge", or "auto" (an edge if the two ends differ a lot)
+    """
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {KINDS}, not {kind!r}")
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.isfinite(y)
+    xv, yv = x[valid], y[valid]
+    if len(xv) < 3:
+        raise ValueError(
+            "fewer than 3 bins with data, the scan is too short or too fast"
+        )
+    if kind == "auto":
+        span = np.max(yv) - np.min(yv)
+        step = np.mean(yv[-3:]) - np.mean(yv[:3])
+        kind = "edge" if span > 0 and abs(step) > EDGE_STEP * span else "peak"
+    if kind == "peak":
+        centre, width, height = _half_max(xv, yv)
+        return Alignment("peak", centre, width, height, x, y)
+    slope = np.gradient(yv, xv)
+    step = float(np.mean(yv[-3:]) - np.mean(yv[:3]))
+    centre, width, _ = _half_max(xv, slope if step >= 0 else -slope)
+    return Alignment("edge", centre, width, step, x, y)
@@ -0,0 +1,534 @@
+"""
+Travel-minimising order of the blocks of a ``measurement_info.json`` file.
+
+Each block of the file (``<name>_<sample index>``) selects a sample (moves
+the rheometer or sample stage), selects a detector (moves ``detector.x/y``
+when it changes) and, for each attenuation of its ``att_list``, runs the
+acquisitions listed for that attenuation.  Run in file order, a file that
+goes back and forth between samples, detectors or attenuations spends
+minutes moving hardware.
+
+:func:`compile_blocks` turns the file into :class:`MeasurementBlock`
+tasks plus the ordering constraints the user declared, as a small task
+graph.  A :class:`CostModel` gives the overhead of going from one block to
+the next (stage travel, detector swap, filter changes) from the state the
+hardware is left in.  :func:`optimize` orders the blocks (greedy nearest
+block, then relocations and swaps while they lower the total) and the
+attenuations inside each block, never doing worse than the file order.
+:func:`format_diff` shows both schedules side by side for a dry run.
+
+Ordering constraints, optional keys of a block:
+
+* ``"after"``: list of block keys that must run before this block;
+* ``"keep_att_order"``: true to run the attenuations as listed.
+
+.. autosummary::
+
+    ~Acquisition
+    ~AttStep
+    ~MeasurementBlock
+    ~Overhead
+    ~ScheduleState
+    ~CostModel
+    ~Schedule
+    ~compile_blocks
+    ~file_order
+    ~optimize
+    ~format_diff
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from dataclasses import field
+from dataclasses import replace
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+logger = logging.getLogger(__name__)
+
+MAX_PASSES = 50  # local search passes, each one tries every relocation and swap
+
+_SAMPLE_INDEX = re.compile(r"_(\d+)")
+
+
+@dataclass(frozen=True)
+class Acquisition:
+    """One acquisition series of a block."""
+
+    acq_time: float
+    acq_period: float
+    num_frames: int
+    num_reps: int
+    sample_move: bool
+
+
+@dataclass(frozen=True)
+class AttStep:
+    """One attenuation of a block and the acquisitions run with it."""
+
+    att: Union[float, str]  # or "auto": chosen from a preview when run
+    acquisitions: Tuple[Acquisition, ...]
+
+
+@dataclass(frozen=True)
+class MeasurementBlock:
+    """One block of the file, a node of the task graph."""
+
+    key: str
+    position: int  # in the file
+    sample: int
+    detector: str
+    steps: Tuple[AttStep, ...]
+    after: Tuple[str, ...] = ()
+    keep_att_order: bool = False
+
+
+@dataclass
+class Overhead:
+    """Seconds spent moving hardware, by kind."""
+
+    travel: float = 0.0
+    detector: float = 0.0
+    filter: float = 0.0
+
+    @property
+    def total(self) -> float:
+        """Sum of all kinds."""
+        return self.travel + self.detector + self.filter
+
+    def __add__(self, other: "Overhead") -> "Overhead":
+        """Kind-wise sum."""
+        return Overhead(
+            self.travel + other.travel,
+            self.detector + other.detector,
+            self.filter + other.filter,
+        )
+
+
+@dataclass(frozen=True)
+class ScheduleState:
+    """What the hardware is left with after a block."""
+
+    # (stage, x, y) of every stage moved so far
+    stages: Tuple[Tuple[str, float, float], ...] = ()
+    detector: Optional[str] = None
+    att: Optional[float] = None
+
+    def stage_position(self, stage: str) -> Optional[Tuple[float, float]]:
+        """Last known (x, y) of a stage, None if unknown."""
+        for name, x, y in self.stages:
+            if name == stage:
+                return x, y
+        return None
+
+    def moved(self, stage: str, x: float, y: float) -> "ScheduleState":
+        """State after moving ``stage`` to (x, y)."""
+        stages = tuple(s for s in self.stages if s[0] != stage) + ((stage, x, y),)
+        return replace(self, stages=stages)
+
+
+def _as_list(block: Dict[str, Any], key: str, block_key: str) -> list:
+    value = block.get(key)
+    if not isinstance(value, list):
+        raise ValueError(f"{block_key}: {key!r} must be a list")
+    return value
+
+
+def compile_blocks(measurement_info: Dict[str, Any]) -> List[MeasurementBlock]:
+    """Parse the blocks of a ``measurement_info.json`` file, in file order.
+
+    Raises:
+        ValueError: If a block is malformed, or its ordering constraints
+            name an unknown block or form a cycle
+    """
+    blocks = []
+    for position, (key, raw) in enumerate(measurement_info.items()):
+        match = _SAMPLE_INDEX.search(key)
+        if match is None:
+            raise ValueError(f"{key}: block keys must end with _<sample index>")
+        att_list = _as_list(raw, "att_list", key)
+        columns = (
+            "acq_time_list",
+            "acq_period_list",
+            "num_frames_list",
+            "num_reps_list",
+            "sample_move_yes_list",
+        )
+        lists = [_as_list(raw, column, key) for column in columns]
+        if any(len(values) != len(att_list) for values in lists):
+            raise ValueError(f"{key}: every list must have one entry per attenuation")
+        steps = []
+        for ii, att in enumerate(att_list):
+            rows = [values[ii] for values in lists]
+            if len({len(row) for row in rows}) != 1:
+                raise ValueError(
+                    f"{key}: the lists of attenuation {att} have different lengths"
+                )
+            acquisitions = tuple(
+                Acquisition(float(t), float(p), int(n), int(r), bool(m))
+                for t, p, n, r, m in zip(*rows, strict=True)
+            )
+            steps.append(AttStep(att, acquisitions))
+        after = raw.get("after", [])
+        blocks.append(
+            MeasurementBlock(
+                key=key,
+                position=position,
+                sample=int(match.group(1)),
+                detector=raw.get("detector"),
+                steps=tuple(steps),
+                after=tuple([after] if isinstance(after, str) else after),
+                keep_att_order=bool(raw.get("keep_att_order", False)),
+            )
+        )
+
+    keys = {b.key for b in blocks}
+    for b in blocks:
+        unknown = set(b.after) - keys
+        if unknown:
+            raise ValueError(f"{b.key}: 'after' names unknown blocks {sorted(unknown)}")
+    if not _feasible([b.key for b in _topological(blocks)], blocks):
+        raise ValueError("The 'after' constraints of the blocks form a cycle")
+    return blocks
+
+
+def _topological(blocks: Sequence[MeasurementBlock]) -> List[MeasurementBlock]:
+    """Blocks in file order, delayed only as far as their constraints require."""
+    done, order, pending = set(), [], list(blocks)
+    while pending:
+        ready = next((b for b in pending if set(b.after) <= done), None)
+        if ready is None:
+            return order + pending  # cycle, reported by the caller
+        pending.remove(ready)
+        order.append(ready)
+        done.add(ready.key)
+    return order
+
+
+def _feasible(keys: Sequence[str], blocks: Sequence[MeasurementBlock]) -> bool:
+    """True if the order ``keys`` honours every 'after' constraint."""
+    rank = {key: n for n, key in enumerate(keys)}
+    return all(rank[dep] < rank[b.key] for b in blocks for dep in b.after)
+
+
+@dataclass
+class CostModel:
+    """Seconds of hardware motion between blocks."""
+
+    sample_position: Callable[[int], Tuple[str, float, float]]  # index -> (stage, x, y)
+    # mm/s of each stage, both axes
+    stage_speed: Dict[str, float] = field(default_factory=dict)
+    default_speed: float = 1.0  # mm/s of a stage not in stage_speed
+    settle: float = 0.5  # s after each stage move
+    detector_swap: float = 60.0  # s to move detector.x/y to the other detector
+    # s per attenuation change (filter motion until filterBusy drops)
+    filter_change: float = 1.0
+
+    def travel(self, state: ScheduleState, sample: int) -> Tuple[float, ScheduleState]:
+        """Time to bring ``sample`` into the beam, and the state after it."""
+        stage, x, y = self.sample_position(sample)
+        last = state.stage_position(stage)
+        if last is None:  # position unknown, count the settling only
+            seconds = self.settle
+        elif last == (x, y):
+            seconds = 0.0
+        else:
+            speed = self.stage_speed.get(stage, self.default_speed)
+            # x and y move together
+            seconds = max(abs(x - last[0]), abs(y - last[1])) / speed + self.settle
+        return seconds, state.moved(stage, x, y)
+
+    def att_order(
+        self, block: MeasurementBlock, entry_att: Optional[float]
+    ) -> Tuple[AttStep, ...]:
+        """Attenuation steps of a block, in the order with the fewest filter changes.
+
+        Steps with the same attenuation are run one after the other, starting
+        with the attenuation the filters are already at; otherwise the file
+        order is kept.
+        """
+        if block.keep_att_order:
+            return block.steps
+        groups: Dict[float, List[AttStep]] = {}
+        for step in block.steps:
+            groups.setdefault(step.att, []).append(step)
+        atts = list(groups)
+        if entry_att in groups:
+            atts.remove(entry_att)
+            atts.insert(0, entry_att)
+        return tuple(step for att in atts for step in groups[att])
+
+    def filter_changes(
+        self, steps: Sequence[AttStep], entry_att: Optional[float]
+    ) -> int:
+        """Number of attenuation changes to run ``steps`` from ``entry_att``."""
+        changes, att = 0, entry_att
+        for step in steps:
+            if step.att != att:
+                changes += 1
+                att = step.att
+        return changes
+
+    def transition(
+        self, state: ScheduleState, block: MeasurementBlock, reorder_att: bool = True
+    ) -> Tuple[Overhead, Tuple[AttStep, ...], ScheduleState]:
+        """Overhead of running ``block`` after ``state``.
+
+        Returns:
+            (overhead, attenuation steps in run order, state after the block)
+        """
+        travel, state = self.travel(state, block.sample)
+        detector = 0.0 if block.detector == state.detector else self.detector_swap
+        steps = self.att_order(block, state.att) if reorder_att else block.steps
+        filters = self.filter_changes(steps, state.att) * self.filter_change
+        exit_att = steps[-1].att if steps else state.att
+        state = replace(state, detector=block.detector, att=exit_att)
+        return Overhead(travel, detector, filters), steps, state
+
+
+@dataclass
+class Schedule:
+    """Blocks in run order, with their attenuation order and overhead."""
+
+    blocks: List[MeasurementBlock]
+    steps: List[Tuple[AttStep, ...]]
+    overheads: List[Overhead]
+
+    @classmethod
+    def evaluate(
+        cls,
+        blocks: Sequence[MeasurementBlock],
+        costs: CostModel,
+        start: ScheduleState,
+        reorder_att: bool = True,
+    ) -> "Schedule":
+        """Overhead of running ``blocks`` in this order from ``start``."""
+        schedule = cls(list(blocks), [], [])
+        state = start
+        for block in blocks:
+            overhead, steps, state = costs.transition(state, block, reorder_att)
+            schedule.steps.append(steps)
+            schedule.overheads.append(overhead)
+        return schedule
+
+    @property
+    def overhead(self) -> Overhead:
+        """Total overhead."""
+        return sum(self.overheads, Overhead())
+
+    @property
+    def keys(self) -> List[str]:
+        """Block keys in run order."""
+        return [b.key for b in self.blocks]
+
+    def __iter__(self):
+        """(block, attenuation steps) in run order."""
+        return iter(zip(self.blocks, self.steps, strict=True))
+
+
+def file_order(
+    blocks: Sequence[MeasurementBlock], costs: CostModel, start: ScheduleState
+) -> Schedule:
+    """The schedule as written.
+
+    Blocks in file order (delayed only by 'after'), attenuations as listed.
+    """
+    return Schedule.evaluate(_topological(blocks), costs, start, reorder_att=False)
+
+
+def _greedy(
+    blocks: Sequence[MeasurementBlock], costs: CostModel, start: ScheduleState
+) -> List[MeasurementBlock]:
+    """Nearest next block among those whose constraints are met, file order on ties."""
+    order, done, state = [], set(), start
+    pending = list(blocks)
+    while pending:
+        ready = [b for b in pending if set(b.after) <= done]
+        best = min(
+            ready, key=lambda b: (costs.transition(state, b)[0].total, b.position)
+        )
+        _, _, state = costs.transition(state, best)
+        pending.remove(best)
+        order.append(best)
+        done.add(best.key)
+    return order
+
+
+def _neighbours(order: List[MeasurementBlock]):
+    """Every order one relocation or one swap away, with the first index it changes."""
+    n = len(order)
+    for i in range(n):
+        for j in range(n):
+            if i == j:
+                continue
+            moved = order[:i] + order[i + 1 :]
+            moved.insert(j, order[i])
+            yield min(i, j), moved
+            if i < j:
+                swapped = list(order)
+                swapped[i], swapped[j] = swapped[j], swapped[i]
+                yield i, swapped
+
+
+def _memoised(
+    costs: CostModel,
+) -> Callable[[ScheduleState, MeasurementBlock], Tuple[float, ScheduleState]]:
+    """``costs.transition`` as (total overhead, state after), cached.
+
+    The local search reaches the same (state, block) pairs over and over.
+    """
+    cache: Dict[Tuple[ScheduleState, int], Tuple[float, ScheduleState]] = {}
+
+    def transition(
+        state: ScheduleState, block: MeasurementBlock
+    ) -> Tuple[float, ScheduleState]:
+        key = state, block.position
+        if key not in cache:
+            overhead, _, after = costs.transition(state, block)
+            cache[key] = overhead.total, after
+        return cache[key]
+
+    return transition
+
+
+def _prefix(
+    order: Sequence[MeasurementBlock], transition, start: ScheduleState
+) -> Tuple[List[ScheduleState], List[float]]:
+    """State before each block of ``order`` (and after the last), overhead so far."""
+    states, totals, state, total = [start], [0.0], start, 0.0
+    for block in order:
+        overhead, state = transition(state, block)
+        total += overhead
+        states.append(state)
+        totals.append(total)
+    return states, totals
+
+
+def _cost_from(
+    order: Sequence[MeasurementBlock],
+    first: int,
+    prefix: Tuple[List[ScheduleState], List[float]],
+    transition,
+    bound: float,
+) -> Optional[float]:
+    """Total overhead of ``order``, None as soon as it reaches ``bound``.
+
+    The blocks before ``first`` are those of the order ``prefix`` was
+    computed for, so only the rest is evaluated.
+    """
+    states, totals = prefix
+    state, total = states[first], totals[first]
+    for block in order[first:]:
+        overhead, state = transition(state, block)
+        total += overhead
+        if total >= bound:
+            return None
+    return total
+
+
+def _improve(
+    order: List[MeasurementBlock],
+    blocks: Sequence[MeasurementBlock],
+    costs: CostModel,
+    start: ScheduleState,
+) -> List[MeasurementBlock]:
+    """Take the first relocation or swap that lowers the overhead, until none does."""
+    transition = _memoised(costs)
+    prefix = _prefix(order, transition, start)
+    for _ in range(MAX_PASSES):
+        best = prefix[1][-1]
+        for first, candidate in _neighbours(order):
+            if not _feasible([b.key for b in candidate], blocks):
+                continue
+            if (
+                _cost_from(candidate, first, prefix, transition, best - 1e-9)
+                is not None
+            ):
+                order, prefix = candidate, _prefix(candidate, transition, start)
+                break
+        else:
+            break  # local minimum
+    return order
+
+
+def optimize(
+    blocks: Sequence[MeasurementBlock],
+    costs: CostModel,
+    start: Optional[ScheduleState] = None,
+    reorder_blocks: bool = True,
+    reorder_att: bool = True,
+) -> Schedule:
+    """Order the blocks and their attenuations for the least overhead.
+
+    Args:
+        blocks: Blocks of the file (see compile_blocks)
+        costs: Cost model
+        start: State of the hardware before the first block (default: unknown)
+        reorder_blocks: False to keep the block order
+        reorder_att: False to keep the attenuation order of every block
+
+    Returns:
+        The best schedule found, never worse than the file order
+    """
+    start = start or ScheduleState()
+    reference = file_order(blocks, costs, start)
+    seeds = [_topological(blocks)]
+    if reorder_blocks and len(blocks) > 1:
+        seeds = [
+            _improve(seed, blocks, costs, start)
+            for seed in (_greedy(blocks, costs, start), seeds[0])
+        ]
+    candidates = [Schedule.evaluate(seed, costs, start, reorder_att) for seed in seeds]
+    best = min(candidates, key=lambda s: s.overhead.total)
+    if best.overhead.total >= reference.overhead.total - 1e-9:
+        return reference
+    logger.info(
+        "Schedule overhead %.0f s -> %.0f s",
+        reference.overhead.total,
+        best.overhead.total,
+    )
+    return best
+
+
+def _describe(
+    block: MeasurementBlock, steps: Sequence[AttStep], overhead: Overhead
+) -> str:
+    atts = ",".join(
+        f"{s.att:g}" if isinstance(s.att, (int, float)) else str(s.att) for s in steps
+    )
+    where = f"sample {block.sample}, {block.detector}, att {atts}"
+    return f"{block.key} ({where}) +{overhead.total:.0f} s"
+
+
+def _rows(schedule: Schedule):
+    return schedule.blocks, schedule.steps, schedule.overheads
+
+
+def format_diff(old: Schedule, new: Schedule) -> str:
+    """Both schedules side by side, changed rows marked ``*``, and their overheads."""
+    left = [_describe(*row) for row in zip(*_rows(old), strict=True)]
+    right = [_describe(*row) for row in zip(*_rows(new), strict=True)]
+    width = max(len(text) for text in left + ["file order"])
+    lines = [f"    {'file order':<{width}}    optimised"]
+    for n, (was, now) in enumerate(zip(left, right, strict=True)):
+        mark = " " if was == now else "*"
+        lines.append(f"{n:3d} {was:<{width}}  {mark} {now}")
+    for label, kind in (
+        ("stage travel", "travel"),
+        ("detector", "detector"),
+        ("filters", "filter"),
+    ):
+        was, now = getattr(old.overhead, kind), getattr(new.overhead, kind)
+        lines.append(f"    {label:<12s} {was:8.0f} s -> {now:8.0f} s")
+    was, now = old.overhead.total, new.overhead.total
+    lines.append(
+        f"    {'total':<12s} {was:8.0f} s -> {now:8.0f} s (saves {was - now:.0f} s)"
+    )
+    return "\n".join(lines)
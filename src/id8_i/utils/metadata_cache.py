@@ -0,0 +1,158 @@
+"""
+Monitor-backed cache of slowly-changing metadata values.
+
+Most metadata values (cycle name, beam center registers, QNW setpoints,
+mono energy, attenuator index) barely change between repetitions.  The
+:class:`MonitoredValueCache` keeps a Channel Access monitor (an ophyd value
+subscription) on each watched signal and serves the latest value, with its
+age, without a network round trip.
+
+Each signal has a maximum age.  A cached value older than that (counted
+from the last monitor update or live read) is considered stale and the
+caller falls back to a live read.  ``max_age=None`` trusts the monitor for
+as long as the signal stays connected.
+
+.. autosummary::
+
+    ~MonitoredValueCache
+    ~metadata_cache
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _CacheEntry:
+    """Latest value of one watched signal."""
+
+    signal: Any
+    max_age: Optional[float]
+    subscription: Any = None
+    value: Any = None
+    timestamp: Optional[float] = None  # EPICS (or ophyd) timestamp of the value
+    refreshed: Optional[float] = None  # local time.monotonic() of the last update
+
+
+class MonitoredValueCache:
+    """Serve signal values from CA monitors, with per-signal staleness bounds."""
+
+    def __init__(self):
+        """Start with an empty cache and zeroed counters."""
+        self._lock = threading.Lock()
+        self._entries: Dict[int, _CacheEntry] = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Zero the hit, miss, and stale counters."""
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Counters since the last reset (stale reads are also counted as misses)."""
+        return {"hits": self.hits, "misses": self.misses, "stale": self.stale}
+
+    def watch(self, signal: Any, max_age: Optional[float] = None):
+        """Subscribe to ``signal`` and cache its value (idempotent).
+
+        Args:
+            signal: ophyd signal to monitor
+            max_age: Maximum age (s) of a cached value, None for no limit
+        """
+        with self._lock:
+            entry = self._entries.get(id(signal))
+            if entry is not None:
+                entry.max_age = max_age
+                return
+            entry = _CacheEntry(signal=signal, max_age=max_age)
+            self._entries[id(signal)] = entry
+
+        def on_value(value=None, timestamp=None, **kwargs):
+            self._store(entry, value, timestamp)
+
+        entry.subscription = signal.subscribe(
+            on_value, event_type=signal.SUB_VALUE, run=True
+        )
+
+    def unwatch(self, signal: Any):
+        """Stop monitoring ``signal`` and forget its value."""
+        with self._lock:
+            entry = self._entries.pop(id(signal), None)
+        if entry is not None and entry.subscription is not None:
+            signal.unsubscribe(entry.subscription)
+
+    def is_watched(self, signal: Any) -> bool:
+        """True if ``signal`` is monitored by this cache."""
+        return id(signal) in self._entries
+
+    def _store(self, entry: _CacheEntry, value: Any, timestamp: Optional[float]):
+        with self._lock:
+            entry.value = value
+            entry.timestamp = timestamp
+            entry.refreshed = time.monotonic()
+
+    def refresh(self, signal: Any, value: Any, timestamp: Optional[float] = None):
+        """Record a value obtained by a live read of a watched signal."""
+        entry = self._entries.get(id(signal))
+        if entry is not None:
+            self._store(entry, value, timestamp or time.time())
+
+    def age(self, signal: Any) -> Optional[float]:
+        """Seconds since the cached value was last updated, None if never."""
+        entry = self._entries.get(id(signal))
+        if entry is None or entry.refreshed is None:
+            return None
+        return time.monotonic() - entry.refreshed
+
+    def lookup(self, signal: Any) -> Tuple[bool, Any, Optional[float]]:
+        """Return (hit, value, timestamp) from the cache, without any I/O.
+
+        A miss (not watched, no value yet, disconnected, or stale) is counted
+        and the caller is expected to read the signal itself.
+        """
+        entry = self._entries.get(id(signal))
+        with self._lock:
+            if entry is None or entry.refreshed is None or not signal.connected:
+                self.misses += 1
+                return False, None, None
+            if (
+                entry.max_age is not None
+                and time.monotonic() - entry.refreshed > entry.max_age
+            ):
+                self.stale += 1
+                self.misses += 1
+                return False, None, None
+            self.hits += 1
+            return True, entry.value, entry.timestamp
+
+    def get(self, signal: Any, **kwargs) -> Any:
+        """Return the cached value, or read (and cache) it live on a miss.
+
+        Keyword arguments are passed to ``signal.get()`` on a miss.
+        """
+        hit, value, _ = self.lookup(signal)
+        if hit:
+            return value
+        value = signal.get(**kwargs)
+        self.refresh(signal, value)
+        return value
+
+    def __repr__(self) -> str:
+        """Short summary of the cache."""
+        return (
+            f"{self.__class__.__name__}(watched={len(self._entries)},"
+            f" hits={self.hits}, misses={self.misses}, stale={self.stale})"
+        )
+
+
+metadata_cache = MonitoredValueCache()
+"""Process-wide cache shared by the metadata writers."""
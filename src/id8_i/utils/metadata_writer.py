@@ -0,0 +1,137 @@
+"""
+Background writer for the XPCS NeXus metadata files.
+
+The metadata values are snapshotted in the plan (cheap, see
+``nexus_utils.snapshot_runtime_metadata``) and handed to a dedicated thread
+that writes the HDF5 file to the (NFS-mounted) data directory.  A bounded
+queue applies back-pressure if the file system falls behind.
+
+Each submitted file gets an ophyd ``Status`` that finishes once the file
+has been written and flushed to stable storage (``fsync``).  Plans wait on
+that status (``plans.wait_plans.wait_for_metadata_file``) only when the
+file is actually needed, for example before a DM job is submitted.
+
+.. autosummary::
+
+    ~MetadataWriter
+    ~write_durable_nexus_file
+    ~metadata_writer
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+from typing import Mapping
+from typing import Optional
+
+from ophyd.status import Status
+
+from .nexus_write_program import write_nexus_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 8  # files waiting to be written before submit() blocks
+STATUS_HISTORY = 100  # completed statuses kept for late waiters
+
+
+def write_durable_nexus_file(filename: str, runtime_metadata: Mapping[str, Any]):
+    """Write a metadata file and flush it to stable storage.
+
+    Args:
+        filename: Name of the HDF5 file to create (overwritten)
+        runtime_metadata: Mapping of HDF5 path to value
+    """
+    write_nexus_file(filename, runtime_metadata)
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class MetadataWriter:
+    """Write NeXus metadata files from a dedicated thread with a bounded queue."""
+
+    def __init__(
+        self, maxsize: int = DEFAULT_QUEUE_SIZE, writer=write_durable_nexus_file
+    ):
+        """Create the writer, the thread is started on the first submit().
+
+        Args:
+            maxsize: Number of queued files before submit() blocks
+            writer: Callable (filename, runtime_metadata) that writes one file
+        """
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._writer = writer
+        self._statuses = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.last_write_time = None  # seconds, duration of the last write
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="nexus-metadata-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            filename, runtime_metadata, status = self._queue.get()
+            t0 = time.monotonic()
+            try:
+                self._writer(filename, runtime_metadata)
+                self.last_write_time = time.monotonic() - t0
+                logger.debug("Wrote %s in %.3f s", filename, self.last_write_time)
+                status.set_finished()
+            except Exception as exc:
+                logger.error("Could not write metadata file %s: %s", filename, exc)
+                status.set_exception(exc)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, filename: str, runtime_metadata: Mapping[str, Any]) -> Status:
+        """Queue one file for writing.  Blocks while the queue is full.
+
+        Args:
+            filename: Name of the HDF5 file to create (overwritten)
+            runtime_metadata: Snapshot of the metadata values (not modified)
+
+        Returns:
+            Status that finishes once the file is durable on disk
+        """
+        self._ensure_thread()
+        status = Status()
+        with self._lock:
+            self._statuses[filename] = status
+            self._statuses.move_to_end(filename)
+            while len(self._statuses) > STATUS_HISTORY:
+                oldest = next(iter(self._statuses))
+                if not self._statuses[oldest].done:
+                    break
+                self._statuses.pop(oldest)
+        self._queue.put((filename, dict(runtime_metadata), status))
+        return status
+
+    def status(self, filename: str) -> Optional[Status]:
+        """Status of the most recent submission of ``filename``, or None."""
+        with self._lock:
+            return self._statuses.get(filename)
+
+    @property
+    def pending(self) -> int:
+        """Number of files queued or being written."""
+        return self._queue.unfinished_tasks
+
+    def flush(self):
+        """Block until every queued file has been written (not a plan)."""
+        self._queue.join()
+
+
+metadata_writer = MetadataWriter()
+"""Process-wide metadata writer used by the acquisition plans."""
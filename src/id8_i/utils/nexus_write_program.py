@@ -0,0 +1,265 @@
+"""
+Precompiled write program for the APS 8-ID-I XPCS NeXus metadata file.
+
+The nested ``xpcs_schema`` dictionary is walked exactly once, at import time,
+and compiled into a flat, immutable tuple of :class:`NexusRecord` entries in
+document order (a group always precedes its members).  Writing a metadata
+file then only binds the runtime values to the records and issues the h5py
+creates, without re-walking (or mutating) the schema on every repetition.
+
+This module does not touch any EPICS devices so it can be imported (and
+benchmarked) outside of a bluesky session.
+
+.. autosummary::
+
+    ~NexusRecord
+    ~compile_schema
+    ~bind_values
+    ~write_nexus_file
+    ~XPCS_WRITE_PROGRAM
+"""
+
+from types import MappingProxyType
+from typing import Any
+from typing import Dict
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+import h5py
+import numpy as np
+from h5py import h5a
+from h5py import h5s
+from h5py import h5t
+
+from .APS8IDI_xpcs_schema import xpcs_schema
+
+default_units_keymap = {
+    "NX_COUNT": "one",  # Used for frame_sum, frame_average, delay_difference
+    "NX_DIMENSIONLESS": "dim.less",  # Used for g2, g2_derr, dynamic_roi_map
+    "NX_LENGTH": "m",  # Used for beam_center_x, beam_center_y, distance
+    "NX_TIME": "s",  # Used for count_time, frame_time
+    "NX_ENERGY": "keV",  # Used for incident_energy, incident_energy_spread
+    "NX_PER_LENGTH": "1/Å",  # Used for dynamic_phi_list, dynamic_q_list
+    "NX_TEMPERATURE": "K",  # Used for temperature, temperature_set
+    "NX_CURRENT": "mA",  # Used for current, milliamper
+    "NX_ANY": "any",  # Used for G2_unnormalized, two_time_corr_func
+    "NX_ANGLE": "degree",  # Used for rotation_x, rotation_y, rotation_z
+}
+
+default_storage_dtype = {
+    "NX_CHAR": "S1",
+    "NX_NUMBER": "f8",
+    "NX_INT": "i8",
+}
+
+# Keys of a schema node that describe the node itself (not a child).
+SCHEMA_KEYWORDS = (
+    "attributes",
+    "data",
+    "deprecated",
+    "description",
+    "required",
+    "type",
+    "units",
+)
+
+# Arrays of at least this many values (time series) are written gzip-compressed.
+COMPRESS_MIN_SIZE = 1024
+
+# (name, value, file type, memory type, dataspace) of one attribute, ready to write.
+CompiledAttr = Tuple[bytes, np.ndarray, h5t.TypeID, h5t.TypeID, h5s.SpaceID]
+
+
+class NexusRecord(NamedTuple):
+    """One HDF5 object (group or field) to be created in the metadata file."""
+
+    path: str
+    """Absolute HDF5 path, such as ``/entry/instrument/detector_1``."""
+
+    dtype: Optional[str]
+    """NeXus type of a field (``NX_CHAR``, ``NX_NUMBER``, ...), None for a group."""
+
+    units: Optional[str]
+    """NeXus units category (``NX_LENGTH``, ...), if any."""
+
+    nx_class: Optional[str]
+    """NeXus base class of a group (``NXentry``, ...), None for a field."""
+
+    description: Optional[str]
+    """Human-readable description, if any."""
+
+    required: bool
+    """True if the schema marks this object as required."""
+
+    default: Any
+    """Default (template) value of a field, None for a group."""
+
+    parent: str
+    """Absolute HDF5 path of the parent group."""
+
+    name: str
+    """Name of this object within its parent group."""
+
+    attrs: Tuple[CompiledAttr, ...]
+    """HDF5 attributes, precomputed from the schema."""
+
+    @property
+    def is_group(self) -> bool:
+        """True if this record creates a group."""
+        return self.dtype is None
+
+
+def _compile_attr(key: str, value: Any) -> CompiledAttr:
+    """Convert one attribute to the arguments of a low-level h5py create."""
+    # Same storage as ``group.attrs[key] = value`` (str: variable-length UTF-8).
+    dtype = h5py.string_dtype() if isinstance(value, str) else None
+    data = np.asarray(value, dtype=dtype, order="C")
+    return (
+        key.encode("utf-8"),
+        data,
+        h5t.py_create(data.dtype, logical=True),
+        h5t.py_create(data.dtype),
+        h5s.create_simple(data.shape),
+    )
+
+
+def _record_attrs(node: Mapping[str, Any]) -> Tuple[CompiledAttr, ...]:
+    """Precompute the HDF5 attributes of one schema node."""
+    attrs = [(key, value["data"]) for key, value in node.get("attributes", {}).items()]
+    # Same attribute names as the original (recursive) writer.
+    if node.get("type") is not None:
+        attrs.append(("NX_Class", node["type"]))
+    if node.get("units") is not None:
+        attrs.append(("unit", default_units_keymap.get(node["units"], "any")))
+    if node.get("description") is not None:
+        attrs.append(("description", node["description"]))
+    return tuple(_compile_attr(key, value) for key, value in attrs)
+
+
+def _write_attrs(handle: h5py.HLObject, attrs: Tuple[CompiledAttr, ...]):
+    """Create precompiled attributes with the low-level API (no dtype guessing)."""
+    for name, data, file_type, memory_type, space in attrs:
+        attr = h5a.create(handle.id, name, file_type, space)
+        attr.write(data, mtype=memory_type)
+
+
+def compile_schema(schema: Mapping[str, Any]) -> Tuple[NexusRecord, ...]:
+    """Compile a nested NeXus schema dictionary into a flat write program.
+
+    The schema is only read, never modified.
+
+    Args:
+        schema: Nested schema, in the form of ``xpcs_schema``
+
+    Returns:
+        Tuple of records in document order, parents before children
+    """
+    program = []
+
+    def walk(node: Mapping[str, Any], parent: str):
+        for key, child in node.items():
+            if key in SCHEMA_KEYWORDS:
+                continue
+            path = f"{parent.rstrip('/')}/{key}"
+            is_field = "data" in child
+            program.append(
+                NexusRecord(
+                    path=path,
+                    dtype=child.get("type") if is_field else None,
+                    units=child.get("units"),
+                    nx_class=None if is_field else child.get("type"),
+                    description=child.get("description"),
+                    required=bool(child.get("required", False)),
+                    default=child.get("data"),
+                    parent=parent,
+                    name=key,
+                    attrs=_record_attrs(child),
+                )
+            )
+            if not is_field:
+                walk(child, path)
+
+    walk(schema, "/")
+    return tuple(program)
+
+
+def bind_values(
+    program: Tuple[NexusRecord, ...],
+    runtime_metadata: Optional[Mapping[str, Any]] = None,
+    index: Optional[Mapping[str, int]] = None,
+) -> list:
+    """Bind runtime values to the fields of a write program.
+
+    Args:
+        program: Compiled write program
+        runtime_metadata: Mapping of HDF5 path to value (leading '/' optional)
+        index: Path to record position in ``program`` (computed if not given)
+
+    Returns:
+        List of values, one per record (None for groups)
+
+    Raises:
+        KeyError: If a runtime path is not a field in the program
+    """
+    values = [record.default for record in program]
+    if index is None:
+        index = {record.path: i for i, record in enumerate(program)}
+    for path, value in (runtime_metadata or {}).items():
+        position = index[f"/{path.lstrip('/')}"]
+        if program[position].is_group:
+            raise KeyError(f"{path!r} is a group, not a field.")
+        values[position] = value
+    return values
+
+
+def write_nexus_file(
+    filename: str,
+    runtime_metadata: Optional[Mapping[str, Any]] = None,
+    program: Optional[Tuple[NexusRecord, ...]] = None,
+    required_only: bool = False,
+):
+    """Write a NeXus file from a compiled program and runtime values.
+
+    Args:
+        filename: Name of the HDF5 file to create (overwritten)
+        runtime_metadata: Mapping of HDF5 path to value (optional)
+        program: Compiled write program (default: ``XPCS_WRITE_PROGRAM``)
+        required_only: If True, skip objects not marked as required
+    """
+    if program is None:
+        program, index = XPCS_WRITE_PROGRAM, XPCS_PATH_INDEX
+    else:
+        index = None
+    values = bind_values(program, runtime_metadata, index=index)
+
+    with h5py.File(filename, "w") as root:
+        groups: Dict[str, h5py.Group] = {"/": root}
+        for record, value in zip(program, values, strict=True):
+            parent = groups.get(record.parent)
+            if parent is None:  # parent skipped (required_only)
+                continue
+            if required_only and not record.required:
+                continue
+            if record.is_group:
+                handle = parent.create_group(record.name)
+                groups[record.path] = handle
+            elif value is None:
+                handle = parent.create_dataset(record.name, shape=(0,))
+            elif np.size(value) >= COMPRESS_MIN_SIZE:
+                handle = parent.create_dataset(
+                    record.name, data=value, compression="gzip", shuffle=True
+                )
+            else:
+                handle = parent.create_dataset(record.name, data=value)
+            _write_attrs(handle, record.attrs)
+
+
+XPCS_WRITE_PROGRAM = compile_schema(xpcs_schema)
+"""Write program compiled from ``APS8IDI_xpcs_schema.xpcs_schema``."""
+
+XPCS_PATH_INDEX = MappingProxyType(
+    {record.path: i for i, record in enumerate(XPCS_WRITE_PROGRAM)}
+)
+"""Read-only map of HDF5 path to position in ``XPCS_WRITE_PROGRAM``."""
@@ -0,0 +1,435 @@
+"""
+Predict the wall time of a plan without running it.
+
+Two estimators, both returning an :class:`Estimate` (total time and the
+time of each stage):
+
+* :func:`simulate_plan` steps through the messages of a plan generator
+  without a RunEngine and charges each one with :class:`MessageCosts`:
+  motor moves from the distance, velocity and acceleration time of the
+  motor (trapezoidal profile, moves of one group overlap), ``sleep``
+  durations, puts and document overheads.  Nothing is sent to the
+  hardware; positions are tracked in the simulation.  It suits plans
+  whose messages describe everything they do (stage moves, alignment
+  scans, ``select_sample``, ``att``).
+
+* :func:`estimate_series` models the XPCS series plans
+  (``eiger_acq_int_series``, ``eiger_acq_ext_trig``,
+  ``rigaku_acq_ZDT_series``) stage by stage, the way ``pipelined_series``
+  overlaps them.  Those plans also act outside their messages (CA-monitor
+  statuses, metadata files, DM submission), so they are not stepped
+  through.  The stage names are those of
+  :class:`~id8_i.utils.acq_timeline.AcquisitionTimeline`, and
+  :meth:`SeriesCosts.from_timeline` calibrates the costs on a recorded
+  series.
+
+.. autosummary::
+
+    ~Estimate
+    ~MessageCosts
+    ~simulate_plan
+    ~SeriesCosts
+    ~estimate_series
+    ~move_time
+    ~SERIES_KINDS
+"""
+
+import logging
+import math
+import statistics
+from collections import defaultdict
+from dataclasses import dataclass
+from dataclasses import field
+from dataclasses import replace
+from typing import Any
+from typing import Dict
+from typing import Generator
+from typing import Optional
+
+from ophyd.status import Status
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGES = 1_000_000  # a plan that polls hardware would never end in simulation
+
+SERIES_KINDS = ("eiger_int", "eiger_ext", "rigaku_zdt")
+"""Series plans known to :func:`estimate_series`."""
+
+
+@dataclass
+class Estimate:
+    """Predicted wall time of a plan and the time of each stage.
+
+    ``stages`` are the seconds on the critical path; ``background`` the
+    seconds of stages hidden behind others (such as a sample move during
+    the HDF5 drain), which cost no wall time.
+    """
+
+    stages: Dict[str, float] = field(default_factory=dict)
+    background: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def total(self) -> float:
+        """Predicted wall time, seconds."""
+        return sum(self.stages.values())
+
+    @property
+    def dead_time(self) -> float:
+        """Seconds not spent exposing."""
+        return self.total - self.stages.get("expose", 0.0)
+
+    @property
+    def dead_fraction(self) -> float:
+        """Fraction of the wall time not spent exposing."""
+        return self.dead_time / self.total if self.total > 0 else 0.0
+
+    def add(self, stage: str, seconds: float, background: bool = False):
+        """Charge ``seconds`` to ``stage``."""
+        totals = self.background if background else self.stages
+        totals[stage] = totals.get(stage, 0.0) + seconds
+
+    def __add__(self, other: "Estimate") -> "Estimate":
+        """Stage-wise sum, such as the blocks of a measurement file."""
+        result = Estimate(dict(self.stages), dict(self.background))
+        for stage, seconds in other.stages.items():
+            result.add(stage, seconds)
+        for stage, seconds in other.background.items():
+            result.add(stage, seconds, background=True)
+        return result
+
+    def scaled(self, factor: float) -> "Estimate":
+        """Every stage times ``factor``, such as for repeated series."""
+        return Estimate(
+            {k: v * factor for k, v in self.stages.items()},
+            {k: v * factor for k, v in self.background.items()},
+        )
+
+    def report(self) -> str:
+        """Multi-line summary for the console."""
+        lines = [
+            f"predicted {self.total:.1f} s ({self.total / 3600:.2f} h),"
+            f" dead time {self.dead_time:.1f} s ({100 * self.dead_fraction:.0f}%)"
+        ]
+        for stage, seconds in sorted(self.stages.items(), key=lambda kv: -kv[1]):
+            share = 100 * seconds / self.total if self.total > 0 else 0.0
+            lines.append(f"  {stage:>10s}: {seconds:10.1f} s {share:5.1f}%")
+        for stage, seconds in sorted(self.background.items(), key=lambda kv: -kv[1]):
+            lines.append(f"  {stage:>10s}: {seconds:10.1f} s (in background)")
+        return "\n".join(lines)
+
+
+def move_time(distance: float, velocity: float, accel_time: float) -> float:
+    """Seconds of a trapezoidal move (triangular if too short to reach ``velocity``).
+
+    Args:
+        distance: Length of the move
+        velocity: Top speed, length per second
+        accel_time: Seconds to reach the top speed (the motor record's ACCL)
+    """
+    distance = abs(distance)
+    if distance == 0:
+        return 0.0
+    if velocity <= 0:
+        raise ValueError(f"velocity must be positive, got {velocity}")
+    accel_time = max(accel_time, 0.0)
+    if distance >= velocity * accel_time:
+        return distance / velocity + accel_time
+    return 2 * math.sqrt(distance * accel_time / velocity)
+
+
+@dataclass
+class MessageCosts:
+    """Seconds charged to the messages of a plan by :func:`simulate_plan`."""
+
+    put: float = 0.02  # set of a signal (CA put and callback)
+    read: float = 0.005  # read of a device
+    document: float = 0.002  # open_run, create, save, close_run, ...
+    # seconds per triggered device name
+    trigger: Dict[str, float] = field(default_factory=dict)
+    default_trigger: float = 0.1
+    settle: float = 0.0  # added to every motor move
+    # overrides the motor's own, by name
+    velocity: Dict[str, float] = field(default_factory=dict)
+    accel_time: Dict[str, float] = field(default_factory=dict)
+    default_velocity: float = 1.0  # for motors whose velocity cannot be read
+    default_accel_time: float = 0.2
+
+
+def _motor_parameter(
+    obj: Any, name: str, overrides: Dict[str, float], default: float
+) -> float:
+    """Motor velocity or acceleration: override, else the motor's, else the default."""
+    if obj.name in overrides:
+        return overrides[obj.name]
+    try:
+        return float(getattr(obj, name).get())
+    except Exception:
+        return default
+
+
+def _is_motor(obj: Any) -> bool:
+    return hasattr(obj, "velocity") and hasattr(obj, "position")
+
+
+class _PlanSimulation:
+    """State of one :func:`simulate_plan` run."""
+
+    def __init__(self, costs: MessageCosts):
+        self.costs = costs
+        self.clock = 0.0
+        self.estimate = Estimate()
+        self.positions: Dict[str, Any] = {}
+        self.groups: Dict[str, list] = defaultdict(list)  # group -> [(end time, stage)]
+
+    def _done(self) -> Status:
+        status = Status()
+        status.set_finished()
+        return status
+
+    def _advance(self, stage: str, seconds: float):
+        self.clock += seconds
+        self.estimate.add(stage, seconds)
+
+    def _start(self, msg, seconds: float, stage: str):
+        """Start an operation, it costs time when its group is waited for."""
+        group = msg.kwargs.get("group")
+        # like the RunEngine, nothing waits for ungrouped operations
+        if group is not None:
+            self.groups[group].append((self.clock + seconds, stage))
+
+    def position(self, obj: Any) -> Any:
+        if obj.name not in self.positions:
+            try:
+                self.positions[obj.name] = obj.position if _is_motor(obj) else obj.get()
+            except Exception:
+                self.positions[obj.name] = 0.0
+        return self.positions[obj.name]
+
+    def handle(self, msg) -> Any:
+        command, obj = msg.command, msg.obj
+        if command == "set":
+            value = msg.args[0]
+            if _is_motor(obj):
+                start = self.position(obj)
+                velocity = _motor_parameter(
+                    obj, "velocity", self.costs.velocity, self.costs.default_velocity
+                )
+                accel = _motor_parameter(
+                    obj,
+                    "acceleration",
+                    self.costs.accel_time,
+                    self.costs.default_accel_time,
+                )
+                try:
+                    seconds = (
+                        move_time(float(value) - float(start), velocity, accel)
+                        + self.costs.settle
+                    )
+                except (TypeError, ValueError):
+                    seconds = self.costs.put
+                stage = "motion"
+            else:
+                seconds, stage = self.costs.put, "put"
+            self.positions[obj.name] = value
+            self._start(msg, seconds, stage)
+            return self._done()
+        if command == "wait":
+            pending = self.groups.pop(
+                msg.kwargs.get("group", msg.args[0] if msg.args else None), []
+            )
+            if pending:
+                end, stage = max(pending)
+                if end > self.clock:
+                    self._advance(stage, end - self.clock)
+            return None
+        if command == "sleep":
+            self._advance("sleep", float(msg.args[0]))
+            return None
+        if command == "trigger":
+            self._start(
+                msg,
+                self.costs.trigger.get(obj.name, self.costs.default_trigger),
+                "trigger",
+            )
+            return self._done()
+        if command in ("read", "locate"):
+            self._advance("read", self.costs.read)
+            value = self.position(obj)
+            if command == "locate":
+                return {"setpoint": value, "readback": value}
+            return {obj.name: {"value": value, "timestamp": self.clock}}
+        if command in ("kickoff", "complete", "stage", "unstage", "prepare"):
+            self._advance("put", self.costs.put)
+            return self._done()
+        if command == "open_run":
+            self._advance("documents", self.costs.document)
+            return f"simulated-{id(self)}"
+        if command in ("create", "save", "close_run", "declare_stream", "collect"):
+            self._advance("documents", self.costs.document)
+        return None
+
+
+def simulate_plan(plan: Generator, costs: Optional[MessageCosts] = None) -> Estimate:
+    """Predict the wall time of a plan by stepping through its messages.
+
+    Stages of the estimate: ``motion``, ``sleep``, ``put``, ``trigger``,
+    ``read`` and ``documents``.  Moves started in a group run in parallel
+    and cost the time of the slowest one at the ``wait``.
+
+    Args:
+        plan: Plan generator (not started)
+        costs: Message costs (default: MessageCosts())
+
+    Raises:
+        RuntimeError: If the plan does not end after MAX_MESSAGES messages
+    """
+    sim = _PlanSimulation(costs or MessageCosts())
+    response = None
+    for _ in range(MAX_MESSAGES):
+        try:
+            msg = plan.send(response)
+        except StopIteration:
+            break
+        response = sim.handle(msg)
+    else:
+        plan.close()
+        raise RuntimeError(
+            f"Plan did not end after {MAX_MESSAGES} simulated messages"
+            " (polling hardware?)"
+        )
+    return sim.estimate
+
+
+@dataclass
+class SeriesCosts:
+    """Seconds of each stage of a series plan, see :func:`estimate_series`.
+
+    Defaults are rough figures for 8-ID-I; calibrate them with
+    :meth:`from_timeline` on a recorded series.
+    """
+
+    prepare: float = 1.0  # post_align, shutteroff, DM setup, once per series
+    # detector settings of the first repetition (all read and most written)
+    setup_first: float = 1.5
+    setup: float = 0.3  # settings of the held devices, per repetition (file names)
+    prestage: float = 0.1  # other settings of the next repetition, behind the drain
+    arm: float = 0.5  # hdf1 capture and cam acquire until frames flow
+    shutter: float = 0.25  # showbeam, the 0.1 s settle, blockbeam
+    snapshot: float = 0.1  # metadata snapshot taken in the plan
+    metadata: float = 1.0  # metadata file, written in the background
+    dm: float = 0.01  # DM job queued (submitted in the background)
+    dm_submit: float = 2.0  # DM submission latency, in the background
+    move: float = 1.0  # sample move to the next spot of the grid
+    hdf5_rate: float = 2000.0  # frames per second the HDF5 plugin writes (Eiger)
+    file_close: float = 0.3  # hdf1 capture off until the file is closed
+    rigaku_poll: float = 0.2  # detector_state polled every 0.1 s, twice
+
+    @classmethod
+    def from_timeline(
+        cls, timeline, exposure: Optional[float] = None, **overrides
+    ) -> "SeriesCosts":
+        """Costs measured on a recorded series (``AcquisitionTimeline``).
+
+        The per-repetition stages (setup, prestage, snapshot, dm, move) take
+        the median of their spans; the first setup is taken on its own.  With
+        the nominal ``exposure`` of a repetition (period x frames), the rest
+        of the expose span calibrates ``arm``.  ``overrides`` set fields
+        instead of the timeline (the shutter time used for ``arm`` included).
+        """
+        costs = cls(**overrides)
+        by_stage = defaultdict(list)
+        for rep, stage, start, end in timeline.rows():
+            by_stage[stage].append((rep, end - start))
+        measured = {}
+        setups = sorted(by_stage.get("setup", []))
+        if setups:
+            measured["setup_first"] = setups[0][1]
+            if len(setups) > 1:
+                measured["setup"] = statistics.median(d for _, d in setups[1:])
+        for stage in ("prestage", "snapshot", "dm", "move", "metadata"):
+            if by_stage.get(stage):
+                measured[stage] = statistics.median(d for _, d in by_stage[stage])
+        if exposure is not None and by_stage.get("expose"):
+            spent = statistics.median(d for _, d in by_stage["expose"])
+            measured["arm"] = max(spent - exposure - costs.shutter, 0.0)
+        measured = {k: v for k, v in measured.items() if k not in overrides}
+        return replace(costs, **measured)
+
+
+def estimate_series(
+    kind: str,
+    acq_time: float,
+    num_frames: int,
+    num_rep: int,
+    acq_period: Optional[float] = None,
+    wait_time: float = 0,
+    sample_move: bool = False,
+    process: bool = True,
+    costs: Optional[SeriesCosts] = None,
+) -> Estimate:
+    """Predict the wall time of a pipelined XPCS series.
+
+    Each repetition runs wait, setup, arm (shutter and detector start),
+    expose and snapshot one after the other; the HDF5 drain of a repetition
+    overlaps the sample move and the prestaged settings of the next one, and
+    the metadata file and DM submission run in the background (as in
+    ``pipelined_series``).  The first setup writes everything; later ones
+    write only the settings of the held devices, the rest is prestaged.
+
+    Args:
+        kind: One of SERIES_KINDS
+        acq_time: Exposure per frame, seconds
+        num_frames: Frames per repetition
+        num_rep: Repetitions
+        acq_period: Frame period, seconds (default: acq_time)
+        wait_time: Wait at the start of each repetition
+        sample_move: Move to a new spot for each repetition
+        process: Submit the DM analysis jobs
+        costs: Stage costs (default: SeriesCosts())
+    """
+    if kind not in SERIES_KINDS:
+        raise ValueError(f"Unknown series {kind!r}, expected one of {SERIES_KINDS}")
+    costs = costs or SeriesCosts()
+    period = acq_time if acq_period is None else max(acq_period, acq_time)
+    exposure = period * num_frames
+
+    estimate = Estimate()
+    estimate.add("prepare", costs.prepare)
+    for ii in range(num_rep):
+        if wait_time > 0:
+            estimate.add("wait", wait_time)
+        if sample_move and ii == 0:
+            estimate.add("move", costs.move)
+        estimate.add("setup", costs.setup_first if ii == 0 else costs.setup)
+        estimate.add(
+            "arm",
+            costs.shutter
+            + costs.arm
+            + (costs.rigaku_poll if kind == "rigaku_zdt" else 0.0),
+        )
+        estimate.add("expose", exposure)
+        if kind == "rigaku_zdt":
+            drain = 0.0  # the Rigaku writes its own file
+        else:
+            drain = max(num_frames / costs.hdf5_rate - exposure, 0.0) + costs.file_close
+        estimate.add("snapshot", costs.snapshot)
+        estimate.add("metadata", costs.metadata, background=True)
+
+        estimate.add("drain", drain)
+        if ii + 1 < num_rep:
+            # Next spot and prestaged settings, hidden behind the drain.
+            hidden = drain
+            for stage, seconds in (
+                ("move", costs.move if sample_move else 0.0),
+                ("prestage", costs.prestage),
+            ):
+                shown = max(seconds - hidden, 0.0)
+                hidden = max(hidden - seconds, 0.0)
+                if shown > 0:
+                    estimate.add(stage, shown)
+                if seconds > shown:
+                    estimate.add(stage, seconds - shown, background=True)
+        if process:
+            estimate.add("dm", costs.dm)
+            estimate.add("dm_submit", costs.dm_submit, background=True)
+    return estimate
@@ -0,0 +1,231 @@
+"""
+Concurrent snapshot of many ophyd signals with one shared timeout.
+
+A snapshot is described declaratively, as a mapping of a key (usually a
+NeXus path) to an ophyd signal or positioner.  Scalar numeric EPICS
+signals are read in one batched Channel Access request: every ``get`` is
+issued first, the request is flushed once, then the replies are collected
+against a single deadline.  Their raw value is what ophyd would return.
+Strings, enums and arrays need ophyd's conversions: they are read with
+the signal's own ``get()`` while the batch is in flight, within the same
+deadline.  A slow or disconnected IOC costs at most the shared timeout
+and is reported, instead of stalling every read that follows it.
+
+Positioners are read from their (monitored) ``.position``, without a
+network round trip.  Signals watched by a
+:class:`~id8_i.utils.metadata_cache.MonitoredValueCache` are served from
+the cache while their value is fresh enough.
+
+.. autosummary::
+
+    ~SnapshotItem
+    ~SnapshotReport
+    ~snapshot_signals
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from epics import ca
+from epics import dbr
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_TIMEOUT = 2.0  # seconds, shared by all signals in one snapshot
+BATCHED_TYPES = (dbr.INT, dbr.FLOAT, dbr.CHAR, dbr.LONG, dbr.DOUBLE)
+
+
+class SnapshotItem(NamedTuple):
+    """One value to snapshot: an ophyd signal or positioner, optional transform."""
+
+    source: Any
+    transform: Optional[Callable[[Any], Any]] = None
+
+
+@dataclass
+class SnapshotEntry:
+    """Outcome of reading one item of a snapshot."""
+
+    key: str
+    pvname: str
+    status: str  # "ok", "cached", "local", "timeout", "disconnected", or "error"
+    latency: float  # seconds, from request to reply (or to giving up)
+    error: Optional[str] = None
+
+
+@dataclass
+class SnapshotReport:
+    """Per-signal latency and failure report of one snapshot."""
+
+    timeout: float
+    elapsed: float = 0.0
+    entries: List[SnapshotEntry] = field(default_factory=list)
+
+    @property
+    def failed(self) -> List[SnapshotEntry]:
+        """Entries that did not return a value."""
+        return [e for e in self.entries if e.status not in ("ok", "cached", "local")]
+
+    def slowest(self, n: int = 5) -> List[SnapshotEntry]:
+        """The ``n`` entries with the longest latency."""
+        return sorted(self.entries, key=lambda e: e.latency, reverse=True)[:n]
+
+    def __str__(self) -> str:
+        """Short summary, suitable for the console or a log file."""
+        text = (
+            f"snapshot of {len(self.entries)} signals in {self.elapsed * 1e3:.1f} ms"
+            f" ({len(self.failed)} failed, timeout={self.timeout} s)"
+        )
+        for e in self.failed:
+            text += (
+                f"\n  {e.status}: {e.key} ({e.pvname}) after {e.latency * 1e3:.1f} ms"
+            )
+        return text
+
+
+def _channel_access_pv(source: Any):
+    """Return the pyepics PV behind an EpicsSignal, or None."""
+    pv = getattr(source, "_read_pv", None)
+    if pv is None or getattr(pv, "chid", None) is None:
+        return None  # soft signal, positioner, or another control layer
+    return pv
+
+
+def _batched(pv: Any, source: Any) -> bool:
+    """True if the raw Channel Access value is the value ophyd returns."""
+    if getattr(source, "as_string", False):
+        return False
+    try:
+        return (
+            ca.field_type(pv.chid) in BATCHED_TYPES and ca.element_count(pv.chid) == 1
+        )
+    except Exception:
+        return False
+
+
+def _read_local(source: Any) -> Any:
+    """Read a source that needs no Channel Access request."""
+    if hasattr(source, "position") and not hasattr(source, "_read_pv"):
+        return source.position  # positioners keep a monitored readback
+    return source.get()
+
+
+def snapshot_signals(
+    items: Mapping[str, Any],
+    timeout: float = DEFAULT_SNAPSHOT_TIMEOUT,
+    cache: Optional[Any] = None,
+) -> Tuple[Dict[str, Any], SnapshotReport]:
+    """Read all items concurrently, with one shared timeout.
+
+    Items that fail (timeout, disconnected, error) are left out of the
+    returned dictionary and listed in the report, so the caller can keep a
+    default value for them.
+
+    Args:
+        items: Mapping of key to signal, positioner, or :class:`SnapshotItem`
+        timeout: Shared deadline (seconds) for the whole snapshot
+        cache: MonitoredValueCache to serve (and refresh) watched signals
+
+    Returns:
+        Tuple of (values by key, report)
+    """
+    t0 = time.monotonic()
+    deadline = t0 + timeout
+    report = SnapshotReport(timeout=timeout)
+    values: Dict[str, Any] = {}
+    pending = []
+    converted = []
+
+    def finish(key, item, value):
+        if item.transform is not None:
+            value = item.transform(value)
+        values[key] = value
+
+    for key, item in items.items():
+        if not isinstance(item, SnapshotItem):
+            item = SnapshotItem(item)
+        pv = _channel_access_pv(item.source)
+        pvname = getattr(item.source, "pvname", None) or getattr(
+            item.source, "name", ""
+        )
+        if cache is not None and cache.is_watched(item.source):
+            hit, value, _ = cache.lookup(item.source)
+            if hit:
+                try:
+                    finish(key, item, value)
+                    report.entries.append(SnapshotEntry(key, pvname, "cached", 0.0))
+                    continue
+                except Exception as exc:
+                    logger.debug("Cached value of %s not usable: %s", pvname, exc)
+        if pv is None:
+            t_read = time.monotonic()
+            try:
+                finish(key, item, _read_local(item.source))
+                status, error = "local", None
+            except Exception as exc:
+                status, error = "error", str(exc)
+            report.entries.append(
+                SnapshotEntry(key, pvname, status, time.monotonic() - t_read, error)
+            )
+        elif not pv.connected:
+            report.entries.append(SnapshotEntry(key, pvname, "disconnected", 0.0))
+        elif _batched(pv, item.source):
+            ca.get(pv.chid, wait=False)
+            pending.append((key, item, pv, pvname))
+        else:
+            converted.append((key, item, pvname))
+
+    def received(key, item, pvname, value):
+        latency = time.monotonic() - t0
+        if value is None:
+            report.entries.append(SnapshotEntry(key, pvname, "timeout", latency))
+            return
+        if cache is not None:
+            cache.refresh(item.source, value)
+        try:
+            finish(key, item, value)
+            report.entries.append(SnapshotEntry(key, pvname, "ok", latency))
+        except Exception as exc:
+            report.entries.append(
+                SnapshotEntry(key, pvname, "error", latency, str(exc))
+            )
+
+    # One flush sends every request; the IOCs reply concurrently.
+    ca.poll()
+    for key, item, pvname in converted:
+        try:
+            value = item.source.get(timeout=max(deadline - time.monotonic(), 1e-3))
+        except TimeoutError:
+            value = None
+        except Exception as exc:
+            report.entries.append(
+                SnapshotEntry(key, pvname, "error", time.monotonic() - t0, str(exc))
+            )
+            continue
+        received(key, item, pvname, value)
+    for key, item, pv, pvname in pending:
+        try:
+            value = ca.get_complete(
+                pv.chid, timeout=max(deadline - time.monotonic(), 1e-3)
+            )
+        except Exception as exc:
+            report.entries.append(
+                SnapshotEntry(key, pvname, "error", time.monotonic() - t0, str(exc))
+            )
+            continue
+        received(key, item, pvname, value)
+
+    report.elapsed = time.monotonic() - t0
+    for entry in report.failed:
+        logger.warning("Snapshot %s: %s (%s)", entry.status, entry.key, entry.pvname)
+    return values, report
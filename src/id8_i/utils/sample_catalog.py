@@ -0,0 +1,187 @@
+"""
+Cached, validated view of the ``sample_info.json`` file.
+
+The file maps ``sample_{N}`` keys to the position, grid and naming of each
+sample.  :class:`SampleCatalog` parses it once into :class:`SampleInfo`
+records indexed by N and parses it again only when its modification time
+or size changes.  The file is checked with ``os.stat`` at most once per
+``check_interval`` seconds, so looking up a sample in a plan costs a dict
+lookup rather than reading a file on the NFS home directory.
+
+Only keys ``sample_{N}`` (N an integer) are samples.  Each entry is
+validated on its own: a malformed one is logged and left out, and only a
+lookup of that sample raises.
+
+.. autosummary::
+
+    ~SampleInfo
+    ~SampleCatalog
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = 1.0  # seconds between two checks of the file's mtime and size
+KEY_PREFIX = "sample_"
+KEY_PATTERN = re.compile(rf"{KEY_PREFIX}(\d+)")
+
+
+@dataclass(frozen=True, slots=True)
+class SampleInfo:
+    """One sample of ``sample_info.json``."""
+
+    index: int
+    sample_name: str
+    header: str
+    x_cen: float
+    y_cen: float
+    x_radius: float
+    y_radius: float
+    x_pts: int
+    y_pts: int
+    temp_zone: str
+
+    @classmethod
+    def from_dict(cls, index: int, entry: Dict[str, Any]) -> "SampleInfo":
+        """Validate and convert one entry of the file.
+
+        Raises:
+            ValueError: If a key is missing or a value has the wrong type
+        """
+        try:
+            info = cls(
+                index=index,
+                sample_name=str(entry["sample_name"]),
+                header=str(entry["header"]),
+                x_cen=float(entry["x_cen"]),
+                y_cen=float(entry["y_cen"]),
+                x_radius=float(entry["x_radius"]),
+                y_radius=float(entry["y_radius"]),
+                x_pts=int(entry["x_pts"]),
+                y_pts=int(entry["y_pts"]),
+                temp_zone=str(entry["temp_zone"]),
+            )
+        except KeyError as exc:
+            raise ValueError(f"{KEY_PREFIX}{index}: missing key {exc}") from exc
+        except (TypeError, ValueError) as exc:
+            raise ValueError(f"{KEY_PREFIX}{index}: {exc}") from exc
+        if info.x_pts < 1 or info.y_pts < 1:
+            raise ValueError(f"{KEY_PREFIX}{index}: x_pts and y_pts must be at least 1")
+        return info
+
+    @property
+    def num_points(self) -> int:
+        """Number of positions in the sample's grid."""
+        return self.x_pts * self.y_pts
+
+
+class SampleCatalog:
+    """Samples of a ``sample_info.json`` file, reloaded when the file changes."""
+
+    def __init__(self, path: Union[str, Path], check_interval: float = CHECK_INTERVAL):
+        """The file is read at the first lookup.
+
+        Args:
+            path: Path of the JSON file
+            check_interval: Minimum seconds between two checks of the file
+        """
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._samples: Dict[int, SampleInfo] = {}
+        self._invalid: Dict[int, str] = {}  # index: why the entry was left out
+        self._stamp: Optional[Tuple[int, int]] = None  # (mtime_ns, size) loaded
+        self._checked: Optional[float] = None
+        self.loads = 0  # number of times the file was parsed
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload the file if it changed, return True if it was reloaded."""
+        now = time.monotonic()
+        with self._lock:
+            if (
+                not force
+                and self._checked is not None
+                and now - self._checked < self.check_interval
+            ):
+                return False
+            self._checked = now
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size)
+            if not force and stamp == self._stamp:
+                return False
+            try:
+                with open(self.path, "r") as f:
+                    raw = json.load(f)
+            except ValueError as exc:  # such as a file being written
+                if self._stamp is None:
+                    raise
+                logger.warning("%s not readable, samples kept: %s", self.path, exc)
+                return False
+            samples, invalid = {}, {}
+            for key, entry in raw.items():
+                match = KEY_PATTERN.fullmatch(key)
+                if match is None:
+                    continue
+                index = int(match.group(1))
+                try:
+                    if not isinstance(entry, dict):
+                        raise ValueError(f"{key}: not an object")
+                    samples[index] = SampleInfo.from_dict(index, entry)
+                except ValueError as exc:
+                    invalid[index] = str(exc)
+                    logger.warning("Left out of %s: %s", self.path, exc)
+            self._samples = samples
+            self._invalid = invalid
+            self._stamp = stamp
+            self.loads += 1
+        logger.info("Loaded %d samples from %s", len(samples), self.path)
+        return True
+
+    def __getitem__(self, index: int) -> SampleInfo:
+        """Sample ``index`` (the N of ``sample_N``).
+
+        Raises:
+            KeyError: If the file has no such sample
+            ValueError: If its entry is malformed
+        """
+        self.refresh()
+        index = int(index)
+        if index in self._invalid:
+            raise ValueError(f"Invalid entry in {self.path}: {self._invalid[index]}")
+        try:
+            return self._samples[index]
+        except KeyError:
+            raise KeyError(f"No {KEY_PREFIX}{index} in {self.path}") from None
+
+    def __contains__(self, index: int) -> bool:
+        """True if the file has sample ``index``."""
+        self.refresh()
+        return int(index) in self._samples
+
+    def __len__(self) -> int:
+        """Number of samples in the file."""
+        self.refresh()
+        return len(self._samples)
+
+    def samples(self) -> Dict[int, SampleInfo]:
+        """All valid samples, by index."""
+        self.refresh()
+        return dict(self._samples)
+
+    def invalid(self) -> Dict[int, str]:
+        """Why each malformed entry was left out, by index."""
+        self.refresh()
+        return dict(self._invalid)
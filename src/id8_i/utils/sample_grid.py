@@ -0,0 +1,222 @@
+"""
+Precomputed grid of measurement spots on a sample.
+
+A sample is measured on an ``x_pts`` by ``y_pts`` grid centred on
+(``x_cen``, ``y_cen``), a fresh spot per repetition.  :class:`SampleGrid`
+computes every position of the grid once, in visiting order, as one numpy
+array; a step number (the cursor kept in the ``sample{N}_pos`` register)
+indexes it directly.
+
+Visiting orders:
+
+* ``raster`` (default): rows of increasing x, the order used before (the
+  cursor of this order is the index used by the old plans);
+* ``serpentine``: every other row is walked backwards, so each move is one
+  grid spacing and the stage never flies back across the sample;
+* ``hilbert``: a (generalised) Hilbert curve, each move is one grid spacing
+  (a few diagonal ones on odd-sized grids) and any run of consecutive
+  spots stays in a compact patch.
+
+Grids are cached by geometry and order, see :func:`grid_for`.
+
+.. autosummary::
+
+    ~SampleGrid
+    ~grid_for
+    ~ORDERS
+"""
+
+from functools import lru_cache
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+ORDERS = ("raster", "serpentine", "hilbert")
+"""Visiting orders of :class:`SampleGrid`."""
+
+SINGLE_SPOT_OFFSET = 0.05  # mm, largest offset from the spot of a 1x1 grid
+
+
+def _sign(v: int) -> int:
+    return (v > 0) - (v < 0)
+
+
+def _gilbert(
+    x: int, y: int, ax: int, ay: int, bx: int, by: int
+) -> Iterator[Tuple[int, int]]:
+    """Generalised Hilbert curve over the rectangle spanned by (ax, ay) and (bx, by)."""
+    w = abs(ax + ay)
+    h = abs(bx + by)
+    dax, day = _sign(ax), _sign(ay)
+    dbx, dby = _sign(bx), _sign(by)
+
+    if h == 1:
+        for _ in range(w):
+            yield x, y
+            x, y = x + dax, y + day
+        return
+    if w == 1:
+        for _ in range(h):
+            yield x, y
+            x, y = x + dbx, y + dby
+        return
+
+    ax2, ay2 = ax // 2, ay // 2
+    bx2, by2 = bx // 2, by // 2
+    w2 = abs(ax2 + ay2)
+    h2 = abs(bx2 + by2)
+
+    if 2 * w > 3 * h:
+        if w2 % 2 and w > 2:
+            ax2, ay2 = ax2 + dax, ay2 + day  # prefer even steps
+        yield from _gilbert(x, y, ax2, ay2, bx, by)
+        yield from _gilbert(x + ax2, y + ay2, ax - ax2, ay - ay2, bx, by)
+    else:
+        if h2 % 2 and h > 2:
+            bx2, by2 = bx2 + dbx, by2 + dby  # prefer even steps
+        yield from _gilbert(x, y, bx2, by2, ax2, ay2)
+        yield from _gilbert(x + bx2, y + by2, ax, ay, bx - bx2, by - by2)
+        yield from _gilbert(
+            x + (ax - dax) + (bx2 - dbx),
+            y + (ay - day) + (by2 - dby),
+            -bx2,
+            -by2,
+            -(ax - ax2),
+            -(ay - ay2),
+        )
+
+
+def _cells(x_pts: int, y_pts: int, order: str) -> np.ndarray:
+    """(ix, iy) grid indices of every spot, in visiting order."""
+    if order == "hilbert":
+        if x_pts >= y_pts:
+            path = _gilbert(0, 0, x_pts, 0, 0, y_pts)
+        else:
+            path = _gilbert(0, 0, 0, y_pts, x_pts, 0)
+        return np.fromiter((c for xy in path for c in xy), dtype=int).reshape(-1, 2)
+    iy, ix = np.divmod(np.arange(x_pts * y_pts), x_pts)
+    if order == "serpentine":
+        odd = iy % 2 == 1
+        ix[odd] = x_pts - 1 - ix[odd]
+    elif order != "raster":
+        raise ValueError(f"Unknown grid order {order!r}, expected one of {ORDERS}.")
+    return np.column_stack((ix, iy))
+
+
+class SampleGrid:
+    """All spots of a sample grid, in visiting order."""
+
+    def __init__(
+        self,
+        x_cen: float,
+        y_cen: float,
+        x_radius: float,
+        y_radius: float,
+        x_pts: int,
+        y_pts: int,
+        order: str = "raster",
+    ):
+        """Compute the positions (use :func:`grid_for` to share grids).
+
+        Args:
+            x_cen, y_cen: Centre of the grid
+            x_radius, y_radius: Half width of the grid in each direction
+            x_pts, y_pts: Number of spots in each direction
+            order: Visiting order, one of ``ORDERS``
+        """
+        self.order = order
+        self.shape = (int(x_pts), int(y_pts))
+        xs = np.linspace(x_cen - x_radius, x_cen + x_radius, num=self.shape[0])
+        ys = np.linspace(y_cen - y_radius, y_cen + y_radius, num=self.shape[1])
+        self.cells = _cells(*self.shape, order)
+        self.positions = np.column_stack((xs[self.cells[:, 0]], ys[self.cells[:, 1]]))
+        self.cells.flags.writeable = False
+        self.positions.flags.writeable = False
+        self._axes = (xs, ys)
+        self._steps = np.empty(self.shape, dtype=int)  # (ix, iy) -> step
+        self._steps[self.cells[:, 0], self.cells[:, 1]] = np.arange(len(self.cells))
+        spacing = [float(a[1] - a[0]) if len(a) > 1 else None for a in self._axes]
+        known = [d for d in spacing if d]
+        self._max_offset = tuple(
+            0.5 * (d or min(known, default=2 * SINGLE_SPOT_OFFSET)) for d in spacing
+        )
+
+    @classmethod
+    def from_sample(cls, info, order: str = "raster") -> "SampleGrid":
+        """Cached grid of a ``sample_catalog.SampleInfo``."""
+        return grid_for(
+            info.x_cen,
+            info.y_cen,
+            info.x_radius,
+            info.y_radius,
+            info.x_pts,
+            info.y_pts,
+            order,
+        )
+
+    def __len__(self) -> int:
+        """Number of spots."""
+        return len(self.positions)
+
+    def wrap(self, step: int) -> int:
+        """Step number folded into the grid (the grid is walked again and again)."""
+        return int(step) % len(self.positions)
+
+    def position(self, step: int) -> Tuple[float, float]:
+        """(x, y) of the spot at ``step``."""
+        x, y = self.positions[self.wrap(step)]
+        return float(x), float(y)
+
+    def nearest_step(self, x: float, y: float) -> Optional[int]:
+        """Step of the spot at (x, y), such as a stage readback near its setpoint.
+
+        Returns None if (x, y) is more than half the grid spacing from every
+        spot (``SINGLE_SPOT_OFFSET`` on a 1x1 grid).
+        """
+        index = []
+        axes = zip((x, y), self._axes, self._max_offset, strict=True)
+        for value, axis, max_offset in axes:
+            i = int(np.abs(axis - value).argmin())
+            if abs(axis[i] - value) > max_offset:
+                return None
+            index.append(i)
+        return int(self._steps[index[0], index[1]])
+
+    def next_positions(self, cursor: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """The ``k`` spots after ``cursor``, such as to prefetch their moves.
+
+        Returns:
+            (steps, positions): wrapped step numbers (k,) and (x, y) positions (k, 2)
+        """
+        steps = (int(cursor) + 1 + np.arange(k)) % len(self.positions)
+        return steps, self.positions[steps]
+
+    def path_length(self, cursor: int = 0, k: int = None) -> float:
+        """Stage travel (x plus y) from the spot at ``cursor`` over ``k`` more spots.
+
+        The default ``k`` covers one pass over the grid.
+        """
+        k = len(self.positions) - 1 if k is None else k
+        steps = (int(cursor) + np.arange(k + 1)) % len(self.positions)
+        return float(np.abs(np.diff(self.positions[steps], axis=0)).sum())
+
+    def __repr__(self) -> str:
+        """Shape and order of the grid."""
+        shape = f"{self.shape[0]}x{self.shape[1]}"
+        return f"{self.__class__.__name__}({shape}, order={self.order!r})"
+
+
+@lru_cache(maxsize=64)
+def grid_for(
+    x_cen: float,
+    y_cen: float,
+    x_radius: float,
+    y_radius: float,
+    x_pts: int,
+    y_pts: int,
+    order: str = "raster",
+) -> SampleGrid:
+    """Return the (shared) SampleGrid of this geometry and order."""
+    return SampleGrid(x_cen, y_cen, x_radius, y_radius, x_pts, y_pts, order)
@@ -1,20 +1,37 @@
 """Utility functions for 8ID-I beamline operations.
 
 This module provides utility functions for common operations at the 8ID-I beamline,
-including machine name selection and temperature string formatting.
+including analysis machine selection and temperature string formatting.
 """
 
-import random
+from typing import Optional
 
+from apsbits.utils.config_loaders import get_config
 
-def get_machine_name() -> str:
-    """Returns the name of a randomly selected machine (A or B).
+from .analysis_scheduler import AnalysisScheduler
+
+iconfig = get_config()
+
+analysis_scheduler = AnalysisScheduler(
+    iconfig.get("ANALYSIS_MACHINES", {"adamite": 1, "califone": 2}),
+    policy=iconfig.get("ANALYSIS_POLICY", "least-loaded"),
+)
+"""Session-wide scheduler of the local analysis machines."""
+
+
+def get_machine_name(job_key: Optional[str] = None) -> str:
+    """Returns the analysis machine for a new job.
+
+    The machine is chosen by ``analysis_scheduler`` from the load of each
+    machine (see ``utils.analysis_scheduler``).
+
+    Args:
+        job_key: ``filePath`` of the job, recorded in the machine's ledger
 
     Returns:
-        str: Either 'adamite' or 'amazonite'
+        str: Name of the machine, such as 'adamite' or 'califone'
     """
-    machines = ["adamite", "califone", "califone"]
-    return random.choice(machines)
+    return analysis_scheduler.choose(job_key)
 
 
 def temp2str(temp: float) -> str: